@@ -1,31 +1,74 @@
 import asyncio
 import logging
+import multiprocessing
+import os
+import signal
 
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.fsm.storage.redis import DefaultKeyBuilder, RedisStorage
-from aiogram.types import (
-    BotCommand,
-    BotCommandScopeAllChatAdministrators,
-    BotCommandScopeAllGroupChats,
-    BotCommandScopeAllPrivateChats,
-)
+from redis.asyncio import Redis
 from stp_database import create_engine, create_session_pool
 
 from tgbot.config import Config, load_config
-from tgbot.handlers import routers_list
+from tgbot.middlewares.CasinoRateLimitMiddleware import CasinoRateLimitMiddleware
+from tgbot.middlewares.ConcurrencyMiddleware import ConcurrencyMiddleware
 from tgbot.middlewares.ConfigMiddleware import ConfigMiddleware
 from tgbot.middlewares.DatabaseMiddleware import DatabaseMiddleware
 from tgbot.middlewares.GroupsMiddleware import GroupsMiddleware
+from tgbot.middlewares.MetricsMiddleware import (
+    HandlerLabelMiddleware,
+    MetricsMiddleware,
+)
+from tgbot.middlewares.ProfilerMiddleware import ProfilerMiddleware
+from tgbot.middlewares.UpdateClassifierMiddleware import UpdateClassifierMiddleware
 from tgbot.middlewares.UsersMiddleware import UsersMiddleware
+from tgbot.services.balances import balance_ledger
+from tgbot.services.broadcast_jobs import broadcast_jobs
+from tgbot.services.broadcaster import broadcast_engine
+from tgbot.services.casino import casino_table
+from tgbot.services.commands import sync_commands
+from tgbot.services.concurrency import (
+    ConcurrencyLimiter,
+    EarlyAnswerFilter,
+    HandlerCosts,
+    configure_heavy_executor,
+)
+from tgbot.services.group_cache import groups_cache
+from tgbot.services.history import transaction_history
+from tgbot.services.leader import LeaderElection
+from tgbot.services.leaderboards import leaderboards
 from tgbot.services.logger import setup_logging
+from tgbot.services.mailing import mail_outbox
+from tgbot.services.metrics import (
+    TelegramCallsCounter,
+    instrument_engine,
+    log_summary_periodically,
+    start_metrics_server,
+)
+from tgbot.services.notifications import notification_queue
+from tgbot.services.profiler import UpdateProfiler
+from tgbot.services.rate_limit import casino_limiter
 from tgbot.services.scheduler import SchedulerManager
-
-bot_config = load_config(".env")
+from tgbot.services.schedulers.achievements import kpi_watcher
+from tgbot.services.startup import StartupReport
+from tgbot.services.statistics import player_statistics
+from tgbot.services.username_sync import username_sync
+from tgbot.services.webhook import set_webhook, start_webhook_server
 
 logger = logging.getLogger(__name__)
 
+ALLOWED_UPDATES = [
+    "message",
+    "callback_query",
+    "inline_query",
+    "my_chat_member",
+    "chat_member",
+]
+
 
 async def on_startup():
     """Функция запуска бота"""
@@ -38,6 +81,7 @@ def register_middlewares(
     bot: Bot,
     main_session_pool=None,
     kpi_session_pool=None,
+    profiler: UpdateProfiler = None,
 ):
     """
     Alternative setup with more selective middleware application.
@@ -54,6 +98,57 @@ def register_middlewares(
     users_middleware = UsersMiddleware()
     groups_middleware = GroupsMiddleware()
 
+    observers = [
+        dp.message,
+        dp.callback_query,
+        dp.inline_query,
+        dp.my_chat_member,
+        dp.chat_member,
+    ]
+
+    # Метрики и профилирование регистрируются первыми, чтобы учитывать всю цепочку
+    if config.metrics.enabled:
+        metrics_middleware = MetricsMiddleware()
+        for observer in observers:
+            observer.outer_middleware(metrics_middleware)
+
+    if profiler:
+        profiler_middleware = ProfilerMiddleware(profiler)
+        for observer in observers:
+            observer.outer_middleware(profiler_middleware)
+
+    if config.metrics.enabled or profiler:
+        handler_label_middleware = HandlerLabelMiddleware()
+        for observer in observers:
+            observer.middleware(handler_label_middleware)
+        bot.session.middleware(TelegramCallsCounter())
+
+    # Классификация сообщений до запуска цепочки с обращениями к БД
+    dp.message.outer_middleware(UpdateClassifierMiddleware())
+
+    # Лимит частоты игр в казино до занятия слотов и обращений к БД
+    casino_rate_limit_middleware = CasinoRateLimitMiddleware()
+    dp.message.outer_middleware(casino_rate_limit_middleware)
+    dp.callback_query.outer_middleware(casino_rate_limit_middleware)
+
+    # Ограничение параллельности по классу стоимости хендлера (флаг cost).
+    # Слот занимается до открытия сессий БД, чтобы ожидающие апдейты
+    # не держали соединения пула
+    limiter = ConcurrencyLimiter(
+        light=config.concurrency.light_limit,
+        db=config.concurrency.db_limit,
+        heavy=config.concurrency.heavy_limit,
+        still_working_after=config.concurrency.still_working_after,
+    )
+    configure_heavy_executor(config.concurrency.heavy_limit)
+    costs = HandlerCosts()
+    costs.index(dp)
+    for observer in observers:
+        observer.outer_middleware(
+            ConcurrencyMiddleware(limiter, costs, observer.event_name)
+        )
+    bot.session.middleware(EarlyAnswerFilter(limiter))
+
     for middleware in [
         config_middleware,
         database_middleware,
@@ -67,121 +162,260 @@ def register_middlewares(
         dp.chat_member.outer_middleware(middleware)
 
 
-def get_storage(config):
+def get_storage(redis: Redis | None):
     """
     Return storage based on the provided configuration.
 
     Args:
-        config (Config): The configuration object.
+        redis (Redis | None): Redis client, if Redis is enabled in the configuration.
 
     Returns:
         Storage: The storage object based on the configuration.
 
     """
-    if config.tg_bot.use_redis:
-        return RedisStorage.from_url(
-            config.redis.dsn(),
+    if redis is not None:
+        return RedisStorage(
+            redis=redis,
             key_builder=DefaultKeyBuilder(with_bot_id=True, with_destiny=True),
         )
     else:
         return MemoryStorage()
 
 
-async def main():
-    setup_logging()
+def get_session(config: Config) -> AiohttpSession | None:
+    """
+    Сессия бота с нестандартным адресом Bot API (например, локальной заглушкой)
+    """
+    if config.tg_bot.api_url:
+        return AiohttpSession(api=TelegramAPIServer.from_base(config.tg_bot.api_url))
+    return None
 
-    storage = get_storage(bot_config)
 
-    bot = Bot(
-        token=bot_config.tg_bot.token,
-        default=DefaultBotProperties(parse_mode="HTML", link_preview_is_disabled=True),
-    )
+async def main(
+    config: Config, worker_index: int = 0, report: StartupReport | None = None
+):
+    """
+    Запуск бота
 
-    # Определение команд для приватных чатов
-    await bot.set_my_commands(
-        commands=[BotCommand(command="start", description="Главное меню")],
-        scope=BotCommandScopeAllPrivateChats(),
-    )
-    await bot.set_my_commands(
-        commands=[
-            BotCommand(command="balance", description="Баланс баллов"),
-            BotCommand(command="top", description="Топ группы по баллам"),
-            BotCommand(command="slots", description="Сыграть в слоты"),
-            BotCommand(command="dice", description="Сыграть в кубик"),
-            BotCommand(command="darts", description="Сыграть в дартс"),
-            BotCommand(command="bowling", description="Сыграть в боулинг"),
-            BotCommand(
-                command="whois", description="Проверить информацию о сотруднике"
-            ),
-            BotCommand(
-                command="admins", description="Проверить список администраторов"
-            ),
-        ],
-        scope=BotCommandScopeAllGroupChats(),
-    )
-    await bot.set_my_commands(
-        commands=[
-            BotCommand(
-                command="whois", description="Проверить информацию о сотруднике"
-            ),
-            BotCommand(
-                command="pin", description="Закрепить сообщение (ответом на него)"
-            ),
-            BotCommand(
-                command="unpin", description="Открепить сообщение (ответом на него)"
+    :param config: Конфигурация бота, загружается один раз при старте процесса
+    :param worker_index: Номер воркера в режиме вебхука. Общие для всех
+        воркеров действия (команды, вебхук, планировщик) выполняет воркер 0
+    :param report: Отчет о времени запуска с уже замеренными этапами
+    """
+    report = report or StartupReport()
+    role = config.scheduler.role
+    is_primary = worker_index == 0
+
+    with report.phase("Логирование"):
+        setup_logging(config.logging)
+
+    with report.phase("Импорт роутеров"):
+        from tgbot.handlers import routers_list
+
+    with report.phase("Бот и хранилище FSM"):
+        redis = Redis.from_url(config.redis.dsn()) if config.tg_bot.use_redis else None
+        storage = get_storage(redis)
+
+        bot = Bot(
+            token=config.tg_bot.token,
+            session=get_session(config),
+            default=DefaultBotProperties(
+                parse_mode="HTML", link_preview_is_disabled=True
             ),
-            BotCommand(command="mute", description="Замутить пользователя"),
-            BotCommand(command="unmute", description="Размутить пользователя"),
-            BotCommand(command="ban", description="Забанить пользователя"),
-            BotCommand(command="unban", description="Разбанить пользователя"),
-            BotCommand(command="settings", description="Настройки группы"),
-            BotCommand(command="slots", description="Сыграть в слоты"),
-            BotCommand(command="dice", description="Сыграть в кубик"),
-            BotCommand(command="darts", description="Сыграть в дартс"),
-            BotCommand(command="bowling", description="Сыграть в боулинг"),
-        ],
-        scope=BotCommandScopeAllChatAdministrators(),
-    )
+        )
+        dp = Dispatcher(storage=storage)
 
-    dp = Dispatcher(storage=storage)
+    with report.phase("Подключение к БД"):
+        main_db_engine = create_engine(config.db, db_name=config.db.main_db)
+        kpi_db_engine = create_engine(config.db, db_name=config.db.kpi_db)
 
-    main_db_engine = create_engine(bot_config.db, db_name=bot_config.db.main_db)
-    kpi_db_engine = create_engine(bot_config.db, db_name=bot_config.db.kpi_db)
+        if config.metrics.enabled or config.profiling.enabled:
+            instrument_engine(main_db_engine)
+            instrument_engine(kpi_db_engine)
 
-    main_db = create_session_pool(main_db_engine)
-    kpi_db = create_session_pool(kpi_db_engine)
+        main_db = create_session_pool(main_db_engine)
+        kpi_db = create_session_pool(kpi_db_engine)
 
-    # Store session pools in dispatcher
-    dp["main_db"] = main_db
-    dp["kpi_db"] = kpi_db
+        # Store session pools in dispatcher
+        dp["main_db"] = main_db
+        dp["kpi_db"] = kpi_db
 
-    dp.include_routers(*routers_list)
+    with report.phase("Роутеры и middleware"):
+        dp.include_routers(*routers_list)
 
-    register_middlewares(dp, bot_config, bot, main_db, kpi_db)
+        profiler = None
+        if config.profiling.enabled:
+            profiler = UpdateProfiler(
+                sample_rate=config.profiling.sample_rate,
+                slow_threshold=config.profiling.slow_threshold,
+                interval=config.profiling.interval,
+                directory=config.profiling.directory,
+                max_files=config.profiling.max_files,
+            )
+            profiler.start()
+
+        register_middlewares(dp, config, bot, main_db, kpi_db, profiler)
 
     # Setup all scheduled jobs using the new scheduler manager
-    scheduler_manager = SchedulerManager()
-    scheduler_manager.setup_jobs(main_db, bot, kpi_db)
-    scheduler_manager.start()
+    scheduler_manager = None
+    if is_primary:
+        with report.phase("Планировщик"):
+            election = None
+            if redis is not None:
+                # Среди реплик с одной ролью задачи выполняет только лидер
+                election = LeaderElection(
+                    redis,
+                    name=f"scheduler:{role}",
+                    ttl=config.scheduler.leader_ttl,
+                )
+            # Отметки проверенных обновлений KPI общие для всех реплик
+            kpi_watcher.configure(redis)
+            scheduler_manager = SchedulerManager(config, election=election)
+            scheduler_manager.setup_jobs(main_db, bot, kpi_db)
+            scheduler_manager.start()
+
+    with report.phase("Фоновые сервисы"):
+        # Общий лимит скорости рассылок и список недоступных чатов
+        broadcast_engine.configure(config.broadcast, redis)
+        # Материализованные балансы пользователей
+        balance_ledger.configure(redis)
+        # Рейтинги по балансу, обновляемые вместе с балансами
+        leaderboards.configure(redis)
+        # Кеш количества транзакций для истории баланса
+        transaction_history.configure(redis)
+        # Кеш статистики профилей и групп, сбрасываемый при транзакциях
+        player_statistics.configure(redis)
+        # Сброс кеша групп во всех процессах
+        groups_cache.start(redis)
+        # Лимиты частоты игр в казино
+        casino_limiter.configure(config.casino, redis)
+        notification_queue.configure(config.notifications, redis)
+        notification_queue.start(bot)
+        # Возобновление рассылок, прерванных перезапуском
+        broadcast_jobs.start(bot, redis)
+        # Очередь писем с отправкой через общее SMTP соединение
+        await mail_outbox.start(config.mail, redis)
+        # Отложенное завершение раундов казино
+        await casino_table.start(bot, main_db, redis)
+
+        # Отложенная запись изменений юзернеймов
+        username_sync.start(main_db)
+
+        metrics_runner = None
+        metrics_summary_task = None
+        if config.metrics.enabled:
+            metrics_runner = await start_metrics_server(
+                config.metrics.host, config.metrics.port + worker_index
+            )
+            metrics_summary_task = asyncio.create_task(
+                log_summary_periodically(
+                    config.metrics.log_interval,
+                    config.metrics.n_plus_one_threshold,
+                )
+            )
 
     await on_startup()
+    webhook_runner = None
     try:
-        await dp.start_polling(
-            bot,
-            allowed_updates=[
-                "message",
-                "callback_query",
-                "inline_query",
-                "my_chat_member",
-                "chat_member",
-            ],
-        )
+        if role == "worker":
+            report.log()
+            # Процесс только выполняет запланированные задачи
+            await asyncio.Event().wait()
+            return
+
+        with report.phase("Команды и прием апдейтов"):
+            if is_primary:
+                # Команды и вебхук устанавливаются параллельно
+                await asyncio.gather(
+                    sync_commands(bot, redis),
+                    set_webhook(bot, config.webhook, ALLOWED_UPDATES)
+                    if config.webhook.enabled
+                    else bot.delete_webhook(),
+                )
+
+            if config.webhook.enabled:
+                webhook_runner = await start_webhook_server(
+                    dp, bot, config.webhook, worker_index
+                )
+        report.log()
+
+        if config.webhook.enabled:
+            await asyncio.Event().wait()
+        else:
+            await dp.start_polling(bot, allowed_updates=ALLOWED_UPDATES)
     finally:
+        if webhook_runner:
+            await webhook_runner.cleanup()
+        if scheduler_manager:
+            await scheduler_manager.shutdown()
+        if metrics_summary_task:
+            metrics_summary_task.cancel()
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        if profiler:
+            profiler.stop()
+        await username_sync.stop()
+        await broadcast_jobs.stop()
+        await notification_queue.stop()
+        await mail_outbox.stop()
+        await casino_table.stop()
+        await groups_cache.stop()
+        if redis is not None:
+            await redis.aclose()
         await main_db_engine.dispose()
 
 
-if __name__ == "__main__":
+def run_worker(
+    config: Config, worker_index: int = 0, report: StartupReport | None = None
+):
     try:
-        asyncio.run(main())
+        asyncio.run(main(config, worker_index, report))
     except (KeyboardInterrupt, SystemExit):
         logging.error("Bot was interrupted by the user!")
+
+
+def run_workers(config: Config, count: int, report: StartupReport):
+    """
+    Запуск нескольких воркеров вебхука в отдельных процессах
+    """
+    if not config.tg_bot.use_redis:
+        raise SystemExit(
+            "Для нескольких воркеров вебхука требуется USE_REDIS=True: состояния FSM должны быть общими"
+        )
+
+    processes = [
+        multiprocessing.Process(
+            target=run_worker, args=(config, index, report), name=f"worker-{index}"
+        )
+        for index in range(count)
+    ]
+    for process in processes:
+        process.start()
+
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        # В терминале SIGINT получает вся группа процессов, в контейнере - только
+        # родитель, поэтому сигнал пересылается воркерам, не завершившимся сами
+        for process in processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGINT)
+        for process in processes:
+            process.join()
+
+
+if __name__ == "__main__":
+    startup_report = StartupReport()
+    with startup_report.phase("Конфигурация"):
+        bot_config = load_config(".env")
+
+    if (
+        bot_config.webhook.enabled
+        and bot_config.webhook.workers > 1
+        and bot_config.scheduler.role != "worker"
+    ):
+        run_workers(bot_config, bot_config.webhook.workers, startup_report)
+    else:
+        run_worker(bot_config, report=startup_report)
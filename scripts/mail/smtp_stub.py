@@ -0,0 +1,171 @@
+"""
+Локальная заглушка SMTP сервера для проверки отправки писем
+
+Принимает любые учетные данные и письма, не отправляя их дальше, и считает
+количество писем и соединений. Может отвечать временной ошибкой 451
+на часть писем, чтобы проверить повторные попытки отправки.
+
+Запуск:
+    python scripts/mail/smtp_stub.py --port 1025 --save-dir /tmp/mail
+и в .env бота:
+    EMAIL_HOST=127.0.0.1
+    EMAIL_PORT=1025
+    EMAIL_USE_SSL=False
+"""
+
+import argparse
+import asyncio
+import itertools
+import random
+from pathlib import Path
+from typing import Optional
+
+connection_ids = itertools.count(1)
+stats = {"connections": 0, "messages": 0, "rejected": 0}
+
+
+class SMTPSession:
+    """
+    Обработка команд одного SMTP соединения
+    """
+
+    def __init__(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        fail_rate: float,
+        save_dir: Optional[Path],
+    ):
+        self.reader = reader
+        self.writer = writer
+        self.fail_rate = fail_rate
+        self.save_dir = save_dir
+        self.connection_id = next(connection_ids)
+        self.recipients: list[str] = []
+
+    async def reply(self, line: str) -> None:
+        self.writer.write(f"{line}\r\n".encode())
+        await self.writer.drain()
+
+    async def read_line(self) -> Optional[str]:
+        line = await self.reader.readline()
+        if not line:
+            return None
+        return line.decode(errors="replace").rstrip("\r\n")
+
+    async def read_data(self) -> bytes:
+        lines = []
+        while True:
+            line = await self.reader.readline()
+            if not line or line.rstrip(b"\r\n") == b".":
+                break
+            # Снятие точки, добавленной клиентом в начало строки
+            lines.append(line[1:] if line.startswith(b"..") else line)
+        return b"".join(lines)
+
+    async def run(self) -> None:
+        stats["connections"] += 1
+        await self.reply("220 smtp-stub ESMTP ready")
+
+        while (line := await self.read_line()) is not None:
+            command = line.split(" ", 1)[0].upper()
+
+            if command == "EHLO":
+                await self.reply("250-smtp-stub")
+                await self.reply("250-AUTH PLAIN LOGIN")
+                await self.reply("250 8BITMIME")
+            elif command == "HELO":
+                await self.reply("250 smtp-stub")
+            elif command == "AUTH":
+                parts = line.split()
+                if parts[1].upper() == "LOGIN":
+                    # Логин и пароль передаются отдельными строками,
+                    # логин может прийти сразу в команде
+                    prompts = ["UGFzc3dvcmQ6"]
+                    if len(parts) == 2:
+                        prompts.insert(0, "VXNlcm5hbWU6")
+                    for prompt in prompts:
+                        await self.reply(f"334 {prompt}")
+                        await self.read_line()
+                elif len(parts) == 2:
+                    await self.reply("334 ")
+                    await self.read_line()
+                await self.reply("235 Authentication successful")
+            elif command == "MAIL":
+                self.recipients = []
+                await self.reply("250 OK")
+            elif command == "RCPT":
+                self.recipients.append(line.split(":", 1)[-1].strip(" <>"))
+                await self.reply("250 OK")
+            elif command == "DATA":
+                await self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = await self.read_data()
+                if random.random() < self.fail_rate:
+                    stats["rejected"] += 1
+                    await self.reply("451 Temporary failure, try again later")
+                    continue
+
+                stats["messages"] += 1
+                if self.save_dir:
+                    path = self.save_dir / f"{stats['messages']:06d}.eml"
+                    path.write_bytes(data)
+                print(
+                    f"#{stats['messages']} соединение {self.connection_id}: "
+                    f"{', '.join(self.recipients)} ({len(data)} байт)"
+                )
+                await self.reply("250 OK: queued")
+            elif command == "RSET":
+                self.recipients = []
+                await self.reply("250 OK")
+            elif command == "NOOP":
+                await self.reply("250 OK")
+            elif command == "QUIT":
+                await self.reply("221 Bye")
+                break
+            else:
+                await self.reply("502 Command not implemented")
+
+        self.writer.close()
+
+
+async def main(host: str, port: int, fail_rate: float, save_dir: Optional[Path]):
+    if save_dir:
+        save_dir.mkdir(parents=True, exist_ok=True)
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            await SMTPSession(reader, writer, fail_rate, save_dir).run()
+        except ConnectionError:
+            pass
+
+    server = await asyncio.start_server(handle, host, port)
+    print(f"Заглушка SMTP запущена на {host}:{port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        print(
+            f"Соединений: {stats['connections']}, писем: {stats['messages']}, "
+            f"отклонено: {stats['rejected']}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Заглушка SMTP сервера")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1025)
+    parser.add_argument(
+        "--fail-rate",
+        type=float,
+        default=0.0,
+        help="Доля писем, отклоняемых временной ошибкой 451",
+    )
+    parser.add_argument(
+        "--save-dir", type=Path, default=None, help="Каталог для сохранения .eml"
+    )
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(main(args.host, args.port, args.fail_rate, args.save_dir))
+    except KeyboardInterrupt:
+        pass
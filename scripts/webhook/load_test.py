@@ -0,0 +1,108 @@
+"""
+Нагрузочный тест режима вебхука
+
+Отправляет на вебхук синтетические апдейты (команды /start в личных
+чатах и нажатия кнопок меню) с заданной параллельностью и выводит
+пропускную способность и время ответа вебхука.
+
+Запуск:
+    python scripts/webhook/load_test.py --url http://127.0.0.1:8080/webhook \\
+        --secret <WEBHOOK_SECRET> --updates 5000 --concurrency 100
+"""
+
+import argparse
+import asyncio
+import itertools
+import random
+import statistics
+import time
+
+import aiohttp
+
+update_ids = itertools.count(1)
+
+
+def _user(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+
+
+def build_update(users: int) -> dict:
+    user_id = random.randint(1, users)
+    update_id = next(update_ids)
+    chat = {"id": user_id, "type": "private"}
+
+    if random.random() < 0.5:
+        return {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": chat,
+                "from": _user(user_id),
+                "text": "/start",
+                "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+            },
+        }
+
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": _user(user_id),
+            "chat_instance": str(user_id),
+            "data": random.choice(["menu:main", "menu:schedule", "menu:kpi"]),
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": chat,
+                "from": {"id": 1, "is_bot": True, "first_name": "stub"},
+                "text": "Меню",
+            },
+        },
+    }
+
+
+async def run(url: str, secret: str, updates: int, concurrency: int, users: int):
+    latencies: list[float] = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret else {}
+
+    async with aiohttp.ClientSession(headers=headers) as session:
+
+        async def send_one():
+            nonlocal errors
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    async with session.post(url, json=build_update(users)) as response:
+                        if response.status != 200:
+                            errors += 1
+                except aiohttp.ClientError:
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        started_at = time.perf_counter()
+        await asyncio.gather(*(send_one() for _ in range(updates)))
+        elapsed = time.perf_counter() - started_at
+
+    latencies.sort()
+    print(f"Апдейтов: {updates}, ошибок: {errors}, время: {elapsed:.2f}с")
+    print(f"Пропускная способность: {updates / elapsed:.1f} апдейтов/с")
+    print(
+        f"Время ответа: p50 {statistics.median(latencies) * 1000:.1f}мс, "
+        f"p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f}мс, "
+        f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f}мс"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Нагрузочный тест вебхука")
+    parser.add_argument("--url", default="http://127.0.0.1:8080/webhook")
+    parser.add_argument("--secret", default="")
+    parser.add_argument("--updates", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--users", type=int, default=500)
+    args = parser.parse_args()
+
+    asyncio.run(run(args.url, args.secret, args.updates, args.concurrency, args.users))
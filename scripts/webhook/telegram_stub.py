@@ -0,0 +1,143 @@
+"""
+Локальная заглушка Bot API для нагрузочного тестирования режима вебхука
+
+Отвечает на вызовы методов правдоподобными объектами, не обращаясь
+к Telegram, и считает количество вызовов по методам (GET /stats).
+
+Запуск:
+    python scripts/webhook/telegram_stub.py --port 8090
+и в .env бота:
+    TELEGRAM_API_URL=http://127.0.0.1:8090
+"""
+
+import argparse
+import asyncio
+import itertools
+import time
+from collections import Counter
+
+from aiohttp import web
+
+BOT_USER = {
+    "id": 1,
+    "is_bot": True,
+    "first_name": "stub",
+    "username": "stub_bot",
+    "can_join_groups": True,
+    "can_read_all_group_messages": True,
+    "supports_inline_queries": True,
+}
+
+MESSAGE_METHODS = (
+    "send",
+    "edit",
+    "copymessage",
+    "forwardmessage",
+    "stopmessagelivelocation",
+)
+
+message_ids = itertools.count(1)
+calls: Counter = Counter()
+started_at = time.monotonic()
+
+
+def _chat(chat_id) -> dict:
+    try:
+        chat_id = int(chat_id)
+    except (TypeError, ValueError):
+        chat_id = 1
+    return {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"}
+
+
+def _message(params: dict) -> dict:
+    message = {
+        "message_id": int(params.get("message_id") or next(message_ids)),
+        "date": int(time.time()),
+        "chat": _chat(params.get("chat_id")),
+        "from": BOT_USER,
+    }
+    if "text" in params:
+        message["text"] = params["text"]
+    return message
+
+
+def build_result(method: str, params: dict):
+    """
+    Результат вызова метода Bot API
+    """
+    method = method.lower()
+
+    if method == "getme":
+        return BOT_USER
+    if method == "getchat":
+        return _chat(params.get("chat_id"))
+    if method == "getchatmember":
+        return {
+            "status": "member",
+            "user": {
+                "id": int(params.get("user_id", 1)),
+                "is_bot": False,
+                "first_name": "user",
+            },
+        }
+    if method == "getchatadministrators":
+        return []
+    if method == "getwebhookinfo":
+        return {"url": "", "has_custom_certificate": False, "pending_update_count": 0}
+    if method in ("getupdates", "getmycommands"):
+        return []
+    if method == "sendmediagroup":
+        return [_message(params)]
+    if method == "copymessage":
+        return {"message_id": next(message_ids)}
+    if method.startswith(MESSAGE_METHODS):
+        if method.startswith("edit") and params.get("inline_message_id"):
+            return True
+        return _message(params)
+    return True
+
+
+async def handle_method(request: web.Request) -> web.Response:
+    method = request.match_info["method"]
+    if request.content_type == "application/json":
+        params = await request.json()
+    else:
+        params = dict(await request.post())
+
+    calls[method] += 1
+    if request.app["latency"]:
+        await asyncio.sleep(request.app["latency"])
+
+    return web.json_response({"ok": True, "result": build_result(method, params)})
+
+
+async def handle_stats(request: web.Request) -> web.Response:
+    elapsed = time.monotonic() - started_at
+    total = sum(calls.values())
+    return web.json_response(
+        {
+            "total": total,
+            "per_second": round(total / elapsed, 2) if elapsed else 0,
+            "methods": dict(calls.most_common()),
+        }
+    )
+
+
+def create_app(latency: float = 0.0) -> web.Application:
+    app = web.Application()
+    app["latency"] = latency
+    app.router.add_post("/bot{token}/{method}", handle_method)
+    app.router.add_get("/stats", handle_stats)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Заглушка Telegram Bot API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument(
+        "--latency", type=float, default=0.05, help="Задержка ответа в секундах"
+    )
+    args = parser.parse_args()
+
+    web.run_app(create_app(args.latency), host=args.host, port=args.port)
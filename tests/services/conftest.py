@@ -0,0 +1,20 @@
+from types import SimpleNamespace
+
+import pytest
+
+
+@pytest.fixture(params=["memory", "redis"])
+def redis(request):
+    """Run a test with the in-process cache and again on fakeredis"""
+    if request.param == "memory":
+        return None
+    fakeredis = pytest.importorskip("fakeredis")
+    # Lua scripts run on fakeredis through lupa
+    pytest.importorskip("lupa")
+    return fakeredis.aioredis.FakeRedis()
+
+
+@pytest.fixture
+def stp_repo():
+    """Repository for code paths that never reach the database session"""
+    return SimpleNamespace(session=None)
@@ -0,0 +1,218 @@
+import asyncio
+import json
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("stp_database")
+pytest.importorskip("pandas")
+
+from sqlalchemy import Column, MetaData, Table, create_engine, insert  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+from stp_database import Employee  # noqa: E402
+
+from tgbot.services.schedulers.achievements import (  # noqa: E402
+    _evaluate_achievements,
+    _get_playing_users,
+)
+
+EXTRACTED = datetime(2025, 1, 10)
+NO_RECEIVED = (set(), set())
+
+
+def user(user_id, division="НТП1", position="Специалист"):
+    return SimpleNamespace(
+        user_id=user_id,
+        fullname=f"Сотрудник {user_id}",
+        division=division,
+        position=position,
+    )
+
+
+def kpi(**values):
+    return SimpleNamespace(kpi_extract_date=EXTRACTED, **values)
+
+
+def achievement(achievement_id, criteria, division="ALL", position="ALL"):
+    return SimpleNamespace(
+        id=achievement_id,
+        name=f"Достижение {achievement_id}",
+        description="",
+        reward=10,
+        kpi=json.dumps(criteria) if isinstance(criteria, dict) else criteria,
+        division=division,
+        position=position,
+    )
+
+
+def earned(awards):
+    """Achievement IDs by user ID"""
+    return {
+        user_id: [award["id"] for award in user_awards]
+        for user_id, (_, user_awards) in awards.items()
+    }
+
+
+class TestEvaluateAchievements:
+    """Test cases for the batch check of achievement criteria"""
+
+    def test_awards_users_within_all_ranges(self):
+        """Test that every range of the criteria must be met, bounds included"""
+        users = [user(1), user(2), user(3)]
+        kpi_by_name = {
+            "Сотрудник 1": kpi(aht=700, contacts_count=20),
+            "Сотрудник 2": kpi(aht=741, contacts_count=50),
+            "Сотрудник 3": kpi(aht=740, contacts_count=19),
+        }
+        achievements = [achievement(1, {"AHT": [0, 740], "CC": [20, 99999]})]
+
+        awards = _evaluate_achievements(users, kpi_by_name, achievements, NO_RECEIVED)
+
+        assert earned(awards) == {1: [1]}
+        (award,) = awards[1][1]
+        assert award["kpi_values"] == {"AHT": 700, "Контактов": 20}
+        assert award["kpi_extract_date"] == EXTRACTED
+        assert award["reward_points"] == 10
+
+    def test_missing_kpi_values_do_not_match(self):
+        """Test that empty or missing KPI values fail the range"""
+        users = [user(1), user(2)]
+        kpi_by_name = {"Сотрудник 1": kpi(aht=None), "Сотрудник 2": kpi()}
+        achievements = [achievement(1, {"AHT": [0, 740]})]
+
+        assert (
+            _evaluate_achievements(users, kpi_by_name, achievements, NO_RECEIVED) == {}
+        )
+
+    def test_users_without_kpi_are_skipped(self):
+        """Test that a user without a KPI row does not stop the check"""
+        users = [user(1), user(2)]
+        kpi_by_name = {"Сотрудник 2": kpi(csi=5)}
+        achievements = [achievement(1, {"CSI": [4, 5]})]
+
+        awards = _evaluate_achievements(users, kpi_by_name, achievements, NO_RECEIVED)
+
+        assert earned(awards) == {2: [1]}
+
+    def test_division_and_position_filters(self):
+        """Test that НТП covers НТП1/НТП2 and position must match exactly"""
+        users = [
+            user(1, division="НТП1"),
+            user(2, division="НТП2", position="Ведущий специалист"),
+            user(3, division="НЦК"),
+        ]
+        kpi_by_name = {f"Сотрудник {i}": kpi(flr=90) for i in (1, 2, 3)}
+        achievements = [
+            achievement(1, {"FLR": [80, 100]}, division="НТП"),
+            achievement(2, {"FLR": [80, 100]}, division="НЦК"),
+            achievement(3, {"FLR": [80, 100]}, position="Ведущий специалист"),
+        ]
+
+        awards = _evaluate_achievements(users, kpi_by_name, achievements, NO_RECEIVED)
+
+        assert earned(awards) == {1: [1], 2: [1, 3], 3: [2]}
+
+    def test_received_achievements_are_not_repeated(self):
+        """Test both protections: same KPI extract date and recent award"""
+        users = [user(1), user(2), user(3)]
+        kpi_by_name = {f"Сотрудник {i}": kpi(pok=100) for i in (1, 2, 3)}
+        achievements = [achievement(1, {"POK": [90, 100]})]
+        received = (
+            {
+                (1, 1, EXTRACTED),
+                # Received for older KPI data, can be earned again
+                (2, 1, datetime(2025, 1, 3)),
+            },
+            {(3, 1)},
+        )
+
+        awards = _evaluate_achievements(users, kpi_by_name, achievements, received)
+
+        assert earned(awards) == {2: [1]}
+
+    def test_invalid_criteria_are_skipped(self):
+        """Test that broken or unknown criteria do not award or fail the check"""
+        users = [user(1)]
+        kpi_by_name = {"Сотрудник 1": kpi(delay=1)}
+        achievements = [
+            achievement(1, "{not json"),
+            achievement(2, {"Unknown": [0, 10]}),
+            achievement(3, {"DELAY": [0, 5]}),
+        ]
+
+        awards = _evaluate_achievements(users, kpi_by_name, achievements, NO_RECEIVED)
+
+        assert earned(awards) == {1: [3]}
+
+
+# (id, user_id, fullname, role)
+EMPLOYEES = [
+    (1, 1, "Иванов Иван Иванович", 1),
+    (2, 2, "Петров Петр Петрович", 3),
+    (3, None, "Сидоров Сидор Сидорович", 1),
+    (4, 4, "Кузнецов Кузьма Кузьмич", 2),
+    (5, 5, "Смирнов Семен Семенович", 10),
+]
+
+
+class AsyncSession:
+    """Awaitable facade over a synchronous SQLite session that counts queries"""
+
+    def __init__(self, session: Session):
+        self.session = session
+        self.queries = 0
+
+    async def scalars(self, query):
+        self.queries += 1
+        return self.session.scalars(query)
+
+
+@pytest.fixture
+def stp_repo():
+    columns = ("id", "user_id", "fullname", "role")
+    engine = create_engine("sqlite://")
+    metadata = MetaData()
+    # The query loads whole employees, other columns are left empty
+    table = Table(
+        Employee.__table__.name,
+        metadata,
+        *(
+            Column(
+                column.name,
+                column.type.as_generic(),
+                primary_key=column.name == "id",
+                nullable=True,
+            )
+            for column in Employee.__table__.columns
+        ),
+    )
+    metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(
+            insert(table),
+            [dict(zip(columns, employee, strict=True)) for employee in EMPLOYEES],
+        )
+    with Session(engine) as session:
+        yield SimpleNamespace(session=AsyncSession(session))
+
+
+class TestPlayingUsers:
+    """Test cases for loading the players of the achievement check"""
+
+    def test_registered_players_only(self, stp_repo):
+        """Test that other roles and employees without a Telegram ID are skipped"""
+        users = asyncio.run(_get_playing_users(stp_repo))
+        assert sorted(user.user_id for user in users) == [1, 2, 5]
+        assert stp_repo.session.queries == 1
+
+    def test_fullnames_are_filtered_in_the_query(self, stp_repo):
+        fullnames = {
+            "Петров Петр Петрович",
+            "Сидоров Сидор Сидорович",
+            "Кузнецов Кузьма Кузьмич",
+            "Уволенный Сотрудник",
+        }
+        users = asyncio.run(_get_playing_users(stp_repo, fullnames))
+        assert [user.user_id for user in users] == [2]
+        assert stp_repo.session.queries == 1
@@ -0,0 +1,247 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("stp_database")
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")
+
+from tgbot.services.balances import (  # noqa: E402
+    BALANCE_KEY,
+    FILL_SCRIPT,
+    HOLD_KEY,
+    INCREMENT_SCRIPT,
+    RESERVE_SCRIPT,
+    VERSION_KEY,
+    Balance,
+    BalanceLedger,
+    transaction_delta,
+)
+
+
+class FakeJournal:
+    """Transaction totals by user that stand in for the database"""
+
+    def __init__(self, balances):
+        self.balances = dict(balances)
+        self.computed = 0
+        # Called after the totals were read, before the ledger stores them
+        self.on_compute = None
+
+    async def compute(self, session, user_ids=None):
+        self.computed += 1
+        totals = {
+            user_id: self.balances.get(user_id, Balance())
+            for user_id in (user_ids or self.balances)
+        }
+        if self.on_compute is not None:
+            on_compute, self.on_compute = self.on_compute, None
+            await on_compute()
+        return totals
+
+
+def make_ledger(journal, redis=None) -> BalanceLedger:
+    ledger = BalanceLedger()
+    ledger.configure(redis)
+    ledger._compute = journal.compute
+    return ledger
+
+
+class TestTransactionDelta:
+    """Test cases for transaction_delta"""
+
+    def test_achievement_earns_balance_and_achievements(self):
+        assert transaction_delta("earn", "achievement", 50) == Balance(50, 50)
+
+    def test_other_earnings_do_not_count_as_achievements(self):
+        assert transaction_delta("earn", "casino", 30) == Balance(30, 0)
+        assert transaction_delta("earn", "product", 10) == Balance(10, 0)
+
+    def test_spend_decreases_balance_only(self):
+        assert transaction_delta("spend", "product", 40) == Balance(-40, 0)
+        assert transaction_delta("spend", "achievement", 5) == Balance(-5, 0)
+
+
+class TestScripts:
+    """Test cases for the balance Lua scripts"""
+
+    @pytest.fixture
+    def server(self):
+        return fakeredis.aioredis.FakeRedis()
+
+    def test_increment_changes_only_cached_balances(self, server):
+        """Test that INCREMENT skips missing balances but bumps every counter"""
+
+        async def scenario():
+            await server.hset(
+                BALANCE_KEY.format(user_id=1),
+                mapping={"balance": 10, "achievements": 5},
+            )
+            increment = server.register_script(INCREMENT_SCRIPT)
+            keys = []
+            for user_id in (1, 2):
+                keys += [
+                    BALANCE_KEY.format(user_id=user_id),
+                    VERSION_KEY.format(user_id=user_id),
+                ]
+            await increment(keys=keys, args=[3, 1, 7, 0, 3600])
+            return (
+                await server.hgetall(BALANCE_KEY.format(user_id=1)),
+                await server.exists(BALANCE_KEY.format(user_id=2)),
+                await server.mget(
+                    VERSION_KEY.format(user_id=1), VERSION_KEY.format(user_id=2)
+                ),
+            )
+
+        cached, missing, versions = asyncio.run(scenario())
+        assert cached == {b"balance": b"13", b"achievements": b"6"}
+        assert missing == 0
+        assert versions == [b"1", b"1"]
+
+    def test_fill_skips_existing_and_changed_balances(self, server):
+        """Test that FILL writes only missing balances with an unchanged counter"""
+
+        async def scenario():
+            await server.hset(
+                BALANCE_KEY.format(user_id=1),
+                mapping={"balance": 10, "achievements": 0},
+            )
+            await server.set(VERSION_KEY.format(user_id=3), 2)
+            fill = server.register_script(FILL_SCRIPT)
+            keys = []
+            for user_id in (1, 2, 3):
+                keys += [
+                    BALANCE_KEY.format(user_id=user_id),
+                    VERSION_KEY.format(user_id=user_id),
+                ]
+            # Counters read before computing: 0, 0 and 1 (user 3 changed since)
+            changed = await fill(
+                keys=keys, args=[99, 0, 60, 0, 20, 5, 60, 0, 30, 0, 60, 1]
+            )
+            return changed, [
+                await server.hget(BALANCE_KEY.format(user_id=user_id), "balance")
+                for user_id in (1, 2, 3)
+            ]
+
+        changed, balances = asyncio.run(scenario())
+        assert changed == [3]
+        assert balances == [b"10", b"20", None]
+
+    def test_reserve_counts_existing_holds(self, server):
+        """Test that RESERVE checks the balance minus the other holds"""
+
+        async def scenario():
+            reserve = server.register_script(RESERVE_SCRIPT)
+            keys = [BALANCE_KEY.format(user_id=1), HOLD_KEY.format(user_id=1)]
+            missing = await reserve(keys=keys, args=[10, 60, "a"])
+            await server.hset(keys[0], mapping={"balance": 100, "achievements": 0})
+            results = [
+                await reserve(keys=keys, args=[40, 60, hold_id])
+                for hold_id in ("a", "b", "c")
+            ]
+            return missing, results, await server.hgetall(keys[1])
+
+        missing, results, holds = asyncio.run(scenario())
+        assert missing is None
+        assert results == [[1, 100], [1, 60], [0, 20]]
+        assert holds == {b"a": b"40", b"b": b"40"}
+
+
+class TestBalanceLedger:
+    """Test cases for BalanceLedger in memory and in Redis"""
+
+    def test_get_computes_once_and_applies_deltas(self, redis, stp_repo):
+        """Test that a cached balance changes with transactions without a query"""
+        journal = FakeJournal({1: Balance(100, 20)})
+        ledger = make_ledger(journal, redis)
+
+        async def scenario():
+            first = await ledger.get(stp_repo, 1)
+            await ledger.apply({1: transaction_delta("spend", "product", 30)})
+            return first, await ledger.get(stp_repo, 1)
+
+        assert asyncio.run(scenario()) == (Balance(100, 20), Balance(70, 20))
+        assert journal.computed == 1
+
+    def test_transaction_during_compute_is_not_lost(self, redis, stp_repo):
+        """Test that a balance computed before a concurrent transaction is not cached"""
+        journal = FakeJournal({1: Balance(100, 0)})
+        ledger = make_ledger(journal, redis)
+
+        async def concurrent_spend():
+            journal.balances[1] = Balance(70, 0)
+            await ledger.apply({1: Balance(-30, 0)})
+
+        journal.on_compute = concurrent_spend
+
+        async def scenario():
+            return await ledger.get(stp_repo, 1), await ledger.get(stp_repo, 1)
+
+        assert asyncio.run(scenario()) == (Balance(70, 0), Balance(70, 0))
+
+    def test_reserve_holds_until_release(self, redis, stp_repo):
+        """Test that reserved amounts are unavailable until released"""
+        ledger = make_ledger(FakeJournal({1: Balance(100, 0)}), redis)
+
+        async def scenario():
+            first = await ledger.reserve(stp_repo, 1, 60, "bet-1")
+            second = await ledger.reserve(stp_repo, 1, 60, "bet-2")
+            available = await ledger.get_balance(stp_repo, 1)
+            await ledger.release(1, "bet-1")
+            return first, second, available, await ledger.get_balance(stp_repo, 1)
+
+        assert asyncio.run(scenario()) == ((True, 100), (False, 40), 40, 100)
+
+    def test_hold_is_idempotent(self, redis, stp_repo):
+        """Test that holding the same operation twice reserves the amount once"""
+        ledger = make_ledger(FakeJournal({1: Balance(100, 0)}), redis)
+
+        async def scenario():
+            await ledger.hold(1, "round", 30)
+            await ledger.hold(1, "round", 30)
+            return await ledger.get_balance(stp_repo, 1)
+
+        assert asyncio.run(scenario()) == 70
+
+    def test_concurrent_reserves_do_not_overspend(self, redis, stp_repo):
+        """Test that concurrent reserves cannot spend the same points"""
+        ledger = make_ledger(FakeJournal({1: Balance(100, 0)}), redis)
+
+        async def scenario():
+            await ledger.get(stp_repo, 1)
+            return await asyncio.gather(
+                *(ledger.reserve(stp_repo, 1, 30, f"bet-{i}") for i in range(5))
+            )
+
+        results = asyncio.run(scenario())
+        assert sum(reserved for reserved, _ in results) == 3
+
+    def test_reconcile_fixes_drift(self, stp_repo):
+        """Test that reconcile replaces cached balances that differ from the journal"""
+        journal = FakeJournal({1: Balance(100, 0), 2: Balance(50, 0)})
+        ledger = make_ledger(journal, fakeredis.aioredis.FakeRedis())
+        deltas = []
+
+        async def listener(changes):
+            deltas.append(changes)
+
+        ledger.subscribe(listener)
+
+        class SessionPool:
+            async def __aenter__(self):
+                return None
+
+            async def __aexit__(self, *args):
+                return False
+
+        async def scenario():
+            await ledger.get_many(stp_repo, [1, 2])
+            # Drift: the journal changed without a transaction through the ledger
+            journal.balances[1] = Balance(120, 0)
+            fixed = await ledger.reconcile(SessionPool)
+            return fixed, await ledger.get_many(stp_repo, [1, 2])
+
+        fixed, balances = asyncio.run(scenario())
+        assert fixed == 1
+        assert balances == {1: Balance(120, 0), 2: Balance(50, 0)}
+        assert deltas == [{1: Balance(20, 0)}]
@@ -0,0 +1,131 @@
+import asyncio
+import time
+
+import pytest
+
+from tgbot.services.broadcaster import (
+    BULK,
+    TRANSACTIONAL,
+    SharedTokenBucket,
+    TokenBucket,
+)
+
+
+def shared_buckets(count: int, rate: float, capacity: int) -> list[SharedTokenBucket]:
+    """Buckets of several bot processes that share one Redis server"""
+    fakeredis = pytest.importorskip("fakeredis")
+    # Lua scripts run on fakeredis through lupa
+    pytest.importorskip("lupa")
+    server = fakeredis.FakeServer()
+    return [
+        SharedTokenBucket(rate, capacity, fakeredis.aioredis.FakeRedis(server=server))
+        for _ in range(count)
+    ]
+
+
+class FailingScript:
+    """Registered script whose Redis connection is lost"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def __call__(self, keys, args):
+        self.calls += 1
+        raise ConnectionError("redis is unavailable")
+
+
+class TestTokenBucket:
+    """Test cases for the in-process token bucket"""
+
+    def test_notices_overtake_mailings(self):
+        """Test that waiting notices get tokens before mailings queued earlier"""
+        bucket = TokenBucket(rate=100, capacity=1)
+        order = []
+
+        async def send(name: str, priority: int):
+            await bucket.acquire(priority)
+            order.append(name)
+
+        async def scenario():
+            await bucket.acquire()
+            await asyncio.gather(
+                send("mailing 1", BULK),
+                send("mailing 2", BULK),
+                send("notice", TRANSACTIONAL),
+            )
+
+        asyncio.run(scenario())
+        assert order == ["notice", "mailing 1", "mailing 2"]
+
+    def test_cancelled_waiter_does_not_take_token(self):
+        bucket = TokenBucket(rate=100, capacity=1)
+        order = []
+
+        async def send(name: str, priority: int):
+            await bucket.acquire(priority)
+            order.append(name)
+
+        async def scenario():
+            await bucket.acquire()
+            cancelled = asyncio.create_task(send("notice", TRANSACTIONAL))
+            waiting = asyncio.create_task(send("mailing", BULK))
+            await asyncio.sleep(0)
+            cancelled.cancel()
+            await waiting
+
+        asyncio.run(scenario())
+        assert order == ["mailing"]
+
+    def test_pause_delays_next_token(self):
+        """Test that flood control stops the bucket for retry_after"""
+        bucket = TokenBucket(rate=1000, capacity=10)
+
+        async def scenario():
+            await bucket.pause(0.1)
+            started = time.monotonic()
+            await bucket.acquire(TRANSACTIONAL)
+            return time.monotonic() - started
+
+        assert asyncio.run(scenario()) >= 0.09
+
+
+class TestSharedTokenBucket:
+    """Test cases for the token bucket shared through Redis"""
+
+    def test_tokens_are_shared_between_processes(self):
+        first, second = shared_buckets(2, rate=1, capacity=1)
+
+        async def scenario():
+            return await first._take(), await second._take()
+
+        taken, wait = asyncio.run(scenario())
+        assert taken == 0
+        assert 0 < wait <= 1
+
+    def test_pause_is_shared_between_processes(self):
+        """Test that flood control in one process pauses the others"""
+        first, second = shared_buckets(2, rate=1000, capacity=10)
+
+        async def scenario():
+            await first.pause(5)
+            return await second._take()
+
+        assert 4 < asyncio.run(scenario()) <= 5
+
+    def test_local_bucket_is_used_when_redis_fails(self):
+        """Test that a Redis outage does not stop delivery or the rate limit"""
+        (bucket,) = shared_buckets(1, rate=1, capacity=1)
+        bucket._shared_take = FailingScript()
+        bucket._shared_pause = FailingScript()
+
+        async def scenario():
+            await bucket.acquire(TRANSACTIONAL)
+            wait = await bucket._take()
+            await bucket.pause(5)
+            return wait, await bucket._take()
+
+        wait, paused = asyncio.run(scenario())
+        assert 0 < wait <= 1
+        assert 4 < paused <= 5
+        assert bucket._shared_take.calls == 3
+        assert bucket._shared_pause.calls == 1
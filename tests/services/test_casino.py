@@ -0,0 +1,269 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("stp_database")
+fakeredis = pytest.importorskip("fakeredis")
+
+from tgbot.services import casino  # noqa: E402
+from tgbot.services.balances import Balance, BalanceLedger  # noqa: E402
+from tgbot.services.casino import (  # noqa: E402
+    GROUP,
+    ROUNDS_KEY,
+    CasinoRound,
+    CasinoTable,
+)
+
+
+class FakeDatabase:
+    """Transaction journal that stands in for MainRequestsRepo"""
+
+    def __init__(self, balance: int, failures: int = 0):
+        self.balance = balance
+        self.failures = failures
+        # Writes that succeed, but whose response is lost
+        self.lost_responses = 0
+        self.transactions = []
+
+    def repo(self, session):
+        return SimpleNamespace(
+            session=SimpleNamespace(execute=self.execute),
+            transaction=SimpleNamespace(add_transaction=self.add_transaction),
+        )
+
+    async def add_transaction(self, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("database is unavailable")
+        self.transactions.append(kwargs)
+        sign = 1 if kwargs["transaction_type"] == "earn" else -1
+        self.balance += sign * kwargs["amount"]
+        if self.lost_responses:
+            self.lost_responses -= 1
+            raise ConnectionError("connection lost after commit")
+        return SimpleNamespace(**kwargs), self.balance
+
+    async def execute(self, query):
+        """Answers the lookup of a round transaction by its comment marker"""
+        suffixes = [
+            value
+            for value in query.compile().params.values()
+            if isinstance(value, str) and value.startswith("#")
+        ]
+        found = any(
+            t["comment"].endswith(suffix)
+            for t in self.transactions
+            for suffix in suffixes
+        )
+        return SimpleNamespace(scalar_one_or_none=lambda: 1 if found else None)
+
+    async def compute(self, session, user_ids=None):
+        return {user_id: Balance(self.balance, 0) for user_id in user_ids}
+
+
+class SessionPool:
+    def __call__(self):
+        return self
+
+    async def __aenter__(self):
+        return None
+
+    async def __aexit__(self, *args):
+        return False
+
+
+@pytest.fixture
+def database(monkeypatch):
+    database = FakeDatabase(balance=100)
+    ledger = BalanceLedger()
+    ledger._compute = database.compute
+    monkeypatch.setattr(casino, "balance_ledger", ledger)
+    monkeypatch.setattr(casino, "MainRequestsRepo", database.repo)
+    monkeypatch.setattr(casino, "DEFAULT_ANIMATION_DELAY", 0.01)
+    monkeypatch.setattr(casino, "RESTORE_GRACE", 0.01)
+    monkeypatch.setattr(casino, "SETTLE_RETRY_DELAY", 0.02)
+    return database
+
+
+def make_round(**kwargs) -> CasinoRound:
+    values = dict(
+        user_id=1,
+        chat_id=-100,
+        mode=GROUP,
+        game_type="slots",
+        game_name="слотах",
+        bet=40,
+        result_text="🍋🍋🍋",
+        multiplier=2.5,
+        balance_before=100,
+    )
+    values.update(kwargs)
+    return CasinoRound(**values)
+
+
+async def make_table(redis=None) -> tuple[CasinoTable, list]:
+    table = CasinoTable()
+    results = []
+
+    @table.renderer(GROUP)
+    async def render(bot, casino_round, new_balance):
+        results.append((casino_round.round_id, new_balance))
+
+    await table.start(None, SessionPool(), redis)
+    return table, results
+
+
+class TestCasinoTable:
+    """Test cases for the deferred settlement of casino rounds"""
+
+    def test_round_settles_after_animation(self, database):
+        """Test that the result is written once and the bet hold is released"""
+
+        async def scenario():
+            redis = fakeredis.aioredis.FakeRedis()
+            casino.balance_ledger.configure(redis)
+            table, results = await make_table(redis)
+            casino_round = make_round()
+            reserved = await casino.balance_ledger.reserve(
+                database.repo(None), 1, casino_round.bet, casino_round.round_id
+            )
+            await table.play(casino_round)
+            stored = await redis.hlen(ROUNDS_KEY)
+            await asyncio.sleep(0.1)
+            return (
+                reserved,
+                stored,
+                results,
+                await redis.hlen(ROUNDS_KEY),
+                await casino.balance_ledger.get_balance(database.repo(None), 1),
+                casino_round.round_id,
+            )
+
+        reserved, stored, results, left, available, round_id = asyncio.run(scenario())
+        assert reserved == (True, 100)
+        assert stored == 1
+        assert results == [(round_id, 160)]
+        assert left == 0
+        assert available == 160
+        assert [t["transaction_type"] for t in database.transactions] == ["earn"]
+        assert database.transactions[0]["amount"] == 60
+
+    def test_loss_and_consolation_amounts(self, database):
+        """Test the transaction written for a loss and for a partial return"""
+
+        async def scenario():
+            table, _ = await make_table()
+            await table.play(make_round(multiplier=0))
+            await table.play(make_round(multiplier=0.5))
+            await asyncio.sleep(0.1)
+
+        asyncio.run(scenario())
+        amounts = [(t["transaction_type"], t["amount"]) for t in database.transactions]
+        assert amounts == [("spend", 40), ("spend", 20)]
+
+    def test_restored_round_is_claimed_once(self, database):
+        """Test that two processes restoring one round write it once"""
+
+        async def scenario():
+            server = fakeredis.FakeServer()
+            redis = fakeredis.aioredis.FakeRedis(server=server)
+            casino.balance_ledger.configure(redis)
+            casino_round = make_round(due=0)
+            await redis.hset(ROUNDS_KEY, casino_round.round_id, casino_round.dump())
+
+            tables = [
+                await make_table(fakeredis.aioredis.FakeRedis(server=server))
+                for _ in range(2)
+            ]
+            await asyncio.sleep(0.1)
+            return [results for _, results in tables]
+
+        results = asyncio.run(scenario())
+        assert sum(len(table_results) for table_results in results) == 1
+        assert len(database.transactions) == 1
+
+    def test_failed_settlement_is_retried(self, database):
+        """Test that a failed write keeps the round and the hold until it succeeds"""
+        database.failures = 2
+
+        async def scenario():
+            redis = fakeredis.aioredis.FakeRedis()
+            casino.balance_ledger.configure(redis)
+            table, results = await make_table(redis)
+            casino_round = make_round()
+            await casino.balance_ledger.reserve(
+                database.repo(None), 1, casino_round.bet, casino_round.round_id
+            )
+            await table.play(casino_round)
+
+            await asyncio.sleep(0.03)
+            during_retry = (
+                await redis.hexists(ROUNDS_KEY, casino_round.round_id),
+                await casino.balance_ledger.get_balance(database.repo(None), 1),
+            )
+            await asyncio.sleep(0.2)
+            return during_retry, casino_round.attempts, results
+
+        during_retry, attempts, results = asyncio.run(scenario())
+        assert during_retry == (True, 60)
+        assert attempts == 2
+        assert [balance for _, balance in results] == [160]
+        assert len(database.transactions) == 1
+
+    def test_retry_after_lost_response_writes_once(self, database):
+        """Test that a retry finds the transaction written by the failed attempt"""
+        database.lost_responses = 1
+
+        async def scenario():
+            table, results = await make_table()
+            casino_round = make_round()
+            await table.play(casino_round)
+            await asyncio.sleep(0.2)
+            return casino_round, results
+
+        casino_round, results = asyncio.run(scenario())
+        assert casino_round.attempts == 1
+        assert len(database.transactions) == 1
+        assert database.transactions[0]["comment"].endswith(casino_round.marker)
+        assert results == [(casino_round.round_id, 160)]
+
+    def test_claim_error_defers_round(self, database):
+        """Test that a round is not settled while Redis cannot confirm the claim"""
+
+        async def scenario():
+            redis = fakeredis.aioredis.FakeRedis()
+            table, results = await make_table(redis)
+            hdel = redis.hdel
+            failures = [ConnectionError("redis is down")]
+
+            async def failing_hdel(*args):
+                if failures:
+                    raise failures.pop()
+                return await hdel(*args)
+
+            redis.hdel = failing_hdel
+            casino_round = make_round()
+            await table.play(casino_round)
+            await asyncio.sleep(0.015)
+            deferred = (len(database.transactions), results[:])
+            await asyncio.sleep(0.1)
+            return deferred, results
+
+        deferred, results = asyncio.run(scenario())
+        assert deferred == (0, [])
+        assert len(results) == 1
+        assert len(database.transactions) == 1
+
+    def test_stop_settles_pending_rounds(self, database, monkeypatch):
+        """Test that stop settles rounds without waiting for the animation"""
+        monkeypatch.setattr(casino, "DEFAULT_ANIMATION_DELAY", 60)
+
+        async def scenario():
+            table, results = await make_table()
+            await table.play(make_round())
+            await table.stop()
+            return results
+
+        assert len(asyncio.run(scenario())) == 1
+        assert len(database.transactions) == 1
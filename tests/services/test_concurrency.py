@@ -0,0 +1,229 @@
+import asyncio
+
+from aiogram import F, Router
+from aiogram.filters import BaseFilter
+from aiogram.filters.callback_data import CallbackData
+from aiogram.methods import AnswerCallbackQuery, SendMessage
+from aiogram.types import CallbackQuery, Chat, Message, User
+
+from tgbot.services.concurrency import (
+    COST_DB,
+    COST_HEAVY,
+    COST_LIGHT,
+    HEAVY,
+    LIGHT,
+    ConcurrencyLimiter,
+    EarlyAnswerFilter,
+    FairSemaphore,
+    HandlerCosts,
+)
+
+USER = User(id=1, is_bot=False, first_name="Иван")
+
+
+class Menu(CallbackData, prefix="menu"):
+    menu: str
+
+
+class Page(CallbackData, prefix="page"):
+    page: int
+
+
+class RoleFilter(BaseFilter):
+    """Filter that needs middleware data and must not decide the cost"""
+
+    async def __call__(self, callback: CallbackQuery, user) -> bool:
+        return user is not None
+
+
+def callback(data: str) -> CallbackQuery:
+    return CallbackQuery(id="1", from_user=USER, chat_instance="chat", data=data)
+
+
+def make_costs() -> HandlerCosts:
+    router = Router()
+
+    @router.callback_query(Menu.filter(F.menu == "kpi"), RoleFilter(), flags=HEAVY)
+    async def kpi(callback: CallbackQuery): ...
+
+    @router.callback_query(Menu.filter(F.menu == "links"), flags=LIGHT)
+    async def links(callback: CallbackQuery): ...
+
+    @router.callback_query(Menu.filter())
+    async def menu(callback: CallbackQuery): ...
+
+    @router.callback_query(F.data == "noop", flags=LIGHT)
+    async def noop(callback: CallbackQuery): ...
+
+    @router.callback_query(Page.filter(F.page > 10), flags=HEAVY)
+    async def far_page(callback: CallbackQuery): ...
+
+    @router.message()
+    async def message(message: Message): ...
+
+    costs = HandlerCosts()
+    costs.index(router)
+    return costs
+
+
+class TestFairSemaphore:
+    """Test cases for FairSemaphore"""
+
+    def test_waiters_are_served_round_robin(self):
+        """Test that an owner with many waiters does not starve the others"""
+        semaphore = FairSemaphore(1)
+        order = []
+
+        async def worker(name: str, owner: str):
+            await semaphore.acquire(owner)
+            order.append(name)
+
+        async def scenario():
+            await semaphore.acquire("holder")
+            names = [("a1", "a"), ("a2", "a"), ("a3", "a"), ("b1", "b"), ("c1", "c")]
+            tasks = [asyncio.create_task(worker(*name)) for name in names]
+            await asyncio.sleep(0)
+            assert semaphore.waiting == 5
+            for _ in names:
+                semaphore.release()
+                await asyncio.sleep(0)
+            await asyncio.gather(*tasks)
+
+        asyncio.run(scenario())
+        assert order == ["a1", "b1", "c1", "a2", "a3"]
+        assert semaphore.active == 1
+
+    def test_free_slots_are_taken_immediately(self):
+        semaphore = FairSemaphore(2)
+
+        async def scenario():
+            await semaphore.acquire(1)
+            await semaphore.acquire(1)
+
+        asyncio.run(scenario())
+        assert (semaphore.active, semaphore.waiting) == (2, 0)
+
+    def test_cancelled_waiter_is_skipped(self):
+        """Test that a cancelled waiter neither keeps its place nor a slot"""
+        semaphore = FairSemaphore(1)
+        order = []
+
+        async def worker(owner: str):
+            await semaphore.acquire(owner)
+            order.append(owner)
+
+        async def scenario():
+            await semaphore.acquire("holder")
+            cancelled = asyncio.create_task(worker("a"))
+            waiting = asyncio.create_task(worker("b"))
+            await asyncio.sleep(0)
+            cancelled.cancel()
+            await asyncio.sleep(0)
+            semaphore.release()
+            await waiting
+
+        asyncio.run(scenario())
+        assert order == ["b"]
+        assert (semaphore.active, semaphore.waiting) == (1, 0)
+
+
+class TestHandlerCosts:
+    """Test cases for HandlerCosts.resolve"""
+
+    def test_callback_data_selects_handler(self):
+        costs = make_costs()
+
+        async def scenario():
+            return [
+                await costs.resolve("callback_query", callback(data))
+                for data in (
+                    Menu(menu="kpi").pack(),
+                    Menu(menu="links").pack(),
+                    Menu(menu="main").pack(),
+                )
+            ]
+
+        assert asyncio.run(scenario()) == [COST_HEAVY, COST_LIGHT, COST_DB]
+
+    def test_magic_filters_are_checked(self):
+        """Test that magic filters on the callback and its data decide the match"""
+        costs = make_costs()
+
+        async def scenario():
+            return [
+                await costs.resolve("callback_query", callback(data))
+                for data in ("noop", Page(page=20).pack(), Page(page=2).pack())
+            ]
+
+        assert asyncio.run(scenario()) == [COST_LIGHT, COST_HEAVY, COST_DB]
+
+    def test_unknown_updates_default_to_db(self):
+        costs = make_costs()
+        message = Message(
+            message_id=1,
+            date=0,
+            chat=Chat(id=1, type="private"),
+            from_user=USER,
+            text="/start",
+        )
+
+        async def scenario():
+            return (
+                await costs.resolve("callback_query", callback("unknown")),
+                await costs.resolve("message", message),
+            )
+
+        assert asyncio.run(scenario()) == (COST_DB, COST_DB)
+
+
+class FakeBot:
+    """Bot that records the messages sent instead of an early answer"""
+
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        self.sent.append((chat_id, text))
+
+
+class TestEarlyAnswerFilter:
+    """Test cases for answers to callbacks that were answered early"""
+
+    def answer(self, method, early_answered):
+        limiter = ConcurrencyLimiter(1, 1, 1, still_working_after=2.0)
+        limiter.early_answered.update(early_answered)
+        bot = FakeBot()
+        requests = []
+
+        async def make_request(bot, method):
+            requests.append(method)
+            return "sent"
+
+        result = asyncio.run(EarlyAnswerFilter(limiter)(make_request, bot, method))
+        return result, requests, bot.sent
+
+    def test_empty_answer_is_dropped(self):
+        method = AnswerCallbackQuery(callback_query_id="1")
+        result, requests, sent = self.answer(method, {"1": 42})
+        assert result.ok is True
+        assert (requests, sent) == ([], [])
+
+    def test_alert_is_sent_as_message(self):
+        """Test that an error shown as an alert still reaches the user"""
+        method = AnswerCallbackQuery(
+            callback_query_id="1", text="❌ Файл не найден", show_alert=True
+        )
+        _, requests, sent = self.answer(method, {"1": 42})
+        assert requests == []
+        assert sent == [(42, "❌ Файл не найден")]
+
+    def test_other_requests_pass_through(self):
+        methods = [
+            AnswerCallbackQuery(callback_query_id="2", text="ok"),
+            SendMessage(chat_id=42, text="hello"),
+        ]
+        for method in methods:
+            result, requests, sent = self.answer(method, {"1": 42})
+            assert result == "sent"
+            assert requests == [method]
+            assert sent == []
@@ -0,0 +1,99 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from tgbot.services import group_cache
+from tgbot.services.group_cache import GroupsCache
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+def group(group_id, is_casino_allowed=True):
+    return SimpleNamespace(group_id=group_id, is_casino_allowed=is_casino_allowed)
+
+
+async def wait_for(condition, timeout=1.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        if asyncio.get_running_loop().time() > deadline:
+            raise TimeoutError
+        await asyncio.sleep(0.01)
+
+
+class TestGroupsCache:
+    """Test cases for the in-memory group cache"""
+
+    def test_group_entries_expire(self, monkeypatch):
+        """Test that group settings and negative entries expire after group_ttl"""
+        now = [1000.0]
+        monkeypatch.setattr(group_cache.time, "monotonic", lambda: now[0])
+        cache = GroupsCache(group_ttl=10)
+
+        cache.set_group(1, group(1, is_casino_allowed=False))
+        cache.set_group(2, None)
+        assert cache.get_group(1)[1].is_casino_allowed is False
+        assert cache.get_group(2) == (True, None)
+
+        now[0] += 11
+        assert cache.get_group(1) == (False, None)
+        assert cache.get_group(2) == (False, None)
+
+    def test_invalidate_group_drops_its_members(self):
+        """Test that a group reset also forgets its validated members"""
+        cache = GroupsCache()
+        cache.set_group(1, group(1))
+        cache.mark_validated(1, 10)
+        cache.mark_validated(2, 10)
+
+        cache.invalidate_group(1)
+
+        assert cache.get_group(1) == (False, None)
+        assert not cache.is_validated_member(1, 10)
+        assert cache.is_validated_member(2, 10)
+
+
+class TestGroupsCacheInvalidation:
+    """Test cases for invalidating the cache in other processes via Redis"""
+
+    def test_invalidations_reach_other_processes(self):
+        """Test that a settings change and a kick in one process reach the other"""
+
+        async def scenario():
+            server = fakeredis.FakeServer()
+            caches = [GroupsCache(), GroupsCache()]
+            for cache in caches:
+                cache.start(fakeredis.aioredis.FakeRedis(server=server))
+            redis = fakeredis.aioredis.FakeRedis(server=server)
+            # Both processes have subscribed
+            while True:
+                [(_, subscribers)] = await redis.pubsub_numsub(
+                    group_cache.INVALIDATION_CHANNEL
+                )
+                if subscribers == 2:
+                    break
+                await asyncio.sleep(0.01)
+
+            for cache in caches:
+                cache.set_group(1, group(1))
+                cache.mark_validated(1, 10)
+                cache.mark_validated(1, 20)
+
+            caches[0].forget_member(1, 10)
+            await wait_for(lambda: not caches[1].is_validated_member(1, 10))
+            member_kept = caches[1].is_validated_member(1, 20)
+
+            caches[0].invalidate_group(1)
+            await wait_for(lambda: not caches[1].get_group(1)[0])
+            member_dropped = not caches[1].is_validated_member(1, 20)
+
+            # The sender keeps entries written after its own reset
+            caches[0].set_group(1, group(1))
+            await asyncio.sleep(0.05)
+            sender_kept = caches[0].get_group(1)[0]
+
+            for cache in caches:
+                await cache.stop()
+            return member_kept, member_dropped, sender_kept
+
+        assert asyncio.run(asyncio.wait_for(scenario(), 5)) == (True, True, True)
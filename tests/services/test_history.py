@@ -0,0 +1,305 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("stp_database")
+
+from sqlalchemy import create_engine, insert, select  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+from stp_database.models.STP.transactions import Transaction  # noqa: E402
+
+from tgbot.services import history as history_module  # noqa: E402
+from tgbot.services.balances import Balance, BalanceLedger  # noqa: E402
+from tgbot.services.history import (  # noqa: E402
+    AT,
+    COUNT_TTL,
+    FIRST,
+    KIND_EARN,
+    KIND_SPEND,
+    LAST,
+    NEXT,
+    PERIOD_ALL,
+    PERIOD_DAY,
+    PERIOD_MONTH,
+    PERIOD_SUMMARY_TTL,
+    PERIOD_WEEK,
+    PREV,
+    HistoryFilters,
+    MemberSummary,
+    TransactionHistory,
+)
+
+PAGE_SIZE = 3
+
+# Transactions 1-7, several share created_at: pages are ordered by (created_at, id)
+CREATED_AT = {
+    1: datetime(2025, 1, 1),
+    2: datetime(2025, 1, 1),
+    3: datetime(2025, 1, 2),
+    4: datetime(2025, 1, 2),
+    5: datetime(2025, 1, 2),
+    6: datetime(2025, 1, 3),
+    7: datetime(2025, 1, 3) + timedelta(hours=1),
+}
+TOTAL = len(CREATED_AT)
+
+
+class AsyncSession:
+    """Awaitable facade over a synchronous SQLite session"""
+
+    def __init__(self, session: Session):
+        self.session = session
+
+    async def scalars(self, query):
+        return self.session.scalars(query)
+
+
+@pytest.fixture(scope="module")
+def connection():
+    engine = create_engine("sqlite://")
+    Transaction.__table__.create(engine)
+    with engine.begin() as connection:
+        connection.execute(
+            insert(Transaction),
+            [
+                {
+                    "id": transaction_id,
+                    "user_id": 1,
+                    "type": "earn",
+                    "source_type": "achievement",
+                    "amount": 10,
+                    "created_at": created_at,
+                }
+                for transaction_id, created_at in CREATED_AT.items()
+            ],
+        )
+    with Session(engine) as session:
+        yield AsyncSession(session)
+
+
+def page(connection, direction, cursor=0, total=TOTAL):
+    rows = asyncio.run(
+        TransactionHistory.page(connection, 1, direction, cursor, total, PAGE_SIZE)
+    )
+    return [transaction.id for transaction in rows]
+
+
+class TestKeysetPage:
+    """Test cases for the keyset pagination of the transaction history"""
+
+    def test_first_page_is_newest(self, connection):
+        assert page(connection, FIRST) == [7, 6, 5]
+
+    def test_next_page_starts_after_cursor(self, connection):
+        """Test NEXT across transactions with the same created_at"""
+        assert page(connection, NEXT, cursor=5) == [4, 3, 2]
+        assert page(connection, NEXT, cursor=2) == [1]
+
+    def test_next_after_oldest_is_empty(self, connection):
+        assert page(connection, NEXT, cursor=1) == []
+
+    def test_prev_page_ends_before_cursor(self, connection):
+        """Test PREV returns the newer rows closest to the cursor, newest first"""
+        assert page(connection, PREV, cursor=4) == [7, 6, 5]
+        assert page(connection, PREV, cursor=3) == [6, 5, 4]
+
+    def test_prev_before_newest_is_empty(self, connection):
+        assert page(connection, PREV, cursor=7) == []
+
+    def test_last_page_holds_remainder(self, connection):
+        """Test LAST returns total % page_size oldest rows"""
+        assert page(connection, LAST) == [1]
+        assert page(connection, LAST, total=6) == [3, 2, 1]
+
+    def test_at_page_starts_with_cursor(self, connection):
+        assert page(connection, AT, cursor=4) == [4, 3, 2]
+        assert page(connection, AT, cursor=1) == [1]
+
+    def test_pages_cover_all_rows_once(self, connection):
+        """Test that walking NEXT and then PREV visits every row exactly once"""
+        pages = [page(connection, FIRST)]
+        while True:
+            next_page = page(connection, NEXT, cursor=pages[-1][-1])
+            if not next_page:
+                break
+            pages.append(next_page)
+
+        assert [row for rows in pages for row in rows] == [7, 6, 5, 4, 3, 2, 1]
+
+        back = [pages[-1]]
+        while True:
+            prev_page = page(connection, PREV, cursor=back[-1][0])
+            if not prev_page:
+                break
+            back.append(prev_page)
+
+        assert [row for rows in reversed(back) for row in rows] == [7, 6, 5, 4, 3, 2, 1]
+
+
+NOW = datetime.now()
+
+# Group feed: (id, user_id, type, created_at)
+FEED = [
+    (11, 1, "earn", NOW),
+    (12, 1, "spend", NOW - timedelta(days=3)),
+    (13, 2, "earn", NOW - timedelta(days=20)),
+    (14, 2, "spend", NOW - timedelta(days=60)),
+    (15, 1, "earn", NOW - timedelta(days=60)),
+]
+
+
+@pytest.fixture(scope="module")
+def feed():
+    engine = create_engine("sqlite://")
+    Transaction.__table__.create(engine)
+    with engine.begin() as connection:
+        connection.execute(
+            insert(Transaction),
+            [
+                {
+                    "id": transaction_id,
+                    "user_id": user_id,
+                    "type": transaction_type,
+                    "source_type": "manual",
+                    "amount": 10,
+                    "created_at": created_at,
+                }
+                for transaction_id, user_id, transaction_type, created_at in FEED
+            ],
+        )
+    with engine.connect() as connection:
+        yield connection
+
+
+def filtered(connection, **filters):
+    query = (
+        select(Transaction.id)
+        .where(*HistoryFilters(**filters).conditions())
+        .order_by(Transaction.id)
+    )
+    return connection.execute(query).scalars().all()
+
+
+class TestHistoryFilters:
+    """Test cases for the group feed filters"""
+
+    def test_no_filters_match_everything(self, feed):
+        assert filtered(feed) == [11, 12, 13, 14, 15]
+
+    def test_member_filter(self, feed):
+        assert filtered(feed, member=1) == [11, 12, 15]
+        assert filtered(feed, member=2) == [13, 14]
+
+    def test_kind_filter(self, feed):
+        assert filtered(feed, kind=KIND_EARN) == [11, 13, 15]
+        assert filtered(feed, kind=KIND_SPEND) == [12, 14]
+
+    def test_period_filter(self, feed):
+        """Test that periods count from the start of the day, 7 and 30 days back"""
+        assert filtered(feed, period=PERIOD_DAY) == [11]
+        assert filtered(feed, period=PERIOD_WEEK) == [11, 12]
+        assert filtered(feed, period=PERIOD_MONTH) == [11, 12, 13]
+        assert filtered(feed, period=PERIOD_ALL) == [11, 12, 13, 14, 15]
+
+    def test_filters_combine(self, feed):
+        assert filtered(feed, member=1, kind=KIND_EARN, period=PERIOD_MONTH) == [11]
+        assert filtered(feed, member=2, kind=KIND_SPEND) == [14]
+
+    def test_rolling_periods_expire_sooner(self):
+        assert HistoryFilters(period=PERIOD_ALL).ttl == COUNT_TTL
+        assert HistoryFilters(period=PERIOD_WEEK).ttl == PERIOD_SUMMARY_TTL
+
+
+class FakeClock:
+    """Wall clock that only moves when told to"""
+
+    def __init__(self):
+        self.now = datetime.now().timestamp()
+
+    def __call__(self):
+        return self.now
+
+
+class SummarySession:
+    """Session that returns the members of a group and counts the queries"""
+
+    def __init__(self, member_ids):
+        self.member_ids = member_ids
+        self.queries = 0
+
+    async def execute(self, query):
+        self.queries += 1
+        return SimpleNamespace(
+            scalars=lambda: SimpleNamespace(all=lambda: self.member_ids)
+        )
+
+
+SUMMARY = [MemberSummary(1, "Иванов Иван Иванович", 30, 10, 4)]
+
+
+@pytest.fixture
+def history(redis, monkeypatch):
+    # A separate ledger keeps the subscription out of the shared one
+    monkeypatch.setattr(history_module, "balance_ledger", BalanceLedger())
+    history = TransactionHistory()
+    history.configure(redis)
+
+    async def query_group_summary(session, head, filters):
+        return list(SUMMARY)
+
+    history._query_group_summary = query_group_summary
+    return history
+
+
+class TestGroupSummary:
+    """Test cases for the cached group summaries in memory and in Redis"""
+
+    def test_summary_is_cached_per_filters(self, history):
+        """Test that a summary is read from the database once per filters"""
+        session = SummarySession([1, 2])
+
+        async def scenario():
+            first = await history.group_summary(session, "Head", HistoryFilters())
+            second = await history.group_summary(session, "Head", HistoryFilters())
+            await history.group_summary(session, "Head", HistoryFilters(member=1))
+            return first, second
+
+        first, second = asyncio.run(scenario())
+        assert first == second == SUMMARY
+        assert session.queries == 2
+
+    def test_member_transaction_invalidates_summary(self, history):
+        """Test that a transaction of any member drops the summaries of the group"""
+        session = SummarySession([1, 2])
+        other = SummarySession([3])
+
+        async def scenario():
+            await history.group_summary(session, "Head", HistoryFilters())
+            await history.group_summary(other, "Other", HistoryFilters())
+            # User 2 has no transactions in the summary yet
+            await history.forget({2: Balance(10, 0)})
+            await history.group_summary(session, "Head", HistoryFilters())
+            await history.group_summary(other, "Other", HistoryFilters())
+
+        asyncio.run(scenario())
+        assert session.queries == 2
+        assert other.queries == 1
+
+    def test_rolling_period_summary_expires(self, history, monkeypatch):
+        """Test that a rolling period summary expires without transactions"""
+        clock = FakeClock()
+        monkeypatch.setattr(history_module.time, "time", clock)
+        session = SummarySession([1])
+        day = HistoryFilters(period=PERIOD_DAY)
+
+        async def scenario():
+            await history.group_summary(session, "Head", day)
+            await history.group_summary(session, "Head", HistoryFilters())
+            clock.now += PERIOD_SUMMARY_TTL + 1
+            cached_day = await history._get_summary("Head", day)
+            cached_all = await history._get_summary("Head", HistoryFilters())
+            return cached_day, cached_all
+
+        assert asyncio.run(scenario()) == (None, SUMMARY)
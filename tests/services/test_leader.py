@@ -0,0 +1,135 @@
+import asyncio
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")
+
+from tgbot.services.leader import LeaderElection  # noqa: E402
+
+
+class Events:
+    """Leadership callbacks recorded in order"""
+
+    def __init__(self):
+        self.calls = []
+
+    def elected(self):
+        self.calls.append("elected")
+
+    async def lost(self):
+        self.calls.append("lost")
+
+
+@pytest.fixture
+def server():
+    return fakeredis.aioredis.FakeRedis()
+
+
+def make_election(server, ttl: int = 30) -> tuple[LeaderElection, Events]:
+    return LeaderElection(server, "scheduler", ttl=ttl), Events()
+
+
+async def step(election: LeaderElection, events: Events) -> None:
+    await election._step(events.elected, events.lost)
+
+
+class TestLeaderElection:
+    """Test cases for LeaderElection on fakeredis"""
+
+    def test_first_instance_becomes_leader(self, server):
+        """Test that only one of two instances takes the lock"""
+        first, first_events = make_election(server)
+        second, second_events = make_election(server)
+
+        async def scenario():
+            await step(first, first_events)
+            await step(second, second_events)
+            return await server.get(first.lock_key), await first.is_current()
+
+        owner, current = asyncio.run(scenario())
+        assert owner == first.instance_id.encode()
+        assert current is True
+        assert (first.is_leader, second.is_leader) == (True, False)
+        assert first.fencing_token == 1
+        assert first_events.calls == ["elected"]
+        assert second_events.calls == []
+
+    def test_leader_renews_lock(self, server):
+        """Test that a renewal extends the lock and keeps the token"""
+        election, events = make_election(server, ttl=30)
+
+        async def scenario():
+            await step(election, events)
+            await server.pexpire(election.lock_key, 1000)
+            await step(election, events)
+            return await server.pttl(election.lock_key)
+
+        assert asyncio.run(scenario()) > 1000
+        assert election.fencing_token == 1
+        assert events.calls == ["elected"]
+
+    def test_leader_loses_expired_lock(self, server):
+        """Test that a leader whose lock was taken over steps down"""
+        first, first_events = make_election(server)
+        second, second_events = make_election(server)
+
+        async def scenario():
+            await step(first, first_events)
+            # The lock expired during a pause and another instance took it
+            await server.delete(first.lock_key)
+            await step(second, second_events)
+            await step(first, first_events)
+
+        asyncio.run(scenario())
+        assert (first.is_leader, second.is_leader) == (False, True)
+        assert second.fencing_token == 2
+        assert first_events.calls == ["elected", "lost"]
+        assert second_events.calls == ["elected"]
+
+    def test_stale_token_is_rejected(self, server):
+        """Test that is_current refuses a leader whose token was superseded"""
+        first, first_events = make_election(server)
+        second, second_events = make_election(server)
+
+        async def scenario():
+            await step(first, first_events)
+            await server.delete(first.lock_key)
+            await step(second, second_events)
+            # The old leader has not noticed yet and still holds token 1
+            stale = await first.is_current()
+            # Even with the lock back, the fencing token no longer matches
+            await server.set(first.lock_key, first.instance_id)
+            return stale, await first.is_current(), await second.is_current()
+
+        assert asyncio.run(scenario()) == (False, False, False)
+        assert first.fencing_token == 1
+
+    def test_redis_error_drops_leadership(self, server):
+        """Test that a leader steps down when Redis cannot be reached"""
+        election, events = make_election(server)
+
+        async def failing_eval(*args):
+            raise ConnectionError("redis is down")
+
+        async def scenario():
+            await step(election, events)
+            server.eval = failing_eval
+            await step(election, events)
+
+        asyncio.run(scenario())
+        assert election.is_leader is False
+        assert events.calls == ["elected", "lost"]
+
+    def test_stop_releases_own_lock(self, server):
+        """Test that stop frees the lock for another instance"""
+        first, first_events = make_election(server)
+        second, second_events = make_election(server)
+
+        async def scenario():
+            await step(first, first_events)
+            await first.stop()
+            await step(second, second_events)
+
+        asyncio.run(scenario())
+        assert (first.is_leader, second.is_leader) == (False, True)
@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("stp_database")
+
+from tgbot.services import leaderboards as leaderboards_module  # noqa: E402
+from tgbot.services.balances import Balance, BalanceLedger  # noqa: E402
+from tgbot.services.leaderboards import Board, Leaderboards  # noqa: E402
+
+
+class FakeJournal:
+    """Transaction totals by user that stand in for the database"""
+
+    def __init__(self, balances):
+        self.balances = dict(balances)
+
+    async def compute(self, session, user_ids=None):
+        return {
+            user_id: self.balances.get(user_id, Balance())
+            for user_id in (user_ids or self.balances)
+        }
+
+
+class StaticBoard(Board):
+    """Board with fixed members instead of a database query"""
+
+    async def member_ids(self, stp_repo):
+        return [1, 2]
+
+
+class RacingLeaderboards(Leaderboards):
+    """Leaderboards that run a hook after the scores were read"""
+
+    on_scores = None
+
+    async def _scores(self, stp_repo, member_ids):
+        scores = await super()._scores(stp_repo, member_ids)
+        if self.on_scores is not None:
+            on_scores, self.on_scores = self.on_scores, None
+            await on_scores()
+        return scores
+
+
+@pytest.fixture
+def journal():
+    return FakeJournal({1: Balance(100, 0), 2: Balance(50, 0)})
+
+
+@pytest.fixture
+def ledger(journal, redis, monkeypatch):
+    ledger = BalanceLedger()
+    ledger.configure(redis)
+    ledger._compute = journal.compute
+    monkeypatch.setattr(leaderboards_module, "balance_ledger", ledger)
+    return ledger
+
+
+@pytest.fixture
+def boards(ledger, redis):
+    boards = RacingLeaderboards()
+    boards.configure(redis)
+    return boards
+
+
+BOARD = StaticBoard("division", "test")
+
+
+class TestLeaderboards:
+    """Test cases for Leaderboards in memory and in Redis"""
+
+    def test_rebuild_ranks_members_by_balance(self, boards, stp_repo):
+        """Test that a rebuilt board is stored and ranked by balance"""
+
+        async def scenario():
+            built = await boards._rebuild(stp_repo, BOARD, None)
+            return built, await boards._range(BOARD, 1)
+
+        assert asyncio.run(scenario()) == ([(1, 100), (2, 50)], [(1, 100)])
+
+    def test_transactions_change_scores(self, boards, ledger, stp_repo):
+        """Test that a transaction moves a member within a built board"""
+
+        async def scenario():
+            await boards._rebuild(stp_repo, BOARD, None)
+            await ledger.apply({1: Balance(-60, 0)})
+            return await boards._range(BOARD, None)
+
+        assert asyncio.run(scenario()) == [(2, 50), (1, 40)]
+
+    def test_transaction_during_rebuild_is_not_lost(
+        self, boards, ledger, journal, stp_repo
+    ):
+        """Test that a transaction between reading and storing the scores counts"""
+
+        async def concurrent_earn():
+            journal.balances[2] = Balance(80, 0)
+            await ledger.apply({2: Balance(30, 0)})
+
+        boards.on_scores = concurrent_earn
+
+        async def scenario():
+            built = await boards._rebuild(stp_repo, BOARD, None)
+            return built, await boards._range(BOARD, None)
+
+        built, stored = asyncio.run(scenario())
+        assert built == [(1, 100), (2, 80)]
+        assert stored == [(1, 100), (2, 80)]
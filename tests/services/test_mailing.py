@@ -0,0 +1,222 @@
+import asyncio
+from email.mime.text import MIMEText
+
+import aiosmtplib
+import pytest
+
+from tgbot.config import MailConfig
+from tgbot.services import mailing
+from tgbot.services.mailing import OUTBOX_KEY, MailOutbox, OutgoingEmail
+
+fakeredis = pytest.importorskip("fakeredis")
+
+CONFIG = MailConfig(
+    host="127.0.0.1",
+    port=1025,
+    user="bot@example.com",
+    password="",
+    use_ssl=False,
+    nck_email_addr="",
+    ntp_email_addr="",
+    gok_email_addr="",
+    mip_email_addr="",
+    max_retries=3,
+)
+
+
+class FakeTransport:
+    """SMTP transport that records messages and fails with the given errors"""
+
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.sent = []
+        self.is_connected = False
+
+    async def send(self, message, recipients):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.is_connected = True
+        self.sent.append((message["Subject"], recipients))
+
+    async def close(self):
+        self.is_connected = False
+
+
+def make_message(subject: str) -> MIMEText:
+    message = MIMEText("body")
+    message["Subject"] = subject
+    return message
+
+
+def make_outbox(transport: FakeTransport) -> MailOutbox:
+    outbox = MailOutbox()
+    outbox.config = CONFIG
+    outbox._transport = transport
+    return outbox
+
+
+@pytest.fixture(autouse=True)
+def short_retry_delay(monkeypatch):
+    """Retry delays become a few milliseconds"""
+    monkeypatch.setattr(mailing.random, "uniform", lambda a, b: 0.005)
+
+
+class TestMailOutbox:
+    """Test cases for the MailOutbox queue"""
+
+    def test_sends_submitted_messages(self):
+        """Test that submitted messages are sent, urgent ones first"""
+
+        async def scenario():
+            transport = FakeTransport()
+            outbox = make_outbox(transport)
+            outbox.submit(CONFIG, make_message("normal"), ["a@example.com"])
+            outbox.submit(
+                CONFIG, make_message("urgent"), ["b@example.com"], mailing.URGENT
+            )
+            await outbox.stop()
+            return transport.sent
+
+        assert asyncio.run(scenario()) == [
+            ("urgent", ["b@example.com"]),
+            ("normal", ["a@example.com"]),
+        ]
+
+    def test_retries_temporary_errors(self):
+        """Test that a 4xx response is retried until the message is sent"""
+
+        async def scenario():
+            transport = FakeTransport(
+                [aiosmtplib.SMTPResponseException(451, "try later")] * 2
+            )
+            outbox = make_outbox(transport)
+            outbox.submit(CONFIG, make_message("retry"), ["a@example.com"])
+            await asyncio.sleep(0.2)
+            await outbox.stop()
+            return transport.sent
+
+        assert asyncio.run(scenario()) == [("retry", ["a@example.com"])]
+
+    def test_drops_permanent_errors(self):
+        """Test that a 5xx response is not retried"""
+
+        async def scenario():
+            transport = FakeTransport(
+                [aiosmtplib.SMTPResponseException(550, "no such user")]
+            )
+            outbox = make_outbox(transport)
+            outbox.submit(CONFIG, make_message("bounce"), ["a@example.com"])
+            await asyncio.sleep(0.1)
+            pending = len(outbox._retries)
+            await outbox.stop()
+            return pending, transport.sent
+
+        assert asyncio.run(scenario()) == (0, [])
+
+    def test_gives_up_after_max_retries(self):
+        """Test that a message is dropped after max_retries attempts"""
+
+        async def scenario():
+            transport = FakeTransport([OSError("connection reset")] * 5)
+            outbox = make_outbox(transport)
+            outbox.submit(CONFIG, make_message("lost"), ["a@example.com"])
+            await asyncio.sleep(0.3)
+            await outbox.stop()
+            return len(transport.errors), transport.sent
+
+        # Three attempts use three of the five errors
+        assert asyncio.run(scenario()) == (2, [])
+
+
+class TestOutboxPersistence:
+    """Test cases for saving and restoring the outbox through Redis"""
+
+    def test_pending_retries_are_saved_on_stop(self, monkeypatch):
+        """Test that messages waiting for a retry are saved to Redis"""
+        # A real retry delay, the message is still waiting when the bot stops
+        monkeypatch.setattr(mailing.random, "uniform", lambda a, b: 100)
+
+        async def scenario():
+            redis = fakeredis.aioredis.FakeRedis()
+            transport = FakeTransport([OSError("connection reset")])
+            outbox = make_outbox(transport)
+            await outbox.start(CONFIG, redis)
+            outbox.submit(CONFIG, make_message("saved"), ["a@example.com"])
+            await asyncio.sleep(0.05)
+            await outbox.stop(timeout=0.1)
+            return [
+                OutgoingEmail.load(p) for p in await redis.lrange(OUTBOX_KEY, 0, -1)
+            ]
+
+        (saved,) = asyncio.run(scenario())
+        assert saved.message["Subject"] == "saved"
+        assert saved.recipients == ["a@example.com"]
+        assert saved.attempts == 1
+
+    def test_auth_codes_are_not_saved_on_stop(self, monkeypatch):
+        """Test that unsent urgent messages are dropped instead of saved"""
+        monkeypatch.setattr(mailing.random, "uniform", lambda a, b: 100)
+
+        async def scenario():
+            redis = fakeredis.aioredis.FakeRedis()
+            transport = FakeTransport([OSError("connection reset")] * 2)
+            outbox = make_outbox(transport)
+            await outbox.start(CONFIG, redis)
+            outbox.submit(
+                CONFIG, make_message("code"), ["a@example.com"], mailing.URGENT
+            )
+            outbox.submit(CONFIG, make_message("purchase"), ["b@example.com"])
+            await asyncio.sleep(0.05)
+            await outbox.stop(timeout=0.1)
+            return [
+                OutgoingEmail.load(p).message["Subject"]
+                for p in await redis.lrange(OUTBOX_KEY, 0, -1)
+            ]
+
+        assert asyncio.run(scenario()) == ["purchase"]
+
+    def test_saved_messages_are_sent_after_start(self):
+        """Test that saved messages are restored and the saved queue is removed"""
+
+        async def scenario():
+            redis = fakeredis.aioredis.FakeRedis()
+            item = OutgoingEmail(make_message("restored"), ["a@example.com"])
+            await redis.rpush(OUTBOX_KEY, item.dump())
+
+            transport = FakeTransport()
+            outbox = make_outbox(transport)
+            await outbox.start(CONFIG, redis)
+            await outbox.stop()
+            return transport.sent, await redis.exists(OUTBOX_KEY)
+
+        assert asyncio.run(scenario()) == ([("restored", ["a@example.com"])], 0)
+
+    def test_concurrent_start_restores_each_message_once(self):
+        """Test that two processes starting together do not both send the queue"""
+
+        async def scenario():
+            server = fakeredis.FakeServer()
+            redis = fakeredis.aioredis.FakeRedis(server=server)
+            await redis.rpush(
+                OUTBOX_KEY,
+                *(
+                    OutgoingEmail(make_message(f"m{i}"), ["a@example.com"]).dump()
+                    for i in range(10)
+                ),
+            )
+
+            transports = [FakeTransport(), FakeTransport()]
+            outboxes = [make_outbox(transport) for transport in transports]
+            await asyncio.gather(
+                *(
+                    outbox.start(CONFIG, fakeredis.aioredis.FakeRedis(server=server))
+                    for outbox in outboxes
+                )
+            )
+            for outbox in outboxes:
+                await outbox.stop()
+            return sorted(
+                subject for transport in transports for subject, _ in transport.sent
+            )
+
+        assert asyncio.run(scenario()) == sorted(f"m{i}" for i in range(10))
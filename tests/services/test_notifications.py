@@ -0,0 +1,222 @@
+import asyncio
+
+from tgbot.config import NotificationsConfig
+from tgbot.services.broadcaster import BULK, TRANSACTIONAL
+from tgbot.services.notifications import (
+    DIGEST_SEPARATOR,
+    Notification,
+    NotificationQueue,
+)
+
+BOT = object()
+
+
+class RecordingQueue(NotificationQueue):
+    """Notification queue that records sends instead of calling Telegram"""
+
+    def __init__(self, config: NotificationsConfig, results=None):
+        super().__init__(config)
+        self.sent: list[Notification] = []
+        # Results of consecutive sends; True once exhausted
+        self.results = list(results or [])
+
+    async def _send(self, notification: Notification):
+        self.sent.append(notification)
+        return self.results.pop(0) if self.results else True
+
+
+def make_config(**overrides) -> NotificationsConfig:
+    values = dict(
+        workers=1,
+        dead_letter_limit=100,
+        dead_letter_retry_interval=900,
+        dead_letter_max_rounds=2,
+        digest_window=60,
+    )
+    values.update(overrides)
+    return NotificationsConfig(**values)
+
+
+async def drain(queue: NotificationQueue) -> None:
+    await queue._queue.join()
+    for worker in queue._workers:
+        worker.cancel()
+    queue._workers = []
+
+
+class TestPriorities:
+    """Test cases for the priority lanes"""
+
+    def test_transactional_before_bulk(self):
+        """Test that a notification overtakes bulk messages queued before it"""
+        queue = RecordingQueue(make_config(digest_window=0))
+
+        async def scenario():
+            queue.submit(BOT, 1, "bulk 1", job="mailing", priority=BULK)
+            queue.submit(BOT, 2, "bulk 2", job="mailing", priority=BULK)
+            queue.submit(BOT, 3, "purchase", job="purchases")
+            await drain(queue)
+
+        asyncio.run(scenario())
+        assert [n.text for n in queue.sent] == ["purchase", "bulk 1", "bulk 2"]
+
+    def test_same_priority_keeps_order(self):
+        """Test that notifications of one priority are sent first in, first out"""
+        queue = RecordingQueue(make_config(digest_window=0))
+
+        async def scenario():
+            for i in range(5):
+                queue.submit(BOT, i, f"n{i}", job="studies")
+            await drain(queue)
+
+        asyncio.run(scenario())
+        assert [n.chat_id for n in queue.sent] == [0, 1, 2, 3, 4]
+
+
+class TestDigests:
+    """Test cases for per-user digests"""
+
+    def test_first_notification_is_sent_at_once(self):
+        """Test that only notifications after the first one wait for the window"""
+        queue = RecordingQueue(make_config())
+
+        async def scenario():
+            first = queue.submit(BOT, 1, "first", job="achievements")
+            second = queue.submit(BOT, 1, "second", job="achievements")
+            third = queue.submit(BOT, 1, "third", job="achievements")
+            await drain(queue)
+            sent_before_window = [n.text for n in queue.sent]
+            held = second.done()
+            queue._flush_digest(1)
+            await drain(queue)
+            return sent_before_window, held, [await f for f in (first, second, third)]
+
+        sent_before_window, held, delivered = asyncio.run(scenario())
+        assert sent_before_window == ["first"]
+        assert held is False
+        assert delivered == [True, True, True]
+        assert [n.text for n in queue.sent] == [
+            "first",
+            "second" + DIGEST_SEPARATOR + "third",
+        ]
+        assert queue.sent[1].job == "achievements"
+        assert queue.coalesced == 1
+        assert queue.stats["achievements"].sent == 3
+
+    def test_window_closes_without_followers(self):
+        """Test that a notification after a quiet window is sent at once again"""
+        queue = RecordingQueue(make_config())
+
+        async def scenario():
+            queue.submit(BOT, 1, "first", job="studies")
+            await drain(queue)
+            queue._flush_digest(1)
+            queue.submit(BOT, 1, "second", job="studies")
+            await drain(queue)
+
+        asyncio.run(scenario())
+        assert [n.text for n in queue.sent] == ["first", "second"]
+        assert queue.coalesced == 0
+
+    def test_digest_reports_failed_delivery(self):
+        """Test that merged notifications resolve with the result of the digest"""
+        queue = RecordingQueue(make_config(), results=[True, False])
+
+        async def scenario():
+            queue.submit(BOT, 1, "first", job="hr")
+            held = [queue.submit(BOT, 1, text, job="hr") for text in ("a", "b")]
+            queue._flush_digest(1)
+            await drain(queue)
+            return [await future for future in held]
+
+        assert asyncio.run(scenario()) == [False, False]
+        assert queue.stats["hr"].failed == 2
+
+    def test_urgent_flushes_pending_digest(self):
+        """Test that an urgent notification takes the pending digest with it"""
+        queue = RecordingQueue(make_config())
+
+        async def scenario():
+            queue.submit(BOT, 1, "first", job="achievements")
+            queue.submit(BOT, 1, "achievement", job="achievements")
+            queue.submit(BOT, 2, "other user", job="achievements")
+            queue.submit(BOT, 2, "other user again", job="achievements")
+            urgent = queue.submit(BOT, 1, "schedule", job="schedule", urgent=True)
+            await drain(queue)
+            return await urgent
+
+        delivered = asyncio.run(scenario())
+        assert delivered is True
+        assert [(n.chat_id, n.text, n.job) for n in queue.sent] == [
+            (1, "first", "achievements"),
+            (2, "other user", "achievements"),
+            (1, "achievement" + DIGEST_SEPARATOR + "schedule", "digest"),
+        ]
+        # The digest of the other recipient is still waiting
+        assert list(queue._digests) == [2]
+
+    def test_long_digest_is_split(self):
+        """Test that a digest longer than a message is sent in several parts"""
+        queue = RecordingQueue(make_config())
+
+        async def scenario():
+            for i in range(4):
+                queue.submit(BOT, 1, str(i) * 3000, job="studies")
+            queue._flush_digest(1)
+            await drain(queue)
+
+        asyncio.run(scenario())
+        assert [len(n.text) for n in queue.sent] == [3000, 3000, 3000, 3000]
+
+
+class TestDeadLetters:
+    """Test cases for retries and the dead-letter list"""
+
+    def test_failed_notification_is_dead_lettered(self):
+        """Test that a failed send is reported and stored for a retry"""
+        queue = RecordingQueue(make_config(), results=[False])
+
+        async def scenario():
+            delivered = queue.submit(BOT, 1, "hr", job="hr", urgent=True)
+            await drain(queue)
+            return await delivered
+
+        assert asyncio.run(scenario()) is False
+        assert len(queue._dead_letters) == 1
+        assert queue.stats["hr"].dead_lettered == 1
+
+    def test_dead_letter_kept_after_max_rounds(self):
+        """Test that a notification is retried max_rounds times, then kept"""
+        queue = RecordingQueue(make_config(), results=[False] * 10)
+
+        async def scenario():
+            queue.submit(BOT, 1, "hr", job="hr", urgent=True)
+            await drain(queue)
+            requeued = []
+            for _ in range(3):
+                requeued.append(await queue.requeue_dead_letters(BOT))
+                await drain(queue)
+            return requeued
+
+        assert asyncio.run(scenario()) == [1, 1, 0]
+        assert len(queue.sent) == 3
+        assert all(n.priority == BULK for n in queue.sent[1:])
+        assert len(queue._dead_letters) == 1
+        kept = Notification.load(BOT, queue._dead_letters[0])
+        assert kept.rounds == 2
+        assert kept.priority == BULK
+        assert queue.stats["hr"].failed == 3
+
+    def test_requeued_notification_can_succeed(self):
+        """Test that a retried notification leaves the dead-letter list"""
+        queue = RecordingQueue(make_config(), results=[False, True])
+
+        async def scenario():
+            queue.submit(BOT, 1, "hr", job="hr", priority=TRANSACTIONAL, urgent=True)
+            await drain(queue)
+            await queue.requeue_dead_letters(BOT)
+            await drain(queue)
+
+        asyncio.run(scenario())
+        assert len(queue._dead_letters) == 0
+        assert queue.stats["hr"].sent == 1
@@ -0,0 +1,60 @@
+import asyncio
+import time
+
+from tgbot.services.concurrency import heavy_calls, run_heavy
+from tgbot.services.metrics import UpdateStats
+from tgbot.services.profiler import UpdateProfiler
+
+
+def parse_workbook(seconds: float) -> None:
+    """Busy loop that stands in for a pandas/openpyxl call"""
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def render_chart(seconds: float) -> None:
+    parse_workbook(seconds)
+
+
+class TestStackSampler:
+    """Test cases for sampling the stacks of profiled updates"""
+
+    def test_heavy_thread_is_sampled(self, tmp_path):
+        """Test that time spent in run_heavy is attributed to the waiting update"""
+        profiler = UpdateProfiler(
+            sample_rate=0,
+            slow_threshold=60,
+            interval=0.005,
+            directory=str(tmp_path),
+            max_files=10,
+        )
+
+        async def update():
+            session = profiler.begin(UpdateStats(), "CallbackQuery", None)
+            await run_heavy(parse_workbook, 0.2)
+            await profiler.finish(session)
+            return session
+
+        async def scenario():
+            profiler.start()
+            try:
+                # Another update waits in the same pool without being profiled
+                _, session = await asyncio.gather(
+                    run_heavy(render_chart, 0.2), update()
+                )
+            finally:
+                profiler.stop()
+            return session
+
+        session = asyncio.run(scenario())
+        functions = {frame[1] for stack in session.stacks for frame in stack}
+        assert "parse_workbook" in functions
+        assert "render_chart" not in functions
+        # Stacks of the pool start in the wrapper, not in the executor internals
+        assert all(
+            stack[0][1] == "_call_in_heavy_thread"
+            for stack in session.stacks
+            if any(frame[1] == "parse_workbook" for frame in stack)
+        )
+        assert heavy_calls == {}
@@ -0,0 +1,182 @@
+import asyncio
+
+import pytest
+
+from tgbot.config import CasinoConfig
+from tgbot.services import rate_limit
+from tgbot.services.rate_limit import (
+    CASINO_LIMITS,
+    TAKE_SCRIPT,
+    CasinoRateLimiter,
+    TokenBuckets,
+)
+
+
+class FakeClock:
+    """Monotonic clock that only moves when told to"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", clock)
+    return clock
+
+
+class TestTokenBuckets:
+    """Test cases for the in-memory TokenBuckets"""
+
+    def test_take_allows_burst_then_refuses(self, clock):
+        """Test that a new bucket starts full and refuses once empty"""
+        buckets = TokenBuckets()
+        bucket = [("user", 1.0, 3)]
+
+        assert [buckets.take(bucket) for _ in range(4)] == [True, True, True, False]
+
+    def test_take_refills_at_rate(self, clock):
+        """Test that tokens come back at the configured rate"""
+        buckets = TokenBuckets()
+        bucket = [("user", 0.5, 1)]
+
+        assert buckets.take(bucket)
+        clock.now += 1.9
+        assert not buckets.take(bucket)
+        clock.now += 0.1
+        assert buckets.take(bucket)
+
+    def test_refill_is_capped_by_capacity(self, clock):
+        """Test that an idle bucket does not collect more than its capacity"""
+        buckets = TokenBuckets()
+        bucket = [("user", 1.0, 2)]
+
+        assert buckets.take(bucket)
+        clock.now += 3600
+        assert [buckets.take(bucket) for _ in range(3)] == [True, True, False]
+
+    def test_take_is_all_or_nothing(self, clock):
+        """Test that no token is taken when one of the buckets is empty"""
+        buckets = TokenBuckets()
+        user = ("user", 1.0, 5)
+        chat = ("chat", 1.0, 1)
+
+        assert buckets.take([user, chat])
+        assert not buckets.take([user, chat])
+        # The user bucket kept its tokens: 4 left after the first take
+        assert [buckets.take([user]) for _ in range(5)] == [True] * 4 + [False]
+
+    def test_oldest_buckets_are_evicted(self, clock):
+        """Test that the number of buckets is bounded by max_buckets"""
+        buckets = TokenBuckets(max_buckets=2)
+        for key in ("a", "b", "c"):
+            assert buckets.take([(key, 1.0, 1)])
+
+        assert list(buckets._buckets) == ["b", "c"]
+        # The evicted bucket starts full again
+        assert buckets.take([("a", 1.0, 1)])
+
+
+class TestTakeScript:
+    """Test cases for the shared TAKE_SCRIPT in Redis"""
+
+    @pytest.fixture
+    def redis(self):
+        fakeredis = pytest.importorskip("fakeredis")
+        pytest.importorskip("lupa")
+        return fakeredis.aioredis.FakeRedis()
+
+    def test_take_allows_burst_then_refuses(self, redis):
+        """Test that the script allows burst tokens and then refuses"""
+
+        async def scenario():
+            take = redis.register_script(TAKE_SCRIPT)
+            return [await take(keys=["user"], args=[0.001, 3]) for _ in range(4)]
+
+        assert asyncio.run(scenario()) == [1, 1, 1, 0]
+
+    def test_take_is_all_or_nothing(self, redis):
+        """Test that an empty bucket leaves the other buckets untouched"""
+
+        async def scenario():
+            take = redis.register_script(TAKE_SCRIPT)
+            both = await take(keys=["user", "chat"], args=[0.001, 5, 0.001, 1])
+            refused = await take(keys=["user", "chat"], args=[0.001, 5, 0.001, 1])
+            user_tokens = float(await redis.hget("user", "tokens"))
+            ttl = await redis.pttl("chat")
+            return both, refused, user_tokens, ttl
+
+        both, refused, user_tokens, ttl = asyncio.run(scenario())
+        assert (both, refused) == (1, 0)
+        assert user_tokens == pytest.approx(4, abs=0.01)
+        # Buckets expire once they would have refilled completely
+        assert 0 < ttl <= 1000 * 1000
+
+
+class TestCasinoRateLimiter:
+    """Test cases for the CasinoRateLimiter presets"""
+
+    def make_limiter(self, redis=None, shared_limits=False):
+        limiter = CasinoRateLimiter()
+        limiter.configure(
+            CasinoConfig(default_limit="strict", shared_limits=shared_limits), redis
+        )
+        return limiter
+
+    def test_group_user_limited_by_user_burst(self, clock):
+        """Test that a player in a group gets user_burst games in a row"""
+        limiter = self.make_limiter()
+        burst = CASINO_LIMITS["strict"].user_burst
+
+        results = asyncio.run(self.play(limiter, chat_id=-100, user_id=1, games=4))
+        assert results == [True] * burst + [False] * (4 - burst)
+
+    def test_group_limited_by_chat_burst(self, clock):
+        """Test that players in one group share the chat bucket"""
+        limiter = self.make_limiter()
+        chat_burst = CASINO_LIMITS["strict"].chat_burst
+
+        async def scenario():
+            return [
+                await limiter.allow(-100, user_id) for user_id in range(chat_burst + 1)
+            ]
+
+        assert asyncio.run(scenario()) == [True] * chat_burst + [False]
+
+    def test_next_limit_cycles_presets(self):
+        """Test that the group preset toggle goes through all presets"""
+        limiter = self.make_limiter()
+
+        async def scenario():
+            return [await limiter.next_limit(-100) for _ in range(len(CASINO_LIMITS))]
+
+        presets = list(CASINO_LIMITS)
+        start = presets.index("strict") + 1
+        expected = [presets[(start + i) % len(presets)] for i in range(len(presets))]
+        assert asyncio.run(scenario()) == expected
+
+    def test_shared_limits_use_redis(self):
+        """Test that two limiters on one Redis share the buckets"""
+        fakeredis = pytest.importorskip("fakeredis")
+        pytest.importorskip("lupa")
+        server = fakeredis.FakeServer()
+        limiters = [
+            self.make_limiter(fakeredis.aioredis.FakeRedis(server=server), True)
+            for _ in range(2)
+        ]
+        burst = CASINO_LIMITS["strict"].user_burst
+
+        async def scenario():
+            return [
+                await limiters[game % 2].allow(-100, 1) for game in range(burst + 1)
+            ]
+
+        assert asyncio.run(scenario()) == [True] * burst + [False]
+
+    @staticmethod
+    async def play(limiter, chat_id, user_id, games):
+        return [await limiter.allow(chat_id, user_id) for _ in range(games)]
@@ -0,0 +1,197 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("stp_database")
+
+from sqlalchemy import Column, MetaData, Table, create_engine, insert  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+from stp_database import Employee, Product  # noqa: E402
+from stp_database.models.STP.purchase import Purchase  # noqa: E402
+
+from tgbot.services import statistics as statistics_module  # noqa: E402
+from tgbot.services.balances import Balance, BalanceLedger  # noqa: E402
+from tgbot.services.statistics import (  # noqa: E402
+    GroupStatistics,
+    PlayerStatistics,
+    UserStatistics,
+)
+
+# Only the columns the statistics queries read, so that the other
+# (possibly NOT NULL) columns of the models need no values
+COLUMNS = {
+    Employee: ("id", "user_id", "fullname", "head"),
+    Product: ("id", "name", "cost"),
+    Purchase: ("id", "user_id", "product_id"),
+}
+
+EMPLOYEES = [
+    (1, 1, "Иванов Иван Иванович", "Head"),
+    (2, 2, "Петров Петр Петрович", "Head"),
+    # Not registered in the bot yet
+    (3, None, "Сидоров Сидор Сидорович", "Head"),
+    (4, 4, "Кузнецов Кузьма Кузьмич", "Other"),
+]
+PRODUCTS = [(1, "Кофе", 10), (2, "Выходной", 100)]
+# (user_id, product_id): user 1 mostly buys coffee, the group mostly days off
+PURCHASES = [(1, 1), (1, 1), (1, 2), (2, 2), (2, 2), (4, 1), (4, 1), (4, 1)]
+
+BALANCES = {
+    1: Balance(100, 40),
+    2: Balance(50, 20),
+    4: Balance(10, 999),
+}
+
+
+def create_tables(engine) -> dict:
+    metadata = MetaData()
+    tables = {
+        model: Table(
+            model.__table__.name,
+            metadata,
+            *(
+                Column(
+                    name,
+                    model.__table__.c[name].type.as_generic(),
+                    primary_key=name == "id",
+                )
+                for name in columns
+            ),
+        )
+        for model, columns in COLUMNS.items()
+    }
+    metadata.create_all(engine)
+    return tables
+
+
+class AsyncSession:
+    """Awaitable facade over a synchronous SQLite session that counts queries"""
+
+    def __init__(self, session: Session):
+        self.session = session
+        self.queries = 0
+
+    async def execute(self, query):
+        self.queries += 1
+        return self.session.execute(query)
+
+
+@pytest.fixture(scope="module")
+def engine():
+    engine = create_engine("sqlite://")
+    tables = create_tables(engine)
+    with engine.begin() as connection:
+        connection.execute(
+            insert(tables[Employee]),
+            [
+                dict(zip(COLUMNS[Employee], employee, strict=True))
+                for employee in EMPLOYEES
+            ],
+        )
+        connection.execute(
+            insert(tables[Product]),
+            [dict(zip(COLUMNS[Product], product, strict=True)) for product in PRODUCTS],
+        )
+        connection.execute(
+            insert(tables[Purchase]),
+            [
+                {"id": purchase_id, "user_id": user_id, "product_id": product_id}
+                for purchase_id, (user_id, product_id) in enumerate(PURCHASES, 1)
+            ],
+        )
+    return engine
+
+
+@pytest.fixture
+def repo(engine):
+    with Session(engine) as session:
+        yield SimpleNamespace(session=AsyncSession(session))
+
+
+@pytest.fixture
+def statistics(redis, monkeypatch):
+    async def compute(session, user_ids=None):
+        return {
+            user_id: BALANCES.get(user_id, Balance())
+            for user_id in (user_ids or BALANCES)
+        }
+
+    ledger = BalanceLedger()
+    ledger.configure(redis)
+    ledger._compute = compute
+    monkeypatch.setattr(statistics_module, "balance_ledger", ledger)
+
+    statistics = PlayerStatistics()
+    statistics.configure(redis)
+    return statistics
+
+
+class TestStatisticsQueries:
+    """Test cases for the aggregate statistics queries on SQLite"""
+
+    def test_user_statistics(self, statistics, repo):
+        """Test that purchases are counted and summed with the ledger balance"""
+        result = asyncio.run(statistics.user(repo, 1))
+        assert result == UserStatistics(
+            balance=100, achievements=40, purchases_count=3, purchases_sum=120
+        )
+
+    def test_user_without_purchases(self, statistics, repo):
+        assert asyncio.run(statistics.user(repo, 3)) == UserStatistics()
+
+    def test_group_statistics(self, statistics, repo):
+        """Test the group totals, counting employees without a Telegram ID"""
+        result = asyncio.run(statistics.group(repo, "Head"))
+        assert result.total_users == 3
+        assert result.total_points == 60
+
+    def test_most_popular_product_is_merged_across_members(self, statistics, repo):
+        """Test that the group favourite sums purchases of all members
+
+        User 1 buys coffee most often, but the group bought three days off
+        against two coffees.
+        """
+        result = asyncio.run(statistics.group(repo, "Head"))
+        assert result.most_popular_product == "Выходной"
+
+    def test_group_without_purchases(self, statistics, repo):
+        assert asyncio.run(statistics.group(repo, "Nobody")) == GroupStatistics()
+
+
+class TestStatisticsCache:
+    """Test cases for caching and invalidation in memory and in Redis"""
+
+    def test_group_is_cached(self, statistics, repo):
+        async def scenario():
+            first = await statistics.group(repo, "Head")
+            return first, await statistics.group(repo, "Head")
+
+        first, second = asyncio.run(scenario())
+        assert first == second
+        assert repo.session.queries == 1
+
+    def test_member_transaction_invalidates_group(self, statistics, repo):
+        """Test that only the group of the transacting user is recomputed"""
+
+        async def scenario():
+            await statistics.group(repo, "Head")
+            await statistics.group(repo, "Other")
+            await statistics.forget({2: Balance(-10, 0)})
+            await statistics.group(repo, "Head")
+            await statistics.group(repo, "Other")
+
+        asyncio.run(scenario())
+        assert repo.session.queries == 3
+
+    def test_transaction_invalidates_user(self, statistics, repo):
+        async def scenario():
+            await statistics.user(repo, 1)
+            await statistics.user(repo, 1)
+            await statistics.user(repo, 2)
+            await statistics.forget({1: Balance(-10, 0)})
+            await statistics.user(repo, 1)
+            await statistics.user(repo, 2)
+
+        asyncio.run(scenario())
+        assert repo.session.queries == 3
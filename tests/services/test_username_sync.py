@@ -0,0 +1,113 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("stp_database")
+
+from tgbot.services.username_sync import UsernameSyncQueue  # noqa: E402
+
+
+class FakeSession:
+    """Session that records statements instead of writing them"""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    async def execute(self, statement):
+        if self.pool.on_execute is not None:
+            self.pool.on_execute()
+        if self.pool.failures:
+            self.pool.failures -= 1
+            raise ConnectionError("database is unavailable")
+        self.pool.statements.append(statement)
+
+    async def commit(self):
+        self.pool.commits += 1
+
+
+class SessionPool:
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        # Called while the batch is being written
+        self.on_execute = None
+        self.statements = []
+        self.commits = 0
+
+    def __call__(self):
+        return self
+
+    async def __aenter__(self):
+        return FakeSession(self)
+
+    async def __aexit__(self, *args):
+        return False
+
+
+def make_queue(pool: SessionPool, max_batch: int = 500) -> UsernameSyncQueue:
+    queue = UsernameSyncQueue(max_batch=max_batch)
+    queue._session_pool = pool
+    return queue
+
+
+class TestUsernameSync:
+    """Test cases for the deferred username updates"""
+
+    def test_changes_are_merged_into_one_update(self):
+        """Test that the latest username of each user is written by one UPDATE"""
+        pool = SessionPool()
+        queue = make_queue(pool)
+        queue.enqueue(1, "old")
+        queue.enqueue(1, "new")
+        queue.enqueue(2, None)
+
+        assert asyncio.run(queue.flush()) == 2
+        assert len(pool.statements) == 1
+        assert pool.commits == 1
+        params = pool.statements[0].compile().params
+        assert sorted(v for v in params.values() if isinstance(v, str)) == ["new"]
+        assert queue._pending == {}
+
+    def test_failed_batch_is_requeued(self):
+        """Test that a failed batch returns without overwriting newer changes"""
+        pool = SessionPool(failures=1)
+        queue = make_queue(pool)
+        queue.enqueue(1, "first")
+        queue.enqueue(2, "second")
+        # A newer username arrives while the batch is being written
+        pool.on_execute = lambda: queue.enqueue(2, "newer")
+
+        assert asyncio.run(queue.flush()) == 0
+        assert queue._pending == {1: "first", 2: "newer"}
+        assert queue._flushing == {}
+        pool.on_execute = None
+        assert asyncio.run(queue.flush()) == 2
+        assert len(pool.statements) == 1
+
+    def test_batches_are_limited(self):
+        pool = SessionPool()
+        queue = make_queue(pool, max_batch=2)
+        for user_id in range(5):
+            queue.enqueue(user_id, f"user{user_id}")
+
+        assert asyncio.run(queue.flush()) == 2
+        assert len(queue._pending) == 3
+
+    def test_repeated_change_is_not_enqueued_again(self):
+        """Test that enqueue reports a value that already waits for the write"""
+        queue = make_queue(SessionPool())
+
+        assert queue.enqueue(1, "new") is True
+        assert queue.enqueue(1, "new") is False
+        assert queue.enqueue(1, None) is True
+        assert queue.enqueue(1, None) is False
+
+    def test_change_being_written_is_not_enqueued_again(self):
+        pool = SessionPool()
+        queue = make_queue(pool)
+        queue.enqueue(1, "new")
+        repeated = []
+        pool.on_execute = lambda: repeated.append(queue.enqueue(1, "new"))
+
+        asyncio.run(queue.flush())
+        assert repeated == [False]
+        assert queue._pending == {}
@@ -1,3 +1,4 @@
+import re
 from dataclasses import dataclass
 from typing import Optional
 
@@ -13,6 +14,7 @@ class TgBot:
 
     token: str
     use_redis: bool
+    api_url: Optional[str] = None
 
     @staticmethod
     def from_env(env: Env):
@@ -21,7 +23,8 @@ class TgBot:
         """
         token = env.str("BOT_TOKEN")
         use_redis = env.bool("USE_REDIS")
-        return TgBot(token=token, use_redis=use_redis)
+        api_url = env.str("TELEGRAM_API_URL", None)
+        return TgBot(token=token, use_redis=use_redis, api_url=api_url)
 
 
 @dataclass
@@ -110,7 +113,14 @@ class MailConfig:
     password : str
         The password used to authenticate with the email server.
     use_ssl : bool
-        The use_ssl flag used to connect to the email server.
+        Connect with implicit TLS (SMTPS). When disabled, the connection is
+        upgraded with STARTTLS if the server supports it.
+    idle_timeout : float
+        Seconds an idle SMTP connection is kept open for reuse.
+    max_retries : int
+        Delivery attempts of an outbox message before it is dropped.
+    messages_per_connection : int
+        Messages sent over one SMTP connection before reconnecting.
     """
 
     host: str
@@ -124,6 +134,10 @@ class MailConfig:
     gok_email_addr: str
     mip_email_addr: str
 
+    idle_timeout: float = 60
+    max_retries: int = 5
+    messages_per_connection: int = 50
+
     @staticmethod
     def from_env(env: Env):
         """
@@ -133,13 +147,17 @@ class MailConfig:
         port = env.int("EMAIL_PORT")
         user = env.str("EMAIL_USER")
         password = env.str("EMAIL_PASS")
-        use_ssl = env.bool("EMAIL_USE_SSL")
+        use_ssl = env.bool("EMAIL_USE_SSL", True)
 
         nck_email_addr = env.str("NCK_EMAIL_ADDR")
         ntp_email_addr = env.str("NTP_EMAIL_ADDR")
         gok_email_addr = env.str("GOK_EMAIL_ADDR")
         mip_email_addr = env.str("MIP_EMAIL_ADDR")
 
+        idle_timeout = env.float("EMAIL_IDLE_TIMEOUT", 60)
+        max_retries = env.int("EMAIL_MAX_RETRIES", 5)
+        messages_per_connection = env.int("EMAIL_MESSAGES_PER_CONNECTION", 50)
+
         return MailConfig(
             host=host,
             port=port,
@@ -150,6 +168,9 @@ class MailConfig:
             ntp_email_addr=ntp_email_addr,
             gok_email_addr=gok_email_addr,
             mip_email_addr=mip_email_addr,
+            idle_timeout=idle_timeout,
+            max_retries=max_retries,
+            messages_per_connection=messages_per_connection,
         )
 
 
@@ -195,6 +216,404 @@ class RedisConfig:
         )
 
 
+@dataclass
+class MetricsConfig:
+    """
+    Metrics configuration class.
+
+    Attributes
+    ----------
+    enabled : bool
+        Whether per-handler instrumentation is enabled.
+    host : str
+        The host of the local HTTP metrics endpoint.
+    port : int
+        The port of the local HTTP metrics endpoint.
+    log_interval : int
+        Interval in seconds between periodic log summaries.
+    n_plus_one_threshold : int
+        Average number of SQL statements per update above which a handler is flagged as N+1.
+    """
+
+    enabled: bool
+    host: str
+    port: int
+    log_interval: int
+    n_plus_one_threshold: int
+
+    @staticmethod
+    def from_env(env: Env):
+        """
+        Creates the MetricsConfig object from environment variables.
+        """
+        enabled = env.bool("METRICS_ENABLED", False)
+        host = env.str("METRICS_HOST", "127.0.0.1")
+        port = env.int("METRICS_PORT", 9100)
+        log_interval = env.int("METRICS_LOG_INTERVAL", 300)
+        n_plus_one_threshold = env.int("METRICS_N_PLUS_ONE_THRESHOLD", 15)
+
+        return MetricsConfig(
+            enabled=enabled,
+            host=host,
+            port=port,
+            log_interval=log_interval,
+            n_plus_one_threshold=n_plus_one_threshold,
+        )
+
+
+@dataclass
+class ProfilingConfig:
+    """
+    Slow-update profiler configuration class.
+
+    Attributes
+    ----------
+    enabled : bool
+        Whether the profiling mode is enabled.
+    sample_rate : float
+        Share of updates (0..1) that are dumped regardless of their latency.
+    slow_threshold : float
+        Latency in seconds above which an update is always dumped.
+    interval : float
+        Stack sampling interval in seconds.
+    directory : str
+        Directory where per-update profiles are written.
+    max_files : int
+        Maximum number of profiles kept in the directory.
+    """
+
+    enabled: bool
+    sample_rate: float
+    slow_threshold: float
+    interval: float
+    directory: str
+    max_files: int
+
+    @staticmethod
+    def from_env(env: Env):
+        """
+        Creates the ProfilingConfig object from environment variables.
+        """
+        enabled = env.bool("PROFILING_ENABLED", False)
+        sample_rate = env.float("PROFILING_SAMPLE_RATE", 0.01)
+        slow_threshold = env.float("PROFILING_SLOW_THRESHOLD", 2.0)
+        interval = env.float("PROFILING_INTERVAL", 0.005)
+        directory = env.str("PROFILING_DIR", "profiles")
+        max_files = env.int("PROFILING_MAX_FILES", 200)
+
+        return ProfilingConfig(
+            enabled=enabled,
+            sample_rate=sample_rate,
+            slow_threshold=slow_threshold,
+            interval=interval,
+            directory=directory,
+            max_files=max_files,
+        )
+
+
+@dataclass
+class ConcurrencyConfig:
+    """
+    Handler concurrency limits configuration class.
+
+    Attributes
+    ----------
+    light_limit : int
+        Maximum number of concurrently running light handlers.
+    db_limit : int
+        Maximum number of concurrently running DB-bound handlers.
+    heavy_limit : int
+        Maximum number of concurrently running CPU-heavy handlers.
+    still_working_after : float
+        Seconds after which a queued callback gets a "still working" answer.
+    """
+
+    light_limit: int
+    db_limit: int
+    heavy_limit: int
+    still_working_after: float
+
+    @staticmethod
+    def from_env(env: Env):
+        """
+        Creates the ConcurrencyConfig object from environment variables.
+        """
+        light_limit = env.int("CONCURRENCY_LIGHT_LIMIT", 200)
+        db_limit = env.int("CONCURRENCY_DB_LIMIT", 30)
+        heavy_limit = env.int("CONCURRENCY_HEAVY_LIMIT", 4)
+        still_working_after = env.float("CONCURRENCY_STILL_WORKING_AFTER", 2.0)
+
+        return ConcurrencyConfig(
+            light_limit=light_limit,
+            db_limit=db_limit,
+            heavy_limit=heavy_limit,
+            still_working_after=still_working_after,
+        )
+
+
+@dataclass
+class WebhookConfig:
+    """
+    Webhook mode configuration class.
+
+    Attributes
+    ----------
+    enabled : bool
+        Receive updates through a webhook instead of long polling.
+    base_url : str
+        Public HTTPS address of the reverse proxy (without the path).
+    path : str
+        Path on which the bot receives updates.
+    secret : str
+        Secret token Telegram sends in the X-Telegram-Bot-Api-Secret-Token header.
+        Required when webhook mode is enabled.
+    host : str
+        Host the worker HTTP servers bind to.
+    port : int
+        Port of the first worker, the N-th worker listens on port + N.
+    workers : int
+        Number of worker processes.
+    """
+
+    enabled: bool
+    base_url: str
+    path: str
+    secret: str
+    host: str
+    port: int
+    workers: int
+
+    @property
+    def url(self) -> str:
+        return f"{self.base_url.rstrip('/')}{self.path}"
+
+    @staticmethod
+    def from_env(env: Env):
+        """
+        Creates the WebhookConfig object from environment variables.
+        """
+        enabled = env.bool("WEBHOOK_ENABLED", False)
+        base_url = env.str("WEBHOOK_BASE_URL", "")
+        path = env.str("WEBHOOK_PATH", "/webhook")
+        secret = env.str("WEBHOOK_SECRET", "")
+        host = env.str("WEBHOOK_HOST", "127.0.0.1")
+        port = env.int("WEBHOOK_PORT", 8080)
+        workers = env.int("WEBHOOK_WORKERS", 1)
+
+        # The webhook endpoint is public, so updates must be authenticated
+        if enabled and not re.fullmatch(r"[A-Za-z0-9_-]{1,256}", secret):
+            raise ValueError(
+                "WEBHOOK_SECRET must be set to 1-256 characters A-Z, a-z, 0-9, _ "
+                "or - when WEBHOOK_ENABLED is true"
+            )
+
+        return WebhookConfig(
+            enabled=enabled,
+            base_url=base_url,
+            path=path,
+            secret=secret,
+            host=host,
+            port=port,
+            workers=workers,
+        )
+
+
+@dataclass
+class SchedulerConfig:
+    """
+    Scheduled jobs configuration class.
+
+    Attributes
+    ----------
+    role : str
+        Process role: "all" handles updates and runs every job, "bot" handles
+        updates and runs jobs not pinned to the worker, "worker" only runs
+        pinned jobs.
+    worker_jobs : list[str]
+        Job ID prefixes pinned to the worker role (empty - all jobs).
+    leader_ttl : int
+        Seconds the scheduler leader lock in Redis lives without renewal.
+    kpi_poll_interval : int
+        Seconds between checks of the KPI tables for new data.
+    """
+
+    role: str
+    worker_jobs: list[str]
+    leader_ttl: int
+    kpi_poll_interval: int
+
+    @staticmethod
+    def from_env(env: Env):
+        """
+        Creates the SchedulerConfig object from environment variables.
+        """
+        role = env.str("PROCESS_ROLE", "all")
+        if role not in ("all", "bot", "worker"):
+            raise ValueError(f"Unknown PROCESS_ROLE: {role}")
+        worker_jobs = env.list("SCHEDULER_WORKER_JOBS", [])
+        leader_ttl = env.int("SCHEDULER_LEADER_TTL", 30)
+        kpi_poll_interval = env.int("SCHEDULER_KPI_POLL_INTERVAL", 300)
+
+        return SchedulerConfig(
+            role=role,
+            worker_jobs=worker_jobs,
+            leader_ttl=leader_ttl,
+            kpi_poll_interval=kpi_poll_interval,
+        )
+
+
+@dataclass
+class LoggingConfig:
+    """
+    Logging configuration class.
+
+    Attributes
+    ----------
+    level : str
+        Root logger level name (DEBUG, INFO, ...).
+    mode : str
+        "sync" writes logs in the calling thread, "queue" hands records to
+        a background QueueListener thread.
+    sampling : dict[str, float]
+        Share of records below WARNING kept per logger name prefix.
+    """
+
+    level: str
+    mode: str
+    sampling: dict[str, float]
+
+    @staticmethod
+    def from_env(env: Env):
+        """
+        Creates the LoggingConfig object from environment variables.
+        """
+        level = env.str("LOG_LEVEL", "INFO")
+        mode = env.str("LOG_MODE", "sync")
+        sampling = env.dict("LOG_SAMPLING", subcast_values=float, default={})
+
+        return LoggingConfig(level=level, mode=mode, sampling=sampling)
+
+
+@dataclass
+class BroadcastConfig:
+    """
+    Broadcast engine configuration class.
+
+    Attributes
+    ----------
+    rate : float
+        Global number of messages per second sent by broadcasts.
+    burst : int
+        Number of messages that can be sent at once after an idle period.
+    concurrency : int
+        Number of concurrent senders.
+    max_retries : int
+        Retries of a message after flood control or a network error.
+    undeliverable_ttl : int
+        Seconds a chat that blocked the bot is skipped by broadcasts.
+    """
+
+    rate: float
+    burst: int
+    concurrency: int
+    max_retries: int
+    undeliverable_ttl: int
+
+    @staticmethod
+    def from_env(env: Env):
+        """
+        Creates the BroadcastConfig object from environment variables.
+        """
+        rate = env.float("BROADCAST_RATE", 28)
+        burst = env.int("BROADCAST_BURST", 5)
+        concurrency = env.int("BROADCAST_CONCURRENCY", 16)
+        max_retries = env.int("BROADCAST_MAX_RETRIES", 5)
+        undeliverable_ttl = env.int("BROADCAST_UNDELIVERABLE_TTL", 7 * 24 * 3600)
+
+        return BroadcastConfig(
+            rate=rate,
+            burst=burst,
+            concurrency=concurrency,
+            max_retries=max_retries,
+            undeliverable_ttl=undeliverable_ttl,
+        )
+
+
+@dataclass
+class NotificationsConfig:
+    """
+    Outbound notification queue configuration class.
+
+    Attributes
+    ----------
+    workers : int
+        Number of concurrent notification senders.
+    dead_letter_limit : int
+        Maximum number of undelivered notifications kept in the dead-letter list.
+    dead_letter_retry_interval : int
+        Seconds between redelivery attempts of dead-lettered notifications.
+    dead_letter_max_rounds : int
+        Redelivery attempts after which a notification stays in the dead-letter list.
+    digest_window : float
+        Seconds non-urgent notifications to one user are collected into a digest
+        (0 disables digests).
+    """
+
+    workers: int
+    dead_letter_limit: int
+    dead_letter_retry_interval: int
+    dead_letter_max_rounds: int
+    digest_window: float
+
+    @staticmethod
+    def from_env(env: Env):
+        """
+        Creates the NotificationsConfig object from environment variables.
+        """
+        workers = env.int("NOTIFICATIONS_WORKERS", 8)
+        dead_letter_limit = env.int("NOTIFICATIONS_DEAD_LETTER_LIMIT", 1000)
+        dead_letter_retry_interval = env.int(
+            "NOTIFICATIONS_DEAD_LETTER_RETRY_INTERVAL", 900
+        )
+        dead_letter_max_rounds = env.int("NOTIFICATIONS_DEAD_LETTER_MAX_ROUNDS", 3)
+        digest_window = env.float("NOTIFICATIONS_DIGEST_WINDOW", 60)
+
+        return NotificationsConfig(
+            workers=workers,
+            dead_letter_limit=dead_letter_limit,
+            dead_letter_retry_interval=dead_letter_retry_interval,
+            dead_letter_max_rounds=dead_letter_max_rounds,
+            digest_window=digest_window,
+        )
+
+
+@dataclass
+class CasinoConfig:
+    """
+    Casino command rate limiting configuration class.
+
+    Attributes
+    ----------
+    default_limit : str
+        Limit preset for groups that did not choose one (strict, normal or relaxed).
+    shared_limits : bool
+        Whether limiter buckets are kept in Redis and shared by all bot processes.
+    """
+
+    default_limit: str
+    shared_limits: bool
+
+    @staticmethod
+    def from_env(env: Env):
+        """
+        Creates the CasinoConfig object from environment variables.
+        """
+        default_limit = env.str("CASINO_DEFAULT_LIMIT", "normal")
+        shared_limits = env.bool("CASINO_SHARED_LIMITS", True)
+
+        return CasinoConfig(default_limit=default_limit, shared_limits=shared_limits)
+
+
 @dataclass
 class Miscellaneous:
     """
@@ -229,6 +648,24 @@ class Config:
         Holds the settings specific to the database (default is None).
     redis : Optional[RedisConfig]
         Holds the settings specific to Redis (default is None).
+    metrics : Optional[MetricsConfig]
+        Holds the settings of handler instrumentation (default is None).
+    profiling : Optional[ProfilingConfig]
+        Holds the settings of the slow-update profiler (default is None).
+    concurrency : Optional[ConcurrencyConfig]
+        Holds the per-cost-class handler concurrency limits (default is None).
+    webhook : Optional[WebhookConfig]
+        Holds the webhook mode settings (default is None).
+    scheduler : Optional[SchedulerConfig]
+        Holds the process role and scheduled job distribution (default is None).
+    logging : Optional[LoggingConfig]
+        Holds the logging mode and sampling settings (default is None).
+    broadcast : Optional[BroadcastConfig]
+        Holds the broadcast rate limits and retry settings (default is None).
+    notifications : Optional[NotificationsConfig]
+        Holds the outbound notification queue settings (default is None).
+    casino : Optional[CasinoConfig]
+        Holds the casino command rate limits (default is None).
     """
 
     tg_bot: TgBot
@@ -236,6 +673,15 @@ class Config:
     misc: Miscellaneous
     db: Optional[DbConfig] = None
     redis: Optional[RedisConfig] = None
+    metrics: Optional[MetricsConfig] = None
+    profiling: Optional[ProfilingConfig] = None
+    concurrency: Optional[ConcurrencyConfig] = None
+    webhook: Optional[WebhookConfig] = None
+    scheduler: Optional[SchedulerConfig] = None
+    logging: Optional[LoggingConfig] = None
+    broadcast: Optional[BroadcastConfig] = None
+    notifications: Optional[NotificationsConfig] = None
+    casino: Optional[CasinoConfig] = None
 
 
 def load_config(path: str = None) -> Config:
@@ -256,5 +702,14 @@ def load_config(path: str = None) -> Config:
         mail=MailConfig.from_env(env),
         db=DbConfig.from_env(env),
         redis=RedisConfig.from_env(env),
+        metrics=MetricsConfig.from_env(env),
+        profiling=ProfilingConfig.from_env(env),
+        concurrency=ConcurrencyConfig.from_env(env),
+        webhook=WebhookConfig.from_env(env),
+        scheduler=SchedulerConfig.from_env(env),
+        logging=LoggingConfig.from_env(env),
+        broadcast=BroadcastConfig.from_env(env),
+        notifications=NotificationsConfig.from_env(env),
+        casino=CasinoConfig.from_env(env),
         misc=Miscellaneous(),
     )
@@ -5,6 +5,7 @@ from aiogram.types import CallbackQuery
 from tgbot.filters.role import AdministratorFilter
 from tgbot.keyboards.admin.schedule.main import schedule_kb
 from tgbot.keyboards.user.main import MainMenu
+from tgbot.services.concurrency import LIGHT
 
 admin_schedule_router = Router()
 admin_schedule_router.message.filter(F.chat.type == "private", AdministratorFilter())
@@ -13,7 +14,9 @@ admin_schedule_router.callback_query.filter(
 )
 
 
-@admin_schedule_router.callback_query(MainMenu.filter(F.menu == "schedule"))
+@admin_schedule_router.callback_query(
+    MainMenu.filter(F.menu == "schedule"), flags=LIGHT
+)
 async def schedule_cb(callback: CallbackQuery, state: FSMContext):
     await state.clear()
     await callback.message.edit_text(
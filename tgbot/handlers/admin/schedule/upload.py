@@ -1,9 +1,10 @@
+from __future__ import annotations
+
 import fnmatch
 import logging
 import re
 from pathlib import Path
 
-import pandas as pd
 from aiogram import F, Router
 from aiogram.fsm.context import FSMContext
 from aiogram.types import CallbackQuery, Message
@@ -13,12 +14,15 @@ from stp_database import MainRequestsRepo
 from tgbot.filters.role import AdministratorFilter
 from tgbot.keyboards.admin.schedule.main import ScheduleMenu, schedule_kb
 from tgbot.keyboards.admin.schedule.upload import schedule_upload_back_kb
+from tgbot.misc.lazy import lazy_import
 from tgbot.misc.states.admin.upload import UploadFile
 from tgbot.services.schedule.user_processor import (
     process_fired_users_with_stats,
     process_user_changes,
 )
 
+pd = lazy_import("pandas")
+
 # Router setup
 admin_upload_router = Router()
 admin_upload_router.message.filter(F.chat.type == "private", AdministratorFilter())
@@ -24,6 +24,8 @@ from tgbot.keyboards.group.main import (
     group_settings_kb,
 )
 from tgbot.misc.dicts import roles
+from tgbot.services.group_cache import groups_cache
+from tgbot.services.rate_limit import CASINO_LIMITS, casino_limiter
 
 deeplink_group = Router()
 logger = logging.getLogger(__name__)
@@ -94,7 +96,11 @@ async def handle_settings(
 <i>Используй меню для управления функциями бота в группе</i>
 
 💡 <b>Совет:</b> Теперь все настройки групп доступны через основное меню бота в разделе "Группы"!""",
-                reply_markup=group_settings_kb(group, 1),
+                reply_markup=group_settings_kb(
+                    group,
+                    1,
+                    await casino_limiter.get_limit_title(group.group_id),
+                ),
             )
         else:
             # Show info for regular user
@@ -144,13 +150,18 @@ async def _update_toggle_setting(
     updated_group = await stp_repo.group.update_group(
         group_id=group.group_id, **update_data
     )
+    groups_cache.invalidate_group(group.group_id)
 
     if updated_group:
         status = "включено" if new_value else "выключено"
         await callback.answer(f"{success_message} {status}")
 
         await callback.message.edit_reply_markup(
-            reply_markup=group_settings_kb(updated_group, 1)
+            reply_markup=group_settings_kb(
+                updated_group,
+                1,
+                await casino_limiter.get_limit_title(updated_group.group_id),
+            )
         )
         logger.info(f"Successfully updated group {group.group_id} setting {field_name}")
     else:
@@ -200,6 +211,16 @@ async def handle_settings_callback(
                 "Приветствие новых участников",
             )
 
+        case "casino_limit":
+            limit = CASINO_LIMITS[await casino_limiter.next_limit(group.group_id)]
+            logger.info(
+                f"[Казино] Группа {group.group_id}: частота казино изменена на {limit.title}"
+            )
+            await callback.answer(f"Частота казино: {limit.title}")
+            await callback.message.edit_reply_markup(
+                reply_markup=group_settings_kb(group, 1, limit.title)
+            )
+
         case "access":
             # Initialize pending changes with current roles
             pending_role_changes[group.group_id] = (group.allowed_roles or []).copy()
@@ -318,7 +339,11 @@ async def handle_settings_callback(
 - 🔴 Опция выключена
 
 <i>Используй меню для управления функциями бота в группе</i>""",
-                reply_markup=group_settings_kb(group, 1),
+                reply_markup=group_settings_kb(
+                    group,
+                    1,
+                    await casino_limiter.get_limit_title(group.group_id),
+                ),
             )
 
 
@@ -381,6 +406,7 @@ async def handle_access_apply_callback(
             updated_group = await stp_repo.group.update_group(
                 group_id=group.group_id, allowed_roles=new_roles
             )
+            groups_cache.invalidate_group(group.group_id)
 
             if updated_group:
                 await callback.answer("✅ Настройки доступа применены!")
@@ -563,6 +589,7 @@ async def handle_member_action(
             removal_success = await stp_repo.group_member.remove_member(
                 group_id=group.group_id, member_id=callback_data.member_id
             )
+            groups_cache.forget_member(group.group_id, callback_data.member_id)
 
             if removal_success:
                 await callback.answer("✅ Участник забанен и удален из базы")
@@ -705,6 +732,7 @@ async def handle_service_messages_apply_callback(
             updated_group = await stp_repo.group.update_group(
                 group_id=group.group_id, service_messages=new_categories
             )
+            groups_cache.invalidate_group(group.group_id)
 
             if updated_group:
                 await callback.answer("✅ Настройки сервисных сообщений применены!")
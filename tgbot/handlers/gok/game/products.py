@@ -19,6 +19,7 @@ from tgbot.keyboards.gok.main import (
     GokPurchaseActivationMenu,
     parse_filters,
 )
+from tgbot.services.notifications import notify
 
 gok_game_products_router = Router()
 gok_game_products_router.message.filter(F.chat.type == "private", GokFilter())
@@ -304,9 +305,12 @@ async def gok_purchase_action(
 
 📍 Осталось активаций: {product.count - purchase.usage_count} из {product.count}"""
 
-            await callback.bot.send_message(
-                chat_id=employee_user.user_id,
-                text=employee_notify_message,
+            await notify(
+                callback.bot,
+                employee_user.user_id,
+                employee_notify_message,
+                job="purchases",
+                urgent=True,
             )
 
             logger.info(
@@ -326,11 +330,14 @@ async def gok_purchase_action(
                 show_alert=True,
             )
 
-            await callback.bot.send_message(
-                chat_id=employee_user.user_id,
-                text=f"""<b>Активация отменена:</b> {product.name}
+            await notify(
+                callback.bot,
+                employee_user.user_id,
+                f"""<b>Активация отменена:</b> {product.name}
 
 ГОК <a href='t.me/{user.username}'>{user.fullname}</a> отменил активацию предмета""",
+                job="purchases",
+                urgent=True,
             )
 
             logger.info(
@@ -5,6 +5,8 @@ from aiogram.filters import IS_ADMIN, IS_MEMBER, IS_NOT_MEMBER, ChatMemberUpdate
 from aiogram.types import ChatMemberUpdated
 from stp_database.repo.STP.requests import MainRequestsRepo
 
+from tgbot.services.group_cache import groups_cache
+
 logger = logging.getLogger(__name__)
 
 chat_member = Router()
@@ -32,6 +34,7 @@ async def bot_got_direct_admin_rights(
             group = await stp_repo.group.add_group(
                 group_id=event.chat.id, invited_by=event.from_user.id
             )
+            groups_cache.invalidate_group(event.chat.id)
             if group:
                 logger.info(
                     f"[БД] Группа {event.chat.id} добавлена в базу данных пользователем {event.from_user.id}"
@@ -109,6 +112,7 @@ async def bot_got_manual_admin_rights(
             group = await stp_repo.group.add_group(
                 group_id=event.chat.id, invited_by=event.from_user.id
             )
+            groups_cache.invalidate_group(event.chat.id)
             if group:
                 logger.info(
                     f"[БД] Группа {event.chat.id} добавлена в базу данных пользователем {event.from_user.id}"
@@ -27,6 +27,8 @@ from tgbot.keyboards.group.main import (
 )
 from tgbot.middlewares.GroupsMiddleware import GroupsMiddleware
 from tgbot.misc.dicts import roles
+from tgbot.services.group_cache import groups_cache
+from tgbot.services.rate_limit import CASINO_LIMITS, casino_limiter
 
 logger = logging.getLogger(__name__)
 
@@ -126,13 +128,18 @@ async def _update_toggle_setting(
     updated_group = await stp_repo.group.update_group(
         group_id=group.group_id, **update_data
     )
+    groups_cache.invalidate_group(group.group_id)
 
     if updated_group:
         status = "включено" if new_value else "выключено"
         await callback.answer(f"{success_message} {status}")
 
         await callback.message.edit_reply_markup(
-            reply_markup=group_settings_kb(updated_group, page)
+            reply_markup=group_settings_kb(
+                updated_group,
+                page,
+                await casino_limiter.get_limit_title(updated_group.group_id),
+            )
         )
         logger.info(f"Successfully updated group {group.group_id} setting {field_name}")
     else:
@@ -237,7 +244,11 @@ async def handle_group_selection(
 - 🔴 Опция выключена
 
 <i>Используй меню для управления функциями бота в группе</i>""",
-                reply_markup=group_settings_kb(group, callback_data.page),
+                reply_markup=group_settings_kb(
+                    group,
+                    callback_data.page,
+                    await casino_limiter.get_limit_title(group.group_id),
+                ),
             )
         else:
             await callback.message.edit_text(
@@ -354,6 +365,16 @@ async def handle_settings_callback(
                 callback_data.page,
             )
 
+        case "casino_limit":
+            limit = CASINO_LIMITS[await casino_limiter.next_limit(group.group_id)]
+            logger.info(
+                f"[Казино] Группа {group.group_id}: частота казино изменена на {limit.title}"
+            )
+            await callback.answer(f"Частота казино: {limit.title}")
+            await callback.message.edit_reply_markup(
+                reply_markup=group_settings_kb(group, callback_data.page, limit.title)
+            )
+
         case "access":
             pending_role_changes[group.group_id] = (group.allowed_roles or []).copy()
 
@@ -468,7 +489,11 @@ async def handle_settings_callback(
 - 🔴 Опция выключена
 
 <i>Используй меню для управления функциями бота в группе</i>""",
-                reply_markup=group_settings_kb(group, callback_data.page),
+                reply_markup=group_settings_kb(
+                    group,
+                    callback_data.page,
+                    await casino_limiter.get_limit_title(group.group_id),
+                ),
             )
 
     await callback.answer()
@@ -547,6 +572,7 @@ async def handle_access_apply_callback(
             updated_group = await stp_repo.group.update_group(
                 group_id=group.group_id, allowed_roles=new_roles
             )
+            groups_cache.invalidate_group(group.group_id)
 
             if updated_group:
                 await callback.answer("✅ Настройки доступа применены!")
@@ -660,6 +686,7 @@ async def handle_service_messages_apply_callback(
             updated_group = await stp_repo.group.update_group(
                 group_id=group.group_id, service_messages=new_categories
             )
+            groups_cache.invalidate_group(group.group_id)
 
             if updated_group:
                 await callback.answer("✅ Настройки сервисных сообщений применены!")
@@ -860,6 +887,7 @@ async def handle_member_action(
             removal_success = await stp_repo.group_member.remove_member(
                 group_id=group.group_id, member_id=callback_data.member_id
             )
+            groups_cache.forget_member(group.group_id, callback_data.member_id)
 
             if removal_success:
                 await callback.answer("✅ Участник забанен и удален из базы")
@@ -1020,6 +1048,7 @@ async def group_remove_bot_execute_cb(
 
         try:
             await stp_repo.group.delete_group(callback_data.group_id)
+            groups_cache.invalidate_group(callback_data.group_id)
             logger.info(f"Deleted group {callback_data.group_id} from database")
         except Exception as e:
             logger.error(f"Failed to delete group {callback_data.group_id}: {e}")
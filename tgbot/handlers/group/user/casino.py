@@ -1,11 +1,12 @@
-import asyncio
 import logging
 import re
+import uuid
 from typing import Optional
 
-from aiogram import F, Router
+from aiogram import Bot, F, Router
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command
-from aiogram.types import Message
+from aiogram.types import Message, ReplyParameters
 from stp_database import Employee
 from stp_database.repo.STP.requests import MainRequestsRepo
 
@@ -20,6 +21,8 @@ from tgbot.handlers.user.game.casino import (
     get_dice_result_multiplier,
     get_slot_result_multiplier,
 )
+from tgbot.services.balances import balance_ledger
+from tgbot.services.casino import GROUP, CasinoRound, casino_table
 
 logger = logging.getLogger(__name__)
 
@@ -64,10 +67,22 @@ async def play_casino_game(
         )
         return
 
-    # Проверяем баланс пользователя
-    user_balance = await stp_repo.transaction.get_user_balance(user.user_id)
+    # Минимальная ставка
+    if bet_amount < 10:
+        await message.reply(
+            """❌ <b>Минимальная ставка - 10 баллов!</b>
+            
+Попробуй еще раз с большей ставкой""",
+        )
+        return
+
+    # Резервируем ставку, чтобы параллельные игры не потратили те же баллы
+    round_id = uuid.uuid4().hex
+    reserved, user_balance = await balance_ledger.reserve(
+        stp_repo, user.user_id, bet_amount, round_id
+    )
 
-    if bet_amount > user_balance:
+    if not reserved:
         await message.reply(
             f"""❌ <b>Недостаточно средств!</b>
             
@@ -78,15 +93,6 @@ async def play_casino_game(
         )
         return
 
-    # Минимальная ставка
-    if bet_amount < 10:
-        await message.reply(
-            """❌ <b>Минимальная ставка - 10 баллов!</b>
-            
-Попробуй еще раз с большей ставкой""",
-        )
-        return
-
     # Настройки для разных игр
     game_config = {
         "dice": {
@@ -117,82 +123,95 @@ async def play_casino_game(
 
     config = game_config.get(game_type, game_config["slots"])
 
-    # Информируем о начале игры
-    loading_msg = await message.reply(
-        f"""{config["loading_text"]}
+    try:
+        # Информируем о начале игры
+        loading_msg = await message.reply(
+            f"""{config["loading_text"]}
         
 👤 Игрок: {user.fullname}
 💰 Ставка: {bet_amount} баллов
 ⏰ Ждем результат...""",
-    )
-
-    # Отправляем анимированную игру
-    game_result = await message.answer_dice(emoji=config["emoji"])
-    game_value = game_result.dice.value
-
-    # Ждем анимацию
-    if game_type == "dice":
-        await asyncio.sleep(3)
-    else:
-        await asyncio.sleep(2)
-
-    # Определяем результат
-    result_text, multiplier = config["multiplier_func"](game_value)
-    game_name = config["game_name"]
-
-    if multiplier > 0:
-        # Выигрыш
-        winnings = int(bet_amount * multiplier)
+        )
 
-        # Записываем транзакцию выигрыша
-        transaction, new_balance = await stp_repo.transaction.add_transaction(
+        # Отправляем анимированную игру
+        game_result = await message.answer_dice(emoji=config["emoji"])
+    except Exception:
+        await balance_ledger.release(user.user_id, round_id)
+        raise
+
+    # Результат известен сразу, итог подводится после анимации
+    # отложенной задачей, соединения с БД обработчик не удерживает
+    result_text, multiplier = config["multiplier_func"](game_result.dice.value)
+    await casino_table.play(
+        CasinoRound(
+            round_id=round_id,
             user_id=user.user_id,
-            transaction_type="earn",
-            source_type="casino",
-            amount=winnings - bet_amount,
-            comment=f"Выигрыш в {game_name} (группа): {result_text} (x{multiplier})",
+            chat_id=message.chat.id,
+            mode=GROUP,
+            game_type=game_type,
+            game_name=config["game_name"],
+            bet=bet_amount,
+            result_text=result_text,
+            multiplier=multiplier,
+            balance_before=user_balance,
+            player_name=user.fullname,
+            reply_to_message_id=message.message_id,
+            loading_message_id=loading_msg.message_id,
         )
+    )
+
 
+@casino_table.renderer(GROUP)
+async def send_group_casino_result(
+    bot: Bot, casino_round: CasinoRound, new_balance: int
+):
+    """Итог раунда казино в группе"""
+    if casino_round.multiplier > 0:
+        # Выигрыш
         final_result = f"""🎉 <b>Победа!</b> 🎉
 
-👤 <b>{user.fullname}</b>
-{result_text}
+👤 <b>{casino_round.player_name}</b>
+{casino_round.result_text}
 
-🔥 Выигрыш: {bet_amount} x{multiplier} = {winnings} баллов!
-✨ Баланс: {user_balance} → {new_balance} баллов"""
+🔥 Выигрыш: {casino_round.bet} x{casino_round.multiplier} = {casino_round.winnings} баллов!
+✨ Баланс: {casino_round.balance_before} → {new_balance} баллов"""
 
         logger.info(
-            f"[Казино-Группа] {user.fullname} выиграл {winnings} баллов в {game_name} ({result_text})"
+            f"[Казино-Группа] {casino_round.player_name} выиграл {casino_round.winnings} баллов в {casino_round.game_name} ({casino_round.result_text})"
         )
 
     else:
         # Проигрыш
-        # Списываем ставку
-        transaction, new_balance = await stp_repo.transaction.add_transaction(
-            user_id=user.user_id,
-            transaction_type="spend",
-            source_type="casino",
-            amount=bet_amount,
-            comment=f"Проигрыш в {game_name} (группа): {result_text}",
-        )
-
         final_result = f"""💔 <b>Проигрыш</b>
 
-👤 <b>{user.fullname}</b>
-{result_text}
+👤 <b>{casino_round.player_name}</b>
+{casino_round.result_text}
 
-💸 Потрачено: -{bet_amount} баллов
-✨ Баланс: {user_balance} → {new_balance} баллов
+💸 Потрачено: -{casino_round.bet} баллов
+✨ Баланс: {casino_round.balance_before} → {new_balance} баллов
 
 <i>Попробуй еще раз - удача рядом!</i>"""
 
         logger.info(
-            f"[Казино-Группа] {user.fullname} проиграл {bet_amount} баллов в {game_name} ({result_text})"
+            f"[Казино-Группа] {casino_round.player_name} проиграл {casino_round.bet} баллов в {casino_round.game_name} ({casino_round.result_text})"
         )
 
     # Удаляем сообщение загрузки и показываем финальный результат
-    await loading_msg.delete()
-    await message.reply(final_result)
+    if casino_round.loading_message_id:
+        try:
+            await bot.delete_message(
+                casino_round.chat_id, casino_round.loading_message_id
+            )
+        except TelegramBadRequest:
+            pass
+    await bot.send_message(
+        casino_round.chat_id,
+        final_result,
+        reply_parameters=ReplyParameters(
+            message_id=casino_round.reply_to_message_id,
+            allow_sending_without_reply=True,
+        ),
+    )
 
 
 @group_casino_router.message(Command("slots"))
@@ -12,6 +12,8 @@ from stp_database.repo.STP.requests import MainRequestsRepo
 
 from tgbot.filters.role import DutyFilter, MultiRoleFilter, SpecialistFilter
 from tgbot.keyboards.group import short_name
+from tgbot.services.balances import balance_ledger
+from tgbot.services.leaderboards import Board, leaderboards
 from tgbot.services.leveling import LevelingSystem
 
 logger = logging.getLogger(__name__)
@@ -92,10 +94,9 @@ async def admins_cmd(message: Message, user: Employee, stp_repo: MainRequestsRep
 async def balance_cmd(message: Message, user: Employee, stp_repo: MainRequestsRepo):
     """/balance для получения своего баланса"""
     try:
-        user_balance = await stp_repo.transaction.get_user_balance(user_id=user.user_id)
-        achievements_sum = await stp_repo.transaction.get_user_achievements_sum(
-            user_id=user.user_id
-        )
+        user_ledger = await balance_ledger.get(stp_repo, user.user_id)
+        user_balance = user_ledger.balance
+        achievements_sum = user_ledger.achievements
         level_info_text = LevelingSystem.get_level_info_text(
             achievements_sum, user_balance
         )
@@ -116,58 +117,38 @@ async def balance_cmd(message: Message, user: Employee, stp_repo: MainRequestsRe
 async def top_cmd(message: Message, user: Employee, stp_repo: MainRequestsRepo):
     """/top для получения рейтинга группы"""
     try:
-        # Получаем участников группы из базы
-        group_members_data = await stp_repo.group_member.get_group_members(
-            message.chat.id
-        )
+        entries = await leaderboards.top(stp_repo, Board.chat(message.chat.id))
 
-        if not group_members_data:
+        if not entries:
             await message.reply(
                 "🎖️ <b>Рейтинг группы по баллам</b>\n\n<i>Нет участников в базе для этой группы</i>"
             )
             return
 
-        # Получаем информацию о сотрудниках и их балансах
-        balance_data = []
-
-        for member_data in group_members_data:
-            # Получаем информацию о сотруднике по member_id
-            employee = await stp_repo.employee.get_user(user_id=member_data.member_id)
-            if employee and employee.user_id:
-                balance = await stp_repo.transaction.get_user_balance(employee.user_id)
-                balance_data.append({"employee": employee, "balance": balance})
-
-        # Сортируем по балансу (больше = лучше)
-        balance_data.sort(key=lambda x: x["balance"], reverse=True)
-
         # Формируем сообщение
         message_text = "🎖️ <b>Рейтинг группы по баллам</b>\n\n"
 
-        if not balance_data:
-            message_text += "<i>Нет данных о балансе участников</i>"
-        else:
-            for i, data in enumerate(balance_data, 1):
-                employee = data["employee"]
-                balance = data["balance"]
-
-                # Эмодзи для позиций
-                if i == 1:
-                    position_emoji = "🥇"
-                elif i == 2:
-                    position_emoji = "🥈"
-                elif i == 3:
-                    position_emoji = "🥉"
-                else:
-                    position_emoji = f"{i}."
+        for i, entry in enumerate(entries, 1):
+            # Эмодзи для позиций
+            if i == 1:
+                position_emoji = "🥇"
+            elif i == 2:
+                position_emoji = "🥈"
+            elif i == 3:
+                position_emoji = "🥉"
+            else:
+                position_emoji = f"{i}."
 
-                # Формируем строку рейтинга
-                if employee.username:
-                    employee_link = f"<a href='t.me/{employee.username}'>{short_name(employee.fullname)}</a>"
-                else:
-                    employee_link = short_name(employee.fullname)
+            # Формируем строку рейтинга
+            if entry.username:
+                employee_link = (
+                    f"<a href='t.me/{entry.username}'>{short_name(entry.fullname)}</a>"
+                )
+            else:
+                employee_link = short_name(entry.fullname)
 
-                message_text += f"{position_emoji} <b>{employee_link}</b>\n"
-                message_text += f"{balance} баллов\n"
+            message_text += f"{position_emoji} <b>{employee_link}</b>\n"
+            message_text += f"{entry.balance} баллов\n"
 
         await message.reply(message_text)
 
@@ -8,11 +8,20 @@ from stp_database.repo.STP.requests import MainRequestsRepo
 
 from tgbot.filters.role import HeadFilter
 from tgbot.keyboards.head.group.game.history import (
+    HeadGroupHistoryMenu,
     HeadTransactionDetailMenu,
     head_group_history_kb,
+    head_history_members_kb,
     head_transaction_detail_kb,
 )
 from tgbot.keyboards.head.group.game.main import HeadGameMenu
+from tgbot.keyboards.head.group.members import short_name
+from tgbot.services.history import (
+    FIRST,
+    HISTORY_PAGE_SIZE,
+    HistoryFilters,
+    transaction_history,
+)
 
 head_game_history_router = Router()
 head_game_history_router.callback_query.filter(
@@ -22,61 +31,84 @@ head_game_history_router.callback_query.filter(
 logger = logging.getLogger(__name__)
 
 
-@head_game_history_router.callback_query(HeadGameMenu.filter(F.menu == "history"))
-async def head_group_history(
+async def show_group_history(
     callback: CallbackQuery,
-    callback_data: HeadGameMenu,
     user: Employee,
     stp_repo: MainRequestsRepo,
+    filters: HistoryFilters = HistoryFilters(),
+    page: int = 1,
+    direction: str = FIRST,
+    cursor: int = 0,
 ):
-    if not user:
-        await callback.message.edit_text(
-            "❌ <b>Ошибка</b>\n\nНе удалось найти информацию в базе данных."
-        )
-        return
-
-    # Получаем транзакции группы
-    group_transactions = await stp_repo.transaction.get_group_transactions(
-        user.fullname
-    )
-
-    group_members_result = await stp_repo.session.execute(
-        select(Employee).where(Employee.head == user.fullname)
+    """Показывает страницу истории группы с итогами сотрудников"""
+    # Итоги считаются в БД и заодно дают количество транзакций ленты
+    summaries = await transaction_history.group_summary(
+        stp_repo.session, user.fullname, filters
     )
-    members = group_members_result.scalars().all()
-    employee_names = {
-        member.user_id: member.fullname for member in members if member.user_id
-    }
-
-    page = callback_data.page
+    total_transactions = sum(summary.transactions for summary in summaries)
+
+    transactions = []
+    if total_transactions:
+        transactions = await transaction_history.group_page(
+            stp_repo.session,
+            user.fullname,
+            filters,
+            direction,
+            cursor,
+            total_transactions,
+        )
+        if not transactions and direction != FIRST:
+            # Граничная транзакция пропала - начинаем с первой страницы
+            page = 1
+            transactions = await transaction_history.group_page(
+                stp_repo.session, user.fullname, filters
+            )
+
+    member_name = ""
+    if filters.member:
+        member_name = next(
+            (
+                short_name(summary.fullname)
+                for summary in summaries
+                if summary.user_id == filters.member
+            ),
+            "Сотрудник",
+        )
 
-    if not group_transactions:
-        await callback.message.edit_text(
-            """📜 <b>История группы</b>
+    if not transactions:
+        message_text = """📜 <b>История группы</b>
 
 Здесь отображается вся история операций с баллами всех участников твоей группы
 
-У группы пока нет транзакций 🙂
+Транзакций не найдено 🙂
 
-<i>Транзакции появляются при покупке предметов участниками, получении достижений и других операциях с баллами</i>""",
-            reply_markup=head_group_history_kb(
-                [], current_page=page, employee_names=employee_names
-            ),
+<i>Транзакции появляются при покупке предметов участниками, получении достижений и других операциях с баллами</i>"""
+    else:
+        summary_lines = "\n".join(
+            f"{short_name(summary.fullname)}: +{summary.earned} / -{summary.spent} ({summary.transactions})"
+            for summary in summaries
         )
-        return
-
-    total_transactions = len(group_transactions)
-
-    message_text = f"""📜 <b>История группы</b>
+        message_text = f"""📜 <b>История группы</b>
 
 Здесь отображается вся история операций с баллами всех участников твоей группы
 
+<b>Итоги сотрудников</b> (начислено / списано, транзакций)
+<blockquote expandable>{summary_lines}</blockquote>
+
 <i>Всего транзакций: {total_transactions}</i>"""
 
     await callback.message.edit_text(
         message_text,
         reply_markup=head_group_history_kb(
-            group_transactions, current_page=page, employee_names=employee_names
+            [
+                (transaction, short_name(fullname))
+                for transaction, fullname in transactions
+            ],
+            current_page=page,
+            total_transactions=total_transactions,
+            filters=filters,
+            member_name=member_name,
+            transactions_per_page=HISTORY_PAGE_SIZE,
         ),
     )
 
@@ -85,30 +117,92 @@ async def head_group_history(
     )
 
 
+@head_game_history_router.callback_query(HeadGameMenu.filter(F.menu == "history"))
+async def head_group_history(
+    callback: CallbackQuery,
+    user: Employee,
+    stp_repo: MainRequestsRepo,
+):
+    if not user:
+        await callback.message.edit_text(
+            "❌ <b>Ошибка</b>\n\nНе удалось найти информацию в базе данных."
+        )
+        return
+
+    await show_group_history(callback, user, stp_repo)
+
+
+@head_game_history_router.callback_query(HeadGroupHistoryMenu.filter(F.menu == "f"))
+async def head_group_history_paginated(
+    callback: CallbackQuery,
+    callback_data: HeadGroupHistoryMenu,
+    user: Employee,
+    stp_repo: MainRequestsRepo,
+):
+    """Пагинация и фильтры истории группы"""
+    await show_group_history(
+        callback,
+        user,
+        stp_repo,
+        filters=callback_data.filters,
+        page=callback_data.page,
+        direction=callback_data.direction,
+        cursor=callback_data.cursor,
+    )
+
+
+@head_game_history_router.callback_query(HeadGroupHistoryMenu.filter(F.menu == "m"))
+async def head_group_history_members(
+    callback: CallbackQuery,
+    callback_data: HeadGroupHistoryMenu,
+    user: Employee,
+    stp_repo: MainRequestsRepo,
+):
+    """Выбор сотрудника для фильтра истории группы"""
+    result = await stp_repo.session.execute(
+        select(Employee.user_id, Employee.fullname)
+        .where(Employee.head == user.fullname, Employee.user_id.is_not(None))
+        .order_by(Employee.fullname)
+    )
+    members = [(user_id, short_name(fullname)) for user_id, fullname in result]
+
+    await callback.message.edit_text(
+        """📜 <b>История группы</b>
+
+Выбери сотрудника, чьи операции показать""",
+        reply_markup=head_history_members_kb(members, callback_data.filters),
+    )
+
+
 @head_game_history_router.callback_query(HeadTransactionDetailMenu.filter())
 async def head_transaction_detail_view(
     callback: CallbackQuery,
     callback_data: HeadTransactionDetailMenu,
+    user: Employee,
     stp_repo: MainRequestsRepo,
 ):
     """Обработчик детального просмотра транзакции группы"""
-    transaction_id = callback_data.transaction_id
     page = callback_data.page
+    filters = HistoryFilters(
+        callback_data.member, callback_data.kind, callback_data.period
+    )
+    back_kb = head_transaction_detail_kb(page, callback_data.anchor, filters)
 
-    # Получаем информацию о транзакции
-    transaction = await stp_repo.transaction.get_transaction(transaction_id)
+    # Транзакция и сотрудник одним запросом, только в пределах группы
+    found = await transaction_history.group_transaction(
+        stp_repo.session, user.fullname, callback_data.transaction_id
+    )
 
-    if not transaction:
+    if not found:
         await callback.message.edit_text(
             """📜 <b>История баланса группы</b>
 
 Не смог найти информацию о транзакции ☹""",
-            reply_markup=head_transaction_detail_kb(page),
+            reply_markup=back_kb,
         )
         return
 
-    # Получаем информацию о сотруднике
-    employee = await stp_repo.employee.get_user(user_id=transaction.user_id)
+    transaction, employee = found
 
     # Определяем эмодзи и текст типа операции
     type_emoji = "➕" if transaction.type == "earn" else "➖"
@@ -149,9 +243,7 @@ async def head_transaction_detail_view(
 <b>📅 Дата создания</b>
 {transaction.created_at.strftime("%d.%m.%Y в %H:%M")}"""
 
-    if transaction.use:
+    if transaction.comment:
         message_text += f"\n\n<b>💬 Комментарий</b>\n<blockquote expandable>{transaction.comment}</blockquote>"
 
-    await callback.message.edit_text(
-        message_text, reply_markup=head_transaction_detail_kb(page)
-    )
+    await callback.message.edit_text(message_text, reply_markup=back_kb)
@@ -10,6 +10,7 @@ from tgbot.filters.role import HeadFilter
 from tgbot.keyboards.head.group.game.main import HeadGameMenu
 from tgbot.keyboards.head.group.game.rating import game_balance_rating_kb
 from tgbot.keyboards.head.group.members import short_name
+from tgbot.services.leaderboards import Board, LeaderboardEntry, leaderboards
 
 head_group_game_rating_router = Router()
 head_group_game_rating_router.message.filter(F.chat.type == "private", HeadFilter())
@@ -20,32 +21,14 @@ head_group_game_rating_router.callback_query.filter(
 logger = logging.getLogger(__name__)
 
 
-async def format_balance_rating_message(
-    group_members, stp_repo: MainRequestsRepo
-) -> str:
+def format_balance_rating_message(entries: list[LeaderboardEntry]) -> str:
     """Форматирует сообщение с рейтингом группы по балансу"""
-
-    # Собираем данные о балансе для всех участников группы
-    balance_data = []
-
-    for member in group_members:
-        if member.user_id:  # Проверяем, что у пользователя есть user_id
-            balance = await stp_repo.transaction.get_user_balance(member.user_id)
-            balance_data.append({"member": member, "balance": balance})
-
-    # Сортируем по балансу (больше = лучше)
-    balance_data.sort(key=lambda x: x["balance"], reverse=True)
-
-    # Формируем сообщение
     message = "🎖️ <b>Рейтинг группы по балансу</b>\n\n"
 
-    if not balance_data:
+    if not entries:
         message += "<i>Нет данных о балансе участников</i>"
     else:
-        for i, data in enumerate(balance_data, 1):
-            member = data["member"]
-            balance = data["balance"]
-
+        for i, entry in enumerate(entries, 1):
             # Эмодзи для позиций
             if i == 1:
                 position_emoji = "🥇"
@@ -57,13 +40,15 @@ async def format_balance_rating_message(
                 position_emoji = f"{i}."
 
             # Формируем строку рейтинга
-            if member.username:
-                member_link = f"<a href='t.me/{member.username}'>{short_name(member.fullname)}</a>"
+            if entry.username:
+                member_link = (
+                    f"<a href='t.me/{entry.username}'>{short_name(entry.fullname)}</a>"
+                )
             else:
-                member_link = short_name(member.fullname)
+                member_link = short_name(entry.fullname)
 
             message += f"{position_emoji} <b>{member_link}</b>\n"
-            message += f"{balance} баллов\n"
+            message += f"{entry.balance} баллов\n"
 
     return message
 
@@ -81,19 +66,18 @@ async def group_balance_rating_cb(
         )
         return
 
-    # Получаем всех сотрудников этого руководителя
-    group_members = await stp_repo.employee.get_users_by_head(user.fullname)
+    try:
+        entries = await leaderboards.top(stp_repo, Board.head(user.fullname))
 
-    if not group_members:
-        await callback.message.edit_text(
-            "🎖️ <b>Рейтинг группы по балансу</b>\n\nУ тебя пока нет подчиненных в системе\n\n<i>Если это ошибка, обратись к администратору.</i>",
-            reply_markup=game_balance_rating_kb(),
-        )
-        return
+        if not entries:
+            await callback.message.edit_text(
+                "🎖️ <b>Рейтинг группы по балансу</b>\n\nУ тебя пока нет подчиненных в системе\n\n<i>Если это ошибка, обратись к администратору.</i>",
+                reply_markup=game_balance_rating_kb(),
+            )
+            return
 
-    try:
         # Формируем сообщение с рейтингом
-        message_text = await format_balance_rating_message(group_members, stp_repo)
+        message_text = format_balance_rating_message(entries)
 
         await callback.message.edit_text(
             message_text,
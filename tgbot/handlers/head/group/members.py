@@ -36,6 +36,7 @@ from tgbot.keyboards.head.group.members_kpi import head_member_kpi_kb
 from tgbot.keyboards.head.group.members_status import head_member_status_select_kb
 from tgbot.misc.helpers import get_role
 from tgbot.services.salary import KPICalculator, SalaryCalculator, SalaryFormatter
+from tgbot.services.statistics import player_statistics
 
 head_group_members_router = Router()
 head_group_members_router.message.filter(F.chat.type == "private", HeadFilter())
@@ -714,15 +715,10 @@ async def view_member_game_profile(
             return
 
         # Получаем игровую статистику пользователя
-        user_balance = await stp_repo.transaction.get_user_balance(
-            user_id=member.user_id
-        )
-        achievements_sum = await stp_repo.transaction.get_user_achievements_sum(
-            user_id=member.user_id
-        )
-        purchases_sum = await stp_repo.purchase.get_user_purchases_sum(
-            user_id=member.user_id
-        )
+        statistics = await player_statistics.user(stp_repo, member.user_id)
+        user_balance = statistics.balance
+        achievements_sum = statistics.achievements
+        purchases_sum = statistics.purchases_sum
         level_info_text = LevelingSystem.get_level_info_text(
             achievements_sum, user_balance
         )
@@ -7,6 +7,7 @@ from tgbot.handlers.head.schedule.group import head_group_schedule_service
 from tgbot.handlers.user.schedule.main import schedule_service
 from tgbot.keyboards.head.group.main import GroupManagementMenu
 from tgbot.keyboards.user.schedule.main import get_yekaterinburg_date, group_schedule_kb
+from tgbot.services.concurrency import HEAVY
 
 head_group_schedule_router = Router()
 head_group_schedule_router.message.filter(F.chat.type == "private", HeadFilter())
@@ -16,7 +17,8 @@ head_group_schedule_router.callback_query.filter(
 
 
 @head_group_schedule_router.callback_query(
-    GroupManagementMenu.filter(F.menu == "schedule")
+    GroupManagementMenu.filter(F.menu == "schedule"),
+    flags=HEAVY,
 )
 async def group_mgmt_schedule_cb(callback: CallbackQuery, user: Employee, stp_repo):
     """Обработчик расписания группы из меню управления"""
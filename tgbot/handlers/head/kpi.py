@@ -9,6 +9,7 @@ from stp_database.repo.KPI.requests import KPIRequestsRepo
 from tgbot.filters.role import HeadFilter
 from tgbot.keyboards.head.kpi import kpi_calculator_kb, kpi_kb, kpi_salary_kb
 from tgbot.keyboards.user.main import MainMenu
+from tgbot.services.concurrency import HEAVY
 from tgbot.services.salary import KPICalculator, SalaryCalculator, SalaryFormatter
 
 head_kpi_router = Router()
@@ -59,7 +60,9 @@ async def head_start_cb(
         await callback.answer("Обновлений нет")
 
 
-@head_kpi_router.callback_query(MainMenu.filter(F.menu == "kpi_calculator"))
+@head_kpi_router.callback_query(
+    MainMenu.filter(F.menu == "kpi_calculator"), flags=HEAVY
+)
 async def head_kpi_calculator_cb(
     callback: CallbackQuery, user: Employee, kpi_repo: KPIRequestsRepo
 ):
@@ -118,7 +121,7 @@ async def head_kpi_calculator_cb(
         await callback.answer("Обновлений нет")
 
 
-@head_kpi_router.callback_query(MainMenu.filter(F.menu == "kpi_salary"))
+@head_kpi_router.callback_query(MainMenu.filter(F.menu == "kpi_salary"), flags=HEAVY)
 async def head_kpi_salary_cb(
     callback: CallbackQuery, user: Employee, kpi_repo: KPIRequestsRepo
 ):
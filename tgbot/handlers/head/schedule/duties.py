@@ -12,6 +12,7 @@ from tgbot.keyboards.user.schedule.main import (
     duties_kb,
     get_yekaterinburg_date,
 )
+from tgbot.services.concurrency import HEAVY
 
 logger = logging.getLogger(__name__)
 
@@ -22,7 +23,9 @@ head_schedule_duty_router.callback_query.filter(
 )
 
 
-@head_schedule_duty_router.callback_query(ScheduleMenu.filter(F.menu == "duties"))
+@head_schedule_duty_router.callback_query(
+    ScheduleMenu.filter(F.menu == "duties"), flags=HEAVY
+)
 async def head_schedule(callback: CallbackQuery, user: Employee, stp_repo):
     """Обработчик расписания дежурных"""
     if not await schedule_service.check_user_auth(callback, user):
@@ -43,7 +46,7 @@ async def head_schedule(callback: CallbackQuery, user: Employee, stp_repo):
         await schedule_service.handle_schedule_error(callback, e)
 
 
-@head_schedule_duty_router.callback_query(DutyNavigation.filter())
+@head_schedule_duty_router.callback_query(DutyNavigation.filter(), flags=HEAVY)
 async def handle_head_navigation(
     callback: CallbackQuery, callback_data: DutyNavigation, user: Employee, stp_repo
 ):
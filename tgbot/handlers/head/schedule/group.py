@@ -13,6 +13,7 @@ from tgbot.keyboards.user.schedule.main import (
     get_yekaterinburg_date,
     group_schedule_kb,
 )
+from tgbot.services.concurrency import HEAVY
 from tgbot.services.schedule.parsers import GroupScheduleParser
 
 logger = logging.getLogger(__name__)
@@ -56,7 +57,9 @@ class HeadGroupScheduleService:
 head_group_schedule_service = HeadGroupScheduleService()
 
 
-@head_schedule_group_router.callback_query(ScheduleMenu.filter(F.menu == "group"))
+@head_schedule_group_router.callback_query(
+    ScheduleMenu.filter(F.menu == "group"), flags=HEAVY
+)
 async def head_group_schedule(callback: CallbackQuery, user: Employee, stp_repo):
     """Обработчик группового расписания для руководителя"""
     if not await schedule_service.check_user_auth(callback, user):
@@ -93,7 +96,8 @@ async def head_group_schedule(callback: CallbackQuery, user: Employee, stp_repo)
 
 
 @head_schedule_group_router.callback_query(
-    GroupNavigation.filter(F.user_type == "head")
+    GroupNavigation.filter(F.user_type == "head"),
+    flags=HEAVY,
 )
 async def handle_head_group_navigation(
     callback: CallbackQuery, callback_data: GroupNavigation, user: Employee, stp_repo
@@ -12,6 +12,7 @@ from tgbot.keyboards.user.schedule.main import (
     get_yekaterinburg_date,
     heads_kb,
 )
+from tgbot.services.concurrency import HEAVY
 
 logger = logging.getLogger(__name__)
 
@@ -22,7 +23,9 @@ head_schedule_head_router.callback_query.filter(
 )
 
 
-@head_schedule_head_router.callback_query(ScheduleMenu.filter(F.menu == "heads"))
+@head_schedule_head_router.callback_query(
+    ScheduleMenu.filter(F.menu == "heads"), flags=HEAVY
+)
 async def heads_schedule(callback: CallbackQuery, user: Employee, stp_repo):
     """Обработчик расписания руководителей групп"""
     if not await schedule_service.check_user_auth(callback, user):
@@ -43,7 +46,7 @@ async def heads_schedule(callback: CallbackQuery, user: Employee, stp_repo):
         await schedule_service.handle_schedule_error(callback, e)
 
 
-@head_schedule_head_router.callback_query(HeadNavigation.filter())
+@head_schedule_head_router.callback_query(HeadNavigation.filter(), flags=HEAVY)
 async def handle_head_navigation(
     callback: CallbackQuery, callback_data: HeadNavigation, user: Employee, stp_repo
 ):
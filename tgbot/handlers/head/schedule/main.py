@@ -8,6 +8,7 @@ from tgbot.filters.role import HeadFilter
 from tgbot.handlers.user.schedule.main import schedule_service
 from tgbot.keyboards.head.schedule.main import schedule_kb_head
 from tgbot.keyboards.user.main import MainMenu
+from tgbot.services.concurrency import LIGHT
 
 logger = logging.getLogger(__name__)
 
@@ -18,7 +19,7 @@ head_schedule_router.callback_query.filter(
 )
 
 
-@head_schedule_router.callback_query(MainMenu.filter(F.menu == "schedule"))
+@head_schedule_router.callback_query(MainMenu.filter(F.menu == "schedule"), flags=LIGHT)
 async def schedule(callback: CallbackQuery, user: Employee):
     """Главное меню расписаний"""
     if not await schedule_service.check_user_auth(callback, user):
@@ -12,6 +12,7 @@ from tgbot.keyboards.user.schedule.main import (
     create_detailed_schedule_keyboard,
     schedule_with_month_kb,
 )
+from tgbot.services.concurrency import HEAVY
 
 logger = logging.getLogger(__name__)
 
@@ -22,7 +23,9 @@ head_schedule_my_router.callback_query.filter(
 )
 
 
-@head_schedule_my_router.callback_query(ScheduleMenu.filter(F.menu == "my"))
+@head_schedule_my_router.callback_query(
+    ScheduleMenu.filter(F.menu == "my"), flags=HEAVY
+)
 async def head_schedule(callback: CallbackQuery, user: Employee):
     """Обработчик личного расписания"""
     if not await schedule_service.check_user_auth(callback, user):
@@ -45,7 +48,9 @@ async def head_schedule(callback: CallbackQuery, user: Employee):
         await schedule_service.handle_schedule_error(callback, e)
 
 
-@head_schedule_my_router.callback_query(MonthNavigation.filter(F.action == "compact"))
+@head_schedule_my_router.callback_query(
+    MonthNavigation.filter(F.action == "compact"), flags=HEAVY
+)
 async def handle_compact_view(callback: CallbackQuery, user: Employee):
     """Обработчик перехода к компактному виду"""
     if not await schedule_service.check_user_auth(callback, user):
@@ -72,7 +77,7 @@ async def handle_compact_view(callback: CallbackQuery, user: Employee):
         await callback.answer(f"Ошибка: {e}", show_alert=True)
 
 
-@head_schedule_my_router.callback_query(MonthNavigation.filter())
+@head_schedule_my_router.callback_query(MonthNavigation.filter(), flags=HEAVY)
 async def handle_month_navigation(
     callback: CallbackQuery, callback_data: MonthNavigation, user: Employee
 ):
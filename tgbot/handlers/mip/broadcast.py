@@ -1,13 +1,13 @@
-import asyncio
 import logging
 
-from aiogram import Bot, F, Router
+from aiogram import F, Router
 from aiogram.fsm.context import FSMContext
 from aiogram.types import CallbackQuery, Message
 from stp_database.repo.STP.requests import MainRequestsRepo
 
 from tgbot.filters.role import MipFilter
 from tgbot.keyboards.mip.broadcast import (
+    BroadcastJobMenu,
     BroadcastMenu,
     broadcast_kb,
     broadcast_type_kb,
@@ -17,6 +17,8 @@ from tgbot.keyboards.mip.broadcast import (
 )
 from tgbot.keyboards.user.main import MainMenu
 from tgbot.misc.states.mip.broadcast import BroadcastState
+from tgbot.services.broadcast_jobs import broadcast_jobs
+from tgbot.services.recipients import RecipientQuery, get_heads
 
 mip_broadcast_router = Router()
 mip_broadcast_router.message.filter(F.chat.type == "private", MipFilter())
@@ -110,9 +112,8 @@ async def broadcast_everyone(
     """Рассылка всем"""
     data = await state.get_data()
 
-    # Получаем всех пользователей
-    all_users = await stp_repo.employee.get_users()
-    user_count = len(all_users)
+    recipient_query = RecipientQuery.everyone()
+    user_count = await recipient_query.count(stp_repo.session)
 
     message_preview = data.get("message_text", "")
     if len(message_preview) > 150:
@@ -135,7 +136,7 @@ async def broadcast_everyone(
 
     await state.update_data(
         recipients="everyone",
-        recipient_ids=[user.user_id for user in all_users],
+        recipient_query=recipient_query.dump(),
         user_count=user_count,
     )
 
@@ -176,14 +177,10 @@ async def broadcast_division(
         case _:
             division_name = "НЦК"
 
-    # Получаем пользователей подразделения
-    all_users = await stp_repo.employee.get_users()
-    division_users = [
-        user for user in all_users if user.division == division_name and user.user_id
-    ]
-    user_count = len(division_users)
+    recipient_query = RecipientQuery.for_division(division_name)
+    user_count = await recipient_query.count(stp_repo.session)
 
-    if not division_users:
+    if not user_count:
         await callback.answer(
             f"❌ Пользователи {division_name} не найдены", show_alert=True
         )
@@ -211,7 +208,7 @@ async def broadcast_division(
 
     await state.update_data(
         recipients=division_code.lower(),
-        recipient_ids=[user.user_id for user in division_users],
+        recipient_query=recipient_query.dump(),
         user_count=user_count,
         division_name=division_name,
     )
@@ -224,17 +221,13 @@ async def select_heads(
     callback: CallbackQuery, state: FSMContext, stp_repo: MainRequestsRepo
 ):
     """Выбор руководителей для рассылки по группам"""
-    # Получаем всех руководителей
-    all_users = await stp_repo.employee.get_users()
-    heads = [user for user in all_users if user.role == 2]  # role 2 = head
+    # Руководители, отсортированные по ФИО
+    heads = await get_heads(stp_repo.session)
 
     if not heads:
         await callback.answer("❌ Руководители не найдены", show_alert=True)
         return
 
-    # Сортируем по ФИО
-    heads.sort(key=lambda x: x.fullname)
-
     await callback.message.edit_text(
         f"""<b>📢 Выбор групп</b>
 
@@ -242,13 +235,11 @@ async def select_heads(
 Выбери руководителей для рассылки их группам:
 
 <i>💡 Можно выбрать несколько групп</i>""",
-        reply_markup=heads_selection_kb(
-            [(head.fullname, head.user_id) for head in heads]
-        ),
+        reply_markup=heads_selection_kb(heads),
     )
 
     await state.update_data(
-        available_heads=[(head.fullname, head.user_id) for head in heads],
+        available_heads=heads,
         selected_heads=[],
     )
 
@@ -307,25 +298,14 @@ async def confirm_heads_selection(
         await callback.answer("❌ Выбери хотя бы одного руководителя", show_alert=True)
         return
 
-    # Получаем информацию о выбранных руководителях
-    selected_head_names = []
-    all_group_users = []
-
-    for head_id in selected_heads:
-        head_info = next((head for head in available_heads if head[1] == head_id), None)
-        if head_info:
-            head_name = head_info[0]
-            selected_head_names.append(head_name)
-
-            # Получаем сотрудников группы
-            group_users = await stp_repo.employee.get_users_by_head(head_name)
-            all_group_users.extend(group_users)
+    # ФИО выбранных руководителей
+    selected_head_names = [
+        name for name, head_id in available_heads if head_id in selected_heads
+    ]
 
-    # Убираем дубликаты пользователей
-    unique_users = list(
-        {user.user_id: user for user in all_group_users if user.user_id}.values()
-    )
-    user_count = len(unique_users)
+    # Сотрудники всех выбранных групп считаются одним запросом
+    recipient_query = RecipientQuery.for_groups(selected_head_names)
+    user_count = await recipient_query.count(stp_repo.session)
 
     if user_count == 0:
         await callback.answer(
@@ -359,7 +339,7 @@ async def confirm_heads_selection(
 
     await state.update_data(
         recipients="groups",
-        recipient_ids=[user.user_id for user in unique_users],
+        recipient_query=recipient_query.dump(),
         user_count=user_count,
         selected_head_names=selected_head_names,
     )
@@ -369,7 +349,7 @@ async def confirm_heads_selection(
     BroadcastState.selecting_type, BroadcastMenu.filter(F.action == "confirm")
 )
 async def start_broadcast(
-    callback: CallbackQuery, state: FSMContext, bot: Bot, stp_repo: MainRequestsRepo
+    callback: CallbackQuery, state: FSMContext, stp_repo: MainRequestsRepo
 ):
     """Начать рассылку"""
     data = await state.get_data()
@@ -378,10 +358,15 @@ async def start_broadcast(
     data.get("message_type", "text")
     original_message_id = data.get("original_message_id")
     original_chat_id = data.get("original_chat_id")
-    recipient_ids = data.get("recipient_ids", [])
-    user_count = data.get("user_count", 0)
     recipients = data.get("recipients", "")
 
+    recipient_ids = []
+    if data.get("recipient_query"):
+        # Получатели выбираются из БД в момент запуска одним запросом
+        recipient_query = RecipientQuery.load(data["recipient_query"])
+        recipient_ids = await recipient_query.user_ids(stp_repo.session)
+    user_count = len(recipient_ids)
+
     if not recipient_ids:
         await callback.answer("❌ Список получателей пуст", show_alert=True)
         return
@@ -418,90 +403,58 @@ async def start_broadcast(
         logger.error(f"Ошибка сохранения рассылки в БД: {e}")
         # Продолжаем выполнение рассылки даже если не удалось сохранить в БД
 
+    recipient_type_text = {
+        "everyone": "всем пользователям",
+        "ntp": "НТП",
+        "nck": "НЦК",
+        "groups": f"группам ({', '.join(data.get('selected_head_names', []))})",
+    }.get(recipients, "выбранным получателям")
+
     # Показываем прогресс
     progress_message = await callback.message.edit_text(
         f"""<b>📤 Рассылка запущена!</b>
 
 <b>Получателей:</b> {user_count}
 <b>Отправлено:</b> 0 / {user_count}
-<b>Статус:</b> Отправка...
-
-<i>⏳ Не закрывайте бота до завершения</i>""",
+<b>Статус:</b> Отправка...""",
         reply_markup=None,
     )
 
-    # Запускаем рассылку
-    success_count = 0
-
-    try:
-        for i, user_id in enumerate(recipient_ids, 1):
-            try:
-                # Используем copy_message для сохранения оригинального форматирования
-                await bot.copy_message(
-                    chat_id=user_id,
-                    from_chat_id=original_chat_id,
-                    message_id=original_message_id,
-                )
-                success_count += 1
-
-                # Обновляем прогресс каждые 10 сообщений
-                if i % 10 == 0 or i == len(recipient_ids):
-                    await progress_message.edit_text(
-                        f"""<b>📤 Рассылка в процессе</b>
-
-<b>Получателей:</b> {user_count}
-<b>Отправлено:</b> {i} / {user_count}
-<b>Успешно:</b> {success_count}
-<b>Прогресс:</b> {(i / len(recipient_ids) * 100):.1f}%
-
-<i>⏳ Не закрывайте бота до завершения</i>"""
-                    )
-
-                # Задержка между отправками
-                await asyncio.sleep(0.05)  # 20 сообщений в секунду
+    # Рассылка выполняется в фоне и переживает перезапуск бота
+    await broadcast_jobs.create(
+        owner_id=callback.from_user.id,
+        from_chat_id=original_chat_id,
+        message_id=original_message_id,
+        recipients=recipient_ids,
+        title=recipient_type_text,
+        progress_chat_id=progress_message.chat.id,
+        progress_message_id=progress_message.message_id,
+    )
+    await state.clear()
 
-            except Exception as e:
-                logger.error(f"Ошибка отправки сообщения пользователю {user_id}: {e}")
-                continue
 
-    except Exception as e:
-        logger.error(f"Ошибка во время рассылки: {e}")
-        await progress_message.edit_text(
-            f"""<b>❌ Ошибка рассылки</b>
+@mip_broadcast_router.callback_query(BroadcastJobMenu.filter())
+async def broadcast_job_control(
+    callback: CallbackQuery, callback_data: BroadcastJobMenu
+):
+    """Пауза, продолжение и остановка запущенной рассылки"""
+    match callback_data.action:
+        case "pause":
+            done = await broadcast_jobs.pause(callback_data.job_id)
+            answer = "⏸️ Рассылка приостанавливается"
+        case "resume":
+            done = await broadcast_jobs.resume(callback_data.job_id)
+            answer = "▶️ Рассылка продолжена"
+        case "cancel":
+            done = await broadcast_jobs.cancel(callback_data.job_id)
+            answer = "⛔ Рассылка остановлена"
+        case _:
+            done, answer = False, ""
 
-Произошла ошибка во время рассылки.
-Отправлено: {success_count} из {user_count} сообщений""",
-            reply_markup=broadcast_kb(),
-        )
-        await state.clear()
+    if not done:
+        await callback.answer("❌ Рассылка уже завершена или изменена", show_alert=True)
         return
-
-    # Показываем результат
-    success_rate = (success_count / user_count * 100) if user_count > 0 else 0
-
-    recipient_type_text = {
-        "everyone": "всем пользователям",
-        "ntp": "НТП",
-        "nck": "НЦК",
-        "groups": f"группам ({', '.join(data.get('selected_head_names', []))})",
-    }.get(recipients, "выбранным получателям")
-
-    await progress_message.edit_text(
-        f"""<b>✅ Рассылка завершена!</b>
-
-<b>Получатели:</b> {recipient_type_text}
-<b>Всего получателей:</b> {user_count}
-<b>Успешно отправлено:</b> {success_count}
-<b>Успешность:</b> {success_rate:.1f}%
-
-<b>Сообщение было разослано!</b>""",
-        reply_markup=broadcast_kb(),
-    )
-
-    logger.info(
-        f"Рассылка завершена: {success_count}/{user_count} сообщений отправлено"
-    )
-    await state.clear()
+    await callback.answer(answer)
 
 
 @mip_broadcast_router.callback_query(BroadcastMenu.filter(F.action == "cancel"))
@@ -18,6 +18,7 @@ from tgbot.keyboards.mip.game.purchases import (
     purchase_detail_kb,
     purchase_paginated_kb,
 )
+from tgbot.services.notifications import notify
 
 mip_game_products_router = Router()
 mip_game_products_router.message.filter(F.chat.type == "private", MipFilter())
@@ -311,9 +312,12 @@ async def purchase_action(
 
 📍 Осталось активаций: {product.count - purchase.usage_count} из {product.count}"""
 
-            await callback.bot.send_message(
-                chat_id=employee_user.user_id,
-                text=employee_notify_message,
+            await notify(
+                callback.bot,
+                employee_user.user_id,
+                employee_notify_message,
+                job="purchases",
+                urgent=True,
             )
 
             logger.info(
@@ -333,13 +337,16 @@ async def purchase_action(
                 show_alert=True,
             )
 
-            await callback.bot.send_message(
-                chat_id=employee_user.user_id,
-                text=f"""<b>Активация отменена:</b> {product.name}
+            await notify(
+                callback.bot,
+                employee_user.user_id,
+                f"""<b>Активация отменена:</b> {product.name}
 
 Менеджер <a href='t.me/{user.username}'>{user.fullname}</a> отменил активацию <b>{product.name}</b>
 
 <i>Использование предмета не будет засчитано</i>""",
+                job="purchases",
+                urgent=True,
             )
 
             logger.info(
@@ -1,9 +1,10 @@
+from __future__ import annotations
+
 import fnmatch
 import logging
 import re
 from pathlib import Path
 
-import pandas as pd
 from aiogram import F, Router
 from aiogram.fsm.context import FSMContext
 from aiogram.types import CallbackQuery, Message
@@ -13,6 +14,7 @@ from stp_database.repo.STP.requests import MainRequestsRepo
 from tgbot.filters.role import MipFilter
 from tgbot.keyboards.mip.schedule.main import ScheduleMenu, schedule_kb
 from tgbot.keyboards.mip.schedule.upload import schedule_upload_back_kb
+from tgbot.misc.lazy import lazy_import
 from tgbot.misc.states.mip.upload import UploadFile
 from tgbot.services.schedule.user_processor import (
     process_fired_users_with_stats,
@@ -20,6 +22,8 @@ from tgbot.services.schedule.user_processor import (
 )
 from tgbot.services.schedulers.hr import get_fired_users_from_excel
 
+pd = lazy_import("pandas")
+
 # Router setup
 mip_upload_router = Router()
 mip_upload_router.message.filter(F.chat.type == "private", MipFilter())
@@ -7,6 +7,7 @@ from aiogram.types import CallbackQuery, Message
 from stp_database import Employee
 from stp_database.repo.STP.requests import MainRequestsRepo
 
+from tgbot.config import Config
 from tgbot.handlers.user.main import user_start_cmd
 from tgbot.misc.helpers import generate_auth_code
 from tgbot.misc.states.user.auth import Authorization
@@ -37,7 +38,7 @@ async def user_auth(callback: CallbackQuery, state: FSMContext):
 
 
 @user_auth_router.message(Authorization.email)
-async def user_auth_email(message: Message, state: FSMContext):
+async def user_auth_email(message: Message, state: FSMContext, config: Config):
     email_pattern = r"^[A-Za-z0-9._%+-]+@dom\.ru$"
     state_data = await state.get_data()
     await message.delete()
@@ -62,7 +63,7 @@ async def user_auth_email(message: Message, state: FSMContext):
     await state.update_data(email=message.text, auth_code=auth_code)
     await state.set_state(Authorization.auth_code)
     await send_auth_email(
-        code=auth_code, email=message.text, bot_username=bot_info.username
+        config.mail, code=auth_code, email=message.text, bot_username=bot_info.username
     )
     logger.info(
         f"[Авторизация] Пользователю {message.from_user.username} ({message.from_user.id}) отправлено письмо с кодом авторизации {auth_code} на {message.text}"
@@ -1,9 +1,9 @@
-import asyncio
 import logging
+import uuid
 from functools import lru_cache
 from typing import List
 
-from aiogram import F, Router
+from aiogram import Bot, F, Router
 from aiogram.types import CallbackQuery
 from stp_database import Employee
 from stp_database.repo.STP.requests import MainRequestsRepo
@@ -17,6 +17,8 @@ from tgbot.keyboards.user.game.casino import (
     play_again_kb,
 )
 from tgbot.keyboards.user.game.main import GameMenu
+from tgbot.services.balances import balance_ledger
+from tgbot.services.casino import PRIVATE, CasinoRound, casino_table
 
 user_game_casino_router = Router()
 user_game_casino_router.message.filter(
@@ -127,7 +129,7 @@ async def casino_main_menu(
     callback: CallbackQuery, user: Employee, stp_repo: MainRequestsRepo
 ):
     """Главное меню казино"""
-    user_balance = await stp_repo.transaction.get_user_balance(user.user_id)
+    user_balance = await balance_ledger.get_balance(stp_repo, user.user_id)
 
     await callback.message.edit_text(
         f"""🎰 <b>Казино</b>
@@ -162,7 +164,7 @@ async def casino_slot_betting(
     callback: CallbackQuery, user: Employee, stp_repo: MainRequestsRepo
 ):
     """Выбор ставки для игры в слоты"""
-    user_balance = await stp_repo.transaction.get_user_balance(user.user_id)
+    user_balance = await balance_ledger.get_balance(stp_repo, user.user_id)
 
     if user_balance < 10:
         await callback.message.edit_text(
@@ -198,7 +200,7 @@ async def casino_dice_betting(
     callback: CallbackQuery, user: Employee, stp_repo: MainRequestsRepo
 ):
     """Выбор ставки для игры в кости"""
-    user_balance = await stp_repo.transaction.get_user_balance(user.user_id)
+    user_balance = await balance_ledger.get_balance(stp_repo, user.user_id)
 
     if user_balance < 10:
         await callback.message.edit_text(
@@ -236,7 +238,7 @@ async def casino_darts_betting(
     callback: CallbackQuery, user: Employee, stp_repo: MainRequestsRepo
 ):
     """Выбор ставки для игры в дартс"""
-    user_balance = await stp_repo.transaction.get_user_balance(user.user_id)
+    user_balance = await balance_ledger.get_balance(stp_repo, user.user_id)
 
     if user_balance < 10:
         await callback.message.edit_text(
@@ -274,7 +276,7 @@ async def casino_bowling_betting(
     callback: CallbackQuery, user: Employee, stp_repo: MainRequestsRepo
 ):
     """Выбор ставки для игры в боулинг"""
-    user_balance = await stp_repo.transaction.get_user_balance(user.user_id)
+    user_balance = await balance_ledger.get_balance(stp_repo, user.user_id)
 
     if user_balance < 10:
         await callback.message.edit_text(
@@ -315,7 +317,7 @@ async def casino_rate_adjustment(
     stp_repo: MainRequestsRepo,
 ):
     """Регулировка ставки"""
-    user_balance = await stp_repo.transaction.get_user_balance(user.user_id)
+    user_balance = await balance_ledger.get_balance(stp_repo, user.user_id)
     new_rate = callback_data.current_rate
     game_type = callback_data.game_type
 
@@ -378,10 +380,15 @@ async def casino_game(
     """Игра в казино (слоты или кости)"""
     bet_amount = callback_data.bet_amount
     game_type = callback_data.game_type
-    user_balance = await stp_repo.transaction.get_user_balance(user.user_id)
+
+    # Резервируем ставку, чтобы параллельные игры не потратили те же баллы
+    round_id = uuid.uuid4().hex
+    reserved, user_balance = await balance_ledger.reserve(
+        stp_repo, user.user_id, bet_amount, round_id
+    )
 
     # Проверим, что у пользователя достаточно средств
-    if bet_amount > user_balance:
+    if not reserved:
         await callback.message.edit_text(
             """❌ <b>Недостаточно средств!</b>
 
@@ -432,92 +439,78 @@ async def casino_game(
 
     config = game_config.get(game_type, game_config["slots"])
 
-    # Информируем о начале игры
-    await callback.message.edit_text(
-        f"""{config["loading_text"]}
+    try:
+        # Информируем о начале игры
+        await callback.message.edit_text(
+            f"""{config["loading_text"]}
 
 💰 <b>Ставка:</b> {bet_amount} баллов
 ⏰ <b>Ждем результат...</b>
 
 <blockquote expandable>💎 <b>Таблица наград:</b>
 {config["rewards"]}</blockquote>"""
-    )
-
-    # Отправляем анимированную игру
-    game_result = await callback.message.answer_dice(emoji=config["emoji"])
-    game_value = game_result.dice.value
+        )
 
-    # Ждем анимацию (около 3 секунд для кубика и 2 секунды для казино)
-    if game_type == "dice":
-        await asyncio.sleep(3)
-    else:
-        await asyncio.sleep(2)
+        # Отправляем анимированную игру
+        game_result = await callback.message.answer_dice(emoji=config["emoji"])
+    except Exception:
+        await balance_ledger.release(user.user_id, round_id)
+        raise
+
+    # Результат известен сразу, итог подводится после анимации
+    # отложенной задачей, соединения с БД обработчик не удерживает
+    result_text, multiplier = config["multiplier_func"](game_result.dice.value)
+    await casino_table.play(
+        CasinoRound(
+            round_id=round_id,
+            user_id=user.user_id,
+            chat_id=callback.message.chat.id,
+            mode=PRIVATE,
+            game_type=game_type,
+            game_name=config["game_name"],
+            bet=bet_amount,
+            result_text=result_text,
+            multiplier=multiplier,
+            balance_before=user_balance,
+            player_name=callback.from_user.username or user.fullname,
+        )
+    )
 
-    # Определяем результат
-    result_text, multiplier = config["multiplier_func"](game_value)
-    game_name = config["game_name"]
 
-    if multiplier > 0:
+@casino_table.renderer(PRIVATE)
+async def send_casino_result(bot: Bot, casino_round: CasinoRound, new_balance: int):
+    """Итог раунда казино в личных сообщениях"""
+    if casino_round.multiplier > 0:
         # Выигрыш
-        winnings = int(bet_amount * multiplier)
-        net_result = winnings - bet_amount
-
-        if net_result > 0:
-            # Чистый выигрыш - записываем earn транзакцию
-            transaction, new_balance = await stp_repo.transaction.add_transaction(
-                user_id=user.user_id,
-                transaction_type="earn",
-                source_type="casino",
-                amount=net_result,
-                comment=f"Выигрыш в {game_name}: {result_text} (x{multiplier})",
-            )
-        else:
-            # Утешительный приз меньше ставки - записываем spend транзакцию
-            transaction, new_balance = await stp_repo.transaction.add_transaction(
-                user_id=user.user_id,
-                transaction_type="spend",
-                source_type="casino",
-                amount=abs(net_result),
-                comment=f"Утешительный приз в {game_name}: {result_text} (x{multiplier})",
-            )
-
         final_result = f"""🎉 <b>Победа</b> 🎉
 
-{result_text}
+{casino_round.result_text}
 
-🔥 Выигрыш: {bet_amount} x{multiplier} = {winnings} баллов!
-✨ Баланс: {user_balance - bet_amount} → {new_balance} баллов"""
+🔥 Выигрыш: {casino_round.bet} x{casino_round.multiplier} = {casino_round.winnings} баллов!
+✨ Баланс: {casino_round.balance_before} → {new_balance} баллов"""
 
         logger.info(
-            f"[Казино] {callback.from_user.username} выиграл {winnings} баллов в {game_name} ({result_text})"
+            f"[Казино] {casino_round.player_name} выиграл {casino_round.winnings} баллов в {casino_round.game_name} ({casino_round.result_text})"
         )
 
     else:
         # Проигрыш
-        # Списываем ставку
-        transaction, new_balance = await stp_repo.transaction.add_transaction(
-            user_id=user.user_id,
-            transaction_type="spend",
-            source_type="casino",
-            amount=bet_amount,
-            comment=f"Проигрыш в {game_name}: {result_text}",
-        )
-
         final_result = f"""💔 <b>Проигрыш</b>
 
-{result_text}
+{casino_round.result_text}
 
-💸 Потрачено: -{bet_amount} баллов
-✨ Баланс: {new_balance + bet_amount} → {new_balance} баллов
+💸 Потрачено: -{casino_round.bet} баллов
+✨ Баланс: {casino_round.balance_before} → {new_balance} баллов
 
 <i>Попробуй еще раз - удача рядом!</i>"""
 
         logger.info(
-            f"[Казино] {callback.from_user.username} проиграл {bet_amount} баллов в {game_name} ({result_text})"
+            f"[Казино] {casino_round.player_name} проиграл {casino_round.bet} баллов в {casino_round.game_name} ({casino_round.result_text})"
         )
 
     # Показываем финальный результат
-    await callback.message.answer(
+    await bot.send_message(
+        casino_round.chat_id,
         final_result,
-        reply_markup=play_again_kb(bet_amount, game_type),
+        reply_markup=play_again_kb(casino_round.bet, casino_round.game_type),
     )
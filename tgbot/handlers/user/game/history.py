@@ -11,6 +11,7 @@ from tgbot.keyboards.user.game.history import (
     transaction_history_kb,
 )
 from tgbot.keyboards.user.game.main import GameMenu
+from tgbot.services.history import FIRST, HISTORY_PAGE_SIZE, transaction_history
 
 user_game_history_router = Router()
 user_game_history_router.message.filter(
@@ -21,14 +22,27 @@ user_game_history_router.callback_query.filter(F.message.chat.type == "private")
 logger = logging.getLogger(__name__)
 
 
-@user_game_history_router.callback_query(GameMenu.filter(F.menu == "history"))
-async def game_history(callback: CallbackQuery, stp_repo: MainRequestsRepo):
-    """Показывает историю транзакций пользователя"""
-    user_transactions = await stp_repo.transaction.get_user_transactions(
-        user_id=callback.from_user.id
-    )
+async def show_history_page(
+    callback: CallbackQuery,
+    stp_repo: MainRequestsRepo,
+    page: int = 1,
+    direction: str = FIRST,
+    cursor: int = 0,
+):
+    """Показывает страницу истории транзакций пользователя"""
+    user_id = callback.from_user.id
+    total_transactions = await transaction_history.count(stp_repo.session, user_id)
+    transactions = []
+    if total_transactions:
+        transactions = await transaction_history.page(
+            stp_repo.session, user_id, direction, cursor, total_transactions
+        )
+        if not transactions and direction != FIRST:
+            # Граничная транзакция пропала - начинаем с первой страницы
+            page = 1
+            transactions = await transaction_history.page(stp_repo.session, user_id)
 
-    if not user_transactions:
+    if not transactions:
         await callback.message.edit_text(
             """📜 <b>История баланса</b>
 
@@ -41,9 +55,6 @@ async def game_history(callback: CallbackQuery, stp_repo: MainRequestsRepo):
         )
         return
 
-    # Показываем первую страницу по умолчанию
-    total_transactions = len(user_transactions)
-
     message_text = f"""📜 <b>История баланса</b>
 
 Здесь отображается вся история операций с баллами
@@ -52,10 +63,21 @@ async def game_history(callback: CallbackQuery, stp_repo: MainRequestsRepo):
 
     await callback.message.edit_text(
         message_text,
-        reply_markup=transaction_history_kb(user_transactions, current_page=1),
+        reply_markup=transaction_history_kb(
+            transactions,
+            current_page=page,
+            total_transactions=total_transactions,
+            transactions_per_page=HISTORY_PAGE_SIZE,
+        ),
     )
 
 
+@user_game_history_router.callback_query(GameMenu.filter(F.menu == "history"))
+async def game_history(callback: CallbackQuery, stp_repo: MainRequestsRepo):
+    """Показывает историю транзакций пользователя"""
+    await show_history_page(callback, stp_repo)
+
+
 @user_game_history_router.callback_query(
     TransactionHistoryMenu.filter(F.menu == "history")
 )
@@ -65,36 +87,12 @@ async def game_history_paginated(
     stp_repo: MainRequestsRepo,
 ):
     """Обработчик пагинации истории транзакций"""
-    page = callback_data.page
-
-    user_transactions = await stp_repo.transaction.get_user_transactions(
-        user_id=callback.from_user.id
-    )
-
-    if not user_transactions:
-        await callback.message.edit_text(
-            """📜 <b>История баланса</b>
-
-Здесь отображается вся история операций с баллами
-
-У тебя пока нет транзакций 🙂
-
-<i>Транзакции появляются при покупке предметов, получении достижений и других операциях с баллами</i>""",
-            reply_markup=transaction_history_kb([], current_page=1),
-        )
-        return
-
-    total_transactions = len(user_transactions)
-
-    message_text = f"""📜 <b>История баланса</b>
-
-Здесь отображается вся история операций с баллами
-
-<i>Всего транзакций: {total_transactions}</i>"""
-
-    await callback.message.edit_text(
-        message_text,
-        reply_markup=transaction_history_kb(user_transactions, current_page=page),
+    await show_history_page(
+        callback,
+        stp_repo,
+        page=callback_data.page,
+        direction=callback_data.direction,
+        cursor=callback_data.cursor,
     )
 
 
@@ -116,7 +114,7 @@ async def transaction_detail_view(
             """📜 <b>История баланса</b>
 
 Не смог найти информацию о транзакции ☹""",
-            reply_markup=transaction_detail_kb(page),
+            reply_markup=transaction_detail_kb(page, callback_data.anchor),
         )
         return
 
@@ -160,5 +158,5 @@ async def transaction_detail_view(
         message_text += f"\n\n<b>💬 Комментарий</b>\n<blockquote expandable>{transaction.comment}</blockquote>"
 
     await callback.message.edit_text(
-        message_text, reply_markup=transaction_detail_kb(page)
+        message_text, reply_markup=transaction_detail_kb(page, callback_data.anchor)
     )
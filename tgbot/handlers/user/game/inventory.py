@@ -6,6 +6,7 @@ from aiogram.types import CallbackQuery
 from stp_database import Employee
 from stp_database.repo.STP.requests import MainRequestsRepo
 
+from tgbot.config import Config
 from tgbot.keyboards.mip.game.purchases import purchase_notify_kb
 from tgbot.keyboards.user.game.inventory import (
     CancelActivationMenu,
@@ -21,11 +22,13 @@ from tgbot.keyboards.user.game.main import GameMenu
 from tgbot.keyboards.user.game.shop import ProductDetailsShop
 from tgbot.keyboards.user.schedule.main import get_yekaterinburg_date
 from tgbot.misc.helpers import get_role, tz
-from tgbot.services.broadcaster import broadcast
+from tgbot.services.balances import balance_ledger
+from tgbot.services.concurrency import run_heavy
 from tgbot.services.mailing import (
     send_activation_product_email,
     send_cancel_product_email,
 )
+from tgbot.services.notifications import notify_many
 from tgbot.services.schedule import DutyScheduleParser
 from tgbot.services.schedule.parsers import ScheduleParser
 
@@ -320,6 +323,7 @@ async def use_product_handler(
     callback_data: UseProductMenu,
     user: Employee,
     stp_repo: MainRequestsRepo,
+    config: Config,
 ):
     """
     Хендлер нажатия на "Использовать предмет" в открытой информации о приобретенном предмете
@@ -393,7 +397,8 @@ async def use_product_handler(
 
             if user.division in ["НТП1", "НТП2"]:
                 # For НТП1/НТП2, check if user has work shift today
-                user_schedule = schedule_parser.get_user_schedule(
+                user_schedule = await run_heavy(
+                    schedule_parser.get_user_schedule,
                     user.fullname,
                     current_month,
                     user.division,
@@ -415,7 +420,8 @@ async def use_product_handler(
 
             elif user.division == "НЦК":
                 # For НЦК, just check if user works today (has any schedule entry that's not vacation/day off)
-                user_schedule = schedule_parser.get_user_schedule(
+                user_schedule = await run_heavy(
+                    schedule_parser.get_user_schedule,
                     user.fullname,
                     current_month,
                     user.division,
@@ -507,6 +513,7 @@ async def use_product_handler(
                     )
                     bot_info = await callback.bot.get_me()
                     await send_activation_product_email(
+                        config.mail,
                         user,
                         user_head,
                         current_duty_user,
@@ -515,10 +522,12 @@ async def use_product_handler(
                         bot_username=bot_info.username,
                     )
 
-            result = await broadcast(
-                bot=callback.bot,
-                users=manager_ids,
-                text=notification_text,
+            result = await notify_many(
+                callback.bot,
+                manager_ids,
+                notification_text,
+                job="purchases",
+                urgent=True,
                 reply_markup=purchase_notify_kb(),
             )
 
@@ -560,7 +569,8 @@ async def sell_product_handler(
 
     try:
         success = await stp_repo.purchase.delete_user_purchase(user_product_id)
-        await stp_repo.transaction.add_transaction(
+        await balance_ledger.add_transaction(
+            stp_repo,
             user_id=user_product.user_id,
             transaction_type="earn",
             source_type="product",
@@ -610,6 +620,7 @@ async def cancel_activation_handler(
     callback_data: CancelActivationMenu,
     user: Employee,
     stp_repo: MainRequestsRepo,
+    config: Config,
 ):
     """
     Хендлер отмены активации предмета - меняет статус с "review" обратно на "stored"
@@ -660,6 +671,7 @@ async def cancel_activation_handler(
             )
             bot_info = await callback.bot.get_me()
             await send_cancel_product_email(
+                config.mail,
                 user,
                 user_head,
                 current_duty_user,
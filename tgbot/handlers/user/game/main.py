@@ -6,6 +6,7 @@ from stp_database.repo.STP.requests import MainRequestsRepo
 from tgbot.keyboards.user.game.main import game_kb
 from tgbot.keyboards.user.main import MainMenu, auth_kb
 from tgbot.services.leveling import LevelingSystem
+from tgbot.services.statistics import player_statistics
 
 user_game_router = Router()
 user_game_router.message.filter(F.chat.type == "private")
@@ -27,11 +28,10 @@ async def game_main(
         )
         return
 
-    user_balance = await stp_repo.transaction.get_user_balance(user_id=user.user_id)
-    achievements_sum = await stp_repo.transaction.get_user_achievements_sum(
-        user_id=user.user_id
-    )
-    purchases_sum = await stp_repo.purchase.get_user_purchases_sum(user_id=user.user_id)
+    statistics = await player_statistics.user(stp_repo, user.user_id)
+    user_balance = statistics.balance
+    achievements_sum = statistics.achievements
+    purchases_sum = statistics.purchases_sum
     level_info_text = LevelingSystem.get_level_info_text(achievements_sum, user_balance)
 
     await callback.message.edit_text(
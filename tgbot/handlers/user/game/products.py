@@ -13,6 +13,7 @@ from tgbot.keyboards.user.game.products import (
     duty_products_activation_kb,
     duty_purchases_detail_kb,
 )
+from tgbot.services.notifications import notify
 
 duty_game_products_router = Router()
 duty_game_products_router.message.filter(F.chat.type == "private", DutyFilter())
@@ -268,9 +269,12 @@ async def duty_purchase_action(
 
 📍 Осталось активаций: {product.count - purchase.usage_count} из {product.count}"""
 
-            await callback.bot.send_message(
-                chat_id=employee_user.user_id,
-                text=employee_notify_message,
+            await notify(
+                callback.bot,
+                employee_user.user_id,
+                employee_notify_message,
+                job="purchases",
+                urgent=True,
             )
 
             logger.info(
@@ -290,11 +294,14 @@ async def duty_purchase_action(
                 show_alert=True,
             )
 
-            await callback.bot.send_message(
-                chat_id=employee_user.user_id,
-                text=f"""<b>Активация отменена:</b> {product.name}
+            await notify(
+                callback.bot,
+                employee_user.user_id,
+                f"""<b>Активация отменена:</b> {product.name}
 
 Дежурный <a href='t.me/{user.username}'>{user.fullname}</a> отменил активацию предмета""",
+                job="purchases",
+                urgent=True,
             )
 
             logger.info(
@@ -1,4 +1,5 @@
 import logging
+import uuid
 
 from aiogram import F, Router
 from aiogram.types import CallbackQuery
@@ -16,6 +17,7 @@ from tgbot.keyboards.user.game.shop import (
     shop_kb,
     to_game_kb,
 )
+from tgbot.services.balances import balance_ledger
 
 user_game_shop_router = Router()
 user_game_shop_router.message.filter(
@@ -58,7 +60,7 @@ async def game_shop(
     page = getattr(callback_data, "page", 1)
     filter_type = getattr(callback_data, "menu", "available")
 
-    user_balance = await stp_repo.transaction.get_user_balance(user.user_id)
+    user_balance = await balance_ledger.get_balance(stp_repo, user.user_id)
 
     # Получаем предметы на основе фильтра
     if filter_type == "available":
@@ -153,7 +155,7 @@ async def game_shop_confirmation(
         return
 
     # Получаем баланс пользователя
-    user_balance = await stp_repo.transaction.get_user_balance(user.user_id)
+    user_balance = await balance_ledger.get_balance(stp_repo, user.user_id)
 
     # Проверяем, достаточно ли баллов
     if user_balance < product_info.cost:
@@ -227,10 +229,14 @@ async def game_shop_completed(
             )
             return
 
-        # Получаем баланс пользователя
-        user_balance = await stp_repo.transaction.get_user_balance(user.user_id)
+        # Резервируем стоимость, чтобы параллельные игры и покупки
+        # не потратили те же баллы
+        hold_id = uuid.uuid4().hex
+        reserved, user_balance = await balance_ledger.reserve(
+            stp_repo, user.user_id, product_info.cost, hold_id
+        )
 
-        if user_balance < product_info.cost:
+        if not reserved:
             await callback.answer(
                 f"❌ Недостаточно баллов!\nУ тебя: {user_balance}, нужно: {product_info.cost}",
                 show_alert=True,
@@ -242,7 +248,8 @@ async def game_shop_completed(
             new_purchase = await stp_repo.purchase.add_purchase(
                 user_id=user.user_id, product_id=product_id, status="stored"
             )
-            await stp_repo.transaction.add_transaction(
+            await balance_ledger.add_transaction(
+                stp_repo,
                 user_id=user.user_id,
                 transaction_type="spend",
                 source_type="product",
@@ -282,6 +289,8 @@ async def game_shop_completed(
         except Exception as e:
             logger.error(f"Error creating user purchase: {e}")
             await callback.answer("❌ Ошибка при покупке предмета", show_alert=True)
+        finally:
+            await balance_ledger.release(user.user_id, hold_id)
 
 
 @user_game_shop_router.callback_query(SellProductShopMenu.filter())
@@ -314,7 +323,8 @@ async def sell_product_from_shop(
 
     try:
         success = await stp_repo.purchase.delete_user_purchase(user_product_id)
-        await stp_repo.transaction.add_transaction(
+        await balance_ledger.add_transaction(
+            stp_repo,
             user_id=user_product.user_id,
             transaction_type="earn",
             source_type="product",
@@ -8,6 +8,7 @@ from stp_database.repo.KPI.requests import KPIRequestsRepo
 
 from tgbot.keyboards.user.kpi import kpi_calculator_kb, kpi_kb, kpi_salary_kb
 from tgbot.keyboards.user.main import MainMenu
+from tgbot.services.concurrency import HEAVY
 from tgbot.services.salary import KPICalculator, SalaryCalculator, SalaryFormatter
 
 user_kpi_router = Router()
@@ -83,7 +84,9 @@ async def user_kpi_cb(
         await callback.answer("Обновлений нет")
 
 
-@user_kpi_router.callback_query(MainMenu.filter(F.menu == "kpi_calculator"))
+@user_kpi_router.callback_query(
+    MainMenu.filter(F.menu == "kpi_calculator"), flags=HEAVY
+)
 async def user_kpi_calculator_cb(
     callback: CallbackQuery, user: Employee, kpi_repo: KPIRequestsRepo
 ):
@@ -163,7 +166,7 @@ async def user_kpi_calculator_cb(
         await callback.answer("Обновлений нет")
 
 
-@user_kpi_router.callback_query(MainMenu.filter(F.menu == "kpi_salary"))
+@user_kpi_router.callback_query(MainMenu.filter(F.menu == "kpi_salary"), flags=HEAVY)
 async def user_kpi_salary_cb(
     callback: CallbackQuery, user: Employee, kpi_repo: KPIRequestsRepo
 ):
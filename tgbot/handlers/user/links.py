@@ -2,13 +2,14 @@ from aiogram import F, Router
 from aiogram.types import CallbackQuery
 
 from tgbot.keyboards.user.main import MainMenu
+from tgbot.services.concurrency import LIGHT
 
 user_links_router = Router()
 user_links_router.message.filter(F.chat.type == "private")
 user_links_router.callback_query.filter(F.message.chat.type == "private")
 
 
-@user_links_router.callback_query(MainMenu.filter(F.menu == "links"))
+@user_links_router.callback_query(MainMenu.filter(F.menu == "links"), flags=LIGHT)
 async def user_links_cb(callback: CallbackQuery):
     await callback.answer(
         """🚧 Функционал пока недоступен
@@ -11,6 +11,7 @@ from tgbot.keyboards.user.schedule.main import (
     duties_kb,
     get_yekaterinburg_date,
 )
+from tgbot.services.concurrency import HEAVY
 
 logger = logging.getLogger(__name__)
 
@@ -19,7 +20,9 @@ user_schedule_duty_router.message.filter(F.chat.type == "private")
 user_schedule_duty_router.callback_query.filter(F.message.chat.type == "private")
 
 
-@user_schedule_duty_router.callback_query(ScheduleMenu.filter(F.menu == "duties"))
+@user_schedule_duty_router.callback_query(
+    ScheduleMenu.filter(F.menu == "duties"), flags=HEAVY
+)
 async def duties_schedule(callback: CallbackQuery, user: Employee, stp_repo):
     """Обработчик расписания дежурных"""
     if not await schedule_service.check_user_auth(callback, user):
@@ -40,7 +43,7 @@ async def duties_schedule(callback: CallbackQuery, user: Employee, stp_repo):
         await schedule_service.handle_schedule_error(callback, e)
 
 
-@user_schedule_duty_router.callback_query(DutyNavigation.filter())
+@user_schedule_duty_router.callback_query(DutyNavigation.filter(), flags=HEAVY)
 async def handle_duty_navigation(
     callback: CallbackQuery, callback_data: DutyNavigation, user: Employee, stp_repo
 ):
@@ -14,6 +14,7 @@ from tgbot.keyboards.user.schedule.main import (
     get_yekaterinburg_date,
     group_schedule_kb,
 )
+from tgbot.services.concurrency import HEAVY
 from tgbot.services.schedule.parsers import GroupScheduleParser
 
 logger = logging.getLogger(__name__)
@@ -55,7 +56,9 @@ class GroupScheduleService:
 group_schedule_service = GroupScheduleService()
 
 
-@user_schedule_group_router.callback_query(ScheduleMenu.filter(F.menu == "group"))
+@user_schedule_group_router.callback_query(
+    ScheduleMenu.filter(F.menu == "group"), flags=HEAVY
+)
 async def group_schedule(callback: CallbackQuery, user: Employee, stp_repo):
     """Обработчик группового расписания для пользователя"""
     if not await schedule_service.check_user_auth(callback, user):
@@ -92,7 +95,8 @@ async def group_schedule(callback: CallbackQuery, user: Employee, stp_repo):
 
 
 @user_schedule_group_router.callback_query(
-    GroupNavigation.filter(F.user_type == "user")
+    GroupNavigation.filter(F.user_type == "user"),
+    flags=HEAVY,
 )
 async def handle_group_navigation(
     callback: CallbackQuery, callback_data: GroupNavigation, user: Employee, stp_repo
@@ -11,6 +11,7 @@ from tgbot.keyboards.user.schedule.main import (
     get_yekaterinburg_date,
     heads_kb,
 )
+from tgbot.services.concurrency import HEAVY
 
 logger = logging.getLogger(__name__)
 
@@ -19,7 +20,9 @@ user_schedule_head_router.message.filter(F.chat.type == "private")
 user_schedule_head_router.callback_query.filter(F.message.chat.type == "private")
 
 
-@user_schedule_head_router.callback_query(ScheduleMenu.filter(F.menu == "heads"))
+@user_schedule_head_router.callback_query(
+    ScheduleMenu.filter(F.menu == "heads"), flags=HEAVY
+)
 async def heads_schedule(callback: CallbackQuery, user: Employee, stp_repo):
     """Обработчик расписания руководителей групп"""
     if not await schedule_service.check_user_auth(callback, user):
@@ -40,7 +43,7 @@ async def heads_schedule(callback: CallbackQuery, user: Employee, stp_repo):
         await schedule_service.handle_schedule_error(callback, e)
 
 
-@user_schedule_head_router.callback_query(HeadNavigation.filter())
+@user_schedule_head_router.callback_query(HeadNavigation.filter(), flags=HEAVY)
 async def handle_head_navigation(
     callback: CallbackQuery, callback_data: HeadNavigation, user: Employee, stp_repo
 ):
@@ -13,6 +13,7 @@ from tgbot.keyboards.user.schedule.main import (
     schedule_kb,
 )
 from tgbot.misc.dicts import russian_months
+from tgbot.services.concurrency import LIGHT, run_heavy
 from tgbot.services.schedule import (
     DutyScheduleParser,
     HeadScheduleParser,
@@ -110,7 +111,8 @@ class ScheduleHandlerService:
             )
         else:
             # Use regular schedule when no stp_repo (for users viewing their own schedule)
-            return self.schedule_parser.get_user_schedule_formatted(
+            return await run_heavy(
+                self.schedule_parser.get_user_schedule_formatted,
                 fullname=user.fullname,
                 month=month,
                 division=user.division,
@@ -214,7 +216,7 @@ class ScheduleHandlerService:
 schedule_service = ScheduleHandlerService()
 
 
-@user_schedule_router.callback_query(MainMenu.filter(F.menu == "schedule"))
+@user_schedule_router.callback_query(MainMenu.filter(F.menu == "schedule"), flags=LIGHT)
 async def schedule(callback: CallbackQuery, user: Employee):
     """Главное меню расписаний"""
     if not await schedule_service.check_user_auth(callback, user):
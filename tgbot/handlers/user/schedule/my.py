@@ -11,6 +11,7 @@ from tgbot.keyboards.user.schedule.main import (
     create_detailed_schedule_keyboard,
     schedule_with_month_kb,
 )
+from tgbot.services.concurrency import HEAVY
 
 logger = logging.getLogger(__name__)
 
@@ -19,7 +20,9 @@ user_schedule_my_router.message.filter(F.chat.type == "private")
 user_schedule_my_router.callback_query.filter(F.message.chat.type == "private")
 
 
-@user_schedule_my_router.callback_query(ScheduleMenu.filter(F.menu == "my"))
+@user_schedule_my_router.callback_query(
+    ScheduleMenu.filter(F.menu == "my"), flags=HEAVY
+)
 async def user_schedule(callback: CallbackQuery, user: Employee, stp_repo):
     """Обработчик личного расписания"""
     if not await schedule_service.check_user_auth(callback, user):
@@ -42,7 +45,9 @@ async def user_schedule(callback: CallbackQuery, user: Employee, stp_repo):
         await schedule_service.handle_schedule_error(callback, e)
 
 
-@user_schedule_my_router.callback_query(MonthNavigation.filter(F.action == "compact"))
+@user_schedule_my_router.callback_query(
+    MonthNavigation.filter(F.action == "compact"), flags=HEAVY
+)
 async def handle_compact_view(callback: CallbackQuery, user: Employee, stp_repo):
     """Обработчик перехода к компактному виду"""
     if not await schedule_service.check_user_auth(callback, user):
@@ -69,7 +74,7 @@ async def handle_compact_view(callback: CallbackQuery, user: Employee, stp_repo)
         await callback.answer(f"Ошибка: {e}", show_alert=True)
 
 
-@user_schedule_my_router.callback_query(MonthNavigation.filter())
+@user_schedule_my_router.callback_query(MonthNavigation.filter(), flags=HEAVY)
 async def handle_month_navigation(
     callback: CallbackQuery, callback_data: MonthNavigation, user: Employee, stp_repo
 ):
@@ -226,7 +226,9 @@ def group_management_kb(
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
-def group_settings_kb(group: Group, page: int = 1) -> InlineKeyboardMarkup:
+def group_settings_kb(
+    group: Group, page: int = 1, casino_limit: str = "Обычный"
+) -> InlineKeyboardMarkup:
     """Complete group settings keyboard."""
     buttons = [
         [
@@ -251,6 +253,14 @@ def group_settings_kb(group: Group, page: int = 1) -> InlineKeyboardMarkup:
                 ).pack(),
             ),
         ],
+        [
+            InlineKeyboardButton(
+                text=f"⏱️ Частота казино: {casino_limit}",
+                callback_data=GroupSettingsMenu(
+                    group_id=group.group_id, menu="casino_limit", page=page
+                ).pack(),
+            ),
+        ],
         [
             InlineKeyboardButton(
                 text="🗑️ Сервисные сообщения",
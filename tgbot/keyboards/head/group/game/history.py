@@ -1,139 +1,162 @@
 from aiogram.filters.callback_data import CallbackData
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
-from sqlalchemy import Sequence
 from stp_database.models.STP.transactions import Transaction
 
-from tgbot.keyboards.head.group.game.main import HeadGameMenu
 from tgbot.keyboards.head.group.main import GroupManagementMenu
 from tgbot.keyboards.user.main import MainMenu
+from tgbot.services.history import (
+    AT,
+    FIRST,
+    KIND_ALL,
+    KIND_EARN,
+    KIND_SPEND,
+    LAST,
+    NEXT,
+    PERIOD_ALL,
+    PERIOD_DAY,
+    PERIOD_MONTH,
+    PERIOD_WEEK,
+    PREV,
+    HistoryFilters,
+)
+
+KIND_LABELS = {
+    KIND_ALL: "Все операции",
+    KIND_EARN: "Начисления",
+    KIND_SPEND: "Списания",
+}
+
+PERIOD_LABELS = {
+    PERIOD_ALL: "Все время",
+    PERIOD_DAY: "Сегодня",
+    PERIOD_WEEK: "7 дней",
+    PERIOD_MONTH: "30 дней",
+}
 
 
 class HeadGroupHistoryMenu(CallbackData, prefix="head_group_history"):
-    menu: str = "history"
+    # f - лента, m - выбор сотрудника
+    menu: str = "f"
     page: int = 1
+    # Переход по ключу от граничной транзакции (см. tgbot.services.history)
+    direction: str = FIRST
+    cursor: int = 0
+    # Фильтры ленты (см. HistoryFilters)
+    member: int = 0
+    kind: str = KIND_ALL
+    period: str = PERIOD_ALL
 
+    @property
+    def filters(self) -> HistoryFilters:
+        return HistoryFilters(self.member, self.kind, self.period)
 
-class HeadTransactionDetailMenu(CallbackData, prefix="head_transaction_detail"):
+
+class HeadTransactionDetailMenu(CallbackData, prefix="head_tx_detail"):
     transaction_id: int
     page: int = 1
+    # Первая транзакция страницы и фильтры для возврата в ленту
+    anchor: int = 0
+    member: int = 0
+    kind: str = KIND_ALL
+    period: str = PERIOD_ALL
 
 
 class HeadRankingMenu(CallbackData, prefix="head_ranking"):
     menu: str = "ranking"
 
 
+def _next_option(options: dict, current: str) -> str:
+    """Следующее значение фильтра по кругу"""
+    keys = list(options)
+    return keys[(keys.index(current) + 1) % len(keys)] if current in keys else keys[0]
+
+
+def _history_menu(filters: HistoryFilters, **kwargs) -> str:
+    """Callback data ленты с сохранением фильтров"""
+    data = {
+        "member": filters.member,
+        "kind": filters.kind,
+        "period": filters.period,
+        **kwargs,
+    }
+    return HeadGroupHistoryMenu(**data).pack()
+
+
+def _transaction_button(
+    transaction: Transaction,
+    employee_name: str,
+    current_page: int,
+    anchor: int,
+    filters: HistoryFilters,
+) -> InlineKeyboardButton:
+    type_emoji = "➕" if transaction.type == "earn" else "➖"
+    date_str = transaction.created_at.strftime("%d.%m.%y")
+
+    # Определяем источник кратко
+    source_icons = {
+        "achievement": "🏆",
+        "product": "🛒",
+        "manual": "✍️",
+        "casino": "🎰",
+    }
+    source_icon = source_icons.get(transaction.source_type, "❓")
+
+    if len(employee_name) > 15:
+        employee_name = employee_name[:12] + "..."
+
+    return InlineKeyboardButton(
+        text=f"{type_emoji} {transaction.amount} {source_icon} {employee_name} ({date_str})",
+        callback_data=HeadTransactionDetailMenu(
+            transaction_id=transaction.id,
+            page=current_page,
+            anchor=anchor,
+            member=filters.member,
+            kind=filters.kind,
+            period=filters.period,
+        ).pack(),
+    )
+
+
 def head_group_history_kb(
-    transactions: Sequence[Transaction],
+    transactions: list[tuple[Transaction, str]],
     current_page: int = 1,
+    total_transactions: int = 0,
+    filters: HistoryFilters = HistoryFilters(),
+    member_name: str = "",
     transactions_per_page: int = 8,
-    employee_names: dict = None,
 ) -> InlineKeyboardMarkup:
     """
     Клавиатура истории транзакций группы для руководителей с пагинацией.
     Отображает 2 транзакции в ряд, по умолчанию 8 транзакций на страницу (4 ряда).
 
     Args:
-        transactions: Список транзакций группы
+        transactions: Транзакции текущей страницы с ФИО сотрудников
         current_page: Текущая страница
+        total_transactions: Количество транзакций с учетом фильтров
+        filters: Фильтры ленты
+        member_name: ФИО выбранного сотрудника
         transactions_per_page: Количество транзакций на страницу
-        employee_names: Словарь user_id -> имя сотрудника
     """
     buttons = []
 
-    if employee_names is None:
-        employee_names = {}
-
-    if not transactions:
-        # Если нет транзакций, показываем только кнопки навигации
-        buttons.append(
-            [
-                InlineKeyboardButton(
-                    text="↩️ Назад",
-                    callback_data=GroupManagementMenu(menu="game").pack(),
-                ),
-                InlineKeyboardButton(
-                    text="🏠 Домой",
-                    callback_data=MainMenu(menu="main").pack(),
-                ),
-            ]
-        )
-        return InlineKeyboardMarkup(inline_keyboard=buttons)
-
-    # Рассчитываем пагинацию
-    total_transactions = len(transactions)
-    total_pages = (
-        total_transactions + transactions_per_page - 1
-    ) // transactions_per_page
-
-    # Рассчитываем диапазон транзакций для текущей страницы
-    start_idx = (current_page - 1) * transactions_per_page
-    end_idx = start_idx + transactions_per_page
-    page_transactions = transactions[start_idx:end_idx]
+    total_pages = max(
+        (total_transactions + transactions_per_page - 1) // transactions_per_page, 1
+    )
+    current_page = min(current_page, total_pages)
 
     # Создаем кнопки для транзакций (2 в ряд)
-    for i in range(0, len(page_transactions), 2):
-        row = []
-
-        # Первая транзакция в ряду
-        transaction = page_transactions[i]
-        type_emoji = "➕" if transaction.type == "earn" else "➖"
-        date_str = transaction.created_at.strftime("%d.%m.%y")
-        amount_str = f"{transaction.amount}"
-
-        # Определяем источник кратко
-        source_icons = {
-            "achievement": "🏆",
-            "product": "🛒",
-            "manual": "✍️",
-            "casino": "🎰",
-        }
-        source_icon = source_icons.get(transaction.source_type, "❓")
-
-        # Получаем имя сотрудника
-        employee_name = employee_names.get(transaction.user_id, "Неизвестно")
-        if len(employee_name) > 15:
-            employee_name = employee_name[:12] + "..."
-
-        button_text = (
-            f"{type_emoji} {amount_str} {source_icon} {employee_name} ({date_str})"
-        )
-
-        row.append(
-            InlineKeyboardButton(
-                text=button_text,
-                callback_data=HeadTransactionDetailMenu(
-                    transaction_id=transaction.id, page=current_page
-                ).pack(),
-            )
-        )
-
-        # Вторая транзакция в ряду (если есть)
-        if i + 1 < len(page_transactions):
-            transaction = page_transactions[i + 1]
-            type_emoji = "➕" if transaction.type == "earn" else "➖"
-            date_str = transaction.created_at.strftime("%d.%m.%y")
-            amount_str = f"{transaction.amount}"
-
-            source_icon = source_icons.get(transaction.source_type, "❓")
-            employee_name = employee_names.get(transaction.user_id, "Неизвестно")
-            if len(employee_name) > 15:
-                employee_name = employee_name[:12] + "..."
-
-            button_text = (
-                f"{type_emoji} {amount_str} {source_icon} {employee_name} ({date_str})"
-            )
-
-            row.append(
-                InlineKeyboardButton(
-                    text=button_text,
-                    callback_data=HeadTransactionDetailMenu(
-                        transaction_id=transaction.id, page=current_page
-                    ).pack(),
-                )
+    if transactions:
+        anchor = transactions[0][0].id
+        for i in range(0, len(transactions), 2):
+            buttons.append(
+                [
+                    _transaction_button(
+                        transaction, employee_name, current_page, anchor, filters
+                    )
+                    for transaction, employee_name in transactions[i : i + 2]
+                ]
             )
 
-        buttons.append(row)
-
     # Добавляем пагинацию (только если больше одной страницы)
     if total_pages > 1:
         pagination_row = []
@@ -144,7 +167,8 @@ def head_group_history_kb(
         if current_page > 2:
             pagination_row.append(
                 InlineKeyboardButton(
-                    text="⏪", callback_data=HeadGameMenu(menu="history", page=1).pack()
+                    text="⏪",
+                    callback_data=_history_menu(filters, page=1, direction=FIRST),
                 )
             )
         else:
@@ -155,9 +179,12 @@ def head_group_history_kb(
             pagination_row.append(
                 InlineKeyboardButton(
                     text="⬅️",
-                    callback_data=HeadGameMenu(
-                        menu="history", page=current_page - 1
-                    ).pack(),
+                    callback_data=_history_menu(
+                        filters,
+                        page=current_page - 1,
+                        direction=PREV,
+                        cursor=transactions[0][0].id,
+                    ),
                 )
             )
         else:
@@ -176,9 +203,12 @@ def head_group_history_kb(
             pagination_row.append(
                 InlineKeyboardButton(
                     text="➡️",
-                    callback_data=HeadGameMenu(
-                        menu="history", page=current_page + 1
-                    ).pack(),
+                    callback_data=_history_menu(
+                        filters,
+                        page=current_page + 1,
+                        direction=NEXT,
+                        cursor=transactions[-1][0].id,
+                    ),
                 )
             )
         else:
@@ -189,7 +219,9 @@ def head_group_history_kb(
             pagination_row.append(
                 InlineKeyboardButton(
                     text="⏭️",
-                    callback_data=HeadGameMenu(menu="history", page=total_pages).pack(),
+                    callback_data=_history_menu(
+                        filters, page=total_pages, direction=LAST
+                    ),
                 )
             )
         else:
@@ -197,6 +229,32 @@ def head_group_history_kb(
 
         buttons.append(pagination_row)
 
+    # Фильтры ленты: при смене фильтра лента открывается с первой страницы
+    buttons.append(
+        [
+            InlineKeyboardButton(
+                text=f"👤 {member_name or 'Все сотрудники'}",
+                callback_data=_history_menu(filters, menu="m"),
+            ),
+        ]
+    )
+    buttons.append(
+        [
+            InlineKeyboardButton(
+                text=f"🔀 {KIND_LABELS.get(filters.kind, KIND_LABELS[KIND_ALL])}",
+                callback_data=_history_menu(
+                    filters, kind=_next_option(KIND_LABELS, filters.kind)
+                ),
+            ),
+            InlineKeyboardButton(
+                text=f"📅 {PERIOD_LABELS.get(filters.period, PERIOD_LABELS[PERIOD_ALL])}",
+                callback_data=_history_menu(
+                    filters, period=_next_option(PERIOD_LABELS, filters.period)
+                ),
+            ),
+        ]
+    )
+
     # Добавляем кнопки навигации
     buttons.append(
         [
@@ -213,7 +271,54 @@ def head_group_history_kb(
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
-def head_transaction_detail_kb(page: int = 1) -> InlineKeyboardMarkup:
+def head_history_members_kb(
+    members: list[tuple[int, str]], filters: HistoryFilters
+) -> InlineKeyboardMarkup:
+    """
+    Клавиатура выбора сотрудника для фильтра истории группы
+
+    Args:
+        members: Пары (Telegram ID, ФИО) сотрудников группы
+        filters: Текущие фильтры ленты
+    """
+    buttons = [
+        [
+            InlineKeyboardButton(
+                text=("🟢 " if not filters.member else "") + "Все сотрудники",
+                callback_data=_history_menu(filters, member=0),
+            )
+        ]
+    ]
+
+    member_buttons = [
+        InlineKeyboardButton(
+            text=("🟢 " if user_id == filters.member else "") + fullname,
+            callback_data=_history_menu(filters, member=user_id),
+        )
+        for user_id, fullname in members
+    ]
+    for i in range(0, len(member_buttons), 2):
+        buttons.append(member_buttons[i : i + 2])
+
+    buttons.append(
+        [
+            InlineKeyboardButton(
+                text="↩️ Назад",
+                callback_data=_history_menu(filters),
+            ),
+            InlineKeyboardButton(
+                text="🏠 Домой",
+                callback_data=MainMenu(menu="main").pack(),
+            ),
+        ]
+    )
+
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
+def head_transaction_detail_kb(
+    page: int = 1, anchor: int = 0, filters: HistoryFilters = HistoryFilters()
+) -> InlineKeyboardMarkup:
     """
     Клавиатура для детального просмотра транзакции группы
     """
@@ -221,7 +326,12 @@ def head_transaction_detail_kb(page: int = 1) -> InlineKeyboardMarkup:
         [
             InlineKeyboardButton(
                 text="↩️ Назад",
-                callback_data=HeadGameMenu(menu="history", page=page).pack(),
+                callback_data=_history_menu(
+                    filters,
+                    page=page,
+                    direction=AT if anchor else FIRST,
+                    cursor=anchor,
+                ),
             ),
             InlineKeyboardButton(
                 text="🏠 Домой",
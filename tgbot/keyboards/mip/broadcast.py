@@ -11,6 +11,11 @@ class BroadcastMenu(CallbackData, prefix="broadcast"):
     action: str
 
 
+class BroadcastJobMenu(CallbackData, prefix="broadcast_job"):
+    action: str
+    job_id: str
+
+
 def broadcast_kb() -> InlineKeyboardMarkup:
     """
     Клавиатура меню рассылки.
@@ -191,3 +196,29 @@ def confirmation_kb() -> InlineKeyboardMarkup:
     ]
 
     return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
+def broadcast_job_kb(job_id: str, paused: bool = False) -> InlineKeyboardMarkup:
+    """
+    Клавиатура управления запущенной рассылкой
+
+    :param job_id: Идентификатор задачи рассылки
+    :param paused: Рассылка приостановлена
+    :return: Объект встроенной клавиатуры
+    """
+    buttons = [
+        [
+            InlineKeyboardButton(
+                text="▶️ Продолжить" if paused else "⏸️ Пауза",
+                callback_data=BroadcastJobMenu(
+                    action="resume" if paused else "pause", job_id=job_id
+                ).pack(),
+            ),
+            InlineKeyboardButton(
+                text="⛔ Остановить",
+                callback_data=BroadcastJobMenu(action="cancel", job_id=job_id).pack(),
+            ),
+        ],
+    ]
+
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
@@ -4,26 +4,36 @@ from sqlalchemy import Sequence
 from stp_database.models.STP.transactions import Transaction
 
 from tgbot.keyboards.user.main import MainMenu
+from tgbot.services.history import AT, FIRST, LAST, NEXT, PREV
 
 
 class TransactionHistoryMenu(CallbackData, prefix="transaction_history"):
     menu: str = "history"
     page: int = 1
+    # Переход по ключу от граничной транзакции (см. tgbot.services.history)
+    direction: str = FIRST
+    cursor: int = 0
 
 
 class TransactionDetailMenu(CallbackData, prefix="transaction_detail"):
     transaction_id: int
     page: int = 1
+    # Первая транзакция страницы для возврата на нее
+    anchor: int = 0
 
 
 def transaction_history_kb(
     transactions: Sequence[Transaction],
     current_page: int = 1,
+    total_transactions: int = 0,
     transactions_per_page: int = 8,
 ) -> InlineKeyboardMarkup:
     """
     Клавиатура истории транзакций с пагинацией.
     Отображает 2 транзакции в ряд, по умолчанию 8 транзакций на страницу (4 ряда).
+
+    :param transactions: Транзакции текущей страницы
+    :param total_transactions: Количество транзакций пользователя
     """
     buttons = []
 
@@ -42,15 +52,12 @@ def transaction_history_kb(
         return InlineKeyboardMarkup(inline_keyboard=buttons)
 
     # Рассчитываем пагинацию
-    total_transactions = len(transactions)
-    total_pages = (
-        total_transactions + transactions_per_page - 1
-    ) // transactions_per_page
-
-    # Рассчитываем диапазон транзакций для текущей страницы
-    start_idx = (current_page - 1) * transactions_per_page
-    end_idx = start_idx + transactions_per_page
-    page_transactions = transactions[start_idx:end_idx]
+    total_pages = max(
+        (total_transactions + transactions_per_page - 1) // transactions_per_page, 1
+    )
+    current_page = min(current_page, total_pages)
+    page_transactions = transactions
+    anchor = transactions[0].id
 
     # Создаем кнопки для транзакций (2 в ряд)
     for i in range(0, len(page_transactions), 2):
@@ -77,7 +84,7 @@ def transaction_history_kb(
             InlineKeyboardButton(
                 text=button_text,
                 callback_data=TransactionDetailMenu(
-                    transaction_id=transaction.id, page=current_page
+                    transaction_id=transaction.id, page=current_page, anchor=anchor
                 ).pack(),
             )
         )
@@ -96,7 +103,9 @@ def transaction_history_kb(
                 InlineKeyboardButton(
                     text=button_text,
                     callback_data=TransactionDetailMenu(
-                        transaction_id=transaction.id, page=current_page
+                        transaction_id=transaction.id,
+                        page=current_page,
+                        anchor=anchor,
                     ).pack(),
                 )
             )
@@ -114,7 +123,9 @@ def transaction_history_kb(
             pagination_row.append(
                 InlineKeyboardButton(
                     text="⏪",
-                    callback_data=TransactionHistoryMenu(menu="history", page=1).pack(),
+                    callback_data=TransactionHistoryMenu(
+                        menu="history", page=1, direction=FIRST
+                    ).pack(),
                 )
             )
         else:
@@ -126,7 +137,10 @@ def transaction_history_kb(
                 InlineKeyboardButton(
                     text="⬅️",
                     callback_data=TransactionHistoryMenu(
-                        menu="history", page=current_page - 1
+                        menu="history",
+                        page=current_page - 1,
+                        direction=PREV,
+                        cursor=transactions[0].id,
                     ).pack(),
                 )
             )
@@ -147,7 +161,10 @@ def transaction_history_kb(
                 InlineKeyboardButton(
                     text="➡️",
                     callback_data=TransactionHistoryMenu(
-                        menu="history", page=current_page + 1
+                        menu="history",
+                        page=current_page + 1,
+                        direction=NEXT,
+                        cursor=transactions[-1].id,
                     ).pack(),
                 )
             )
@@ -160,7 +177,7 @@ def transaction_history_kb(
                 InlineKeyboardButton(
                     text="⏭️",
                     callback_data=TransactionHistoryMenu(
-                        menu="history", page=total_pages
+                        menu="history", page=total_pages, direction=LAST
                     ).pack(),
                 )
             )
@@ -184,15 +201,23 @@ def transaction_history_kb(
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
-def transaction_detail_kb(page: int = 1) -> InlineKeyboardMarkup:
+def transaction_detail_kb(page: int = 1, anchor: int = 0) -> InlineKeyboardMarkup:
     """
     Клавиатура для детального просмотра транзакции
+
+    :param page: Номер страницы истории, с которой открыта транзакция
+    :param anchor: Первая транзакция этой страницы
     """
     buttons = [
         [
             InlineKeyboardButton(
                 text="↩️ Назад",
-                callback_data=TransactionHistoryMenu(menu="history", page=page).pack(),
+                callback_data=TransactionHistoryMenu(
+                    menu="history",
+                    page=page,
+                    direction=AT if anchor else FIRST,
+                    cursor=anchor,
+                ).pack(),
             ),
             InlineKeyboardButton(
                 text="🏠 Домой", callback_data=MainMenu(menu="main").pack()
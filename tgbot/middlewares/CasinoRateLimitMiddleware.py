@@ -0,0 +1,68 @@
+import logging
+import re
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+from tgbot.keyboards.user.game.casino import CasinoMenu
+from tgbot.services.rate_limit import casino_limiter
+
+logger = logging.getLogger(__name__)
+
+# Команда игры в группе со ставкой, например: /slots 100 или /dice@stpsher_bot 50
+CASINO_COMMAND = re.compile(r"^/(?:slots|dice|darts|bowling)(?:@\w+)?\s+\d+")
+
+
+class CasinoRateLimitMiddleware(BaseMiddleware):
+    """
+    Внешний middleware лимита частоты игр в казино.
+    Регистрируется до middleware с обращениями к БД, поэтому лишние игры
+    отбрасываются до открытия сессий, проверки пользователя и группы.
+    Команды в группах отбрасываются молча, на ставку в личных сообщениях
+    отправляется ответ на callback.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if isinstance(event, Message) and self._is_group_game(event):
+            if not await casino_limiter.allow(event.chat.id, event.from_user.id):
+                logger.debug(
+                    "[Казино-Группа] Пропущена игра %s в группе %s: превышен лимит частоты",
+                    event.from_user.id,
+                    event.chat.id,
+                )
+                return None
+
+        elif isinstance(event, CallbackQuery) and self._is_private_bet(event):
+            if not await casino_limiter.allow(event.from_user.id, event.from_user.id):
+                await event.answer("⏳ Слишком часто, подожди немного")
+                return None
+
+        return await handler(event, data)
+
+    @staticmethod
+    def _is_group_game(message: Message) -> bool:
+        return (
+            message.chat.type in ("group", "supergroup")
+            and message.from_user is not None
+            and bool(CASINO_COMMAND.match(message.text or ""))
+        )
+
+    @staticmethod
+    def _is_private_bet(callback: CallbackQuery) -> bool:
+        if (
+            not callback.data
+            or not callback.data.startswith(f"{CasinoMenu.__prefix__}:")
+            or callback.message is None
+            or callback.message.chat.type != "private"
+        ):
+            return False
+        try:
+            return CasinoMenu.unpack(callback.data).menu == "bet"
+        except (TypeError, ValueError):
+            return False
@@ -0,0 +1,78 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, TelegramObject
+
+from tgbot.services.concurrency import ConcurrencyLimiter, HandlerCosts
+
+logger = logging.getLogger(__name__)
+
+
+class ConcurrencyMiddleware(BaseMiddleware):
+    """
+    Внешний middleware ограничения параллельности по классу стоимости хендлера.
+    Регистрируется до middleware с обращениями к БД, чтобы апдейты в очереди
+    не держали соединения. Класс определяется по флагу ``cost`` хендлера,
+    который обработает апдейт (см. HandlerCosts), по умолчанию - db.
+    """
+
+    def __init__(
+        self, limiter: ConcurrencyLimiter, costs: HandlerCosts, event_type: str
+    ) -> None:
+        self.limiter = limiter
+        self.costs = costs
+        self.event_type = event_type
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        cost = await self.costs.resolve(self.event_type, event)
+        semaphore = self.limiter.get(cost)
+        from_user = getattr(event, "from_user", None)
+        owner = from_user.id if from_user else None
+
+        acquire = asyncio.ensure_future(semaphore.acquire(owner))
+        try:
+            done, _ = await asyncio.wait(
+                {acquire}, timeout=self.limiter.still_working_after
+            )
+            if not done:
+                logger.info(
+                    f"[Нагрузка] Апдейт пользователя {owner} ожидает слот класса {cost} (в очереди {semaphore.waiting})"
+                )
+                if isinstance(event, CallbackQuery):
+                    await self._answer_still_working(event)
+            await acquire
+        except asyncio.CancelledError:
+            if acquire.done() and not acquire.cancelled():
+                semaphore.release()
+            else:
+                acquire.cancel()
+            raise
+
+        try:
+            return await handler(event, data)
+        finally:
+            semaphore.release()
+            if isinstance(event, CallbackQuery):
+                self.limiter.early_answered.pop(event.id, None)
+
+    async def _answer_still_working(self, callback: CallbackQuery) -> None:
+        """
+        Отвечает на callback, чтобы у пользователя не крутилась загрузка
+        """
+        try:
+            await callback.answer("⏳ Обрабатываю запрос, подожди немного...")
+            chat_id = (
+                callback.message.chat.id if callback.message else callback.from_user.id
+            )
+            self.limiter.early_answered[callback.id] = chat_id
+        except Exception as e:
+            logger.debug(
+                f"[Нагрузка] Не удалось ответить на callback {callback.id}: {e}"
+            )
@@ -7,6 +7,8 @@ from aiogram.types import CallbackQuery, ChatMemberUpdated, InlineQuery, Message
 from stp_database.repo.STP.requests import MainRequestsRepo
 
 from tgbot.keyboards.group import short_name
+from tgbot.services.group_cache import GroupSettings, groups_cache
+from tgbot.services.leaderboards import Board, leaderboards
 
 logger = logging.getLogger(__name__)
 
@@ -58,6 +60,25 @@ class GroupsMiddleware(BaseMiddleware):
         result = await handler(event, data)
         return result
 
+    @staticmethod
+    async def _get_group(
+        group_id: int,
+        stp_repo: MainRequestsRepo,
+    ) -> GroupSettings | None:
+        """
+        Получение настроек группы с использованием кеша
+
+        :param group_id: ID группы
+        :param stp_repo: Репозиторий для работы с БД
+        :return: Настройки группы или None, если группа не зарегистрирована
+        """
+        cached, settings = groups_cache.get_group(group_id)
+        if cached:
+            return settings
+
+        group = await stp_repo.group.get_group(group_id)
+        return groups_cache.set_group(group_id, group)
+
     @staticmethod
     async def _cleanup_removed_group(
         group_id: int,
@@ -77,6 +98,7 @@ class GroupsMiddleware(BaseMiddleware):
 
             # Удаляем саму группу
             await stp_repo.group.delete_group(group_id)
+            groups_cache.invalidate_group(group_id)
             logger.info(f"[Группы] Группа {group_id} удалена из базы")
 
         except Exception as e:
@@ -103,12 +125,15 @@ class GroupsMiddleware(BaseMiddleware):
 
         # Добавляем отладочное логирование
         logger.debug(
-            f"[Группы] Обработка сообщения от пользователя {user_id} в группе {group_id}: '{event.text or 'не текст'}'"
+            "[Группы] Обработка сообщения от пользователя %s в группе %s: '%s'",
+            user_id,
+            group_id,
+            event.text or "не текст",
         )
 
         try:
             # Проверяем, есть ли группа в таблице groups
-            group = await stp_repo.group.get_group(group_id)
+            group = await GroupsMiddleware._get_group(group_id, stp_repo)
             if not group:
                 return
 
@@ -133,11 +158,14 @@ class GroupsMiddleware(BaseMiddleware):
             # Проверяем, является ли пользователь уже участником
             is_member = await stp_repo.group_member.is_member(group_id, user_id)
             if is_member:
+                groups_cache.mark_validated(group_id, user_id)
                 return
 
             # Добавляем пользователя в участники группы
             result = await stp_repo.group_member.add_member(group_id, user_id)
             if result:
+                groups_cache.mark_validated(group_id, user_id)
+                await leaderboards.forget(Board.chat(group_id))
                 logger.info(f"[Группы] Добавлен участник {user_id} в группу {group_id}")
             else:
                 logger.warning(
@@ -200,10 +228,10 @@ class GroupsMiddleware(BaseMiddleware):
                 return
 
             # Проверяем, что группа зарегистрирована в системе
-            group = await stp_repo.group.get_group(group_id)
+            group = await GroupsMiddleware._get_group(group_id, stp_repo)
             if not group:
                 logger.debug(
-                    f"[Группы] Группа {group_id} не зарегистрирована в системе"
+                    "[Группы] Группа %s не зарегистрирована в системе", group_id
                 )
                 return
 
@@ -267,7 +295,8 @@ class GroupsMiddleware(BaseMiddleware):
             # Игнорируем ботов
             if event.new_chat_member.user.is_bot:
                 logger.debug(
-                    f"[Группы] Пользователь {user_id} определен как бот, игнорируем обработку"
+                    "[Группы] Пользователь %s определен как бот, игнорируем обработку",
+                    user_id,
                 )
                 return
             # Используем централизованную проверку на трудоустройство
@@ -287,9 +316,13 @@ class GroupsMiddleware(BaseMiddleware):
 
             # Добавляем пользователя в участники группы
             is_member = await stp_repo.group_member.is_member(group_id, user_id)
-            if not is_member:
+            if is_member:
+                groups_cache.mark_validated(group_id, user_id)
+            else:
                 result = await stp_repo.group_member.add_member(group_id, user_id)
                 if result:
+                    groups_cache.mark_validated(group_id, user_id)
+                    await leaderboards.forget(Board.chat(group_id))
                     logger.info(
                         f"[Группы] Пользователь {user_id} добавлен в участники группы {group_id}"
                     )
@@ -319,6 +352,8 @@ class GroupsMiddleware(BaseMiddleware):
         """
         Обработка удаления пользователя из группы
         """
+        groups_cache.forget_member(group_id, user_id)
+
         try:
             # Проверяем, существует ли пользователь в группе перед удалением
             is_member = await stp_repo.group_member.is_member(group_id, user_id)
@@ -326,6 +361,7 @@ class GroupsMiddleware(BaseMiddleware):
             if is_member:
                 # Удаляем пользователя из таблицы group_members
                 result = await stp_repo.group_member.remove_member(group_id, user_id)
+                await leaderboards.forget(Board.chat(group_id))
 
                 action = "исключен" if was_kicked else "покинул группу"
                 if result:
@@ -390,7 +426,8 @@ class GroupsMiddleware(BaseMiddleware):
             # Игнорируем всех ботов, используя API Telegram
             if user and user.is_bot:
                 logger.debug(
-                    f"[Группы] Пользователь {user_id} определен как бот, игнорируем проверку"
+                    "[Группы] Пользователь %s определен как бот, игнорируем проверку",
+                    user_id,
                 )
                 return True
             # Если настройка remove_unemployed отключена, разрешаем всех
@@ -423,7 +460,9 @@ class GroupsMiddleware(BaseMiddleware):
                     return False
 
             logger.debug(
-                f"[Группы] Пользователь {user_id} найден в базе сотрудников: {employee.position or 'Без должности'}"
+                "[Группы] Пользователь %s найден в базе сотрудников: %s",
+                user_id,
+                employee.position or "Без должности",
             )
             return True
 
@@ -466,7 +505,9 @@ class GroupsMiddleware(BaseMiddleware):
 
             if user_role in group.allowed_roles or user_role == 10:
                 logger.debug(
-                    f"[Группы] Пользователь {user_id} имеет доступ (роль {user_role})"
+                    "[Группы] Пользователь %s имеет доступ (роль %s)",
+                    user_id,
+                    user_role,
                 )
                 return True
             else:
@@ -554,12 +595,15 @@ class GroupsMiddleware(BaseMiddleware):
         """
         Общий метод для выполнения бана пользователя
         """
+        groups_cache.forget_member(group_id, user_id)
+
         try:
             # Банить пользователя в Telegram группе
             await bot.ban_chat_member(chat_id=group_id, user_id=user_id)
 
             # Удаляем пользователя из таблицы group_members
             await stp_repo.group_member.remove_member(group_id, user_id)
+            await leaderboards.forget(Board.chat(group_id))
 
             # Отправляем уведомление в группу
             user = await stp_repo.employee.get_user(user_id=user_id)
@@ -617,12 +661,12 @@ class GroupsMiddleware(BaseMiddleware):
             group_id = event.chat.id
 
             # Получаем настройки группы
-            group = await stp_repo.group.get_group(group_id)
+            group = await GroupsMiddleware._get_group(group_id, stp_repo)
             if not group:
                 return False
 
             # Проверяем, есть ли настройки для удаления сервисных сообщений
-            service_categories = getattr(group, "service_messages", []) or []
+            service_categories = group.service_messages
             if not service_categories:
                 return False
 
@@ -737,7 +781,7 @@ class GroupsMiddleware(BaseMiddleware):
                 return False
 
             # Проверяем, зарегистрирована ли группа
-            group = await stp_repo.group.get_group(group_id)
+            group = await GroupsMiddleware._get_group(group_id, stp_repo)
             if group:
                 return False  # Группа уже зарегистрирована, не обрабатываем
 
@@ -873,6 +917,7 @@ class GroupsMiddleware(BaseMiddleware):
             group = await stp_repo.group.add_group(
                 group_id=group_id, invited_by=invited_by
             )
+            groups_cache.invalidate_group(group_id)
 
             if group:
                 logger.info(
@@ -0,0 +1,60 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.event.handler import HandlerObject
+from aiogram.types import CallbackQuery, TelegramObject
+
+from tgbot.services.metrics import UpdateStats, current_update_stats, metrics_registry
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """
+    Внешний middleware измерения апдейта.
+    Регистрируется первым, чтобы учитывать время всей цепочки middleware,
+    SQL запросы и вызовы Telegram API.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        stats = UpdateStats(prefix=self._get_prefix(event))
+        token = current_update_stats.set(stats)
+        try:
+            return await handler(event, data)
+        finally:
+            current_update_stats.reset(token)
+            metrics_registry.observe(stats)
+
+    @staticmethod
+    def _get_prefix(event: TelegramObject) -> str:
+        """
+        Префикс callback data (до первого двоеточия) или тип события
+        """
+        if isinstance(event, CallbackQuery):
+            return (event.data or "").split(":", 1)[0]
+        return type(event).__name__.lower()
+
+
+class HandlerLabelMiddleware(BaseMiddleware):
+    """
+    Внутренний middleware, помечающий статистику апдейта
+    модулем роутера и именем сработавшего хендлера
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        stats = current_update_stats.get()
+        handler_object: HandlerObject | None = data.get("handler")
+        if stats is not None and handler_object is not None:
+            callback = handler_object.callback
+            stats.router = getattr(callback, "__module__", "unknown")
+            stats.handler = getattr(callback, "__name__", "unknown")
+
+        return await handler(event, data)
@@ -0,0 +1,54 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+from tgbot.services.metrics import UpdateStats, current_update_stats
+from tgbot.services.profiler import UpdateProfiler
+
+
+class ProfilerMiddleware(BaseMiddleware):
+    """
+    Middleware профилирования апдейтов.
+    Использует статистику апдейта из MetricsMiddleware, если метрики включены,
+    иначе создает собственную.
+    """
+
+    def __init__(self, profiler: UpdateProfiler) -> None:
+        self.profiler = profiler
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        stats = current_update_stats.get()
+        token = None
+        if stats is None:
+            stats = UpdateStats()
+            token = current_update_stats.set(stats)
+
+        session = self.profiler.begin(
+            stats, type(event).__name__, self._get_callback_data(event)
+        )
+        try:
+            return await handler(event, data)
+        finally:
+            if session is not None:
+                await self.profiler.finish(session)
+            if token is not None:
+                current_update_stats.reset(token)
+
+    @staticmethod
+    def _get_callback_data(event: TelegramObject) -> str | None:
+        """
+        Данные, по которым можно воспроизвести апдейт.
+        Для сообщений записывается только команда: свободный текст может
+        содержать коды авторизации, почту и ФИО из FSM
+        """
+        if isinstance(event, CallbackQuery):
+            return event.data
+        if isinstance(event, Message) and event.text and event.text.startswith("/"):
+            return event.text.split()[0]
+        return None
@@ -0,0 +1,64 @@
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message
+
+from tgbot.middlewares.GroupsMiddleware import GroupsMiddleware
+from tgbot.services.group_cache import groups_cache
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateClassifierMiddleware(BaseMiddleware):
+    """
+    Middleware классификации апдейтов перед основной цепочкой.
+    Определяет по кешу настроек групп и проверенных участников, нужна ли
+    обработка сообщения с обращением к БД. Обычные сообщения в группах
+    ни один хендлер не обрабатывает, поэтому для незарегистрированных групп
+    и уже проверенных участников цепочка middleware не запускается.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
+        event: Message,
+        data: Dict[str, Any],
+    ) -> Any:
+        if isinstance(event, Message) and self._can_skip(event):
+            return None
+
+        return await handler(event, data)
+
+    @staticmethod
+    def _can_skip(event: Message) -> bool:
+        """
+        Проверяет, можно ли пропустить обработку сообщения без запросов к БД
+
+        :param event: Сообщение
+        :return: True если сообщение не требует обработки
+        """
+        if event.chat.type not in ["group", "supergroup"] or not event.from_user:
+            return False
+
+        # Команды и сервисные сообщения всегда проходят полную обработку
+        text = event.text or event.caption or ""
+        if text.startswith("/"):
+            return False
+
+        if GroupsMiddleware._detect_service_message_category(event):
+            return False
+
+        cached, group = groups_cache.get_group(event.chat.id)
+        if not cached:
+            return False
+
+        # Незарегистрированная группа - обычные сообщения не обрабатываются
+        if group is None:
+            return True
+
+        # Ботов GroupsMiddleware не проверяет
+        if event.from_user.is_bot:
+            return True
+
+        return groups_cache.is_validated_member(event.chat.id, event.from_user.id)
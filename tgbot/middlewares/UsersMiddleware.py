@@ -3,12 +3,12 @@ from typing import Any, Awaitable, Callable, Dict, Union
 
 from aiogram import BaseMiddleware
 from aiogram.types import CallbackQuery, InlineQuery, Message
+from sqlalchemy.orm.attributes import set_committed_value
 from stp_database import Employee
 from stp_database.repo.STP.requests import MainRequestsRepo
 
-from tgbot.services.logger import setup_logging
+from tgbot.services.username_sync import username_sync
 
-setup_logging()
 logger = logging.getLogger(__name__)
 
 
@@ -44,7 +44,9 @@ class UsersMiddleware(BaseMiddleware):
         stp_repo: MainRequestsRepo,
     ):
         """
-        Обновление юзернейма пользователя если он отличается от записанного
+        Обновление юзернейма пользователя если он отличается от записанного.
+        Запись в БД выполняется отложенно через очередь синхронизации,
+        а объект пользователя в текущей сессии обновляется сразу
         :param user:
         :param event:
         :return:
@@ -56,23 +58,18 @@ class UsersMiddleware(BaseMiddleware):
         stored_username = user.username
 
         if stored_username != current_username:
-            try:
-                if current_username is None:
-                    await stp_repo.employee.update_user(
-                        user_id=event.from_user.id,
-                        username=None,
-                    )
-                    logger.info(
-                        f"[Юзернейм] Удален юзернейм пользователя {event.from_user.id}"
-                    )
-                else:
-                    await stp_repo.employee.update_user(
-                        user_id=event.from_user.id, username=current_username
-                    )
-                    logger.info(
-                        f"[Юзернейм] Обновлен юзернейм пользователя {event.from_user.id} - @{current_username}"
-                    )
-            except Exception as e:
-                logger.error(
-                    f"[Юзернейм] Ошибка обновления юзернейма для пользователя {event.from_user.id}: {e}"
+            # Обновляем значение без пометки объекта как измененного,
+            # чтобы хендлеры видели новый юзернейм без записи в БД
+            set_committed_value(user, "username", current_username)
+            if not username_sync.enqueue(event.from_user.id, current_username):
+                # Изменение уже ожидает записи в БД
+                return
+
+            if current_username is None:
+                logger.info(
+                    f"[Юзернейм] Удален юзернейм пользователя {event.from_user.id}"
+                )
+            else:
+                logger.info(
+                    f"[Юзернейм] Обновлен юзернейм пользователя {event.from_user.id} - @{current_username}"
                 )
@@ -0,0 +1,33 @@
+"""
+Отложенный импорт тяжелых модулей
+
+Модули pandas и openpyxl нужны только при разборе Excel файлов, но
+импортируются роутерами при запуске бота. Отложенный модуль загружается
+при первом обращении к его атрибуту, а не при импорте.
+"""
+
+import importlib.util
+import sys
+from types import ModuleType
+
+
+def lazy_import(name: str) -> ModuleType:
+    """
+    Возвращает модуль, который будет загружен при первом обращении к атрибуту
+
+    :param name: Полное имя модуля
+    :return: Модуль (отложенный, если еще не был импортирован)
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
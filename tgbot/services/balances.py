@@ -0,0 +1,556 @@
+"""
+Материализованные балансы пользователей
+
+Баланс и сумма баллов, заработанных достижениями, хранятся в Redis
+(без Redis - в памяти процесса) и изменяются на сумму каждой транзакции
+сразу после ее записи, поэтому чтение баланса не требует суммирования
+журнала транзакций. Отсутствующий в кеше баланс вычисляется одним запросом.
+Периодическая сверка с журналом транзакций исправляет расхождения.
+"""
+
+import logging
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Iterable, Optional
+
+from redis.asyncio import Redis
+from sqlalchemy import and_, case, func, select
+from stp_database import MainRequestsRepo
+from stp_database.models.STP.transactions import Transaction
+
+logger = logging.getLogger(__name__)
+
+BALANCE_KEY = "balance:{user_id}"
+# Счетчик изменений баланса: увеличивается при каждой транзакции, даже если
+# баланса нет в кеше, и защищает кеш от записи вычисленного до нее баланса
+VERSION_KEY = "balance_version:{user_id}"
+# Суммы, зарезервированные под незавершенные операции (ставки казино,
+# покупки): хеш ID операции -> сумма
+HOLD_KEY = "balance_holds:{user_id}"
+
+# Кеш обновляется при каждой транзакции, TTL ограничивает время жизни
+# возможного расхождения для пользователей, которых не проверила сверка
+CACHE_TTL = 24 * 60 * 60
+
+# Резервы снимаются явно после записи транзакции. TTL снимает резервы
+# операций, которые никто не завершит, и должен превышать время перезапуска:
+# восстановленные раунды казино записывают свои резервы заново
+HOLD_TTL = 60 * 60
+
+# Счетчику изменений достаточно пережить вычисление баланса из журнала
+VERSION_TTL = 60 * 60
+
+# Изменение полей существующих записей. Отсутствующие записи не создаются:
+# они будут вычислены из журнала при следующем чтении.
+# KEYS: пары (баланс, счетчик изменений). ARGV: пары изменений, TTL счетчиков
+INCREMENT_SCRIPT = """
+local ttl = ARGV[#ARGV]
+for i = 1, #KEYS / 2 do
+    local key = KEYS[2 * i - 1]
+    if redis.call('EXISTS', key) == 1 then
+        redis.call('HINCRBY', key, 'balance', ARGV[2 * i - 1])
+        redis.call('HINCRBY', key, 'achievements', ARGV[2 * i])
+    end
+    redis.call('INCR', KEYS[2 * i])
+    redis.call('EXPIRE', KEYS[2 * i], ttl)
+end
+return 1
+"""
+
+# Запись вычисленных значений, если запись не появилась и баланс не изменился
+# за время вычисления. KEYS: пары (баланс, счетчик изменений).
+# ARGV: четверки (баланс, баллы, TTL, счетчик до вычисления).
+# Возвращает номера (с 1) пар, которые не записаны из-за новых транзакций
+FILL_SCRIPT = """
+local changed = {}
+for i = 1, #KEYS / 2 do
+    local key = KEYS[2 * i - 1]
+    local version = tonumber(redis.call('GET', KEYS[2 * i])) or 0
+    if version ~= tonumber(ARGV[4 * i]) then
+        table.insert(changed, i)
+    elseif redis.call('EXISTS', key) == 0 then
+        redis.call('HSET', key, 'balance', ARGV[4 * i - 3], 'achievements', ARGV[4 * i - 2])
+        redis.call('EXPIRE', key, ARGV[4 * i - 1])
+    end
+end
+return changed
+"""
+
+# Резервирование суммы, если доступный баланс (баланс минус резервы) достаточен.
+# ARGV: сумма, TTL, ID операции.
+# Возвращает {1, доступно} или {0, доступно}, nil - баланса нет в кеше
+RESERVE_SCRIPT = """
+local balance = redis.call('HGET', KEYS[1], 'balance')
+if not balance then
+    return nil
+end
+local held = 0
+for _, amount in ipairs(redis.call('HVALS', KEYS[2])) do
+    held = held + tonumber(amount)
+end
+local available = tonumber(balance) - held
+if available < tonumber(ARGV[1]) then
+    return {0, available}
+end
+redis.call('HSET', KEYS[2], ARGV[3], ARGV[1])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+return {1, available}
+"""
+
+
+@dataclass(frozen=True)
+class Balance:
+    """
+    Баланс пользователя
+
+    :param balance: Текущий баланс
+    :param achievements: Сумма баллов, заработанных достижениями за все время
+    """
+
+    balance: int = 0
+    achievements: int = 0
+
+
+def transaction_delta(transaction_type: str, source_type: str, amount: int) -> Balance:
+    """
+    Изменение баланса от одной транзакции
+
+    :param transaction_type: earn или spend
+    :param source_type: Источник транзакции (achievement, product, casino, ...)
+    :param amount: Сумма транзакции
+    """
+    if transaction_type == "earn":
+        return Balance(amount, amount if source_type == "achievement" else 0)
+    return Balance(-amount, 0)
+
+
+def _totals_query():
+    """Балансы, вычисленные по журналу транзакций"""
+    earned = Transaction.type == "earn"
+    return select(
+        Transaction.user_id,
+        func.coalesce(
+            func.sum(case((earned, Transaction.amount), else_=-Transaction.amount)), 0
+        ),
+        func.coalesce(
+            func.sum(
+                case(
+                    (
+                        and_(earned, Transaction.source_type == "achievement"),
+                        Transaction.amount,
+                    ),
+                    else_=0,
+                )
+            ),
+            0,
+        ),
+    ).group_by(Transaction.user_id)
+
+
+class BalanceLedger:
+    """
+    Кеш балансов, обновляемый вместе с журналом транзакций
+    """
+
+    def __init__(self):
+        self.redis: Optional[Redis] = None
+        self._local: dict[int, Balance] = {}
+        # Счетчики изменений без Redis: ID пользователя -> число транзакций
+        self._versions: dict[int, int] = {}
+        # Резервы без Redis: ID пользователя -> {ID операции: сумма}
+        self._holds: dict[int, dict[str, int]] = {}
+        self._increment = None
+        self._fill = None
+        self._reserve = None
+        self._listeners: list[Callable[[dict[int, Balance]], Awaitable]] = []
+
+    def configure(self, redis: Optional[Redis] = None) -> None:
+        """
+        Настройка хранилища балансов
+
+        :param redis: Клиент Redis. Без него балансы хранятся в памяти процесса
+        """
+        self.redis = redis
+        if redis is not None:
+            self._increment = redis.register_script(INCREMENT_SCRIPT)
+            self._fill = redis.register_script(FILL_SCRIPT)
+            self._reserve = redis.register_script(RESERVE_SCRIPT)
+
+    def subscribe(self, listener: Callable[[dict[int, Balance]], Awaitable]) -> None:
+        """
+        Подписка на изменения балансов (например, для рейтингов)
+
+        :param listener: Корутина, получающая изменения балансов по Telegram ID
+        """
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    async def get(self, stp_repo: MainRequestsRepo, user_id: int) -> Balance:
+        """
+        Баланс пользователя
+
+        :param stp_repo: Репозиторий основной БД
+        :param user_id: Telegram ID пользователя
+        """
+        return (await self.get_many(stp_repo, [user_id]))[user_id]
+
+    async def get_balance(self, stp_repo: MainRequestsRepo, user_id: int) -> int:
+        """Доступный баланс пользователя: текущий баланс за вычетом резервов"""
+        balance = (await self.get(stp_repo, user_id)).balance
+        return balance - await self._held(user_id)
+
+    async def get_many(
+        self, stp_repo: MainRequestsRepo, user_ids: Iterable[int]
+    ) -> dict[int, Balance]:
+        """
+        Балансы нескольких пользователей. Отсутствующие в кеше вычисляются
+        одним запросом
+
+        :param stp_repo: Репозиторий основной БД
+        :param user_ids: Telegram ID пользователей
+        """
+        user_ids = list(dict.fromkeys(user_ids))
+        try:
+            balances = await self._read(user_ids)
+        except Exception as e:
+            logger.error(f"[Баланс] Ошибка чтения балансов из кеша: {e}")
+            return await self._compute(stp_repo.session, user_ids)
+
+        missing = [user_id for user_id in user_ids if user_id not in balances]
+        for attempt in range(2):
+            if not missing:
+                break
+            try:
+                versions = await self.read_versions(missing)
+            except Exception as e:
+                logger.error(f"[Баланс] Ошибка чтения балансов из кеша: {e}")
+                balances.update(await self._compute(stp_repo.session, missing))
+                break
+
+            computed = await self._compute(stp_repo.session, missing)
+            balances.update(computed)
+            try:
+                changed = await self._store(computed, versions)
+            except Exception as e:
+                logger.error(f"[Баланс] Ошибка записи балансов в кеш: {e}")
+                break
+            # Транзакция, записанная во время вычисления, могла не попасть
+            # в результат - такие балансы вычисляются повторно
+            missing = changed
+
+        return balances
+
+    async def add_transaction(self, stp_repo: MainRequestsRepo, **kwargs):
+        """
+        Записывает транзакцию через репозиторий и изменяет баланс в кеше
+
+        Принимает те же аргументы, что и ``stp_repo.transaction.add_transaction``
+
+        :return: Результат ``add_transaction``: (транзакция, новый баланс)
+        """
+        result = await stp_repo.transaction.add_transaction(**kwargs)
+        transaction = result[0] if isinstance(result, tuple) else result
+        if transaction:
+            await self.apply(
+                {
+                    kwargs["user_id"]: transaction_delta(
+                        kwargs["transaction_type"],
+                        kwargs["source_type"],
+                        kwargs["amount"],
+                    )
+                }
+            )
+        return result
+
+    async def reserve(
+        self, stp_repo: MainRequestsRepo, user_id: int, amount: int, hold_id: str
+    ) -> tuple[bool, int]:
+        """
+        Атомарно резервирует сумму из баланса пользователя
+
+        Резерв уменьшает доступный баланс (``get_balance`` и другие
+        резервирования) до вызова ``release``, поэтому операции, проверяющие
+        баланс через резерв, не могут потратить одни и те же баллы.
+        Сама транзакция записывается позже.
+
+        :param stp_repo: Репозиторий основной БД
+        :param user_id: Telegram ID пользователя
+        :param amount: Сумма
+        :param hold_id: ID операции, под которую резервируется сумма
+        :return: (зарезервировано ли, доступный баланс до резервирования)
+        """
+        if self.redis is None:
+            balance = (await self.get(stp_repo, user_id)).balance
+            available = balance - await self._held(user_id)
+            if available < amount:
+                return False, available
+            self._holds.setdefault(user_id, {})[hold_id] = amount
+            return True, available
+
+        keys = [BALANCE_KEY.format(user_id=user_id), HOLD_KEY.format(user_id=user_id)]
+        args = [amount, HOLD_TTL, hold_id]
+        try:
+            result = await self._reserve(keys=keys, args=args)
+            if result is None:
+                # Баланса нет в кеше - вычисляем и повторяем
+                await self.get_many(stp_repo, [user_id])
+                result = await self._reserve(keys=keys, args=args)
+        except Exception as e:
+            logger.error(f"[Баланс] Ошибка резервирования баланса: {e}")
+            result = None
+
+        if result is None:
+            # Без кеша резерв невозможен, проверяем только баланс
+            balance = await self.get_balance(stp_repo, user_id)
+            return balance >= amount, balance
+
+        reserved, available = result
+        return bool(reserved), int(available)
+
+    async def hold(self, user_id: int, hold_id: str, amount: int) -> None:
+        """
+        Записывает резерв операции заново (например, после перезапуска,
+        если резерв успел истечь). Повторный вызов ничего не меняет
+
+        :param user_id: Telegram ID пользователя
+        :param hold_id: ID операции
+        :param amount: Зарезервированная сумма
+        """
+        if self.redis is None:
+            self._holds.setdefault(user_id, {})[hold_id] = amount
+            return
+
+        key = HOLD_KEY.format(user_id=user_id)
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.hset(key, hold_id, amount)
+                pipe.expire(key, HOLD_TTL)
+                await pipe.execute()
+        except Exception as e:
+            logger.error(f"[Баланс] Ошибка восстановления резерва: {e}")
+
+    async def release(self, user_id: int, hold_id: str) -> None:
+        """
+        Снимает резерв после записи транзакции или отмены операции
+
+        :param user_id: Telegram ID пользователя
+        :param hold_id: ID операции
+        """
+        if self.redis is None:
+            holds = self._holds.get(user_id, {})
+            holds.pop(hold_id, None)
+            if not holds:
+                self._holds.pop(user_id, None)
+            return
+
+        try:
+            await self.redis.hdel(HOLD_KEY.format(user_id=user_id), hold_id)
+        except Exception as e:
+            logger.error(f"[Баланс] Ошибка снятия резерва: {e}")
+
+    async def _held(self, user_id: int) -> int:
+        """Сумма резервов пользователя"""
+        if self.redis is None:
+            return sum(self._holds.get(user_id, {}).values())
+        try:
+            amounts = await self.redis.hvals(HOLD_KEY.format(user_id=user_id))
+        except Exception as e:
+            logger.error(f"[Баланс] Ошибка чтения резервов: {e}")
+            return 0
+        return sum(int(amount) for amount in amounts)
+
+    async def apply(self, deltas: dict[int, Balance]) -> None:
+        """
+        Изменяет балансы в кеше на сумму записанных транзакций
+
+        :param deltas: Изменения балансов по Telegram ID пользователя
+        """
+        if not deltas:
+            return
+
+        # Подписчики уведомляются до увеличения счетчиков изменений: рейтинг,
+        # собранный без этой транзакции, увидит новый счетчик при записи
+        await self._notify(deltas)
+
+        if self.redis is None:
+            for user_id, delta in deltas.items():
+                self._versions[user_id] = self._versions.get(user_id, 0) + 1
+                current = self._local.get(user_id)
+                if current is not None:
+                    self._local[user_id] = Balance(
+                        current.balance + delta.balance,
+                        current.achievements + delta.achievements,
+                    )
+            return
+
+        keys = []
+        args = []
+        for user_id, delta in deltas.items():
+            keys += [
+                BALANCE_KEY.format(user_id=user_id),
+                VERSION_KEY.format(user_id=user_id),
+            ]
+            args += [delta.balance, delta.achievements]
+        args.append(VERSION_TTL)
+        try:
+            await self._increment(keys=keys, args=args)
+        except Exception as e:
+            # Устаревшие записи удаляются, чтобы следующее чтение пересчитало баланс
+            logger.error(f"[Баланс] Ошибка изменения балансов: {e}")
+            await self._invalidate(deltas.keys())
+
+    async def reconcile(self, session_pool) -> int:
+        """
+        Сверяет балансы в кеше с журналом транзакций и исправляет расхождения
+
+        :param session_pool: Пул сессий основной БД
+        :return: Количество исправленных балансов
+        """
+        async with session_pool() as session:
+            totals = await self._compute(session)
+            cached = await self._read(list(totals))
+            mismatched = [
+                user_id
+                for user_id, balance in cached.items()
+                if balance != totals[user_id]
+            ]
+            if not mismatched:
+                logger.info(f"[Баланс] Сверка: {len(cached)} балансов совпадают")
+                return 0
+
+            # Повторная проверка исключает транзакции, записанные во время сверки
+            versions = await self.read_versions(mismatched)
+            totals = await self._compute(session, mismatched)
+            cached = await self._read(mismatched)
+            mismatched = [
+                user_id
+                for user_id, balance in cached.items()
+                if balance != totals.get(user_id, Balance())
+            ]
+
+        if mismatched:
+            logger.warning(
+                f"[Баланс] Сверка: исправлено расхождений с журналом транзакций: {len(mismatched)}"
+            )
+            await self._invalidate(mismatched)
+            await self._store(
+                {user_id: totals[user_id] for user_id in mismatched}, versions
+            )
+            await self._notify(
+                {
+                    user_id: Balance(
+                        totals[user_id].balance - cached[user_id].balance,
+                        totals[user_id].achievements - cached[user_id].achievements,
+                    )
+                    for user_id in mismatched
+                }
+            )
+        return len(mismatched)
+
+    async def _notify(self, deltas: dict[int, Balance]) -> None:
+        for listener in self._listeners:
+            try:
+                await listener(deltas)
+            except Exception as e:
+                logger.error(f"[Баланс] Ошибка обработки изменения балансов: {e}")
+
+    @staticmethod
+    async def _compute(session, user_ids: Optional[list[int]] = None) -> dict:
+        query = _totals_query()
+        if user_ids is not None:
+            query = query.where(Transaction.user_id.in_(user_ids))
+        result = await session.execute(query)
+        balances = {
+            user_id: Balance(int(balance), int(achievements))
+            for user_id, balance, achievements in result.all()
+        }
+        # Пользователи без транзакций
+        for user_id in user_ids or []:
+            balances.setdefault(user_id, Balance())
+        return balances
+
+    async def _read(self, user_ids: list[int]) -> dict[int, Balance]:
+        if self.redis is None:
+            return {
+                user_id: self._local[user_id]
+                for user_id in user_ids
+                if user_id in self._local
+            }
+
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for user_id in user_ids:
+                pipe.hmget(
+                    BALANCE_KEY.format(user_id=user_id), "balance", "achievements"
+                )
+            rows = await pipe.execute()
+
+        return {
+            user_id: Balance(int(balance), int(achievements))
+            for user_id, (balance, achievements) in zip(user_ids, rows)
+            if balance is not None and achievements is not None
+        }
+
+    async def read_versions(self, user_ids: list[int]) -> dict[int, int]:
+        """
+        Счетчики изменений балансов. Читаются перед вычислением баланса,
+        чтобы при записи обнаружить транзакции, прошедшие за это время
+        """
+        if self.redis is None:
+            return {user_id: self._versions.get(user_id, 0) for user_id in user_ids}
+        versions = await self.redis.mget(
+            [VERSION_KEY.format(user_id=user_id) for user_id in user_ids]
+        )
+        return {
+            user_id: int(version or 0) for user_id, version in zip(user_ids, versions)
+        }
+
+    async def _store(
+        self, balances: dict[int, Balance], versions: dict[int, int]
+    ) -> list[int]:
+        """
+        Записывает вычисленные балансы, если с момента чтения счетчиков
+        изменений не было транзакций
+
+        :return: Пользователи, балансы которых изменились за время вычисления
+        """
+        if self.redis is None:
+            changed = []
+            for user_id, balance in balances.items():
+                if self._versions.get(user_id, 0) != versions[user_id]:
+                    changed.append(user_id)
+                else:
+                    self._local.setdefault(user_id, balance)
+            return changed
+
+        user_ids = list(balances)
+        keys = []
+        args = []
+        for user_id in user_ids:
+            keys += [
+                BALANCE_KEY.format(user_id=user_id),
+                VERSION_KEY.format(user_id=user_id),
+            ]
+            balance = balances[user_id]
+            args += [
+                balance.balance,
+                balance.achievements,
+                CACHE_TTL,
+                versions[user_id],
+            ]
+        changed = await self._fill(keys=keys, args=args)
+        return [user_ids[int(index) - 1] for index in changed]
+
+    async def _invalidate(self, user_ids: Iterable[int]) -> None:
+        user_ids = list(user_ids)
+        if self.redis is None:
+            for user_id in user_ids:
+                self._local.pop(user_id, None)
+            return
+        try:
+            await self.redis.delete(
+                *(BALANCE_KEY.format(user_id=user_id) for user_id in user_ids)
+            )
+        except Exception as e:
+            logger.error(f"[Баланс] Ошибка сброса балансов: {e}")
+
+
+balance_ledger = BalanceLedger()
@@ -0,0 +1,518 @@
+"""
+Задачи рассылок с сохранением прогресса
+
+Задача рассылки и статус доставки каждому получателю хранятся в Redis:
+- broadcast:job:{id} - параметры и статус задачи;
+- broadcast:job:{id}:recipients - список получателей;
+- broadcast:job:{id}:delivery - статус доставки по ID получателя.
+
+Задачу выполняет процесс, владеющий блокировкой broadcast:job:{id}:lock.
+Если процесс перезапустился или упал, блокировка истекает, и незавершенную
+задачу подхватывает любой запущенный процесс бота. Получатели, отправка
+которым была начата, но не подтверждена до перезапуска, повторно не
+получают сообщение и учитываются как ошибки.
+
+Без Redis задачи хранятся в памяти процесса и не возобновляются после
+перезапуска.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from dataclasses import dataclass, field
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from redis.asyncio import Redis
+
+from tgbot.keyboards.mip.broadcast import broadcast_job_kb, broadcast_kb
+from tgbot.services.broadcaster import (
+    SENT,
+    SKIPPED,
+    UNDELIVERABLE,
+    BroadcastResult,
+    broadcast_engine,
+)
+from tgbot.services.leader import RELEASE_SCRIPT, RENEW_SCRIPT
+
+logger = logging.getLogger(__name__)
+
+JOB_KEY = "broadcast:job:{job_id}"
+RECIPIENTS_KEY = "broadcast:job:{job_id}:recipients"
+DELIVERY_KEY = "broadcast:job:{job_id}:delivery"
+LOCK_KEY = "broadcast:job:{job_id}:lock"
+ACTIVE_JOBS_KEY = "broadcast:jobs"
+
+# Статусы задачи
+RUNNING = "running"
+PAUSED = "paused"
+CANCELLED = "cancelled"
+DONE = "done"
+
+# Отправка начата, но не подтверждена
+SENDING = "sending"
+# Отправка была прервана перезапуском, доставка неизвестна
+INTERRUPTED = "interrupted"
+
+# Сколько хранить завершенные задачи (сек)
+FINISHED_JOB_TTL = 7 * 24 * 3600
+
+
+@dataclass
+class BroadcastJob:
+    """
+    Задача рассылки
+    """
+
+    id: str
+    owner_id: int
+    from_chat_id: int
+    message_id: int
+    title: str
+    recipients: list[int]
+    status: str = RUNNING
+    progress_chat_id: Optional[int] = None
+    progress_message_id: Optional[int] = None
+    delivery: dict[int, str] = field(default_factory=dict)
+
+    def meta(self) -> dict:
+        return {
+            "owner_id": self.owner_id,
+            "from_chat_id": self.from_chat_id,
+            "message_id": self.message_id,
+            "title": self.title,
+            "status": self.status,
+            "progress_chat_id": self.progress_chat_id or "",
+            "progress_message_id": self.progress_message_id or "",
+        }
+
+    def result(self) -> BroadcastResult:
+        """
+        Счетчики по сохраненным статусам доставки
+        """
+        result = BroadcastResult(total=len(self.recipients))
+        for status in self.delivery.values():
+            if status == SENT:
+                result.sent += 1
+            elif status == UNDELIVERABLE:
+                result.undeliverable += 1
+            elif status == SKIPPED:
+                result.skipped += 1
+            else:
+                result.failed += 1
+        return result
+
+
+def _decode(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class BroadcastJobManager:
+    """
+    Запуск, приостановка и возобновление задач рассылок
+    """
+
+    def __init__(self, lock_ttl: int = 30, poll_interval: float = 15):
+        self.lock_ttl = lock_ttl
+        self.poll_interval = poll_interval
+        self.instance_id = (
+            f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        )
+        self.bot: Optional[Bot] = None
+        self.redis: Optional[Redis] = None
+        self._jobs: dict[str, BroadcastJob] = {}
+        self._running: dict[str, tuple[asyncio.Task, asyncio.Event]] = {}
+        self._watcher: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    def start(self, bot: Bot, redis: Optional[Redis] = None) -> None:
+        """
+        Запускает возобновление незавершенных задач
+
+        :param bot: Экземпляр бота
+        :param redis: Клиент Redis для хранения задач (None - в памяти процесса)
+        """
+        self.bot = bot
+        self.redis = redis
+        if redis is not None and (self._watcher is None or self._watcher.done()):
+            self._watcher = asyncio.create_task(self._watch())
+
+    async def stop(self) -> None:
+        """
+        Останавливает выполняемые задачи, сохраняя их для возобновления
+        """
+        self._stopping = True
+        if self._watcher:
+            self._watcher.cancel()
+            self._watcher = None
+
+        running = list(self._running.values())
+        for _, stop in running:
+            stop.set()
+        await asyncio.gather(*(task for task, _ in running), return_exceptions=True)
+
+    async def create(
+        self,
+        owner_id: int,
+        from_chat_id: int,
+        message_id: int,
+        recipients: list[int],
+        title: str,
+        progress_chat_id: int,
+        progress_message_id: int,
+    ) -> BroadcastJob:
+        """
+        Создает и запускает задачу рассылки
+
+        :param owner_id: Telegram ID автора рассылки
+        :param from_chat_id: Чат исходного сообщения
+        :param message_id: ID исходного сообщения
+        :param recipients: ID получателей
+        :param title: Описание получателей для сообщения о прогрессе
+        :param progress_chat_id: Чат сообщения о прогрессе
+        :param progress_message_id: ID сообщения о прогрессе
+        :return: Созданная задача
+        """
+        job = BroadcastJob(
+            id=uuid.uuid4().hex[:12],
+            owner_id=owner_id,
+            from_chat_id=from_chat_id,
+            message_id=message_id,
+            title=title,
+            recipients=list(dict.fromkeys(r for r in recipients if r)),
+            progress_chat_id=progress_chat_id,
+            progress_message_id=progress_message_id,
+        )
+        self._jobs[job.id] = job
+
+        if self.redis is not None:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.hset(JOB_KEY.format(job_id=job.id), mapping=job.meta())
+                if job.recipients:
+                    pipe.rpush(RECIPIENTS_KEY.format(job_id=job.id), *job.recipients)
+                pipe.sadd(ACTIVE_JOBS_KEY, job.id)
+                await pipe.execute()
+
+        logger.info(
+            f"[Рассылка] Создана задача {job.id} на {len(job.recipients)} получателей"
+        )
+        await self._claim(job.id)
+        return job
+
+    async def pause(self, job_id: str) -> bool:
+        """
+        Приостанавливает рассылку после завершения начатых отправок
+
+        :return: True, если задача выполнялась
+        """
+        job = await self._load(job_id)
+        if job is None or job.status != RUNNING:
+            return False
+        await self._set_status(job, PAUSED)
+        self._signal_stop(job_id)
+        return True
+
+    async def resume(self, job_id: str) -> bool:
+        """
+        Возобновляет приостановленную рассылку
+
+        :return: True, если задача была приостановлена
+        """
+        job = await self._load(job_id)
+        if job is None or job.status != PAUSED:
+            return False
+        await self._set_status(job, RUNNING)
+        await self._claim(job_id)
+        return True
+
+    async def cancel(self, job_id: str) -> bool:
+        """
+        Останавливает рассылку без возможности продолжения
+
+        :return: True, если задача не была завершена
+        """
+        job = await self._load(job_id)
+        if job is None or job.status not in (RUNNING, PAUSED):
+            return False
+        was_paused = job.status == PAUSED
+        await self._set_status(job, CANCELLED)
+        self._signal_stop(job_id)
+        if was_paused:
+            # Приостановленную задачу никто не выполняет, завершаем сразу
+            await self._finish(job, CANCELLED, job.result())
+        return True
+
+    def _signal_stop(self, job_id: str) -> None:
+        running = self._running.get(job_id)
+        if running:
+            running[1].set()
+
+    async def _load(self, job_id: str) -> Optional[BroadcastJob]:
+        if self.redis is None:
+            return self._jobs.get(job_id)
+
+        meta, recipients, delivery = await asyncio.gather(
+            self.redis.hgetall(JOB_KEY.format(job_id=job_id)),
+            self.redis.lrange(RECIPIENTS_KEY.format(job_id=job_id), 0, -1),
+            self.redis.hgetall(DELIVERY_KEY.format(job_id=job_id)),
+        )
+        if not meta:
+            return None
+        meta = {_decode(key): _decode(value) for key, value in meta.items()}
+        return BroadcastJob(
+            id=job_id,
+            owner_id=int(meta["owner_id"]),
+            from_chat_id=int(meta["from_chat_id"]),
+            message_id=int(meta["message_id"]),
+            title=meta["title"],
+            recipients=[int(r) for r in recipients],
+            status=meta["status"],
+            progress_chat_id=int(meta["progress_chat_id"] or 0) or None,
+            progress_message_id=int(meta["progress_message_id"] or 0) or None,
+            delivery={int(k): _decode(v) for k, v in delivery.items()},
+        )
+
+    async def _get_status(self, job_id: str) -> Optional[str]:
+        if self.redis is None:
+            job = self._jobs.get(job_id)
+            return job.status if job else None
+        return _decode(await self.redis.hget(JOB_KEY.format(job_id=job_id), "status"))
+
+    async def _set_status(self, job: BroadcastJob, status: str) -> None:
+        job.status = status
+        if job.id in self._jobs:
+            self._jobs[job.id].status = status
+        if self.redis is not None:
+            await self.redis.hset(JOB_KEY.format(job_id=job.id), "status", status)
+
+    async def _set_delivery(self, job: BroadcastJob, chat_id: int, status: str):
+        job.delivery[chat_id] = status
+        if self.redis is not None:
+            await self.redis.hset(DELIVERY_KEY.format(job_id=job.id), chat_id, status)
+
+    async def _claim(self, job_id: str) -> bool:
+        """
+        Запускает задачу в текущем процессе, если ее не выполняет другой
+        """
+        if job_id in self._running or self.bot is None:
+            return job_id in self._running
+
+        if self.redis is not None and not await self.redis.set(
+            LOCK_KEY.format(job_id=job_id),
+            self.instance_id,
+            nx=True,
+            px=self.lock_ttl * 1000,
+        ):
+            return False
+
+        job = await self._load(job_id)
+        if job is None or job.status != RUNNING:
+            await self._release(job_id)
+            return False
+
+        stop = asyncio.Event()
+        task = asyncio.create_task(self._run(job, stop))
+        self._running[job_id] = (task, stop)
+        return True
+
+    async def _release(self, job_id: str) -> None:
+        if self.redis is None:
+            return
+        try:
+            await self.redis.eval(
+                RELEASE_SCRIPT, 1, LOCK_KEY.format(job_id=job_id), self.instance_id
+            )
+        except Exception as e:
+            logger.warning(
+                f"[Рассылка] Не удалось освободить блокировку задачи {job_id}: {e}"
+            )
+
+    async def _keep_lock(self, job: BroadcastJob, stop: asyncio.Event) -> None:
+        # Продлевает блокировку и следит за паузой/отменой из других процессов
+        while not stop.is_set():
+            await asyncio.sleep(2)
+            try:
+                if self.redis is not None and not await self.redis.eval(
+                    RENEW_SCRIPT,
+                    1,
+                    LOCK_KEY.format(job_id=job.id),
+                    self.instance_id,
+                    self.lock_ttl * 1000,
+                ):
+                    logger.warning(f"[Рассылка] Потеряна блокировка задачи {job.id}")
+                    stop.set()
+                elif await self._get_status(job.id) != RUNNING:
+                    stop.set()
+            except Exception as e:
+                logger.error(f"[Рассылка] Ошибка проверки задачи {job.id}: {e}")
+
+    async def _run(self, job: BroadcastJob, stop: asyncio.Event) -> None:
+        bot = self.bot
+        restart = False
+        try:
+            # Отправки, начатые до перезапуска, не повторяются
+            for chat_id, status in list(job.delivery.items()):
+                if status == SENDING:
+                    await self._set_delivery(job, chat_id, INTERRUPTED)
+
+            result = job.result()
+            pending = [r for r in job.recipients if r not in job.delivery]
+            if job.delivery:
+                logger.info(
+                    f"[Рассылка] Возобновлена задача {job.id}: осталось {len(pending)} "
+                    f"из {len(job.recipients)} получателей"
+                )
+
+            async def send(chat_id: int):
+                await self._set_delivery(job, chat_id, SENDING)
+                # Используем copy_message для сохранения оригинального форматирования
+                await bot.copy_message(
+                    chat_id=chat_id,
+                    from_chat_id=job.from_chat_id,
+                    message_id=job.message_id,
+                )
+
+            async def on_result(chat_id: int, status: str):
+                await self._set_delivery(job, chat_id, status)
+
+            async def on_progress(progress: BroadcastResult):
+                await self._show(job, RUNNING, progress)
+
+            await self._show(job, RUNNING, result)
+            keeper = asyncio.create_task(self._keep_lock(job, stop))
+            try:
+                await broadcast_engine.run(
+                    pending,
+                    send,
+                    on_progress=on_progress,
+                    on_result=on_result,
+                    stop=stop,
+                    result=result,
+                )
+            finally:
+                keeper.cancel()
+
+            status = await self._get_status(job.id)
+            if not stop.is_set():
+                await self._finish(job, DONE, result)
+            elif status == CANCELLED:
+                await self._finish(job, CANCELLED, result)
+            elif status == PAUSED:
+                await self._show(job, PAUSED, result)
+            elif status == RUNNING and not self._stopping:
+                # Рассылку продолжили до завершения остановки
+                restart = True
+            # Иначе процесс останавливается, задачу возобновит следующий запуск
+        except Exception as e:
+            logger.exception(f"[Рассылка] Ошибка выполнения задачи {job.id}: {e}")
+        finally:
+            self._running.pop(job.id, None)
+            await self._release(job.id)
+
+        if restart:
+            await self._claim(job.id)
+
+    async def _finish(
+        self, job: BroadcastJob, status: str, result: BroadcastResult
+    ) -> None:
+        await self._set_status(job, status)
+        self._jobs.pop(job.id, None)
+        if self.redis is not None:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.srem(ACTIVE_JOBS_KEY, job.id)
+                for key in (JOB_KEY, RECIPIENTS_KEY, DELIVERY_KEY):
+                    pipe.expire(key.format(job_id=job.id), FINISHED_JOB_TTL)
+                await pipe.execute()
+
+        logger.info(
+            f"[Рассылка] Задача {job.id} {'завершена' if status == DONE else 'остановлена'}: "
+            f"{result.sent}/{result.total} сообщений отправлено"
+        )
+        await self._show(job, status, result)
+
+    async def _show(
+        self, job: BroadcastJob, status: str, result: BroadcastResult
+    ) -> None:
+        """
+        Обновляет сообщение о прогрессе рассылки
+        """
+        if not job.progress_chat_id or not job.progress_message_id:
+            return
+
+        processed = result.processed
+        percent = processed / result.total * 100 if result.total else 100
+        unavailable = result.undeliverable + result.skipped
+        unavailable_text = (
+            f"\n<b>Недоступны (бот заблокирован):</b> {unavailable}"
+            if unavailable
+            else ""
+        )
+
+        if status in (RUNNING, PAUSED):
+            header = (
+                "📤 Рассылка в процессе"
+                if status == RUNNING
+                else "⏸️ Рассылка приостановлена"
+            )
+            text = f"""<b>{header}</b>
+
+<b>Получатели:</b> {job.title}
+<b>Отправлено:</b> {processed} / {result.total}
+<b>Успешно:</b> {result.sent}
+<b>Прогресс:</b> {percent:.1f}%
+
+<i>Рассылка продолжится после перезапуска бота</i>"""
+            reply_markup = broadcast_job_kb(job.id, paused=status == PAUSED)
+        else:
+            success_rate = result.sent / result.total * 100 if result.total else 0
+            header = (
+                "✅ Рассылка завершена!"
+                if status == DONE
+                else "⛔ Рассылка остановлена"
+            )
+            text = f"""<b>{header}</b>
+
+<b>Получатели:</b> {job.title}
+<b>Всего получателей:</b> {result.total}
+<b>Успешно отправлено:</b> {result.sent}
+<b>Успешность:</b> {success_rate:.1f}%{unavailable_text}"""
+            reply_markup = broadcast_kb()
+
+        try:
+            await self.bot.edit_message_text(
+                text=text,
+                chat_id=job.progress_chat_id,
+                message_id=job.progress_message_id,
+                reply_markup=reply_markup,
+            )
+        except TelegramBadRequest as e:
+            if "message is not modified" not in e.message:
+                logger.warning(
+                    f"[Рассылка] Не удалось обновить прогресс задачи {job.id}: {e}"
+                )
+
+    async def _watch(self) -> None:
+        # Подхватывает задачи, которые никто не выполняет (после перезапуска)
+        while True:
+            try:
+                job_ids = await self.redis.smembers(ACTIVE_JOBS_KEY)
+                for job_id in map(_decode, job_ids):
+                    if job_id in self._running:
+                        continue
+                    if await self._get_status(job_id) == RUNNING:
+                        if await self._claim(job_id):
+                            logger.info(
+                                f"[Рассылка] Задача {job_id} подхвачена процессом {self.instance_id}"
+                            )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[Рассылка] Ошибка проверки незавершенных задач: {e}")
+
+            await asyncio.sleep(self.poll_interval)
+
+
+broadcast_jobs = BroadcastJobManager()
@@ -1,81 +1,475 @@
+"""
+Отправка сообщений с соблюдением лимитов Telegram
+
+Уведомления и рассылки проходят через общий token bucket (BROADCAST_RATE
+сообщений в секунду) с приоритетами внутри процесса: уведомления, затем
+рассылки. Ответы хендлеров через корзину не проходят, для них остается запас
+до лимита Telegram. С Redis токены берутся из одной корзины на все процессы
+(воркеры вебхука), поэтому лимит Telegram соблюдается для бота в целом.
+Дополнительно ограничивается частота сообщений в один чат.
+Рассылку выполняет пул из BROADCAST_CONCURRENCY параллельных отправителей,
+поэтому задержка запросов к Telegram не складывается с паузами между
+сообщениями. При flood control отправка приостанавливается для всех на
+retry_after, сетевые ошибки повторяются с экспоненциальной паузой и jitter.
+
+Чаты, в которые доставка невозможна (бот заблокирован, пользователь удален),
+запоминаются и пропускаются следующими рассылками в течение
+BROADCAST_UNDELIVERABLE_TTL.
+"""
+
 import asyncio
+import heapq
+import itertools
 import logging
-from typing import Union
+import random
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Iterable, Optional
+
+from aiogram import exceptions
+from redis.asyncio import Redis
+
+from tgbot.config import BroadcastConfig
+
+logger = logging.getLogger(__name__)
+
+# Минимальный интервал между сообщениями в один чат (сек)
+PRIVATE_CHAT_INTERVAL = 1.0
+GROUP_CHAT_INTERVAL = 3.0
+
+# Ошибки BadRequest, после которых доставка в чат невозможна
+PERMANENT_BAD_REQUESTS = (
+    "chat not found",
+    "user not found",
+    "user is deactivated",
+    "peer_id_invalid",
+    "bot can't initiate conversation",
+)
+
+UNDELIVERABLE_KEY = "broadcast:undeliverable:{chat_id}"
+SHARED_BUCKET_KEY = "broadcast:bucket"
 
-from aiogram import Bot, exceptions
-from aiogram.types import InlineKeyboardMarkup
+# Берет токен из общей корзины. ARGV: скорость в токенах/сек, емкость.
+# Возвращает "0", если токен получен, иначе время ожидания в секундах
+SHARED_TAKE_SCRIPT = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated', 'paused_until')
+local paused_until = tonumber(state[3]) or 0
+if now < paused_until then
+    return tostring(paused_until - now)
+end
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + (now - updated) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], 3600)
+return tostring(wait)
+"""
 
+# Общая пауза на время flood control. ARGV: длительность паузы
+SHARED_PAUSE_SCRIPT = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local paused_until = now + tonumber(ARGV[1])
+local current = tonumber(redis.call('HGET', KEYS[1], 'paused_until')) or 0
+if paused_until > current then
+    redis.call('HSET', KEYS[1], 'paused_until', paused_until, 'tokens', 0, 'updated', paused_until)
+    redis.call('EXPIRE', KEYS[1], 3600)
+end
+return 1
+"""
 
-async def send_message(
-    bot: Bot,
-    user_id: Union[int, str],
-    text: str,
-    disable_notification: bool = False,
-    reply_markup: InlineKeyboardMarkup = None,
-) -> bool:
+# Статусы доставки получателю
+SENT = "sent"
+FAILED = "failed"
+UNDELIVERABLE = "undeliverable"
+SKIPPED = "skipped"
+
+# Приоритеты исходящих сообщений
+TRANSACTIONAL = 1  # уведомления о событиях (достижения, покупки, график)
+BULK = 2  # рассылки
+
+SendFunc = Callable[[int], Awaitable]
+
+
+class TokenBucket:
     """
-    Safe messages sender
-
-    :param bot: Bot instance.
-    :param user_id: user id. If str - must contain only digits.
-    :param text: text of the message.
-    :param disable_notification: disable notification or not.
-    :param reply_markup: reply markup.
-    :return: success.
+    Token bucket с приоритетами ожидающих и общей паузой на время flood control
+
+    Токены выдаются ожидающим в порядке приоритета (меньше - раньше), внутри
+    одного приоритета - в порядке очереди. Очередь ожидающих своя у каждого
+    экземпляра, поэтому приоритет соблюдается только внутри процесса.
+
+    :param rate: Количество токенов в секунду
+    :param capacity: Максимальное количество накопленных токенов
     """
-    try:
-        await bot.send_message(
-            user_id,
-            text,
-            disable_notification=disable_notification,
-            reply_markup=reply_markup,
-        )
-    except exceptions.TelegramBadRequest:
-        logging.error("Telegram server says - Bad Request: chat not found")
-    except exceptions.TelegramForbiddenError:
-        logging.error(f"Target [ID:{user_id}]: got TelegramForbiddenError")
-    except exceptions.TelegramRetryAfter as e:
-        logging.error(
-            f"Target [ID:{user_id}]: Flood limit is exceeded. Sleep {e.retry_after} seconds."
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._counter = itertools.count()
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    async def pause(self, seconds: float) -> None:
+        """
+        Приостанавливает выдачу токенов
+
+        :param seconds: Длительность паузы
+        """
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+    async def _take(self) -> float:
+        """
+        Забирает токен
+
+        :return: 0, если токен получен, иначе время до следующей попытки
+        """
+        now = time.monotonic()
+        if now < self._paused_until:
+            return self._paused_until - now
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated_at) * self.rate
         )
-        await asyncio.sleep(e.retry_after)
-        return await send_message(
-            bot, user_id, text, disable_notification, reply_markup
-        )  # Recursive call
-    except exceptions.TelegramAPIError:
-        logging.exception(f"Target [ID:{user_id}]: failed")
-    else:
-        logging.info(f"Target [ID:{user_id}]: success")
-        return True
-    return False
-
-
-async def broadcast(
-    bot: Bot,
-    users: list[Union[str, int]],
-    text: str,
-    disable_notification: bool = False,
-    reply_markup: InlineKeyboardMarkup = None,
-) -> int:
+        self._updated_at = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    async def acquire(self, priority: int = BULK) -> None:
+        """
+        Ожидает и забирает один токен
+
+        :param priority: Приоритет (TRANSACTIONAL или BULK)
+        """
+        if not self._waiters and not await self._take():
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), future))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        await future
+
+    async def _dispatch(self) -> None:
+        while self._waiters:
+            if self._waiters[0][2].done():
+                # Ожидание отменено
+                heapq.heappop(self._waiters)
+                continue
+
+            wait = await self._take()
+            if wait:
+                await asyncio.sleep(wait)
+                continue
+
+            # Пока токен запрашивался, ожидание могло быть отменено
+            while self._waiters:
+                _, _, future = heapq.heappop(self._waiters)
+                if not future.done():
+                    future.set_result(None)
+                    break
+
+
+class SharedTokenBucket(TokenBucket):
+    """
+    Token bucket, общий для всех процессов бота, с состоянием в Redis
+
+    Общими являются только скорость и пауза flood control. Приоритет
+    соблюдается только внутри одного процесса: процессы берут токены из
+    Redis независимо, и рассылка в одном воркере может получить токен
+    раньше уведомления, ожидающего в другом. При ошибках Redis токены
+    выдаются локальной корзиной процесса с той же скоростью.
+    """
+
+    def __init__(self, rate: float, capacity: int, redis: Redis):
+        super().__init__(rate, capacity)
+        self._shared_take = redis.register_script(SHARED_TAKE_SCRIPT)
+        self._shared_pause = redis.register_script(SHARED_PAUSE_SCRIPT)
+
+    async def pause(self, seconds: float) -> None:
+        await super().pause(seconds)
+        try:
+            await self._shared_pause(keys=[SHARED_BUCKET_KEY], args=[seconds])
+        except Exception as e:
+            logger.warning(f"[Рассылка] Не удалось приостановить общий лимит: {e}")
+
+    async def _take(self) -> float:
+        try:
+            wait = await self._shared_take(
+                keys=[SHARED_BUCKET_KEY], args=[self.rate, self.capacity]
+            )
+        except Exception as e:
+            logger.warning(f"[Рассылка] Общий лимит недоступен: {e}")
+            return await super()._take()
+        return float(wait)
+
+
+@dataclass
+class BroadcastResult:
+    """
+    Счетчики рассылки, обновляются по ходу отправки
+    """
+
+    total: int
+    sent: int = 0
+    failed: int = 0
+    undeliverable: int = 0
+    skipped: int = 0
+
+    @property
+    def processed(self) -> int:
+        return self.sent + self.failed + self.undeliverable + self.skipped
+
+
+class BroadcastEngine:
     """
-    Simple broadcaster.
-    :param bot: Bot instance.
-    :param users: List of users.
-    :param text: Text of the message.
-    :param disable_notification: Disable notification or not.
-    :param reply_markup: Reply markup.
-    :return: Count of messages.
+    Отправка сообщений через общий лимит скорости
     """
-    count = 0
-    try:
-        for user_id in users:
-            if await send_message(
-                bot, user_id, text, disable_notification, reply_markup
-            ):
-                count += 1
-            await asyncio.sleep(
-                0.05
-            )  # 20 messages per second (Limit: 30 messages per second)
-    finally:
-        logging.info(f"{count} messages successful sent.")
-        return count
+
+    def __init__(self, config: Optional[BroadcastConfig] = None):
+        self.configure(
+            config
+            or BroadcastConfig(
+                rate=28,
+                burst=5,
+                concurrency=16,
+                max_retries=5,
+                undeliverable_ttl=7 * 24 * 3600,
+            )
+        )
+
+    def configure(self, config: BroadcastConfig, redis: Optional[Redis] = None) -> None:
+        """
+        Применяет настройки рассылок
+
+        :param config: Настройки рассылок
+        :param redis: Клиент Redis для общего лимита скорости и списка
+            недоступных чатов (None - в памяти процесса)
+        """
+        self.config = config
+        self.redis = redis
+        self.bucket = (
+            SharedTokenBucket(config.rate, config.burst, redis)
+            if redis is not None
+            else TokenBucket(config.rate, config.burst)
+        )
+        self._chat_ready_at: dict[int, float] = {}
+        self._undeliverable: dict[int, float] = {}
+
+    async def _filter_undeliverable(self, chat_ids: list[int]) -> list[bool]:
+        if self.redis is not None and chat_ids:
+            try:
+                values = await self.redis.mget(
+                    [UNDELIVERABLE_KEY.format(chat_id=chat_id) for chat_id in chat_ids]
+                )
+            except Exception as e:
+                logger.warning(f"[Рассылка] Не удалось проверить недоступные чаты: {e}")
+            else:
+                expires_at = time.monotonic() + self.config.undeliverable_ttl
+                for chat_id, value in zip(chat_ids, values):
+                    if value is not None:
+                        self._undeliverable[chat_id] = expires_at
+                return [value is not None for value in values]
+
+        now = time.monotonic()
+        return [self._undeliverable.get(chat_id, 0) > now for chat_id in chat_ids]
+
+    async def _set_undeliverable(self, chat_id: int, value: bool) -> None:
+        # Локальная копия нужна, чтобы снимать отметку только с отмеченных чатов
+        if value:
+            self._undeliverable[chat_id] = (
+                time.monotonic() + self.config.undeliverable_ttl
+            )
+        else:
+            self._undeliverable.pop(chat_id, None)
+
+        if self.redis is None:
+            return
+        key = UNDELIVERABLE_KEY.format(chat_id=chat_id)
+        try:
+            if value:
+                await self.redis.set(key, 1, ex=self.config.undeliverable_ttl)
+            else:
+                await self.redis.delete(key)
+        except Exception as e:
+            logger.warning(f"[Рассылка] Не удалось обновить статус чата {chat_id}: {e}")
+
+    async def _wait_chat(self, chat_id: int) -> None:
+        interval = GROUP_CHAT_INTERVAL if chat_id < 0 else PRIVATE_CHAT_INTERVAL
+        now = time.monotonic()
+        ready_at = self._chat_ready_at.get(chat_id, 0.0)
+        self._chat_ready_at[chat_id] = max(now, ready_at) + interval
+        if ready_at > now:
+            await asyncio.sleep(ready_at - now)
+
+    def _backoff(self, attempt: int) -> float:
+        return min(30.0, 0.5 * 2**attempt) * random.uniform(0.5, 1.5)
+
+    async def deliver(
+        self, chat_id: int, send: SendFunc, priority: int = TRANSACTIONAL
+    ) -> Optional[bool]:
+        """
+        Отправляет одно сообщение с учетом лимитов и повторами
+
+        :param chat_id: ID чата
+        :param send: Корутина-функция, выполняющая отправку в переданный чат
+        :param priority: Приоритет сообщения в общем лимите
+        :return: True - доставлено, False - ошибка, None - чат недоступен
+        """
+        for attempt in range(self.config.max_retries + 1):
+            await self._wait_chat(chat_id)
+            await self.bucket.acquire(priority)
+            try:
+                await send(chat_id)
+            except exceptions.TelegramRetryAfter as e:
+                # Flood control действует на всего бота, поэтому пауза общая
+                logger.warning(
+                    f"[Рассылка] Flood control, пауза {e.retry_after}с (чат {chat_id})"
+                )
+                await self.bucket.pause(e.retry_after + random.uniform(0, 1))
+            except exceptions.TelegramForbiddenError as e:
+                logger.info(f"[Рассылка] Чат {chat_id} недоступен: {e.message}")
+                await self._set_undeliverable(chat_id, True)
+                return None
+            except exceptions.TelegramBadRequest as e:
+                if any(error in e.message.lower() for error in PERMANENT_BAD_REQUESTS):
+                    logger.info(f"[Рассылка] Чат {chat_id} недоступен: {e.message}")
+                    await self._set_undeliverable(chat_id, True)
+                    return None
+                logger.error(f"[Рассылка] Ошибка отправки в чат {chat_id}: {e}")
+                return False
+            except (
+                exceptions.TelegramNetworkError,
+                exceptions.TelegramServerError,
+            ) as e:
+                logger.warning(
+                    f"[Рассылка] Ошибка отправки в чат {chat_id}, попытка {attempt + 1}: {e}"
+                )
+                if attempt < self.config.max_retries:
+                    await asyncio.sleep(self._backoff(attempt))
+            except exceptions.TelegramAPIError as e:
+                logger.error(f"[Рассылка] Ошибка отправки в чат {chat_id}: {e}")
+                return False
+            else:
+                if chat_id in self._undeliverable:
+                    # Чат снова доступен, например после разблокировки бота
+                    await self._set_undeliverable(chat_id, False)
+                return True
+
+        logger.error(f"[Рассылка] Чат {chat_id}: превышено число повторов")
+        return False
+
+    async def run(
+        self,
+        chat_ids: Iterable[int],
+        send: SendFunc,
+        on_progress: Optional[Callable[[BroadcastResult], Awaitable]] = None,
+        progress_interval: float = 3.0,
+        on_result: Optional[Callable[[int, str], Awaitable]] = None,
+        stop: Optional[asyncio.Event] = None,
+        result: Optional[BroadcastResult] = None,
+        priority: int = BULK,
+    ) -> BroadcastResult:
+        """
+        Выполняет рассылку пулом параллельных отправителей
+
+        :param chat_ids: ID чатов получателей
+        :param send: Корутина-функция, выполняющая отправку в переданный чат
+        :param on_progress: Вызывается с текущими счетчиками раз в progress_interval
+        :param progress_interval: Интервал вызова on_progress (сек)
+        :param on_result: Вызывается с ID чата и статусом доставки (SENT, FAILED,
+            UNDELIVERABLE, SKIPPED) для каждого обработанного получателя
+        :param stop: Событие остановки: новые отправки не начинаются, уже
+            начатые завершаются
+        :param result: Счетчики для продолжения ранее начатой рассылки
+        :param priority: Приоритет сообщений в общем лимите
+        :return: Итоговые счетчики рассылки
+        """
+        chat_ids = list(dict.fromkeys(chat_id for chat_id in chat_ids if chat_id))
+        if result is None:
+            result = BroadcastResult(total=len(chat_ids))
+
+        skip = await self._filter_undeliverable(chat_ids)
+        pending = []
+        for chat_id, skipped in zip(chat_ids, skip):
+            if not skipped:
+                pending.append(chat_id)
+                continue
+            result.skipped += 1
+            if on_result:
+                await on_result(chat_id, SKIPPED)
+        pending = iter(pending)
+
+        async def sender():
+            for chat_id in pending:
+                if stop is not None and stop.is_set():
+                    return
+                try:
+                    delivered = await self.deliver(chat_id, send, priority)
+                except Exception as e:
+                    logger.error(f"[Рассылка] Ошибка отправки в чат {chat_id}: {e}")
+                    delivered = False
+
+                if delivered:
+                    result.sent += 1
+                    status = SENT
+                elif delivered is None:
+                    result.undeliverable += 1
+                    status = UNDELIVERABLE
+                else:
+                    result.failed += 1
+                    status = FAILED
+                if on_result:
+                    await on_result(chat_id, status)
+
+        async def reporter():
+            while True:
+                await asyncio.sleep(progress_interval)
+                try:
+                    await on_progress(result)
+                except Exception as e:
+                    logger.debug("[Рассылка] Ошибка обновления прогресса: %s", e)
+
+        started_at = time.monotonic()
+        progress_task = asyncio.create_task(reporter()) if on_progress else None
+        try:
+            await asyncio.gather(
+                *(sender() for _ in range(min(self.config.concurrency, len(chat_ids))))
+            )
+        finally:
+            if progress_task:
+                progress_task.cancel()
+            # Ограничения частоты по чатам нужны только в пределах интервала
+            now = time.monotonic()
+            self._chat_ready_at = {
+                chat_id: ready_at
+                for chat_id, ready_at in self._chat_ready_at.items()
+                if ready_at > now
+            }
+
+        elapsed = time.monotonic() - started_at
+        state = "Остановлена" if stop is not None and stop.is_set() else "Завершена"
+        logger.info(
+            f"[Рассылка] {state} за {elapsed:.1f}с: отправлено {result.sent}, "
+            f"ошибок {result.failed}, недоступно {result.undeliverable}, "
+            f"пропущено {result.skipped} из {result.total}"
+        )
+        return result
+
+
+broadcast_engine = BroadcastEngine()
@@ -0,0 +1,328 @@
+"""
+Двухфазная игра в казино
+
+Обработчик команды резервирует ставку в балансе, отправляет кубик и
+завершается, освобождая соединения с БД на время анимации. Результат
+известен сразу после отправки кубика, а запись транзакции и сообщение
+с итогом выполняются отложенной задачей со своей короткой сессией.
+
+Незавершенные раунды сохраняются в Redis и доигрываются после перезапуска.
+Ставка остается зарезервированной, пока транзакция раунда не записана:
+при ошибке записи раунд повторяется позже, а не отбрасывается. Комментарий
+транзакции содержит метку раунда, поэтому повтор после ошибки, при которой
+транзакция все же была записана, не записывает ее второй раз.
+"""
+
+import asyncio
+import json
+import logging
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from typing import Awaitable, Callable, Optional
+
+from aiogram import Bot
+from redis.asyncio import Redis
+from sqlalchemy import select
+from stp_database.models.STP.transactions import Transaction
+from stp_database.repo.STP.requests import MainRequestsRepo
+
+from tgbot.services.balances import balance_ledger
+
+logger = logging.getLogger(__name__)
+
+# Режимы игры
+PRIVATE = "private"
+GROUP = "group"
+
+ROUNDS_KEY = "casino:rounds"
+
+# Длительность анимации кубика по типу игры, секунды
+ANIMATION_DELAYS = {"dice": 3.0}
+DEFAULT_ANIMATION_DELAY = 2.0
+
+# Задержка перед доигрыванием восстановленного раунда, чтобы его успел
+# завершить процесс, который его начал
+RESTORE_GRACE = 5.0
+
+# Повтор записи результата после ошибки: задержка удваивается до максимума
+SETTLE_RETRY_DELAY = 10.0
+MAX_SETTLE_RETRY_DELAY = 10 * 60.0
+
+
+@dataclass
+class CasinoRound:
+    """
+    Раунд игры с зарезервированной ставкой
+
+    :param user_id: Telegram ID игрока
+    :param chat_id: Чат, в котором идет игра
+    :param mode: PRIVATE или GROUP
+    :param game_type: slots, dice, darts или bowling
+    :param game_name: Название игры для сообщений и комментария транзакции
+    :param bet: Ставка
+    :param result_text: Описание выпавшей комбинации
+    :param multiplier: Множитель выигрыша, 0 - проигрыш
+    :param balance_before: Доступный баланс до ставки
+    :param player_name: ФИО игрока
+    :param reply_to_message_id: Сообщение, на которое отвечает итог
+    :param loading_message_id: Сообщение загрузки, удаляемое после итога
+    :param due: Время завершения раунда (unix time)
+    :param attempts: Количество неудачных попыток записать результат
+    :param round_id: ID раунда, он же ID резерва ставки в BalanceLedger
+    """
+
+    user_id: int
+    chat_id: int
+    mode: str
+    game_type: str
+    game_name: str
+    bet: int
+    result_text: str
+    multiplier: float
+    balance_before: int
+    player_name: str = ""
+    reply_to_message_id: Optional[int] = None
+    loading_message_id: Optional[int] = None
+    due: float = 0.0
+    attempts: int = 0
+    round_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+
+    @property
+    def winnings(self) -> int:
+        return int(self.bet * self.multiplier)
+
+    @property
+    def marker(self) -> str:
+        """Метка раунда в комментарии транзакции"""
+        return f"#{self.round_id[:12]}"
+
+    def dump(self) -> str:
+        return json.dumps(asdict(self), ensure_ascii=False)
+
+    @staticmethod
+    def load(data) -> "CasinoRound":
+        return CasinoRound(**json.loads(data))
+
+
+Renderer = Callable[[Bot, CasinoRound, int], Awaitable]
+
+
+class CasinoTable:
+    """
+    Отложенное завершение раундов казино
+    """
+
+    def __init__(self):
+        self.bot: Optional[Bot] = None
+        self.session_pool = None
+        self.redis: Optional[Redis] = None
+        self._renderers: dict[str, Renderer] = {}
+        self._timers: dict[str, asyncio.TimerHandle] = {}
+        self._rounds: dict[str, CasinoRound] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self._stopping = False
+
+    def renderer(self, mode: str):
+        """
+        Регистрация функции, отправляющей итог раунда
+
+        Функция получает бота, раунд и баланс после транзакции.
+
+        :param mode: PRIVATE или GROUP
+        """
+
+        def decorator(func: Renderer) -> Renderer:
+            self._renderers[mode] = func
+            return func
+
+        return decorator
+
+    async def start(self, bot: Bot, session_pool, redis: Optional[Redis] = None):
+        """
+        Запуск и доигрывание раундов, прерванных перезапуском
+
+        :param bot: Экземпляр бота
+        :param session_pool: Пул сессий основной БД
+        :param redis: Клиент Redis для хранения незавершенных раундов
+        """
+        self.bot = bot
+        self.session_pool = session_pool
+        self.redis = redis
+        self._stopping = False
+        if redis is None:
+            return
+
+        try:
+            stored = await redis.hgetall(ROUNDS_KEY)
+        except Exception as e:
+            logger.error(f"[Казино] Ошибка чтения незавершенных раундов: {e}")
+            return
+
+        for data in stored.values():
+            casino_round = CasinoRound.load(data)
+            # Резерв мог истечь, пока бот был остановлен
+            await balance_ledger.hold(
+                casino_round.user_id, casino_round.round_id, casino_round.bet
+            )
+            self._schedule(casino_round, casino_round.due + RESTORE_GRACE)
+        if stored:
+            logger.info(f"[Казино] Восстановлено незавершенных раундов: {len(stored)}")
+
+    async def stop(self) -> None:
+        """Завершение всех ожидающих раундов без ожидания анимации"""
+        self._stopping = True
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        pending = list(self._rounds.values())
+        await asyncio.gather(
+            *self._tasks,
+            *(self._settle(casino_round) for casino_round in pending),
+            return_exceptions=True,
+        )
+
+    async def play(self, casino_round: CasinoRound) -> None:
+        """
+        Планирует завершение раунда после анимации кубика
+
+        :param casino_round: Раунд с зарезервированной ставкой
+        """
+        delay = ANIMATION_DELAYS.get(casino_round.game_type, DEFAULT_ANIMATION_DELAY)
+        casino_round.due = time.time() + delay
+
+        await self._store(casino_round)
+        self._schedule(casino_round, casino_round.due)
+
+    async def _store(self, casino_round: CasinoRound) -> None:
+        """Сохранение раунда в Redis для доигрывания после перезапуска"""
+        if self.redis is None:
+            return
+        try:
+            await self.redis.hset(
+                ROUNDS_KEY, casino_round.round_id, casino_round.dump()
+            )
+        except Exception as e:
+            logger.error(f"[Казино] Ошибка сохранения раунда: {e}")
+
+    def _schedule(self, casino_round: CasinoRound, due: float) -> None:
+        loop = asyncio.get_running_loop()
+        self._rounds[casino_round.round_id] = casino_round
+        self._timers[casino_round.round_id] = loop.call_later(
+            max(0.0, due - time.time()), self._start_settle, casino_round
+        )
+
+    def _start_settle(self, casino_round: CasinoRound) -> None:
+        self._timers.pop(casino_round.round_id, None)
+        task = asyncio.create_task(self._settle(casino_round))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _claim(self, casino_round: CasinoRound) -> bool:
+        """Раунд завершает только один процесс - тот, что удалил его из Redis"""
+        if self._rounds.pop(casino_round.round_id, None) is None:
+            return False
+        if self.redis is None:
+            return True
+        try:
+            return bool(await self.redis.hdel(ROUNDS_KEY, casino_round.round_id))
+        except Exception as e:
+            # Раунд мог забрать другой процесс, поэтому он откладывается
+            logger.error(f"[Казино] Ошибка удаления раунда из Redis: {e}")
+            if not self._stopping:
+                self._schedule(casino_round, time.time() + SETTLE_RETRY_DELAY)
+            return False
+
+    @staticmethod
+    async def _is_written(
+        stp_repo: MainRequestsRepo, casino_round: CasinoRound
+    ) -> bool:
+        """Записана ли уже транзакция раунда"""
+        result = await stp_repo.session.execute(
+            select(Transaction.id)
+            .where(
+                Transaction.user_id == casino_round.user_id,
+                Transaction.source_type == "casino",
+                Transaction.comment.endswith(casino_round.marker),
+            )
+            .limit(1)
+        )
+        return result.scalar_one_or_none() is not None
+
+    async def _settle(self, casino_round: CasinoRound) -> None:
+        """Запись результата раунда и отправка итога"""
+        if not await self._claim(casino_round):
+            return
+
+        net_result = casino_round.winnings - casino_round.bet
+        suffix = " (группа)" if casino_round.mode == GROUP else ""
+        if casino_round.multiplier <= 0:
+            comment = f"Проигрыш в {casino_round.game_name}{suffix}: {casino_round.result_text}"
+        elif net_result >= 0:
+            comment = f"Выигрыш в {casino_round.game_name}{suffix}: {casino_round.result_text} (x{casino_round.multiplier})"
+        else:
+            comment = f"Утешительный приз в {casino_round.game_name}{suffix}: {casino_round.result_text} (x{casino_round.multiplier})"
+
+        try:
+            async with self.session_pool() as session:
+                stp_repo = MainRequestsRepo(session)
+                # Ошибка прошлой попытки могла произойти уже после записи
+                if casino_round.attempts and await self._is_written(
+                    stp_repo, casino_round
+                ):
+                    logger.info(
+                        f"[Казино] Результат раунда {casino_round.round_id} уже записан"
+                    )
+                    new_balance = (
+                        await balance_ledger.get(stp_repo, casino_round.user_id)
+                    ).balance
+                else:
+                    transaction, new_balance = await balance_ledger.add_transaction(
+                        stp_repo,
+                        user_id=casino_round.user_id,
+                        transaction_type="earn" if net_result > 0 else "spend",
+                        source_type="casino",
+                        amount=abs(net_result),
+                        comment=f"{comment} {casino_round.marker}",
+                    )
+        except Exception as e:
+            logger.error(
+                f"[Казино] Ошибка записи результата раунда {casino_round.round_id} "
+                f"пользователя {casino_round.user_id}: {e}"
+            )
+            await self._retry(casino_round)
+            return
+
+        await balance_ledger.release(casino_round.user_id, casino_round.round_id)
+
+        renderer = self._renderers.get(casino_round.mode)
+        if renderer is None:
+            return
+        try:
+            await renderer(self.bot, casino_round, new_balance)
+        except Exception as e:
+            logger.error(
+                f"[Казино] Ошибка отправки результата пользователю {casino_round.user_id}: {e}"
+            )
+
+    async def _retry(self, casino_round: CasinoRound) -> None:
+        """
+        Возвращает раунд с неудачной записью результата в очередь.
+        Ставка остается зарезервированной до успешной записи
+        """
+        casino_round.attempts += 1
+        delay = min(
+            SETTLE_RETRY_DELAY * 2 ** (casino_round.attempts - 1),
+            MAX_SETTLE_RETRY_DELAY,
+        )
+        casino_round.due = time.time() + delay
+        await self._store(casino_round)
+        await balance_ledger.hold(
+            casino_round.user_id, casino_round.round_id, casino_round.bet
+        )
+        # При остановке раунд доиграет следующий запуск из Redis
+        if not self._stopping:
+            self._schedule(casino_round, casino_round.due)
+
+
+casino_table = CasinoTable()
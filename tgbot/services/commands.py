@@ -0,0 +1,142 @@
+"""
+Списки команд бота
+
+Команды отправляются в Telegram параллельно и только при изменении:
+хеш последнего установленного набора хранится в Redis (или в локальном
+файле, если Redis не используется).
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+from pathlib import Path
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.types import (
+    BotCommand,
+    BotCommandScope,
+    BotCommandScopeAllChatAdministrators,
+    BotCommandScopeAllGroupChats,
+    BotCommandScopeAllPrivateChats,
+)
+from redis.asyncio import Redis
+
+logger = logging.getLogger(__name__)
+
+COMMANDS_HASH_FILE = Path(".commands_hash")
+
+BOT_COMMANDS: list[tuple[BotCommandScope, list[BotCommand]]] = [
+    # Команды для приватных чатов
+    (
+        BotCommandScopeAllPrivateChats(),
+        [BotCommand(command="start", description="Главное меню")],
+    ),
+    # Команды для групп
+    (
+        BotCommandScopeAllGroupChats(),
+        [
+            BotCommand(command="balance", description="Баланс баллов"),
+            BotCommand(command="top", description="Топ группы по баллам"),
+            BotCommand(command="slots", description="Сыграть в слоты"),
+            BotCommand(command="dice", description="Сыграть в кубик"),
+            BotCommand(command="darts", description="Сыграть в дартс"),
+            BotCommand(command="bowling", description="Сыграть в боулинг"),
+            BotCommand(
+                command="whois", description="Проверить информацию о сотруднике"
+            ),
+            BotCommand(
+                command="admins", description="Проверить список администраторов"
+            ),
+        ],
+    ),
+    # Команды для администраторов групп
+    (
+        BotCommandScopeAllChatAdministrators(),
+        [
+            BotCommand(
+                command="whois", description="Проверить информацию о сотруднике"
+            ),
+            BotCommand(
+                command="pin", description="Закрепить сообщение (ответом на него)"
+            ),
+            BotCommand(
+                command="unpin", description="Открепить сообщение (ответом на него)"
+            ),
+            BotCommand(command="mute", description="Замутить пользователя"),
+            BotCommand(command="unmute", description="Размутить пользователя"),
+            BotCommand(command="ban", description="Забанить пользователя"),
+            BotCommand(command="unban", description="Разбанить пользователя"),
+            BotCommand(command="settings", description="Настройки группы"),
+            BotCommand(command="slots", description="Сыграть в слоты"),
+            BotCommand(command="dice", description="Сыграть в кубик"),
+            BotCommand(command="darts", description="Сыграть в дартс"),
+            BotCommand(command="bowling", description="Сыграть в боулинг"),
+        ],
+    ),
+]
+
+
+def get_commands_hash() -> str:
+    """
+    Хеш набора команд со всеми областями видимости
+    """
+    payload = [
+        {
+            "scope": scope.model_dump(),
+            "commands": [command.model_dump() for command in commands],
+        }
+        for scope, commands in BOT_COMMANDS
+    ]
+    return hashlib.sha256(
+        json.dumps(payload, ensure_ascii=False, sort_keys=True).encode()
+    ).hexdigest()
+
+
+async def _get_stored_hash(bot: Bot, redis: Optional[Redis]) -> Optional[str]:
+    if redis is not None:
+        value = await redis.get(f"commands_hash:{bot.id}")
+        return value.decode() if isinstance(value, bytes) else value
+    if COMMANDS_HASH_FILE.exists():
+        return COMMANDS_HASH_FILE.read_text().strip()
+    return None
+
+
+async def _store_hash(bot: Bot, redis: Optional[Redis], commands_hash: str) -> None:
+    if redis is not None:
+        await redis.set(f"commands_hash:{bot.id}", commands_hash)
+    else:
+        COMMANDS_HASH_FILE.write_text(commands_hash)
+
+
+async def sync_commands(bot: Bot, redis: Optional[Redis] = None) -> bool:
+    """
+    Устанавливает списки команд, если они изменились с последнего запуска
+
+    :param bot: Экземпляр бота
+    :param redis: Клиент Redis для хранения хеша (None - локальный файл)
+    :return: True, если команды были отправлены в Telegram
+    """
+    commands_hash = get_commands_hash()
+    try:
+        if await _get_stored_hash(bot, redis) == commands_hash:
+            logger.info("[Команды] Списки команд не изменились, установка пропущена")
+            return False
+    except Exception as e:
+        logger.warning(f"[Команды] Не удалось прочитать хеш команд: {e}")
+
+    await asyncio.gather(
+        *(
+            bot.set_my_commands(commands=commands, scope=scope)
+            for scope, commands in BOT_COMMANDS
+        )
+    )
+
+    try:
+        await _store_hash(bot, redis, commands_hash)
+    except Exception as e:
+        logger.warning(f"[Команды] Не удалось сохранить хеш команд: {e}")
+
+    logger.info(f"[Команды] Установлено наборов команд: {len(BOT_COMMANDS)}")
+    return True
@@ -0,0 +1,300 @@
+"""
+Классы стоимости хендлеров и ограничение параллельности
+
+Хендлеры помечаются флагом ``cost`` (light/db/heavy). Для каждого класса
+действует собственный лимит одновременно выполняемых хендлеров, поэтому
+тяжелые операции (разбор Excel файлов расписания, расчет зарплаты)
+не могут занять слоты легких и DB хендлеров. Очередь ожидания
+обслуживает пользователей по кругу, чтобы один пользователь не мог
+занять все слоты частыми нажатиями.
+
+Слот занимается до открытия сессий БД, поэтому апдейты в очереди не
+держат соединения пула. Класс хендлера определяется заранее по фильтрам,
+которые проверяются по самому апдейту (см. HandlerCosts).
+"""
+
+import asyncio
+import functools
+import logging
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Hashable, Optional
+
+from aiogram import Bot, Router
+from aiogram.client.session.middlewares.base import (
+    BaseRequestMiddleware,
+    NextRequestMiddlewareType,
+)
+from aiogram.dispatcher.event.handler import FilterObject
+from aiogram.filters.callback_data import CallbackQueryFilter
+from aiogram.methods import AnswerCallbackQuery, Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import CallbackQuery, TelegramObject
+
+logger = logging.getLogger(__name__)
+
+COST_LIGHT = "light"
+COST_DB = "db"
+COST_HEAVY = "heavy"
+
+# Флаги для регистрации хендлеров: @router.callback_query(..., flags=HEAVY)
+LIGHT = {"cost": COST_LIGHT}
+DB = {"cost": COST_DB}
+HEAVY = {"cost": COST_HEAVY}
+
+
+class FairSemaphore:
+    """
+    Семафор с очередью ожидания, обслуживающей владельцев по кругу
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._active = 0
+        self._queues: OrderedDict[Hashable, deque[asyncio.Future]] = OrderedDict()
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    async def acquire(self, owner: Hashable) -> None:
+        """
+        Занимает слот. Если слотов нет, ожидает своей очереди
+
+        :param owner: Владелец запроса (например, ID пользователя)
+        """
+        if self._active < self.limit and not self._queues:
+            self._active += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(owner, deque()).append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Слот уже выдан, но задача отменена - возвращаем его
+                self.release()
+            else:
+                self._remove_waiter(owner, future)
+            raise
+
+    def release(self) -> None:
+        """
+        Освобождает слот и передает его следующему владельцу в очереди
+        """
+        self._active -= 1
+        self._wake_next()
+
+    def _wake_next(self) -> None:
+        while self._active < self.limit and self._queues:
+            owner, queue = next(iter(self._queues.items()))
+            future = queue.popleft()
+            if queue:
+                self._queues.move_to_end(owner)
+            else:
+                del self._queues[owner]
+
+            if future.done():
+                continue
+
+            self._active += 1
+            future.set_result(None)
+
+    def _remove_waiter(self, owner: Hashable, future: asyncio.Future) -> None:
+        queue = self._queues.get(owner)
+        if not queue:
+            return
+        try:
+            queue.remove(future)
+        except ValueError:
+            pass
+        if not queue:
+            del self._queues[owner]
+
+
+class ConcurrencyLimiter:
+    """
+    Набор семафоров по классам стоимости хендлеров
+    """
+
+    def __init__(self, light: int, db: int, heavy: int, still_working_after: float):
+        self.semaphores = {
+            COST_LIGHT: FairSemaphore(light),
+            COST_DB: FairSemaphore(db),
+            COST_HEAVY: FairSemaphore(heavy),
+        }
+        self.still_working_after = still_working_after
+        # ID callback, на которые уже ответили "Обрабатываю запрос" -> ID чата
+        self.early_answered: dict[str, int] = {}
+
+    def get(self, cost: Optional[str]) -> FairSemaphore:
+        return self.semaphores.get(cost, self.semaphores[COST_DB])
+
+
+class HandlerCosts:
+    """
+    Классы стоимости хендлеров, определяемые до запуска цепочки middleware
+
+    Флаги хендлера доступны только внутренним middleware, когда сессии БД
+    уже открыты. Поэтому при запуске собираются хендлеры в порядке
+    обработки вместе с фильтрами, которые проверяются по самому апдейту
+    (callback data и магические фильтры), и апдейт сопоставляется с первым
+    подходящим хендлером. Фильтры, которым нужны данные middleware (роль
+    пользователя и т.п.), при сопоставлении считаются пройденными.
+    """
+
+    def __init__(self):
+        # Тип события -> [(префикс callback data, фильтры, класс)]
+        self._handlers: dict[str, list[tuple[Optional[str], list, str]]] = {}
+
+    def index(self, router: Router) -> None:
+        """
+        Сбор хендлеров роутера и всех вложенных роутеров
+
+        :param router: Корневой роутер (диспетчер) с подключенными роутерами
+        """
+        self._handlers.clear()
+        for child in router.chain_tail:
+            for event_type, observer in child.observers.items():
+                for handler in observer.handlers:
+                    prefix = None
+                    filters = []
+                    for filter_object in handler.filters or []:
+                        if isinstance(filter_object.callback, CallbackQueryFilter):
+                            callback_data = filter_object.callback.callback_data
+                            prefix = callback_data.__prefix__
+                            filters.append(filter_object)
+                        elif filter_object.magic is not None:
+                            filters.append(filter_object)
+                    self._handlers.setdefault(event_type, []).append(
+                        (prefix, filters, handler.flags.get("cost", COST_DB))
+                    )
+
+        # Для событий без особых классов сопоставление не нужно
+        self._handlers = {
+            event_type: handlers
+            for event_type, handlers in self._handlers.items()
+            if any(cost != COST_DB for _, _, cost in handlers)
+        }
+
+    async def resolve(self, event_type: str, event: TelegramObject) -> str:
+        """
+        Класс стоимости хендлера, который обработает апдейт
+
+        :param event_type: Тип события (message, callback_query, ...)
+        :param event: Апдейт
+        """
+        handlers = self._handlers.get(event_type)
+        if not handlers:
+            return COST_DB
+
+        prefix = None
+        if isinstance(event, CallbackQuery) and event.data:
+            prefix = event.data.split(":", 1)[0]
+
+        for handler_prefix, filters, cost in handlers:
+            if handler_prefix is not None and handler_prefix != prefix:
+                continue
+            if await self._check(filters, event):
+                return cost
+        return COST_DB
+
+    @staticmethod
+    async def _check(filters: list[FilterObject], event: TelegramObject) -> bool:
+        for filter_object in filters:
+            try:
+                if filter_object.magic is not None:
+                    passed = filter_object.magic.resolve(event)
+                else:
+                    passed = await filter_object.callback(event)
+            except Exception:
+                return False
+            if not passed:
+                return False
+        return True
+
+
+class EarlyAnswerFilter(BaseRequestMiddleware):
+    """
+    Middleware сессии бота для callback, на которые уже был отправлен ответ
+    "Обрабатываю запрос"
+
+    Повторно ответить на callback нельзя, поэтому пустой ответ хендлера
+    пропускается, а ответ с текстом (например, уведомление об ошибке)
+    отправляется в чат сообщением.
+    """
+
+    def __init__(self, limiter: ConcurrencyLimiter):
+        self.limiter = limiter
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        if not isinstance(method, AnswerCallbackQuery):
+            return await make_request(bot, method)
+
+        chat_id = self.limiter.early_answered.get(method.callback_query_id)
+        if chat_id is None:
+            return await make_request(bot, method)
+
+        if method.text:
+            await bot.send_message(chat_id, method.text)
+        return Response[bool](ok=True, result=True)
+
+
+# Пул потоков для синхронных CPU-тяжелых операций (pandas, openpyxl).
+# Размер задается configure_heavy_executor по лимиту тяжелых хендлеров
+heavy_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="heavy")
+
+
+def configure_heavy_executor(max_workers: int) -> None:
+    """
+    Пересоздает пул потоков для тяжелых операций
+
+    :param max_workers: Количество потоков (CONCURRENCY_HEAVY_LIMIT)
+    """
+    global heavy_executor
+    heavy_executor.shutdown(wait=False)
+    heavy_executor = ThreadPoolExecutor(
+        max_workers=max_workers, thread_name_prefix="heavy"
+    )
+
+
+# Задачи, ожидающие тяжелых операций, по ID выполняющего их потока.
+# По ним профилировщик приписывает стеки потоков пула апдейтам
+heavy_calls: dict[int, Optional[asyncio.Task]] = {}
+
+
+def _call_in_heavy_thread(task: Optional[asyncio.Task], func: Callable[[], Any]) -> Any:
+    thread_id = threading.get_ident()
+    heavy_calls[thread_id] = task
+    try:
+        return func()
+    finally:
+        heavy_calls.pop(thread_id, None)
+
+
+async def run_heavy(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Выполняет синхронную тяжелую функцию в отдельном пуле потоков,
+    не блокируя event loop
+
+    :param func: Синхронная функция
+    :return: Результат функции
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        heavy_executor,
+        _call_in_heavy_thread,
+        asyncio.current_task(),
+        functools.partial(func, *args, **kwargs),
+    )
@@ -0,0 +1,235 @@
+"""
+Кеш настроек групп и проверенных участников
+
+Используется классификатором апдейтов, чтобы обычные сообщения в группах
+обрабатывались без обращения к базе данных.
+
+Кеш хранится в памяти процесса. С Redis сброс группы или участника
+рассылается остальным процессам (воркерам вебхука) через pub/sub, поэтому
+изменение настроек или исключение участника видно всем процессам сразу,
+а не по истечении TTL.
+"""
+
+import asyncio
+import json
+import logging
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Optional
+
+from redis.asyncio import Redis
+
+logger = logging.getLogger(__name__)
+
+# Канал сброса записей кеша в других процессах
+INVALIDATION_CHANNEL = "groups_cache:invalidate"
+
+# Пауза перед повторной подпиской после ошибки Redis
+RESUBSCRIBE_DELAY = 5.0
+
+
+@dataclass(frozen=True)
+class GroupSettings:
+    """
+    Снимок настроек группы, достаточный для проверок в middleware.
+
+    Attributes
+    ----------
+    group_id : int
+        Идентификатор группы
+    remove_unemployed : bool
+        Удалять ли уволенных сотрудников
+    allowed_roles : list
+        Список ролей, которым разрешен доступ в группу
+    service_messages : list
+        Категории сервисных сообщений для удаления
+    new_user_notify : bool
+        Уведомлять ли о новых участниках
+    is_casino_allowed : bool
+        Разрешено ли казино в группе
+    """
+
+    group_id: int
+    remove_unemployed: bool = False
+    allowed_roles: list = field(default_factory=list)
+    service_messages: list = field(default_factory=list)
+    new_user_notify: bool = False
+    is_casino_allowed: bool = True
+
+    @staticmethod
+    def from_group(group) -> "GroupSettings":
+        """
+        Создает снимок настроек из модели группы
+        """
+        return GroupSettings(
+            group_id=group.group_id,
+            remove_unemployed=bool(getattr(group, "remove_unemployed", False)),
+            allowed_roles=list(getattr(group, "allowed_roles", None) or []),
+            service_messages=list(getattr(group, "service_messages", None) or []),
+            new_user_notify=bool(getattr(group, "new_user_notify", False)),
+            is_casino_allowed=bool(getattr(group, "is_casino_allowed", True)),
+        )
+
+
+class GroupsCache:
+    """
+    In-memory кеш групп с ограниченным временем жизни записей.
+
+    Хранит как зарегистрированные группы, так и отрицательные записи
+    (группа не зарегистрирована), а также пары группа-участник,
+    прошедшие проверку на трудоустройство.
+    """
+
+    def __init__(self, group_ttl: float = 300, member_ttl: float = 600):
+        self.group_ttl = group_ttl
+        self.member_ttl = member_ttl
+        self.redis: Optional[Redis] = None
+        self._groups: dict[int, tuple[float, Optional[GroupSettings]]] = {}
+        self._members: dict[tuple[int, int], float] = {}
+        # Свои сообщения о сбросе пропускаются
+        self._origin = uuid.uuid4().hex
+        self._listener: Optional[asyncio.Task] = None
+        self._publishing: set[asyncio.Task] = set()
+
+    def start(self, redis: Optional[Redis] = None) -> None:
+        """
+        Подписка на сброс записей другими процессами
+
+        :param redis: Клиент Redis. Без него кеш не согласуется между процессами
+        """
+        self.redis = redis
+        if redis is not None and (self._listener is None or self._listener.done()):
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        """Отправка оставшихся сообщений о сбросе и отписка"""
+        if self._publishing:
+            await asyncio.gather(*self._publishing, return_exceptions=True)
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+
+    def clear(self) -> None:
+        """Сброс всех записей"""
+        self._groups.clear()
+        self._members.clear()
+
+    def get_group(self, group_id: int) -> tuple[bool, Optional[GroupSettings]]:
+        """
+        Получение настроек группы из кеша
+
+        :param group_id: ID группы
+        :return: Кортеж (есть ли запись в кеше, настройки группы или None для незарегистрированной)
+        """
+        entry = self._groups.get(group_id)
+        if entry is None:
+            return False, None
+
+        expires_at, settings = entry
+        if expires_at < time.monotonic():
+            self._groups.pop(group_id, None)
+            return False, None
+
+        return True, settings
+
+    def set_group(self, group_id: int, group) -> Optional[GroupSettings]:
+        """
+        Сохранение группы в кеш
+
+        :param group_id: ID группы
+        :param group: Модель группы из БД или None, если группа не зарегистрирована
+        :return: Сохраненный снимок настроек
+        """
+        settings = GroupSettings.from_group(group) if group else None
+        self._groups[group_id] = (time.monotonic() + self.group_ttl, settings)
+        return settings
+
+    def invalidate_group(self, group_id: int) -> None:
+        """
+        Сброс настроек группы и проверенных участников после изменения настроек
+        или удаления группы во всех процессах
+        """
+        self._drop_group(group_id)
+        self._publish({"group_id": group_id})
+
+    def _drop_group(self, group_id: int) -> None:
+        self._groups.pop(group_id, None)
+        for key in [key for key in self._members if key[0] == group_id]:
+            self._members.pop(key, None)
+
+    def is_validated_member(self, group_id: int, user_id: int) -> bool:
+        """
+        Проверяет, прошел ли участник проверку недавно
+        """
+        expires_at = self._members.get((group_id, user_id))
+        if expires_at is None:
+            return False
+
+        if expires_at < time.monotonic():
+            self._members.pop((group_id, user_id), None)
+            return False
+
+        return True
+
+    def mark_validated(self, group_id: int, user_id: int) -> None:
+        """
+        Запоминает участника, прошедшего проверку и добавленного в группу
+        """
+        self._members[(group_id, user_id)] = time.monotonic() + self.member_ttl
+
+    def forget_member(self, group_id: int, user_id: int) -> None:
+        """
+        Удаляет участника из кеша во всех процессах (бан, выход из группы)
+        """
+        self._members.pop((group_id, user_id), None)
+        self._publish({"group_id": group_id, "user_id": user_id})
+
+    def _publish(self, invalidation: dict) -> None:
+        """Отправка сброса другим процессам в фоне, не задерживая обработчик"""
+        if self.redis is None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        task = loop.create_task(self._send({**invalidation, "origin": self._origin}))
+        self._publishing.add(task)
+        task.add_done_callback(self._publishing.discard)
+
+    async def _send(self, invalidation: dict) -> None:
+        try:
+            await self.redis.publish(INVALIDATION_CHANNEL, json.dumps(invalidation))
+        except Exception as e:
+            logger.error(f"[Группы] Ошибка отправки сброса кеша групп: {e}")
+
+    async def _listen(self) -> None:
+        """Применение сбросов из других процессов"""
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                # Сбросы, отправленные до подписки, потеряны - кеш строится заново
+                self.clear()
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self._apply(json.loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[Группы] Ошибка подписки на сброс кеша групп: {e}")
+                await asyncio.sleep(RESUBSCRIBE_DELAY)
+            finally:
+                await pubsub.aclose()
+
+    def _apply(self, invalidation: dict) -> None:
+        if invalidation.get("origin") == self._origin:
+            return
+        if "user_id" in invalidation:
+            self._members.pop((invalidation["group_id"], invalidation["user_id"]), None)
+        else:
+            self._drop_group(invalidation["group_id"])
+
+
+groups_cache = GroupsCache()
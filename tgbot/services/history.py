@@ -0,0 +1,499 @@
+"""
+Постраничная история транзакций
+
+Страницы читаются по ключу (created_at, id) от границы соседней страницы
+(keyset пагинация), поэтому каждая страница загружает только свои строки,
+а в callback data хранится только ID граничной транзакции. Количество
+транзакций пользователя кешируется отдельно и сбрасывается при каждом
+изменении баланса.
+
+Лента группы руководителя читается одним запросом с присоединением
+сотрудников и фильтрами по сотруднику, типу и периоду, а итоги по
+сотрудникам считаются в БД группировкой. Итоги (и количество транзакций
+ленты) кешируются по руководителю и фильтрам и сбрасываются при
+транзакции любого сотрудника группы, поэтому переход между страницами
+читает только строки страницы.
+"""
+
+import json
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional
+
+from redis.asyncio import Redis
+from sqlalchemy import Select, and_, case, func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from stp_database import Employee
+from stp_database.models.STP.transactions import Transaction
+
+from tgbot.services.balances import Balance, balance_ledger
+
+logger = logging.getLogger(__name__)
+
+# Направления перехода между страницами
+FIRST = "f"  # Самые новые транзакции
+NEXT = "n"  # Старше курсора (курсор - последняя транзакция текущей страницы)
+PREV = "p"  # Новее курсора (курсор - первая транзакция текущей страницы)
+LAST = "l"  # Самые старые транзакции
+AT = "a"  # Страница, начинающаяся с курсора (возврат из деталей транзакции)
+
+HISTORY_PAGE_SIZE = 8
+
+# Фильтры ленты группы по типу операции
+KIND_ALL = "a"
+KIND_EARN = "e"
+KIND_SPEND = "s"
+
+# Фильтры ленты группы по периоду
+PERIOD_ALL = "a"
+PERIOD_DAY = "d"
+PERIOD_WEEK = "w"
+PERIOD_MONTH = "m"
+
+COUNT_KEY = "history_count:{user_id}"
+COUNT_TTL = 60 * 60
+
+# Итоги ленты группы: хеш по руководителю, поле - фильтры
+GROUP_SUMMARY_KEY = "history_group:{head}"
+# Руководитель сотрудника, чьи итоги сбрасываются при его транзакциях
+GROUP_MEMBER_KEY = "history_group_member:{user_id}"
+# Итоги за скользящий период устаревают и без транзакций
+PERIOD_SUMMARY_TTL = 5 * 60
+
+
+@dataclass(frozen=True)
+class HistoryFilters:
+    """
+    Фильтры ленты транзакций группы
+
+    :param member: Telegram ID сотрудника, 0 - все сотрудники
+    :param kind: KIND_ALL, KIND_EARN или KIND_SPEND
+    :param period: PERIOD_ALL, PERIOD_DAY (с начала дня), PERIOD_WEEK
+        (7 дней) или PERIOD_MONTH (30 дней)
+    """
+
+    member: int = 0
+    kind: str = KIND_ALL
+    period: str = PERIOD_ALL
+
+    def since(self) -> Optional[datetime]:
+        """Начало выбранного периода"""
+        now = datetime.now()
+        if self.period == PERIOD_DAY:
+            return now.replace(hour=0, minute=0, second=0, microsecond=0)
+        if self.period == PERIOD_WEEK:
+            return now - timedelta(days=7)
+        if self.period == PERIOD_MONTH:
+            return now - timedelta(days=30)
+        return None
+
+    def conditions(self) -> list:
+        """Условия WHERE для запросов транзакций"""
+        conditions = []
+        if self.member:
+            conditions.append(Transaction.user_id == self.member)
+        if self.kind == KIND_EARN:
+            conditions.append(Transaction.type == "earn")
+        elif self.kind == KIND_SPEND:
+            conditions.append(Transaction.type != "earn")
+        since = self.since()
+        if since is not None:
+            conditions.append(Transaction.created_at >= since)
+        return conditions
+
+    @property
+    def key(self) -> str:
+        return f"{self.member}:{self.kind}:{self.period}"
+
+    @property
+    def ttl(self) -> int:
+        return COUNT_TTL if self.period == PERIOD_ALL else PERIOD_SUMMARY_TTL
+
+
+@dataclass(frozen=True)
+class MemberSummary:
+    """
+    Итоги сотрудника в ленте группы
+
+    :param user_id: Telegram ID сотрудника
+    :param fullname: ФИО
+    :param earned: Сумма начислений
+    :param spent: Сумма списаний
+    :param transactions: Количество транзакций
+    """
+
+    user_id: int
+    fullname: str
+    earned: int
+    spent: int
+    transactions: int
+
+
+class TransactionHistory:
+    """
+    Страницы истории транзакций и кеш их количества
+    """
+
+    def __init__(self):
+        self.redis: Optional[Redis] = None
+        # Кеш без Redis: ID пользователя -> (истекает, количество)
+        self._counts: dict[int, tuple[float, int]] = {}
+        # Итоги групп без Redis: руководитель -> {фильтры: (истекает, итоги)}
+        self._summaries: dict[str, dict[str, tuple[float, list]]] = {}
+        # Руководители сотрудников без Redis
+        self._members: dict[int, str] = {}
+
+    def configure(self, redis: Optional[Redis] = None) -> None:
+        """
+        Настройка кеша количества транзакций
+
+        :param redis: Клиент Redis. Без него кеш хранится в памяти процесса
+        """
+        self.redis = redis
+        self._counts.clear()
+        self._summaries.clear()
+        self._members.clear()
+        balance_ledger.subscribe(self.forget)
+
+    async def count(self, session: AsyncSession, user_id: int) -> int:
+        """
+        Количество транзакций пользователя
+
+        :param session: Сессия основной БД
+        :param user_id: Telegram ID пользователя
+        """
+        key = COUNT_KEY.format(user_id=user_id)
+        if self.redis is None:
+            cached = self._counts.get(user_id)
+            if cached and cached[0] > time.monotonic():
+                return cached[1]
+        else:
+            try:
+                cached = await self.redis.get(key)
+                if cached is not None:
+                    return int(cached)
+            except Exception as e:
+                logger.error(f"[История] Ошибка чтения количества транзакций: {e}")
+
+        result = await session.execute(
+            select(func.count()).where(Transaction.user_id == user_id)
+        )
+        total = result.scalar_one()
+
+        if self.redis is None:
+            self._counts[user_id] = (time.monotonic() + COUNT_TTL, total)
+        else:
+            try:
+                await self.redis.set(key, total, ex=COUNT_TTL)
+            except Exception as e:
+                logger.error(f"[История] Ошибка записи количества транзакций: {e}")
+        return total
+
+    async def forget(self, deltas: dict[int, Balance]) -> None:
+        """
+        Сбрасывает кешированное количество транзакций пользователей
+        и итоги групп, в которые они входят
+
+        :param deltas: Изменения балансов по Telegram ID пользователя
+        """
+        if self.redis is None:
+            for user_id in deltas:
+                self._counts.pop(user_id, None)
+                head = self._members.pop(user_id, None)
+                if head is not None:
+                    self._summaries.pop(head, None)
+            return
+
+        member_keys = [GROUP_MEMBER_KEY.format(user_id=user_id) for user_id in deltas]
+        heads = await self.redis.mget(member_keys)
+        await self.redis.delete(
+            *(COUNT_KEY.format(user_id=user_id) for user_id in deltas),
+            *(
+                GROUP_SUMMARY_KEY.format(
+                    head=head.decode() if isinstance(head, bytes) else head
+                )
+                for head in heads
+                if head is not None
+            ),
+            *member_keys,
+        )
+
+    @staticmethod
+    async def page(
+        session: AsyncSession,
+        user_id: int,
+        direction: str = FIRST,
+        cursor: int = 0,
+        total: int = 0,
+        page_size: int = HISTORY_PAGE_SIZE,
+    ) -> list[Transaction]:
+        """
+        Страница истории от новых транзакций к старым
+
+        :param session: Сессия основной БД
+        :param user_id: Telegram ID пользователя
+        :param direction: FIRST, NEXT, PREV, LAST или AT
+        :param cursor: ID граничной транзакции для NEXT, PREV и AT
+        :param total: Количество транзакций, нужно для LAST
+        :param page_size: Размер страницы
+        """
+        query, reverse = _keyset_page(
+            select(Transaction).where(Transaction.user_id == user_id),
+            direction,
+            cursor,
+            total,
+            page_size,
+        )
+        rows = (await session.scalars(query)).all()
+        return list(reversed(rows)) if reverse else list(rows)
+
+    @staticmethod
+    async def group_page(
+        session: AsyncSession,
+        head: str,
+        filters: HistoryFilters,
+        direction: str = FIRST,
+        cursor: int = 0,
+        total: int = 0,
+        page_size: int = HISTORY_PAGE_SIZE,
+    ) -> list[tuple[Transaction, str]]:
+        """
+        Страница истории группы руководителя с ФИО сотрудников
+
+        :param session: Сессия основной БД
+        :param head: ФИО руководителя
+        :param filters: Фильтры ленты
+        :param direction: FIRST, NEXT, PREV, LAST или AT
+        :param cursor: ID граничной транзакции для NEXT, PREV и AT
+        :param total: Количество транзакций с учетом фильтров, нужно для LAST
+        :param page_size: Размер страницы
+        :return: Пары (транзакция, ФИО сотрудника)
+        """
+        query, reverse = _keyset_page(
+            select(Transaction, Employee.fullname)
+            .join(Employee, Employee.user_id == Transaction.user_id)
+            .where(Employee.head == head, *filters.conditions()),
+            direction,
+            cursor,
+            total,
+            page_size,
+        )
+        rows = [
+            (transaction, fullname)
+            for transaction, fullname in await session.execute(query)
+        ]
+        return rows[::-1] if reverse else rows
+
+    async def group_summary(
+        self, session: AsyncSession, head: str, filters: HistoryFilters
+    ) -> list[MemberSummary]:
+        """
+        Итоги сотрудников группы за выбранный период
+
+        Итоги кешируются по руководителю и фильтрам до транзакции любого
+        сотрудника группы (за скользящий период - не дольше
+        PERIOD_SUMMARY_TTL)
+
+        :param session: Сессия основной БД
+        :param head: ФИО руководителя
+        :param filters: Фильтры ленты
+        :return: Итоги сотрудников с транзакциями, по убыванию начислений
+        """
+        cached = await self._get_summary(head, filters)
+        if cached is not None:
+            return cached
+
+        summaries = await self._query_group_summary(session, head, filters)
+        # Сброс нужен и по транзакциям сотрудников, которых еще нет в итогах
+        result = await session.execute(
+            select(Employee.user_id).where(
+                Employee.head == head, Employee.user_id.is_not(None)
+            )
+        )
+        await self._set_summary(head, filters, summaries, result.scalars().all())
+        return summaries
+
+    async def _get_summary(
+        self, head: str, filters: HistoryFilters
+    ) -> Optional[list[MemberSummary]]:
+        """Итоги группы из кеша или None"""
+        if self.redis is None:
+            cached = self._summaries.get(head, {}).get(filters.key)
+        else:
+            try:
+                cached = await self.redis.hget(
+                    GROUP_SUMMARY_KEY.format(head=head), filters.key
+                )
+            except Exception as e:
+                logger.error(f"[История] Ошибка чтения итогов группы {head}: {e}")
+                return None
+            cached = json.loads(cached) if cached is not None else None
+
+        if not cached or cached[0] < time.time():
+            return None
+        return [MemberSummary(*row) for row in cached[1]]
+
+    async def _set_summary(
+        self,
+        head: str,
+        filters: HistoryFilters,
+        summaries: list[MemberSummary],
+        member_ids: list[int],
+    ) -> None:
+        """Запись итогов группы и связи сотрудников с руководителем"""
+        entry = (
+            time.time() + filters.ttl,
+            [
+                (
+                    summary.user_id,
+                    summary.fullname,
+                    summary.earned,
+                    summary.spent,
+                    summary.transactions,
+                )
+                for summary in summaries
+            ],
+        )
+        if self.redis is None:
+            self._summaries.setdefault(head, {})[filters.key] = entry
+            for user_id in member_ids:
+                self._members[user_id] = head
+            return
+
+        key = GROUP_SUMMARY_KEY.format(head=head)
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.hset(key, filters.key, json.dumps(entry, ensure_ascii=False))
+                pipe.expire(key, COUNT_TTL)
+                for user_id in member_ids:
+                    pipe.set(
+                        GROUP_MEMBER_KEY.format(user_id=user_id), head, ex=COUNT_TTL
+                    )
+                await pipe.execute()
+        except Exception as e:
+            logger.error(f"[История] Ошибка записи итогов группы {head}: {e}")
+
+    @staticmethod
+    async def _query_group_summary(
+        session: AsyncSession, head: str, filters: HistoryFilters
+    ) -> list[MemberSummary]:
+        """
+        Итоги сотрудников группы за выбранный период одним запросом
+
+        :param session: Сессия основной БД
+        :param head: ФИО руководителя
+        :param filters: Фильтры ленты
+        :return: Итоги сотрудников с транзакциями, по убыванию начислений
+        """
+        earned = func.coalesce(
+            func.sum(case((Transaction.type == "earn", Transaction.amount), else_=0)),
+            0,
+        )
+        spent = func.coalesce(
+            func.sum(case((Transaction.type != "earn", Transaction.amount), else_=0)),
+            0,
+        )
+        result = await session.execute(
+            select(
+                Employee.user_id,
+                Employee.fullname,
+                earned,
+                spent,
+                func.count(Transaction.id),
+            )
+            .join(Transaction, Transaction.user_id == Employee.user_id)
+            .where(Employee.head == head, *filters.conditions())
+            .group_by(Employee.user_id, Employee.fullname)
+            .order_by(earned.desc(), Employee.fullname)
+        )
+        return [
+            MemberSummary(user_id, fullname, int(earned), int(spent), transactions)
+            for user_id, fullname, earned, spent, transactions in result
+        ]
+
+    @staticmethod
+    async def group_transaction(
+        session: AsyncSession, head: str, transaction_id: int
+    ) -> Optional[tuple[Transaction, Employee]]:
+        """
+        Транзакция сотрудника группы вместе с сотрудником
+
+        :param session: Сессия основной БД
+        :param head: ФИО руководителя
+        :param transaction_id: ID транзакции
+        :return: (транзакция, сотрудник) или None, если транзакции нет в группе
+        """
+        result = await session.execute(
+            select(Transaction, Employee)
+            .join(Employee, Employee.user_id == Transaction.user_id)
+            .where(Transaction.id == transaction_id, Employee.head == head)
+            .limit(1)
+        )
+        row = result.first()
+        return (row[0], row[1]) if row else None
+
+
+def _keyset_page(
+    query: Select,
+    direction: str,
+    cursor: int,
+    total: int,
+    page_size: int,
+) -> tuple[Select, bool]:
+    """
+    Ограничивает запрос транзакций одной страницей по ключу (created_at, id)
+
+    :return: (запрос, нужно ли развернуть результат)
+    """
+    if direction in (NEXT, PREV, AT):
+        cursor_created_at = (
+            select(Transaction.created_at)
+            .where(Transaction.id == cursor)
+            .scalar_subquery()
+        )
+        if direction == PREV:
+            query = query.where(
+                or_(
+                    Transaction.created_at > cursor_created_at,
+                    and_(
+                        Transaction.created_at == cursor_created_at,
+                        Transaction.id > cursor,
+                    ),
+                )
+            )
+        else:
+            id_condition = (
+                Transaction.id < cursor
+                if direction == NEXT
+                else Transaction.id <= cursor
+            )
+            query = query.where(
+                or_(
+                    Transaction.created_at < cursor_created_at,
+                    and_(Transaction.created_at == cursor_created_at, id_condition),
+                )
+            )
+
+    if direction == LAST:
+        # Последняя страница неполная, если количество не кратно размеру
+        page_size = total % page_size or page_size
+
+    if direction in (PREV, LAST):
+        # Ближайшие к курсору строки читаются в обратном порядке
+        return (
+            query.order_by(Transaction.created_at.asc(), Transaction.id.asc()).limit(
+                page_size
+            ),
+            True,
+        )
+    return (
+        query.order_by(Transaction.created_at.desc(), Transaction.id.desc()).limit(
+            page_size
+        ),
+        False,
+    )
+
+
+transaction_history = TransactionHistory()
@@ -0,0 +1,169 @@
+"""
+Выбор лидера через Redis
+
+Лидером считается процесс, владеющий ключом блокировки. Лидер продлевает
+ключ каждую треть TTL, остальные процессы периодически пытаются его занять.
+При каждой смене лидера увеличивается fencing token, поэтому процесс,
+потерявший лидерство (например, после долгой паузы), не сможет выполнить
+задачу от имени устаревшего лидерства.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from typing import Awaitable, Callable, Optional
+
+from redis.asyncio import Redis
+
+logger = logging.getLogger(__name__)
+
+# Продление блокировки, только если ей владеет текущий процесс
+RENEW_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("PEXPIRE", KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# Снятие блокировки, только если ей владеет текущий процесс
+RELEASE_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
+# Проверка, что процесс все еще лидер с тем же fencing token
+CHECK_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] and redis.call("GET", KEYS[2]) == ARGV[2] then
+    return 1
+end
+return 0
+"""
+
+
+class LeaderElection:
+    """
+    Выбор лидера среди реплик бота
+    """
+
+    def __init__(self, redis: Redis, name: str, ttl: int = 30):
+        self.redis = redis
+        self.name = name
+        self.ttl = ttl
+        self.lock_key = f"leader:{name}:lock"
+        self.fence_key = f"leader:{name}:fence"
+        self.instance_id = (
+            f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        )
+        self.fencing_token: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self.fencing_token is not None
+
+    def start(
+        self,
+        on_elected: Callable[[], Awaitable[None] | None],
+        on_lost: Callable[[], Awaitable[None] | None],
+    ) -> None:
+        """
+        Запускает фоновый цикл выбора лидера
+
+        :param on_elected: Вызывается при получении лидерства
+        :param on_lost: Вызывается при потере лидерства
+        """
+        self._task = asyncio.create_task(self._run(on_elected, on_lost))
+
+    async def stop(self) -> None:
+        """
+        Останавливает цикл и освобождает блокировку
+        """
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        if self.is_leader:
+            try:
+                await self.redis.eval(
+                    RELEASE_SCRIPT, 1, self.lock_key, self.instance_id
+                )
+            except Exception as e:
+                logger.error(
+                    f"[Лидер] Не удалось освободить блокировку {self.name}: {e}"
+                )
+            self.fencing_token = None
+
+    async def is_current(self) -> bool:
+        """
+        Проверяет, что процесс остается лидером с тем же fencing token
+        """
+        if not self.is_leader:
+            return False
+        try:
+            result = await self.redis.eval(
+                CHECK_SCRIPT,
+                2,
+                self.lock_key,
+                self.fence_key,
+                self.instance_id,
+                str(self.fencing_token),
+            )
+        except Exception as e:
+            logger.error(f"[Лидер] Ошибка проверки лидерства {self.name}: {e}")
+            return False
+        return bool(result)
+
+    async def _run(self, on_elected, on_lost) -> None:
+        interval = max(1.0, self.ttl / 3)
+        while True:
+            await self._step(on_elected, on_lost)
+            await asyncio.sleep(interval)
+
+    async def _step(self, on_elected, on_lost) -> None:
+        """
+        Одна попытка продлить или получить лидерство
+        """
+        try:
+            if self.is_leader:
+                renewed = await self.redis.eval(
+                    RENEW_SCRIPT,
+                    1,
+                    self.lock_key,
+                    self.instance_id,
+                    self.ttl * 1000,
+                )
+                if not renewed:
+                    logger.warning(
+                        f"[Лидер] Потеряно лидерство {self.name} (токен {self.fencing_token})"
+                    )
+                    self.fencing_token = None
+                    await _maybe_await(on_lost())
+            elif await self.redis.set(
+                self.lock_key, self.instance_id, nx=True, px=self.ttl * 1000
+            ):
+                self.fencing_token = await self.redis.incr(self.fence_key)
+                logger.info(
+                    f"[Лидер] Процесс {self.instance_id} стал лидером {self.name} (токен {self.fencing_token})"
+                )
+                await _maybe_await(on_elected())
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"[Лидер] Ошибка выбора лидера {self.name}: {e}")
+            if self.is_leader:
+                # Без связи с Redis нельзя гарантировать лидерство
+                self.fencing_token = None
+                await _maybe_await(on_lost())
+
+
+async def _maybe_await(result) -> None:
+    if asyncio.iscoroutine(result):
+        await result
@@ -0,0 +1,402 @@
+"""
+Рейтинги пользователей по балансу
+
+Рейтинги групп (чатов), подразделений, групп руководителей и общий рейтинг
+хранятся в сортированных множествах Redis (без Redis - в памяти процесса).
+Состав рейтинга читается из БД при первом обращении и обновляется по
+истечении BOARD_TTL или при изменении состава группы, а баллы участников
+изменяются при каждой транзакции через подписку на BalanceLedger.
+
+Вывод рейтинга - одно чтение ZREVRANGE и один запрос ФИО участников.
+Рейтинг без участников отмечается отдельным ключом, чтобы не читать
+его состав из БД при каждом обращении.
+"""
+
+import logging
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from redis.asyncio import Redis
+from sqlalchemy import select
+from stp_database import Employee, MainRequestsRepo
+
+from tgbot.services.balances import VERSION_KEY, Balance, balance_ledger
+
+logger = logging.getLogger(__name__)
+
+# Виды рейтингов
+CHAT = "chat"
+DIVISION = "division"
+HEAD = "head"
+GLOBAL = "global"
+
+BOARD_KEY = "leaderboard:{kind}:{value}"
+# Отметка рейтинга без участников: пустое множество в Redis не хранится
+EMPTY_BOARD_KEY = "leaderboard_empty:{kind}:{value}"
+# Рейтинги, в которые входит пользователь
+USER_BOARDS_KEY = "leaderboard:user:{user_id}"
+
+# Время жизни состава рейтинга. Баллы актуальны всегда, TTL ограничивает
+# время, за которое рейтинг узнает о переводах и увольнениях сотрудников
+BOARD_TTL = 15 * 60
+
+# Запись рейтинга, если он не появился за время чтения из БД и балансы
+# участников не изменились за время вычисления: apply не находит рейтинг,
+# пока он не записан, и такое изменение было бы потеряно.
+# KEYS: рейтинг, отметка пустого рейтинга, затем пары (рейтинги участника,
+# счетчик изменений баланса). ARGV: TTL, затем тройки (баллы, ID пользователя,
+# счетчик до вычисления) в порядке KEYS.
+# Возвращает 0, если рейтинг уже есть, иначе номера (с 1) участников, баланс
+# которых изменился; рейтинг в этом случае не записывается
+BUILD_SCRIPT = """
+local board = KEYS[1]
+if redis.call('EXISTS', board, KEYS[2]) > 0 then
+    return 0
+end
+local ttl = ARGV[1]
+if #KEYS == 2 then
+    redis.call('SET', KEYS[2], 1, 'EX', ttl)
+    return {}
+end
+local changed = {}
+for i = 1, (#KEYS - 2) / 2 do
+    local version = tonumber(redis.call('GET', KEYS[2 * i + 2])) or 0
+    if version ~= tonumber(ARGV[3 * i + 1]) then
+        table.insert(changed, i)
+    end
+end
+if #changed > 0 then
+    return changed
+end
+for i = 1, (#KEYS - 2) / 2 do
+    local index = KEYS[2 * i + 1]
+    redis.call('ZADD', board, ARGV[3 * i - 1], ARGV[3 * i])
+    redis.call('SADD', index, board)
+    redis.call('EXPIRE', index, ttl)
+end
+redis.call('EXPIRE', board, ttl)
+return {}
+"""
+
+
+@dataclass(frozen=True)
+class Board:
+    """
+    Описание рейтинга
+
+    :param kind: Вид рейтинга: CHAT, DIVISION, HEAD или GLOBAL
+    :param value: ID чата, подразделение или ФИО руководителя
+    """
+
+    kind: str
+    value: str = "all"
+
+    @staticmethod
+    def chat(chat_id: int) -> "Board":
+        return Board(CHAT, str(chat_id))
+
+    @staticmethod
+    def division(division: str) -> "Board":
+        return Board(DIVISION, division)
+
+    @staticmethod
+    def head(fullname: str) -> "Board":
+        return Board(HEAD, fullname)
+
+    @staticmethod
+    def everyone() -> "Board":
+        return Board(GLOBAL)
+
+    @property
+    def key(self) -> str:
+        return BOARD_KEY.format(kind=self.kind, value=self.value)
+
+    @property
+    def empty_key(self) -> str:
+        return EMPTY_BOARD_KEY.format(kind=self.kind, value=self.value)
+
+    async def member_ids(self, stp_repo: MainRequestsRepo) -> list[int]:
+        """
+        Telegram ID сотрудников, входящих в рейтинг
+
+        :param stp_repo: Репозиторий основной БД
+        """
+        query = select(Employee.user_id).where(Employee.user_id.is_not(None))
+        if self.kind == CHAT:
+            group_members = await stp_repo.group_member.get_group_members(
+                int(self.value)
+            )
+            member_ids = [member.member_id for member in group_members]
+            if not member_ids:
+                return []
+            query = query.where(Employee.user_id.in_(member_ids))
+        elif self.kind == DIVISION:
+            query = query.where(Employee.division == self.value)
+        elif self.kind == HEAD:
+            query = query.where(Employee.head == self.value)
+
+        result = await stp_repo.session.execute(query.distinct())
+        return list(result.scalars().all())
+
+
+@dataclass(frozen=True)
+class LeaderboardEntry:
+    """
+    Строка рейтинга
+
+    :param user_id: Telegram ID пользователя
+    :param fullname: ФИО
+    :param username: Username в Telegram
+    :param balance: Баланс
+    """
+
+    user_id: int
+    fullname: str
+    username: Optional[str]
+    balance: int
+
+
+class Leaderboards:
+    """
+    Рейтинги по балансу в сортированных множествах
+    """
+
+    def __init__(self):
+        self.redis: Optional[Redis] = None
+        # Хранилище без Redis: рейтинг -> (истекает, {ID: баллы})
+        self._local: dict[str, tuple[float, dict[int, int]]] = {}
+        self._build = None
+
+    def configure(self, redis: Optional[Redis] = None) -> None:
+        """
+        Настройка хранилища рейтингов и подписка на изменения балансов
+
+        :param redis: Клиент Redis. Без него рейтинги хранятся в памяти процесса
+        """
+        self.redis = redis
+        self._local.clear()
+        if redis is not None:
+            self._build = redis.register_script(BUILD_SCRIPT)
+        balance_ledger.subscribe(self.apply)
+
+    async def top(
+        self, stp_repo: MainRequestsRepo, board: Board, limit: Optional[int] = None
+    ) -> list[LeaderboardEntry]:
+        """
+        Участники рейтинга по убыванию баланса
+
+        :param stp_repo: Репозиторий основной БД
+        :param board: Рейтинг
+        :param limit: Количество строк. None - все участники
+        """
+        try:
+            scores = await self._range(board, limit)
+            if scores is None:
+                scores = await self._rebuild(stp_repo, board, limit)
+        except Exception as e:
+            logger.error(f"[Рейтинг] Ошибка чтения рейтинга {board.key}: {e}")
+            scores = await self._compute(stp_repo, board)
+            if limit is not None:
+                scores = scores[:limit]
+
+        if not scores:
+            return []
+
+        result = await stp_repo.session.execute(
+            select(Employee.user_id, Employee.fullname, Employee.username).where(
+                Employee.user_id.in_([user_id for user_id, _ in scores])
+            )
+        )
+        names = {
+            user_id: (fullname, username) for user_id, fullname, username in result
+        }
+
+        return [
+            LeaderboardEntry(user_id, *names[user_id], balance)
+            for user_id, balance in scores
+            if user_id in names
+        ]
+
+    async def apply(self, deltas: dict[int, Balance]) -> None:
+        """
+        Изменяет баллы пользователей во всех рейтингах, где они состоят
+
+        :param deltas: Изменения балансов по Telegram ID пользователя
+        """
+        deltas = {
+            user_id: delta.balance for user_id, delta in deltas.items() if delta.balance
+        }
+        if not deltas:
+            return
+
+        if self.redis is None:
+            for _, scores in self._local.values():
+                for user_id, delta in deltas.items():
+                    if user_id in scores:
+                        scores[user_id] += delta
+            return
+
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for user_id in deltas:
+                    pipe.smembers(USER_BOARDS_KEY.format(user_id=user_id))
+                user_boards = await pipe.execute()
+
+            # Баллы изменяются только у участников (XX), новые участники не добавляются
+            increments = [
+                (user_id, board)
+                for user_id, boards in zip(deltas, user_boards)
+                for board in boards
+            ]
+            if not increments:
+                return
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for user_id, board in increments:
+                    pipe.zadd(board, {user_id: deltas[user_id]}, xx=True, incr=True)
+                scores = await pipe.execute()
+
+            # Ссылки на истекшие рейтинги удаляются
+            stale = [
+                increment
+                for increment, score in zip(increments, scores)
+                if score is None
+            ]
+            if stale:
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    for user_id, board in stale:
+                        pipe.srem(USER_BOARDS_KEY.format(user_id=user_id), board)
+                    await pipe.execute()
+        except Exception as e:
+            logger.error(f"[Рейтинг] Ошибка изменения баллов: {e}")
+            await self._forget_user_boards(deltas.keys())
+
+    async def forget(self, board: Board) -> None:
+        """
+        Сбрасывает рейтинг, чтобы при следующем обращении состав был прочитан из БД
+
+        :param board: Рейтинг
+        """
+        if self.redis is None:
+            self._local.pop(board.key, None)
+            return
+        try:
+            await self.redis.delete(board.key, board.empty_key)
+        except Exception as e:
+            logger.error(f"[Рейтинг] Ошибка сброса рейтинга {board.key}: {e}")
+
+    async def _range(
+        self, board: Board, limit: Optional[int]
+    ) -> Optional[list[tuple[int, int]]]:
+        """Рейтинг из хранилища или None, если его нет"""
+        stop = -1 if limit is None else limit - 1
+
+        if self.redis is None:
+            entry = self._local.get(board.key)
+            if entry is None or entry[0] < time.monotonic():
+                return None
+            ranked = sorted(entry[1].items(), key=lambda item: item[1], reverse=True)
+            return ranked if limit is None else ranked[:limit]
+
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.zrevrange(board.key, 0, stop, withscores=True)
+            pipe.exists(board.empty_key)
+            rows, empty = await pipe.execute()
+        if not rows:
+            return [] if empty else None
+        return [(int(user_id), int(score)) for user_id, score in rows]
+
+    async def _rebuild(
+        self, stp_repo: MainRequestsRepo, board: Board, limit: Optional[int]
+    ) -> list[tuple[int, int]]:
+        """
+        Чтение состава рейтинга из БД и запись в хранилище
+
+        Счетчики изменений балансов читаются до вычисления баллов. Если баланс
+        участника изменился до записи рейтинга, изменение не дошло бы до
+        рейтинга через apply - баллы таких участников вычисляются повторно
+        """
+        member_ids = await board.member_ids(stp_repo)
+        versions = await balance_ledger.read_versions(member_ids)
+        scores = await self._scores(stp_repo, member_ids)
+
+        for attempt in range(2):
+            changed = await self._store(board, scores, versions)
+            if not changed:
+                break
+            versions.update(await balance_ledger.read_versions(changed))
+            scores.update(await self._scores(stp_repo, changed))
+
+        logger.debug(
+            "[Рейтинг] Рейтинг %s собран: %d участников", board.key, len(scores)
+        )
+        ranked = _ranked(scores)
+        return ranked if limit is None else ranked[:limit]
+
+    async def _store(
+        self, board: Board, scores: dict[int, int], versions: dict[int, int]
+    ) -> list[int]:
+        """
+        Записывает рейтинг, если балансы участников не изменились
+        с момента чтения счетчиков
+
+        :return: Участники, балансы которых изменились. Рейтинг в этом случае
+            не записан
+        """
+        if self.redis is None:
+            current = await balance_ledger.read_versions(list(scores))
+            changed = [
+                user_id for user_id in scores if current[user_id] != versions[user_id]
+            ]
+            if not changed:
+                self._local[board.key] = (time.monotonic() + BOARD_TTL, dict(scores))
+            return changed
+
+        user_ids = list(scores)
+        keys = [board.key, board.empty_key]
+        args = [BOARD_TTL]
+        for user_id in user_ids:
+            keys += [
+                USER_BOARDS_KEY.format(user_id=user_id),
+                VERSION_KEY.format(user_id=user_id),
+            ]
+            args += [scores[user_id], user_id, versions[user_id]]
+        changed = await self._build(keys=keys, args=args)
+        if not changed:
+            return []
+        return [user_ids[int(index) - 1] for index in changed]
+
+    @staticmethod
+    async def _scores(
+        stp_repo: MainRequestsRepo, member_ids: list[int]
+    ) -> dict[int, int]:
+        """Баллы участников рейтинга"""
+        balances = await balance_ledger.get_many(stp_repo, member_ids)
+        return {user_id: balances[user_id].balance for user_id in member_ids}
+
+    async def _compute(
+        self, stp_repo: MainRequestsRepo, board: Board
+    ) -> list[tuple[int, int]]:
+        """Баллы участников рейтинга по убыванию"""
+        member_ids = await board.member_ids(stp_repo)
+        return _ranked(await self._scores(stp_repo, member_ids))
+
+    async def _forget_user_boards(self, user_ids) -> None:
+        """Сброс всех рейтингов с участием пользователей"""
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for user_id in user_ids:
+                    pipe.smembers(USER_BOARDS_KEY.format(user_id=user_id))
+                boards = set().union(*await pipe.execute())
+            if boards:
+                await self.redis.delete(*boards)
+        except Exception as e:
+            logger.error(f"[Рейтинг] Ошибка сброса рейтингов: {e}")
+
+
+def _ranked(scores: dict[int, int]) -> list[tuple[int, int]]:
+    """Пары (ID пользователя, баллы) по убыванию баллов"""
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+leaderboards = Leaderboards()
@@ -1,13 +1,171 @@
+"""
+Настройка логирования
+
+Режимы:
+- sync: обработчики пишут в stderr в потоке, вызвавшем логгер (по умолчанию);
+- queue: записи кладутся в очередь, а форматирование и запись выполняет
+  отдельный поток QueueListener, поэтому вывод логов не блокирует event loop.
+
+Для частых сообщений можно задать долю записей, которые попадут в лог,
+отдельно для каждого логгера (LOG_SAMPLING). Предупреждения и ошибки
+не отбрасываются никогда.
+"""
+
+import atexit
+import datetime
 import logging
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Optional
 
 import betterlogging as bl
 
+from tgbot.config import LoggingConfig
+
+# Типы аргументов, которые безопасно форматировать в другом потоке
+SAFE_ARG_TYPES = (str, int, float, bool, type(None), datetime.date, datetime.time)
+
+_listener: Optional[QueueListener] = None
+
+
+def fields(**values: Any) -> dict:
+    """
+    Поля структурированной записи для параметра ``extra``:
+
+        logger.info("Группа обновлена", extra=fields(group_id=group_id, user_id=user_id))
+    """
+    return {"fields": values}
+
+
+class StructuredFormatter(bl.ColorizedFormatter):
+    """
+    Цветной форматтер betterlogging, добавляющий поля записи в виде key=value
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = super().format(record)
+        record_fields = getattr(record, "fields", None)
+        if not record_fields:
+            return message
+        pairs = " ".join(f"{key}={value!r}" for key, value in record_fields.items())
+        return f"{message} | {pairs}"
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Пропускает заданную долю записей ниже WARNING для выбранных логгеров
+
+    :param rates: Доля пропускаемых записей по имени логгера (и его потомков)
+    """
+
+    def __init__(self, rates: dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self._cache: dict[str, float] = {}
+
+    def _rate(self, name: str) -> float:
+        rate = self._cache.get(name)
+        if rate is None:
+            rate = 1.0
+            best = ""
+            for prefix, prefix_rate in self.rates.items():
+                if (name == prefix or name.startswith(f"{prefix}.")) and len(
+                    prefix
+                ) > len(best):
+                    best, rate = prefix, prefix_rate
+            self._cache[name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate(record.name)
+        return rate >= 1.0 or random.random() < rate
+
 
-def setup_logging():
-    log_level = logging.INFO
+class LazyQueueHandler(QueueHandler):
+    """
+    QueueHandler, откладывающий форматирование сообщения до потока записи.
+    Сообщения с аргументами сложных типов форматируются сразу, чтобы не
+    обращаться к изменяемым объектам (например, моделям БД) из другого потока
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.args and not all(
+            isinstance(arg, SAFE_ARG_TYPES) for arg in _iter_args(record.args)
+        ):
+            record.msg = record.getMessage()
+            record.args = None
+
+        record_fields = getattr(record, "fields", None)
+        if record_fields:
+            record.fields = {
+                key: value if isinstance(value, SAFE_ARG_TYPES) else repr(value)
+                for key, value in record_fields.items()
+            }
+        return record
+
+
+def _iter_args(args):
+    return args.values() if isinstance(args, dict) else args
+
+
+def setup_logging(config: Optional[LoggingConfig] = None):
+    """
+    Настраивает корневой логгер
+
+    :param config: Настройки логирования. Без них - синхронный режим, уровень INFO
+    """
+    global _listener
+
+    log_level = getattr(logging, config.level.upper()) if config else logging.INFO
     bl.basic_colorized_config(level=log_level)
 
     logging.basicConfig(
         level=log_level,
         format="%(filename)s:%(lineno)d #%(levelname)-8s [%(asctime)s] - %(name)s - %(message)s",
     )
+
+    root = logging.getLogger()
+    for handler in root.handlers:
+        handler.setFormatter(StructuredFormatter())
+
+    if config is None or _listener is not None:
+        return
+
+    sampling_filter = SamplingFilter(config.sampling) if config.sampling else None
+
+    if config.mode != "queue":
+        if sampling_filter:
+            for handler in root.handlers:
+                handler.addFilter(sampling_filter)
+        return
+
+    # Обработчики выполняются в потоке QueueListener, в корневом логгере
+    # остается только быстрый QueueHandler
+    handlers = list(root.handlers)
+    for handler in handlers:
+        root.removeHandler(handler)
+
+    queue_handler = LazyQueueHandler(queue.SimpleQueue())
+    if sampling_filter:
+        # Отброшенные записи не попадают в очередь
+        queue_handler.addFilter(sampling_filter)
+    root.addHandler(queue_handler)
+
+    _listener = QueueListener(
+        queue_handler.queue, *handlers, respect_handler_level=True
+    )
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """
+    Останавливает поток записи логов, дописав оставшиеся записи
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
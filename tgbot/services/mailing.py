@@ -1,59 +1,378 @@
-"""Сервис отправки email писем."""
+"""Сервис отправки email писем.
 
+Письма ставятся в очередь (outbox) и отправляются фоновой задачей через
+одно переиспользуемое SMTP соединение с авторизацией: письма, накопившиеся
+в очереди, уходят пачкой без повторного подключения. Временные ошибки
+повторяются с экспоненциальной паузой. Неотправленные при остановке письма
+сохраняются в Redis и отправляются после запуска, кроме писем с кодами
+авторизации: они не хранятся в открытом виде и к запуску уже устаревают.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import json
 import logging
-import smtplib
-import ssl
+import random
+import time
+from dataclasses import dataclass
+from email import message_from_string
 from email.header import Header
+from email.message import Message
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
+from typing import TYPE_CHECKING, Optional
 
-from stp_database import Employee, Product
-from stp_database.models.STP.purchase import Purchase
+import aiosmtplib
+from redis.asyncio import Redis
 
-from tgbot.config import load_config
+from tgbot.config import MailConfig
 
-config = load_config(".env")
+if TYPE_CHECKING:
+    from stp_database import Employee, Product
+    from stp_database.models.STP.purchase import Purchase
 
 logger = logging.getLogger(__name__)
 
+OUTBOX_KEY = "mail:outbox"
+
+# Приоритеты писем в очереди
+URGENT = 0  # коды авторизации
+NORMAL = 1
+
+
+class SMTPTransport:
+    """
+    SMTP соединение с авторизацией, переиспользуемое между письмами
+    """
+
+    def __init__(self, config: MailConfig):
+        self.config = config
+        self._client: Optional[aiosmtplib.SMTP] = None
+        self._sent_on_connection = 0
+        self.last_used = 0.0
+
+    @property
+    def is_connected(self) -> bool:
+        return self._client is not None and self._client.is_connected
+
+    async def _connect(self) -> None:
+        client = aiosmtplib.SMTP(
+            hostname=self.config.host,
+            port=self.config.port,
+            use_tls=self.config.use_ssl,
+            timeout=30,
+        )
+        await client.connect()
+        if self.config.user and self.config.password:
+            await client.login(self.config.user, self.config.password)
+        self._client = client
+        self._sent_on_connection = 0
+        logger.debug(
+            "[Email] Открыто соединение с %s:%s", self.config.host, self.config.port
+        )
+
+    async def send(self, message: Message, recipients: list[str]) -> None:
+        """
+        Отправляет письмо, при необходимости переподключаясь к серверу
+
+        :param message: Письмо
+        :param recipients: Адреса получателей
+        """
+        if self._sent_on_connection >= self.config.messages_per_connection:
+            await self.close()
+
+        for attempt in range(2):
+            if not self.is_connected:
+                await self._connect()
+            try:
+                await self._client.send_message(
+                    message, sender=self.config.user, recipients=recipients
+                )
+                break
+            except aiosmtplib.SMTPServerDisconnected:
+                # Сервер закрыл простаивавшее соединение
+                self._client = None
+                if attempt:
+                    raise
+
+        self._sent_on_connection += 1
+        self.last_used = time.monotonic()
+
+    async def close(self) -> None:
+        """
+        Закрывает соединение с сервером
+        """
+        client, self._client = self._client, None
+        if client is None or not client.is_connected:
+            return
+        try:
+            await client.quit()
+        except aiosmtplib.SMTPException:
+            client.close()
+
+
+@dataclass
+class OutgoingEmail:
+    """
+    Письмо в очереди на отправку
+    """
+
+    message: Message
+    recipients: list[str]
+    priority: int = NORMAL
+    attempts: int = 0
+
+    def dump(self) -> str:
+        return json.dumps(
+            {
+                "message": self.message.as_string(),
+                "recipients": self.recipients,
+                "priority": self.priority,
+                "attempts": self.attempts,
+            },
+            ensure_ascii=False,
+        )
+
+    @staticmethod
+    def load(payload: str | bytes) -> "OutgoingEmail":
+        data = json.loads(payload)
+        return OutgoingEmail(
+            message=message_from_string(data["message"]),
+            recipients=data["recipients"],
+            priority=data["priority"],
+            attempts=data["attempts"],
+        )
+
+
+class MailOutbox:
+    """
+    Очередь писем с фоновой отправкой через одно SMTP соединение
+    """
+
+    def __init__(self):
+        self.config: Optional[MailConfig] = None
+        self.redis: Optional[Redis] = None
+        self._transport: Optional[SMTPTransport] = None
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._counter = itertools.count()
+        self._task: Optional[asyncio.Task] = None
+        self._batch: list[OutgoingEmail] = []
+        self._retries: dict[asyncio.TimerHandle, OutgoingEmail] = {}
+
+    async def start(self, config: MailConfig, redis: Optional[Redis] = None) -> None:
+        """
+        Запускает фоновую отправку и возвращает в очередь письма,
+        не отправленные до предыдущей остановки
+
+        :param config: Настройки почтового сервера
+        :param redis: Клиент Redis для сохранения очереди при остановке
+        """
+        self.redis = redis
+        self._ensure_started(config)
+        if redis is None:
+            return
+
+        # Очередь забирается атомарно, чтобы при одновременном запуске
+        # нескольких процессов письмо восстановил только один из них
+        try:
+            async with redis.pipeline(transaction=True) as pipe:
+                pipe.lrange(OUTBOX_KEY, 0, -1)
+                pipe.delete(OUTBOX_KEY)
+                payloads, _ = await pipe.execute()
+        except Exception as e:
+            logger.error(f"[Email] Не удалось загрузить сохраненную очередь писем: {e}")
+            return
+
+        for payload in payloads:
+            self._put(OutgoingEmail.load(payload))
+        if payloads:
+            logger.info(f"[Email] Восстановлено писем в очереди: {len(payloads)}")
+
+    def _ensure_started(self, config: MailConfig) -> None:
+        if self.config != config:
+            self.config = config
+            self._transport = SMTPTransport(config)
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._drain())
+
+    def submit(
+        self,
+        config: MailConfig,
+        message: Message,
+        recipients: list[str],
+        priority: int = NORMAL,
+    ) -> None:
+        """
+        Ставит письмо в очередь на отправку
+
+        :param config: Настройки почтового сервера
+        :param message: Письмо
+        :param recipients: Адреса получателей
+        :param priority: URGENT для писем, которые ждет пользователь
+        """
+        self._ensure_started(config)
+        self._put(OutgoingEmail(message, recipients, priority))
+
+    def _put(self, item: OutgoingEmail) -> None:
+        self._queue.put_nowait((item.priority, next(self._counter), item))
+
+    async def _drain(self) -> None:
+        queue = self._queue
+        while True:
+            try:
+                _, _, item = await asyncio.wait_for(
+                    queue.get(), timeout=self.config.idle_timeout
+                )
+            except asyncio.TimeoutError:
+                # Простаивающее соединение закрывается до следующего письма
+                if self._transport.is_connected:
+                    await self._transport.close()
+                continue
+
+            # Письма, накопившиеся в очереди, отправляются через то же соединение
+            self._batch = [item]
+            while not queue.empty():
+                self._batch.append(queue.get_nowait()[2])
+
+            total = len(self._batch)
+            sent = 0
+            while self._batch:
+                item = self._batch[0]
+                try:
+                    await self._transport.send(item.message, item.recipients)
+                    sent += 1
+                except (aiosmtplib.SMTPException, OSError) as e:
+                    if not isinstance(e, aiosmtplib.SMTPResponseException):
+                        # После сетевой ошибки соединение открывается заново
+                        await self._transport.close()
+                    self._retry(item, e)
+                self._batch.pop(0)
+                queue.task_done()
+
+            if total > 1:
+                logger.info(f"[Email] Отправлено писем пачкой: {sent} из {total}")
+
+    def _retry(self, item: OutgoingEmail, error: Exception) -> None:
+        item.attempts += 1
+        if item.attempts >= self.config.max_retries or (
+            isinstance(error, aiosmtplib.SMTPResponseException)
+            and 500 <= error.code < 600
+        ):
+            logger.error(
+                f"[Email] Письмо на {item.recipients} не отправлено "
+                f"после {item.attempts} попыток: {error}"
+            )
+            return
+
+        delay = min(300.0, 2**item.attempts) * random.uniform(0.5, 1.5)
+        logger.warning(
+            f"[Email] Ошибка отправки письма на {item.recipients}, "
+            f"повтор через {delay:.0f}с: {error}"
+        )
+
+        def requeue():
+            self._retries.pop(handle, None)
+            self._put(item)
+
+        handle = asyncio.get_running_loop().call_later(delay, requeue)
+        self._retries[handle] = item
+
+    async def stop(self, timeout: float = 10) -> None:
+        """
+        Отправляет письма из очереди и останавливает фоновую задачу.
+        Не отправленные за timeout письма и письма, ожидающие повтора,
+        сохраняются в Redis. Срочные письма (коды авторизации) отбрасываются
+
+        :param timeout: Максимальное время ожидания отправки (сек)
+        """
+        if self._queue is None:
+            return
+
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+        # Письмо, прерванное во время отправки, может быть доставлено повторно
+        pending = self._batch + list(self._retries.values())
+        pending += [self._queue.get_nowait()[2] for _ in range(self._queue.qsize())]
+        for handle in self._retries:
+            handle.cancel()
+        self._retries.clear()
+        self._batch = []
+        self._queue = None
+        if self._transport:
+            await self._transport.close()
+
+        urgent = [item for item in pending if item.priority == URGENT]
+        if urgent:
+            logger.warning(
+                f"[Email] Не отправлено писем с кодами авторизации: {len(urgent)}"
+            )
+            pending = [item for item in pending if item.priority != URGENT]
+
+        if not pending:
+            return
+        if self.redis is None:
+            logger.warning(f"[Email] Не отправлено писем при остановке: {len(pending)}")
+            return
+        try:
+            await self.redis.rpush(OUTBOX_KEY, *(item.dump() for item in pending))
+            logger.info(f"[Email] Сохранено неотправленных писем: {len(pending)}")
+        except Exception as e:
+            logger.error(f"[Email] Не удалось сохранить очередь писем: {e}")
+
+
+mail_outbox = MailOutbox()
+
 
 async def send_email(
-    addresses: list[str] | str, subject: str, body: str, html: bool = True
+    config: MailConfig,
+    addresses: list[str] | str,
+    subject: str,
+    body: str,
+    html: bool = True,
+    urgent: bool = False,
 ) -> None:
-    """Отправляет письмо на указанные email.
+    """Ставит письмо в очередь на отправку на указанные email.
 
     Args:
+        config: Настройки почтового сервера
         addresses: Список адресов для отправки письма
         subject: Заголовок письма
         body: Тело письма
         html: Использовать ли HTML для форматирования
+        urgent: Отправить раньше остальных писем в очереди
     """
-    context = ssl.create_default_context()
+    recipients = addresses if isinstance(addresses, list) else [addresses]
 
     msg = MIMEMultipart()
-    msg["From"] = config.mail.user
-    msg["To"] = ", ".join(addresses) if isinstance(addresses, list) else addresses
+    msg["From"] = config.user
+    msg["To"] = ", ".join(recipients)
     msg["Subject"] = Header(subject, "utf-8")
 
     content_type = "html" if html else "plain"
     msg.attach(MIMEText(body, content_type, "utf-8"))
 
-    try:
-        with smtplib.SMTP_SSL(
-            host=config.mail.host, port=config.mail.port, context=context
-        ) as server:
-            server.login(user=config.mail.user, password=config.mail.password)
-            server.sendmail(
-                from_addr=config.mail.user, to_addrs=addresses, msg=msg.as_string()
-            )
-    except smtplib.SMTPException as e:
-        logger.error(f"[Email] Ошибка отправки письма: {e}")
+    mail_outbox.submit(config, msg, recipients, URGENT if urgent else NORMAL)
 
 
-async def send_auth_email(code: str, email: str, bot_username: str) -> None:
+async def send_auth_email(
+    config: MailConfig, code: str, email: str, bot_username: str
+) -> None:
     """Отправляет письмо с кодом авторизации.
 
     Args:
+        config: Настройки почтового сервера
         code: Код авторизации
         email: Почта для отправки кода
         bot_username: Юзернейм бота Telegram (для гиперссылки)
@@ -64,10 +383,13 @@ async def send_auth_email(code: str, email: str, bot_username: str) -> None:
 Код для авторизации: <b>{code}</b><br>
 Введите код в бота <a href="https://t.me/{bot_username}">@{bot_username}</a> для завершения авторизации"""
 
-    await send_email(addresses=email, subject=email_subject, body=email_content)
+    await send_email(
+        config, addresses=email, subject=email_subject, body=email_content, urgent=True
+    )
 
 
 async def send_activation_product_email(
+    config: MailConfig,
     user: Employee,
     user_head: Employee | None,
     current_duty: Employee | None,
@@ -78,6 +400,7 @@ async def send_activation_product_email(
     """Отправляет письмо с уведомлением об активации предмета.
 
     Args:
+        config: Настройки почтового сервера
         user: Экземпляр пользователя с моделью Employee. Сотрудник, активировавший предмет
         user_head: Руководитель сотрудника, активировавшего предмет
         current_duty: Текущий дежурный
@@ -100,16 +423,16 @@ async def send_activation_product_email(
         case 3:
             if user.division == "НЦК":
                 # Рассылка РГ НЦК
-                email.append(config.mail.nck_email_addr)
+                email.append(config.nck_email_addr)
             else:
                 # Рассылка РГ НТП
-                email.append(config.mail.ntp_email_addr)
+                email.append(config.ntp_email_addr)
         case 5:
             # Рассылка ГОК
-            email.append(config.mail.gok_email_addr)
+            email.append(config.gok_email_addr)
         case 6:
             # Рассылка МИП
-            email.append(config.mail.mip_email_addr)
+            email.append(config.mip_email_addr)
 
     # Почта руководителя сотрудника
     if user_head and user_head.email:
@@ -122,13 +445,14 @@ async def send_activation_product_email(
     # Почта сотрудника, активировавшего предмет
     email.append(user.email)
 
-    await send_email(addresses=email, subject=email_subject, body=email_content)
+    await send_email(config, addresses=email, subject=email_subject, body=email_content)
     logger.info(
-        f"[Активация предмета] Уведомление об активации {product.name} пользователем {user.fullname} отправлено на {email}"
+        f"[Активация предмета] Уведомление об активации {product.name} пользователем {user.fullname} поставлено в очередь на {email}"
     )
 
 
 async def send_cancel_product_email(
+    config: MailConfig,
     user: Employee,
     user_head: Employee | None,
     current_duty: Employee | None,
@@ -139,6 +463,7 @@ async def send_cancel_product_email(
     """Отправляет письмо с уведомлением об отмене активации предмета.
 
     Args:
+        config: Настройки почтового сервера
         user: Экземпляр пользователя с моделью Employee. Сотрудник, активировавший предмет
         user_head: Руководитель сотрудника, активировавшего предмет
         current_duty: Текущий дежурный
@@ -160,16 +485,16 @@ async def send_cancel_product_email(
         case 3:
             if user.division == "НЦК":
                 # Рассылка РГ НЦК
-                email.append(config.mail.nck_email_addr)
+                email.append(config.nck_email_addr)
             else:
                 # Рассылка РГ НТП
-                email.append(config.mail.ntp_email_addr)
+                email.append(config.ntp_email_addr)
         case 5:
             # Рассылка ГОК
-            email.append(config.mail.gok_email_addr)
+            email.append(config.gok_email_addr)
         case 6:
             # Рассылка МИП
-            email.append(config.mail.mip_email_addr)
+            email.append(config.mip_email_addr)
 
     # Почта руководителя сотрудника
     if user_head and user_head.email:
@@ -182,7 +507,7 @@ async def send_cancel_product_email(
     # Почта сотрудника, активировавшего предмет
     email.append(user.email)
 
-    await send_email(addresses=email, subject=email_subject, body=email_content)
+    await send_email(config, addresses=email, subject=email_subject, body=email_content)
     logger.info(
-        f"[Активация предмета] Уведомление об отмене активации {product.name} пользователем {user.fullname} отправлено на {email}"
+        f"[Активация предмета] Уведомление об отмене активации {product.name} пользователем {user.fullname} поставлено в очередь на {email}"
     )
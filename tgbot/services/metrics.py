@@ -0,0 +1,287 @@
+"""
+Метрики обработки апдейтов
+
+Собирает по каждому хендлеру время обработки, количество SQL запросов,
+время работы с БД и количество вызовов Telegram API. Метрики отдаются
+локальным HTTP эндпоинтом в формате Prometheus и периодически
+выводятся в лог с пометкой хендлеров с признаками N+1 запросов.
+"""
+
+import asyncio
+import logging
+import time
+from collections import defaultdict, deque
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import (
+    BaseRequestMiddleware,
+    NextRequestMiddlewareType,
+)
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiohttp import web
+from sqlalchemy import event
+
+from tgbot.services.notifications import notification_queue
+
+logger = logging.getLogger(__name__)
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+@dataclass
+class UpdateStats:
+    """
+    Статистика обработки одного апдейта
+    """
+
+    router: str = "unhandled"
+    handler: str = "unhandled"
+    prefix: str = ""
+    started_at: float = field(default_factory=time.perf_counter)
+    sql_count: int = 0
+    sql_time: float = 0.0
+    api_calls: int = 0
+    # Заполняется только при профилировании: (смещение, длительность, запрос)
+    sql_timeline: Optional[list[tuple[float, float, str]]] = None
+
+    @property
+    def key(self) -> tuple[str, str, str]:
+        return self.router, self.handler, self.prefix
+
+
+current_update_stats: ContextVar[Optional[UpdateStats]] = ContextVar(
+    "current_update_stats", default=None
+)
+
+
+class HandlerMetrics:
+    """
+    Агрегированные метрики одного хендлера.
+    Квантили считаются по ограниченной выборке последних значений.
+    """
+
+    def __init__(self, window: int = 1000):
+        self.count = 0
+        self.wall_sum = 0.0
+        self.sql_sum = 0
+        self.db_time_sum = 0.0
+        self.api_calls_sum = 0
+        self.wall_samples: deque[float] = deque(maxlen=window)
+        self.db_samples: deque[float] = deque(maxlen=window)
+        self.sql_samples: deque[int] = deque(maxlen=window)
+
+    def observe(self, wall_time: float, stats: UpdateStats) -> None:
+        self.count += 1
+        self.wall_sum += wall_time
+        self.sql_sum += stats.sql_count
+        self.db_time_sum += stats.sql_time
+        self.api_calls_sum += stats.api_calls
+        self.wall_samples.append(wall_time)
+        self.db_samples.append(stats.sql_time)
+        self.sql_samples.append(stats.sql_count)
+
+    @staticmethod
+    def quantile(samples, q: float) -> float:
+        if not samples:
+            return 0.0
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+        return ordered[index]
+
+    @property
+    def avg_sql(self) -> float:
+        return self.sql_sum / self.count if self.count else 0.0
+
+
+class MetricsRegistry:
+    """
+    Реестр метрик хендлеров
+    """
+
+    def __init__(self):
+        self.handlers: dict[tuple[str, str, str], HandlerMetrics] = defaultdict(
+            HandlerMetrics
+        )
+
+    def observe(self, stats: UpdateStats) -> None:
+        wall_time = time.perf_counter() - stats.started_at
+        self.handlers[stats.key].observe(wall_time, stats)
+
+    def render_prometheus(self) -> str:
+        """
+        Формирует метрики в текстовом формате Prometheus
+        """
+        lines = []
+        summaries = [
+            (
+                "stpsher_handler_duration_seconds",
+                "Wall time of update processing",
+                "wall_samples",
+                "wall_sum",
+            ),
+            (
+                "stpsher_handler_db_seconds",
+                "Time spent in SQL statements per update",
+                "db_samples",
+                "db_time_sum",
+            ),
+            (
+                "stpsher_handler_sql_statements",
+                "SQL statements per update",
+                "sql_samples",
+                "sql_sum",
+            ),
+        ]
+
+        for name, help_text, samples_attr, sum_attr in summaries:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} summary")
+            for key, metrics in self.handlers.items():
+                labels = self._labels(key)
+                samples = getattr(metrics, samples_attr)
+                for q in QUANTILES:
+                    value = HandlerMetrics.quantile(samples, q)
+                    lines.append(f'{name}{{{labels},quantile="{q}"}} {value}')
+                lines.append(f"{name}_sum{{{labels}}} {getattr(metrics, sum_attr)}")
+                lines.append(f"{name}_count{{{labels}}} {metrics.count}")
+
+        lines.append(
+            "# HELP stpsher_handler_telegram_calls_total Telegram API calls made by handler"
+        )
+        lines.append("# TYPE stpsher_handler_telegram_calls_total counter")
+        for key, metrics in self.handlers.items():
+            lines.append(
+                f"stpsher_handler_telegram_calls_total{{{self._labels(key)}}} {metrics.api_calls_sum}"
+            )
+
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _labels(key: tuple[str, str, str]) -> str:
+        router, handler, prefix = (
+            value.replace("\\", "\\\\").replace('"', '\\"') for value in key
+        )
+        return f'router="{router}",handler="{handler}",prefix="{prefix}"'
+
+    def log_summary(self, n_plus_one_threshold: int, top: int = 10) -> None:
+        """
+        Выводит в лог самые медленные хендлеры и хендлеры с признаками N+1
+        """
+        if not self.handlers:
+            return
+
+        slowest = sorted(
+            self.handlers.items(),
+            key=lambda item: HandlerMetrics.quantile(item[1].wall_samples, 0.95),
+            reverse=True,
+        )[:top]
+
+        for (router, handler, prefix), metrics in slowest:
+            p50, p95, p99 = (
+                HandlerMetrics.quantile(metrics.wall_samples, q) for q in QUANTILES
+            )
+            logger.info(
+                f"[Метрики] {router}.{handler} [{prefix}]: вызовов {metrics.count}, "
+                f"p50 {p50:.3f}с, p95 {p95:.3f}с, p99 {p99:.3f}с, "
+                f"SQL в среднем {metrics.avg_sql:.1f}, Telegram API {metrics.api_calls_sum}"
+            )
+
+        for (router, handler, prefix), metrics in self.handlers.items():
+            if metrics.avg_sql >= n_plus_one_threshold:
+                logger.warning(
+                    f"[Метрики] Возможный N+1: {router}.{handler} [{prefix}] выполняет "
+                    f"в среднем {metrics.avg_sql:.1f} SQL запросов за апдейт"
+                )
+
+
+metrics_registry = MetricsRegistry()
+
+
+class TelegramCallsCounter(BaseRequestMiddleware):
+    """
+    Middleware сессии бота, считающий вызовы Telegram API текущего апдейта
+    """
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        stats = current_update_stats.get()
+        if stats is not None:
+            stats.api_calls += 1
+        return await make_request(bot, method)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start_times = conn.info.get("query_start_time")
+    if not start_times:
+        return
+
+    started = start_times.pop()
+    elapsed = time.perf_counter() - started
+    stats = current_update_stats.get()
+    if stats is not None:
+        stats.sql_count += 1
+        stats.sql_time += elapsed
+        if stats.sql_timeline is not None:
+            stats.sql_timeline.append(
+                (started - stats.started_at, elapsed, " ".join(statement.split()))
+            )
+
+
+def instrument_engine(engine) -> None:
+    """
+    Подключает подсчет SQL запросов к движку БД
+
+    :param engine: AsyncEngine из stp_database
+    """
+    sync_engine = getattr(engine, "sync_engine", engine)
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+async def _metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(
+        text=metrics_registry.render_prometheus()
+        + notification_queue.render_prometheus(),
+        content_type="text/plain",
+        headers={"X-Content-Type-Options": "nosniff"},
+    )
+
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    """
+    Запускает локальный HTTP сервер с эндпоинтом /metrics
+    """
+    app = web.Application()
+    app.router.add_get("/metrics", _metrics_handler)
+
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host=host, port=port)
+    await site.start()
+
+    logger.info(f"[Метрики] Эндпоинт метрик запущен на http://{host}:{port}/metrics")
+    return runner
+
+
+async def log_summary_periodically(interval: int, n_plus_one_threshold: int) -> None:
+    """
+    Периодически выводит сводку метрик в лог
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            metrics_registry.log_summary(n_plus_one_threshold)
+        except Exception as e:
+            logger.error(f"[Метрики] Ошибка формирования сводки: {e}")
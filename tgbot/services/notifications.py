@@ -0,0 +1,563 @@
+"""
+Очередь исходящих уведомлений
+
+Уведомления всех компонентов (достижения, обучения, HR, изменения графика,
+покупки) отправляются через одну очередь с приоритетами и общий лимит
+скорости рассылок, поэтому одновременные задачи не упираются в flood
+control по отдельности. Уведомления получают токены лимита раньше рассылок.
+Ответы хендлеров лимит не расходуют: для них остается запас между
+BROADCAST_RATE и лимитом Telegram.
+
+Первое несрочное уведомление пользователю отправляется сразу и открывает
+окно NOTIFICATIONS_DIGEST_WINDOW секунд. Уведомления, пришедшие в течение
+окна, объединяются в одно сообщение (дайджест) и отправляются по его
+окончании. Срочные уведомления отправляются сразу и забирают с собой
+накопленный дайджест получателя.
+
+Уведомления, которые не удалось доставить после всех повторов, попадают в
+список недоставленных (dead-letter) и периодически отправляются повторно.
+По каждой задаче ведется статистика доставки.
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+
+from aiogram import Bot
+from aiogram.types import InlineKeyboardMarkup
+from redis.asyncio import Redis
+
+from tgbot.config import NotificationsConfig
+from tgbot.services.broadcaster import (
+    BULK,
+    TRANSACTIONAL,
+    broadcast_engine,
+)
+
+logger = logging.getLogger(__name__)
+
+DEAD_LETTER_KEY = "notifications:dead"
+
+# Максимальная длина сообщения Telegram и разделитель частей дайджеста
+MESSAGE_LIMIT = 4096
+DIGEST_SEPARATOR = "\n\n━━━━━━━━━━━━\n\n"
+
+
+@dataclass
+class Notification:
+    """
+    Уведомление в очереди
+    """
+
+    bot: Bot
+    chat_id: int
+    text: str
+    job: str
+    priority: int = TRANSACTIONAL
+    disable_notification: bool = False
+    reply_markup: Optional[InlineKeyboardMarkup] = None
+    rounds: int = 0
+    queued_at: float = 0.0
+    future: Optional[asyncio.Future] = None
+    # Уведомления, объединенные в дайджест
+    parts: list["Notification"] = field(default_factory=list)
+
+    def dump(self) -> str:
+        return json.dumps(
+            {
+                "chat_id": self.chat_id,
+                "text": self.text,
+                "job": self.job,
+                "priority": self.priority,
+                "disable_notification": self.disable_notification,
+                "reply_markup": self.reply_markup.model_dump(mode="json")
+                if self.reply_markup
+                else None,
+                "rounds": self.rounds,
+                "failed_at": time.time(),
+            },
+            ensure_ascii=False,
+        )
+
+    @staticmethod
+    def load(bot: Bot, payload: str | bytes) -> "Notification":
+        data = json.loads(payload)
+        return Notification(
+            bot=bot,
+            chat_id=data["chat_id"],
+            text=data["text"],
+            job=data["job"],
+            priority=data["priority"],
+            disable_notification=data["disable_notification"],
+            reply_markup=InlineKeyboardMarkup.model_validate(data["reply_markup"])
+            if data["reply_markup"]
+            else None,
+            rounds=data["rounds"],
+        )
+
+
+@dataclass
+class JobStats:
+    """
+    Статистика доставки уведомлений одной задачи
+    """
+
+    queued: int = 0
+    sent: int = 0
+    failed: int = 0
+    undeliverable: int = 0
+    dead_lettered: int = 0
+    wait_sum: float = 0.0
+
+    @property
+    def avg_wait(self) -> float:
+        processed = self.sent + self.failed + self.undeliverable
+        return self.wait_sum / processed if processed else 0.0
+
+
+class NotificationQueue:
+    """
+    Очередь уведомлений с приоритетами и списком недоставленных
+    """
+
+    def __init__(self, config: Optional[NotificationsConfig] = None):
+        self.configure(
+            config
+            or NotificationsConfig(
+                workers=8,
+                dead_letter_limit=1000,
+                dead_letter_retry_interval=900,
+                dead_letter_max_rounds=3,
+                digest_window=60,
+            )
+        )
+        self.stats: dict[str, JobStats] = defaultdict(JobStats)
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._counter = itertools.count()
+        self._workers: list[asyncio.Task] = []
+        self._dead_letter_task: Optional[asyncio.Task] = None
+        # Открытые окна дайджестов: получатель -> (отложенные уведомления, таймер)
+        self._digests: dict[int, tuple[list[Notification], asyncio.TimerHandle]] = {}
+        self.coalesced = 0
+
+    def configure(self, config: NotificationsConfig, redis: Optional[Redis] = None):
+        """
+        Применяет настройки очереди
+
+        :param config: Настройки очереди уведомлений
+        :param redis: Клиент Redis для общего списка недоставленных уведомлений
+            (None - список хранится в памяти процесса)
+        """
+        self.config = config
+        self.redis = redis
+        self._dead_letters: deque[str] = deque(maxlen=config.dead_letter_limit)
+
+    def start(self, bot: Bot) -> None:
+        """
+        Запускает отправителей и повторную отправку недоставленных уведомлений
+
+        :param bot: Экземпляр бота для повторной отправки
+        """
+        self._ensure_workers()
+        if self._dead_letter_task is None or self._dead_letter_task.done():
+            self._dead_letter_task = asyncio.create_task(self._retry_dead_letters(bot))
+
+    async def stop(self, timeout: float = 10) -> None:
+        """
+        Дожидается отправки поставленных уведомлений и останавливает очередь
+
+        :param timeout: Максимальное время ожидания (сек)
+        """
+        if self._dead_letter_task:
+            self._dead_letter_task.cancel()
+            self._dead_letter_task = None
+
+        # Накопленные дайджесты отправляются, не дожидаясь окна
+        for chat_id in list(self._digests):
+            self._flush_digest(chat_id)
+
+        if self._queue is not None:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(
+                    f"[Уведомления] Не отправлено уведомлений при остановке: "
+                    f"{self._queue.qsize()}"
+                )
+
+        for worker in self._workers:
+            worker.cancel()
+        self._workers = []
+        self._queue = None
+        self.log_stats()
+
+    def _ensure_workers(self) -> None:
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+        if not self._workers:
+            self._workers = [
+                asyncio.create_task(self._worker()) for _ in range(self.config.workers)
+            ]
+
+    def submit(
+        self,
+        bot: Bot,
+        chat_id: int,
+        text: str,
+        *,
+        job: str,
+        priority: int = TRANSACTIONAL,
+        urgent: bool = False,
+        disable_notification: bool = False,
+        reply_markup: Optional[InlineKeyboardMarkup] = None,
+    ) -> asyncio.Future:
+        """
+        Ставит уведомление в очередь
+
+        :param bot: Экземпляр бота
+        :param chat_id: ID получателя
+        :param text: Текст сообщения
+        :param job: Название задачи для статистики (achievements, studies, ...)
+        :param priority: TRANSACTIONAL для уведомлений о событиях, BULK для массовых
+        :param urgent: Отправить сразу, не дожидаясь дайджеста
+        :param disable_notification: Отправить без звука
+        :param reply_markup: Клавиатура сообщения
+        :return: Future с результатом доставки (True - доставлено). Для
+            уведомления, добавленного в дайджест, результат известен после
+            отправки дайджеста
+        """
+        loop = asyncio.get_running_loop()
+        notification = Notification(
+            bot=bot,
+            chat_id=int(chat_id),
+            text=text,
+            job=job,
+            priority=priority,
+            disable_notification=disable_notification,
+            reply_markup=reply_markup,
+            future=loop.create_future(),
+        )
+        self.stats[job].queued += 1
+
+        window = self.config.digest_window
+        if urgent or window <= 0 or priority != TRANSACTIONAL:
+            pending = self._digests.pop(notification.chat_id, None)
+            if pending is None or not pending[0]:
+                if pending is not None:
+                    pending[1].cancel()
+                return self._put(notification)
+            # Накопленный дайджест уходит вместе со срочным уведомлением
+            parts, timer = pending
+            timer.cancel()
+            self._flush(parts + [notification])
+            return notification.future
+
+        pending = self._digests.get(notification.chat_id)
+        if pending is None:
+            # Первое уведомление отправляется сразу и открывает окно дайджеста
+            timer = loop.call_later(window, self._flush_digest, notification.chat_id)
+            self._digests[notification.chat_id] = ([], timer)
+            return self._put(notification)
+
+        pending[0].append(notification)
+        return notification.future
+
+    def _flush_digest(self, chat_id: int) -> None:
+        pending = self._digests.pop(chat_id, None)
+        if pending is not None:
+            parts, timer = pending
+            timer.cancel()
+            if parts:
+                self._flush(parts)
+
+    def _flush(self, parts: list[Notification]) -> None:
+        """
+        Ставит в очередь дайджест из накопленных уведомлений одного получателя
+        """
+        if len(parts) == 1:
+            self._put(parts[0])
+            return
+
+        # Уведомления с разными клавиатурами нельзя объединить в одно сообщение
+        groups: dict[Optional[str], list[Notification]] = {}
+        for part in parts:
+            key = part.reply_markup.model_dump_json() if part.reply_markup else None
+            groups.setdefault(key, []).append(part)
+        if None in groups and len(groups) > 1:
+            plain = groups.pop(None)
+            next(iter(groups.values()))[:0] = plain
+
+        for group in groups.values():
+            chunks: list[list[Notification]] = [[]]
+            length = 0
+            for part in group:
+                added = len(part.text) + len(DIGEST_SEPARATOR)
+                if chunks[-1] and length + added > MESSAGE_LIMIT:
+                    chunks.append([])
+                    length = 0
+                chunks[-1].append(part)
+                length += added
+
+            markup = next((p.reply_markup for p in group if p.reply_markup), None)
+            for index, chunk in enumerate(chunks):
+                if len(chunk) == 1 and not chunk[0].parts:
+                    chunk[0].reply_markup = markup if index == len(chunks) - 1 else None
+                    self._put(chunk[0])
+                    continue
+
+                jobs = {part.job for part in chunk}
+                self.coalesced += len(chunk) - 1
+                self._put(
+                    Notification(
+                        bot=chunk[0].bot,
+                        chat_id=chunk[0].chat_id,
+                        text=DIGEST_SEPARATOR.join(part.text for part in chunk),
+                        job=jobs.pop() if len(jobs) == 1 else "digest",
+                        priority=min(part.priority for part in chunk),
+                        disable_notification=all(
+                            part.disable_notification for part in chunk
+                        ),
+                        reply_markup=markup if index == len(chunks) - 1 else None,
+                        parts=chunk,
+                    )
+                )
+
+    def _put(self, notification: Notification) -> asyncio.Future:
+        self._ensure_workers()
+        notification.queued_at = time.monotonic()
+        if notification.future is None:
+            notification.future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait(
+            (notification.priority, next(self._counter), notification)
+        )
+        return notification.future
+
+    async def _worker(self) -> None:
+        while True:
+            _, _, notification = await self._queue.get()
+            try:
+                delivered = await self._send(notification)
+            except Exception as e:
+                logger.error(
+                    f"[Уведомления] Ошибка отправки {notification.job} "
+                    f"в чат {notification.chat_id}: {e}"
+                )
+                delivered = False
+            finally:
+                self._queue.task_done()
+
+            waited = time.monotonic() - notification.queued_at
+            for part in notification.parts or [notification]:
+                stats = self.stats[part.job]
+                stats.wait_sum += waited
+                if delivered:
+                    stats.sent += 1
+                elif delivered is None:
+                    stats.undeliverable += 1
+                else:
+                    stats.failed += 1
+                    stats.dead_lettered += 1
+                if part.future is not None and not part.future.done():
+                    part.future.set_result(bool(delivered))
+
+            if delivered is False:
+                await self._dead_letter(notification)
+            if not notification.future.done():
+                notification.future.set_result(bool(delivered))
+
+    async def _send(self, notification: Notification) -> Optional[bool]:
+        async def send(chat_id: int):
+            await notification.bot.send_message(
+                chat_id,
+                notification.text,
+                disable_notification=notification.disable_notification,
+                reply_markup=notification.reply_markup,
+            )
+
+        return await broadcast_engine.deliver(
+            notification.chat_id, send, notification.priority
+        )
+
+    async def _dead_letter(self, notification: Notification) -> None:
+        payload = notification.dump()
+        if self.redis is None:
+            self._dead_letters.append(payload)
+            return
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.lpush(DEAD_LETTER_KEY, payload)
+                pipe.ltrim(DEAD_LETTER_KEY, 0, self.config.dead_letter_limit - 1)
+                await pipe.execute()
+        except Exception as e:
+            logger.error(
+                f"[Уведомления] Не удалось сохранить недоставленное уведомление: {e}"
+            )
+
+    async def requeue_dead_letters(self, bot: Bot, limit: int = 100) -> int:
+        """
+        Повторно ставит в очередь недоставленные уведомления
+
+        Уведомления, исчерпавшие NOTIFICATIONS_DEAD_LETTER_MAX_ROUNDS попыток,
+        остаются в списке для ручного разбора.
+
+        :param bot: Экземпляр бота
+        :param limit: Максимальное количество уведомлений за раз
+        :return: Количество поставленных в очередь уведомлений
+        """
+        payloads = []
+        if self.redis is not None:
+            payloads = await self.redis.rpop(DEAD_LETTER_KEY, limit) or []
+        else:
+            while self._dead_letters and len(payloads) < limit:
+                payloads.append(self._dead_letters.popleft())
+
+        requeued = 0
+        kept = []
+        for payload in payloads:
+            notification = Notification.load(bot, payload)
+            if notification.rounds >= self.config.dead_letter_max_rounds:
+                kept.append(payload)
+                continue
+            notification.rounds += 1
+            notification.priority = BULK
+            self.stats[notification.job].queued += 1
+            self._put(notification)
+            requeued += 1
+
+        if kept:
+            if self.redis is not None:
+                await self.redis.rpush(DEAD_LETTER_KEY, *kept)
+            else:
+                self._dead_letters.extend(kept)
+
+        if requeued:
+            logger.info(
+                f"[Уведомления] Повторно поставлено в очередь недоставленных: {requeued}"
+            )
+        return requeued
+
+    async def _retry_dead_letters(self, bot: Bot) -> None:
+        while True:
+            await asyncio.sleep(self.config.dead_letter_retry_interval)
+            try:
+                await self.requeue_dead_letters(bot)
+            except Exception as e:
+                logger.error(
+                    f"[Уведомления] Ошибка повторной отправки недоставленных: {e}"
+                )
+            self.log_stats()
+
+    def log_stats(self) -> None:
+        """
+        Выводит в лог статистику доставки по задачам
+        """
+        for job, stats in self.stats.items():
+            logger.info(
+                f"[Уведомления] {job}: в очереди {stats.queued}, доставлено {stats.sent}, "
+                f"ошибок {stats.failed}, недоступно {stats.undeliverable}, "
+                f"недоставлено {stats.dead_lettered}, ожидание {stats.avg_wait:.2f}с"
+            )
+
+    def render_prometheus(self) -> str:
+        """
+        Формирует статистику доставки в текстовом формате Prometheus
+        """
+        lines = [
+            "# HELP stpsher_notifications_total Outbound notifications by job and outcome",
+            "# TYPE stpsher_notifications_total counter",
+        ]
+        for job, stats in self.stats.items():
+            for outcome in (
+                "queued",
+                "sent",
+                "failed",
+                "undeliverable",
+                "dead_lettered",
+            ):
+                lines.append(
+                    f'stpsher_notifications_total{{job="{job}",outcome="{outcome}"}} '
+                    f"{getattr(stats, outcome)}"
+                )
+        lines.append(
+            "# HELP stpsher_notifications_coalesced_total Notifications merged into digests"
+        )
+        lines.append("# TYPE stpsher_notifications_coalesced_total counter")
+        lines.append(f"stpsher_notifications_coalesced_total {self.coalesced}")
+        return "\n".join(lines) + "\n"
+
+
+notification_queue = NotificationQueue()
+
+
+async def notify(
+    bot: Bot,
+    chat_id: int | str,
+    text: str,
+    *,
+    job: str,
+    priority: int = TRANSACTIONAL,
+    urgent: bool = False,
+    disable_notification: bool = False,
+    reply_markup: Optional[InlineKeyboardMarkup] = None,
+) -> bool:
+    """
+    Отправляет уведомление через общую очередь
+
+    :param bot: Экземпляр бота
+    :param chat_id: ID получателя
+    :param text: Текст сообщения
+    :param job: Название задачи для статистики
+    :param priority: Приоритет в очереди
+    :param urgent: Отправить сразу, не дожидаясь дайджеста
+    :param disable_notification: Отправить без звука
+    :param reply_markup: Клавиатура сообщения
+    :return: True, если сообщение доставлено. Уведомление, объединенное
+        в дайджест, ожидает окончания окна дайджеста
+    """
+    return await notification_queue.submit(
+        bot,
+        chat_id,
+        text,
+        job=job,
+        priority=priority,
+        urgent=urgent,
+        disable_notification=disable_notification,
+        reply_markup=reply_markup,
+    )
+
+
+async def notify_many(
+    bot: Bot,
+    chat_ids: Iterable[int | str],
+    text: str,
+    *,
+    job: str,
+    priority: int = TRANSACTIONAL,
+    urgent: bool = False,
+    disable_notification: bool = False,
+    reply_markup: Optional[InlineKeyboardMarkup] = None,
+) -> int:
+    """
+    Отправляет одно уведомление нескольким получателям через общую очередь
+
+    :return: Количество доставленных сообщений
+    """
+    futures = [
+        notification_queue.submit(
+            bot,
+            chat_id,
+            text,
+            job=job,
+            priority=priority,
+            urgent=urgent,
+            disable_notification=disable_notification,
+            reply_markup=reply_markup,
+        )
+        for chat_id in chat_ids
+    ]
+    return sum(await asyncio.gather(*futures))
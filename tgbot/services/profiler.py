@@ -0,0 +1,260 @@
+"""
+Профилировщик медленных апдейтов
+
+Фоновый поток с заданным интервалом снимает стек потока event loop и
+приписывает снимок апдейту, задача которого выполняется в этот момент.
+Стеки потоков пула тяжелых операций (run_heavy) приписываются апдейтам,
+которые ожидают их результата.
+Стоимость сэмплирования не зависит от количества апдейтов, поэтому
+стеки собираются для всех апдейтов, а дамп записывается только для
+медленных апдейтов и случайной доли остальных.
+"""
+
+import asyncio
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from tgbot.services.concurrency import heavy_calls
+from tgbot.services.metrics import UpdateStats
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = str(Path(__file__).resolve().parents[2])
+
+ASYNCIO_EVENTS_FILE = os.path.join("asyncio", "events.py")
+EXECUTOR_THREAD_FILE = os.path.join("concurrent", "futures", "thread.py")
+
+StackFrame = tuple[str, str, int]
+
+
+@dataclass
+class ProfileSession:
+    """
+    Данные профилирования одного апдейта
+    """
+
+    stats: UpdateStats
+    event_type: str
+    callback_data: Optional[str] = None
+    sampled: bool = False
+    stacks: Counter = field(default_factory=Counter)
+
+    def add_stack(self, stack: tuple[StackFrame, ...]) -> None:
+        self.stacks[stack] += 1
+
+
+class StackSampler(threading.Thread):
+    """
+    Поток сэмплирования стека event loop
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, interval: float):
+        super().__init__(name="update-profiler", daemon=True)
+        self.loop = loop
+        self.interval = interval
+        self.loop_thread_id = threading.get_ident()
+        self.sessions: dict[asyncio.Task, ProfileSession] = {}
+        self._stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            if not self.sessions:
+                continue
+
+            frames = sys._current_frames()
+            try:
+                task = asyncio.current_task(self.loop)
+            except RuntimeError:
+                task = None
+            self._sample(task, frames.get(self.loop_thread_id), ASYNCIO_EVENTS_FILE)
+
+            # Потоки пула, результата которых ожидают апдейты
+            for thread_id, heavy_task in heavy_calls.copy().items():
+                self._sample(heavy_task, frames.get(thread_id), EXECUTOR_THREAD_FILE)
+
+    def _sample(self, task: Optional[asyncio.Task], frame, root_file: str) -> None:
+        session = self.sessions.get(task)
+        if session is None or frame is None:
+            return
+        stack = self._extract_stack(frame, root_file)
+        if stack:
+            session.add_stack(stack)
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    @staticmethod
+    def _extract_stack(
+        frame, root_file: str = ASYNCIO_EVENTS_FILE
+    ) -> tuple[StackFrame, ...]:
+        """
+        Преобразует стек в кортеж кадров, начиная с корутины задачи или
+        функции в потоке пула (кадры event loop и пула отбрасываются)
+
+        :param root_file: Файл первого отбрасываемого кадра
+        """
+        frames = []
+        while frame is not None:
+            code = frame.f_code
+            if code.co_filename.endswith(root_file):
+                break
+            frames.append((code.co_filename, code.co_name, frame.f_lineno))
+            frame = frame.f_back
+        frames.reverse()
+        return tuple(frames)
+
+
+class UpdateProfiler:
+    """
+    Профилировщик апдейтов с записью дампов в ротируемую директорию
+    """
+
+    def __init__(
+        self,
+        sample_rate: float,
+        slow_threshold: float,
+        interval: float,
+        directory: str,
+        max_files: int,
+    ):
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+        self.interval = interval
+        self.directory = Path(directory)
+        self.max_files = max_files
+        self._sampler: Optional[StackSampler] = None
+
+    def start(self) -> None:
+        """
+        Запускает поток сэмплирования. Должен вызываться из event loop
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._sampler = StackSampler(asyncio.get_running_loop(), self.interval)
+        self._sampler.start()
+        logger.info(
+            f"[Профилирование] Запущено: доля {self.sample_rate}, порог {self.slow_threshold}с, директория {self.directory}"
+        )
+
+    def stop(self) -> None:
+        if self._sampler:
+            self._sampler.stop()
+            self._sampler = None
+
+    def begin(
+        self, stats: UpdateStats, event_type: str, callback_data: Optional[str]
+    ) -> Optional[ProfileSession]:
+        """
+        Начинает профилирование апдейта в текущей задаче
+        """
+        task = asyncio.current_task()
+        if self._sampler is None or task is None:
+            return None
+
+        stats.sql_timeline = []
+        session = ProfileSession(
+            stats=stats,
+            event_type=event_type,
+            callback_data=callback_data,
+            sampled=random.random() < self.sample_rate,
+        )
+        self._sampler.sessions[task] = session
+        return session
+
+    async def finish(self, session: ProfileSession) -> None:
+        """
+        Завершает профилирование и записывает дамп, если апдейт медленный
+        или попал в выборку
+        """
+        if self._sampler is not None:
+            self._sampler.sessions.pop(asyncio.current_task(), None)
+
+        duration = time.perf_counter() - session.stats.started_at
+        is_slow = duration >= self.slow_threshold
+        if not is_slow and not session.sampled:
+            return
+
+        try:
+            await asyncio.to_thread(self._write_dump, session, duration, is_slow)
+        except Exception as e:
+            logger.error(f"[Профилирование] Ошибка записи профиля: {e}")
+
+    def _write_dump(
+        self, session: ProfileSession, duration: float, is_slow: bool
+    ) -> None:
+        stats = session.stats
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        filename = f"{timestamp}_{stats.handler}_{int(duration * 1000)}ms.txt"
+        path = self.directory / filename
+
+        lines = [
+            f"Обработчик: {stats.router}.{stats.handler}",
+            f"Событие: {session.event_type}",
+            f"Callback data: {session.callback_data or '-'}",
+            f"Причина: {'медленный апдейт' if is_slow else 'выборка'}",
+            f"Длительность: {duration:.3f}с",
+            f"SQL запросов: {stats.sql_count}, время БД: {stats.sql_time:.3f}с",
+            f"Вызовов Telegram API: {stats.api_calls}",
+            f"Снимков стека: {sum(session.stacks.values())} (интервал {self.interval * 1000:.0f}мс)",
+            "",
+            "=== SQL ===",
+        ]
+
+        for offset, elapsed, statement in stats.sql_timeline or []:
+            lines.append(
+                f"+{offset * 1000:8.1f}мс {elapsed * 1000:8.1f}мс  {statement[:500]}"
+            )
+
+        lines.extend(["", "=== Дерево вызовов (CPU) ==="])
+        lines.extend(self._render_call_tree(session.stacks))
+
+        path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+        self._rotate()
+
+    @staticmethod
+    def _render_call_tree(stacks: Counter) -> list[str]:
+        """
+        Строит дерево вызовов из снимков стека
+        """
+        total = sum(stacks.values())
+        if not total:
+            return ["<нет снимков>"]
+
+        tree: dict = {}
+        for stack, count in stacks.items():
+            node = tree
+            for frame in stack:
+                entry = node.setdefault(frame[:2], [0, {}])
+                entry[0] += count
+                node = entry[1]
+
+        lines = []
+
+        def walk(node: dict, depth: int) -> None:
+            for (filename, func_name), (count, children) in sorted(
+                node.items(), key=lambda item: item[1][0], reverse=True
+            ):
+                relative = os.path.relpath(filename, PROJECT_ROOT)
+                lines.append(
+                    f"{'  ' * depth}{count / total:6.1%} {func_name} ({relative})"
+                )
+                walk(children, depth + 1)
+
+        walk(tree, 0)
+        return lines
+
+    def _rotate(self) -> None:
+        """
+        Удаляет самые старые профили сверх лимита
+        """
+        profiles = sorted(self.directory.glob("*.txt"), key=os.path.getmtime)
+        for old_profile in profiles[: max(0, len(profiles) - self.max_files)]:
+            old_profile.unlink(missing_ok=True)
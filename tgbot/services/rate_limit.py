@@ -0,0 +1,239 @@
+"""
+Ограничение частоты игр в казино
+
+Каждая игра берет по токену из двух корзин: пользователя в чате и всего
+чата. Корзины хранятся в памяти процесса, а при нескольких процессах -
+в Redis (общий уровень), с откатом на память при ошибках Redis.
+Пресет лимитов выбирается администратором в настройках группы рядом
+с переключателем казино.
+
+Проверка не обращается к БД и выполняется в CasinoRateLimitMiddleware
+до middleware с обращениями к БД, поэтому частые команды отбрасываются
+до открытия сессий, проверки пользователя, баланса, кубика и транзакции.
+"""
+
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from redis.asyncio import Redis
+
+from tgbot.config import CasinoConfig
+
+logger = logging.getLogger(__name__)
+
+USER_BUCKET_KEY = "casino:bucket:{chat_id}:{user_id}"
+CHAT_BUCKET_KEY = "casino:bucket:{chat_id}"
+GROUP_LIMITS_KEY = "casino:group_limits"
+
+# Количество корзин в памяти, старые вытесняются
+MAX_LOCAL_BUCKETS = 10000
+
+# Берет по токену из каждой корзины, только если токены есть во всех.
+# ARGV: пары (скорость в токенах/сек, емкость) для каждой корзины
+TAKE_SCRIPT = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local tokens = {}
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[2 * i - 1])
+    local burst = tonumber(ARGV[2 * i])
+    local state = redis.call('HMGET', key, 'tokens', 'updated')
+    local available = tonumber(state[1]) or burst
+    local updated = tonumber(state[2]) or now
+    available = math.min(burst, available + (now - updated) * rate)
+    if available < 1 then
+        return 0
+    end
+    tokens[i] = available
+end
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[2 * i - 1])
+    local burst = tonumber(ARGV[2 * i])
+    redis.call('HSET', key, 'tokens', tokens[i] - 1, 'updated', now)
+    redis.call('PEXPIRE', key, math.ceil(burst / rate * 1000))
+end
+return 1
+"""
+
+
+@dataclass(frozen=True)
+class CasinoLimit:
+    """
+    Пресет лимитов казино
+
+    :param title: Название для настроек группы
+    :param user_per_minute: Игр в минуту для одного пользователя
+    :param user_burst: Игр подряд для одного пользователя
+    :param chat_per_minute: Игр в минуту во всем чате
+    :param chat_burst: Игр подряд во всем чате
+    """
+
+    title: str
+    user_per_minute: float
+    user_burst: int
+    chat_per_minute: float
+    chat_burst: int
+
+
+CASINO_LIMITS = {
+    "strict": CasinoLimit("Строгий", 2, 2, 10, 5),
+    "normal": CasinoLimit("Обычный", 5, 3, 30, 10),
+    "relaxed": CasinoLimit("Свободный", 12, 5, 60, 20),
+}
+
+
+class TokenBuckets:
+    """
+    Token bucket в памяти процесса с ограниченным количеством корзин
+    """
+
+    def __init__(self, max_buckets: int = MAX_LOCAL_BUCKETS):
+        self.max_buckets = max_buckets
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    def take(self, buckets: list[tuple[str, float, int]]) -> bool:
+        """
+        Берет по токену из каждой корзины, если токены есть во всех
+
+        :param buckets: Тройки (ключ, скорость в токенах/сек, емкость)
+        """
+        now = time.monotonic()
+        tokens = []
+        for key, rate, burst in buckets:
+            available, updated = self._buckets.get(key, (burst, now))
+            available = min(burst, available + (now - updated) * rate)
+            if available < 1:
+                return False
+            tokens.append(available)
+
+        for (key, _, _), available in zip(buckets, tokens):
+            self._buckets[key] = (available - 1, now)
+            self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_buckets:
+            self._buckets.popitem(last=False)
+        return True
+
+
+class CasinoRateLimiter:
+    """
+    Лимиты частоты игр в казино по пользователю и чату
+    """
+
+    def __init__(self):
+        self.default_limit = "normal"
+        self.redis: Optional[Redis] = None
+        self._local = TokenBuckets()
+        # Пресеты групп без Redis
+        self._group_limits: dict[int, str] = {}
+        self._take = None
+
+    def configure(self, config: CasinoConfig, redis: Optional[Redis] = None) -> None:
+        """
+        Настройка лимитов
+
+        :param config: Настройки казино
+        :param redis: Клиент Redis для общих корзин и пресетов групп
+        """
+        self.default_limit = (
+            config.default_limit if config.default_limit in CASINO_LIMITS else "normal"
+        )
+        self.redis = redis
+        self._take = (
+            redis.register_script(TAKE_SCRIPT)
+            if redis is not None and config.shared_limits
+            else None
+        )
+
+    async def get_limit(self, chat_id: int) -> str:
+        """
+        Пресет лимитов группы
+
+        :param chat_id: ID группы
+        :return: Ключ пресета из CASINO_LIMITS
+        """
+        limit = None
+        if self.redis is not None:
+            try:
+                limit = await self.redis.hget(GROUP_LIMITS_KEY, str(chat_id))
+            except Exception as e:
+                logger.error(f"[Казино] Ошибка чтения лимита группы {chat_id}: {e}")
+            if isinstance(limit, bytes):
+                limit = limit.decode()
+        else:
+            limit = self._group_limits.get(chat_id)
+        return limit if limit in CASINO_LIMITS else self.default_limit
+
+    async def get_limit_title(self, chat_id: int) -> str:
+        """Название пресета лимитов группы для настроек"""
+        return CASINO_LIMITS[await self.get_limit(chat_id)].title
+
+    async def set_limit(self, chat_id: int, limit: str) -> None:
+        """
+        Сохранение пресета лимитов группы
+
+        :param chat_id: ID группы
+        :param limit: Ключ пресета из CASINO_LIMITS
+        """
+        if self.redis is None:
+            self._group_limits[chat_id] = limit
+            return
+        await self.redis.hset(GROUP_LIMITS_KEY, str(chat_id), limit)
+
+    async def next_limit(self, chat_id: int) -> str:
+        """
+        Переключает пресет группы на следующий по кругу
+
+        :param chat_id: ID группы
+        :return: Новый пресет
+        """
+        presets = list(CASINO_LIMITS)
+        current = await self.get_limit(chat_id)
+        limit = presets[(presets.index(current) + 1) % len(presets)]
+        await self.set_limit(chat_id, limit)
+        return limit
+
+    async def allow(self, chat_id: int, user_id: int) -> bool:
+        """
+        Можно ли сыграть сейчас. Учитывает игру, если можно
+
+        :param chat_id: ID чата
+        :param user_id: Telegram ID игрока
+        """
+        limit = CASINO_LIMITS[
+            await self.get_limit(chat_id) if chat_id != user_id else self.default_limit
+        ]
+        buckets = [
+            (
+                USER_BUCKET_KEY.format(chat_id=chat_id, user_id=user_id),
+                limit.user_per_minute / 60,
+                limit.user_burst,
+            )
+        ]
+        # В личных сообщениях корзина чата совпадает с корзиной пользователя
+        if chat_id != user_id:
+            buckets.append(
+                (
+                    CHAT_BUCKET_KEY.format(chat_id=chat_id),
+                    limit.chat_per_minute / 60,
+                    limit.chat_burst,
+                )
+            )
+
+        if self._take is not None:
+            try:
+                args = []
+                for _, rate, burst in buckets:
+                    args += [rate, burst]
+                return bool(
+                    await self._take(keys=[key for key, _, _ in buckets], args=args)
+                )
+            except Exception as e:
+                logger.error(f"[Казино] Ошибка проверки лимита в Redis: {e}")
+
+        return self._local.take(buckets)
+
+
+casino_limiter = CasinoRateLimiter()
@@ -0,0 +1,122 @@
+"""
+Выбор получателей рассылок на стороне БД
+
+Получатели описываются компактным запросом (все / подразделение /
+руководители / группы руководителей), который хранится в состоянии FSM
+вместо списка ID. Количество получателей и их ID получаются одним
+SQL запросом каждый.
+"""
+
+from dataclasses import asdict, dataclass, field
+from typing import AsyncIterator
+
+from sqlalchemy import Select, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from stp_database import Employee
+
+# Виды запросов получателей
+EVERYONE = "everyone"
+DIVISION = "division"
+HEADS = "heads"
+GROUPS = "groups"
+
+HEAD_ROLE = 2
+
+# Размер пачки строк при потоковом чтении ID
+STREAM_BATCH = 1000
+
+
+@dataclass
+class RecipientQuery:
+    """
+    Описание получателей рассылки
+
+    :param kind: Вид запроса: EVERYONE, DIVISION, HEADS или GROUPS
+    :param division: Подразделение для DIVISION (НТП1, НТП2, НЦК)
+    :param heads: ФИО руководителей, чьим группам отправляется рассылка (GROUPS)
+    """
+
+    kind: str
+    division: str | None = None
+    heads: list[str] = field(default_factory=list)
+
+    @staticmethod
+    def everyone() -> "RecipientQuery":
+        return RecipientQuery(EVERYONE)
+
+    @staticmethod
+    def for_division(division: str) -> "RecipientQuery":
+        return RecipientQuery(DIVISION, division=division)
+
+    @staticmethod
+    def all_heads() -> "RecipientQuery":
+        return RecipientQuery(HEADS)
+
+    @staticmethod
+    def for_groups(heads: list[str]) -> "RecipientQuery":
+        return RecipientQuery(GROUPS, heads=list(heads))
+
+    def dump(self) -> dict:
+        """Представление для хранения в состоянии FSM"""
+        return asdict(self)
+
+    @staticmethod
+    def load(data: dict) -> "RecipientQuery":
+        return RecipientQuery(**data)
+
+    def _where(self, query: Select) -> Select:
+        query = query.where(Employee.user_id.is_not(None))
+        if self.kind == DIVISION:
+            return query.where(Employee.division == self.division)
+        if self.kind == HEADS:
+            return query.where(Employee.role == HEAD_ROLE)
+        if self.kind == GROUPS:
+            return query.where(Employee.head.in_(self.heads))
+        return query
+
+    async def count(self, session: AsyncSession) -> int:
+        """
+        Количество получателей
+
+        :param session: Сессия основной БД
+        """
+        result = await session.execute(
+            self._where(select(func.count(func.distinct(Employee.user_id))))
+        )
+        return result.scalar_one()
+
+    async def stream_user_ids(self, session: AsyncSession) -> AsyncIterator[int]:
+        """
+        Telegram ID получателей, читаемые из БД пачками
+
+        :param session: Сессия основной БД
+        """
+        query = self._where(select(Employee.user_id).distinct()).execution_options(
+            yield_per=STREAM_BATCH
+        )
+        result = await session.stream_scalars(query)
+        async for user_id in result:
+            yield user_id
+
+    async def user_ids(self, session: AsyncSession) -> list[int]:
+        """
+        Список Telegram ID получателей
+
+        :param session: Сессия основной БД
+        """
+        return [user_id async for user_id in self.stream_user_ids(session)]
+
+
+async def get_heads(session: AsyncSession) -> list[tuple[str, int]]:
+    """
+    Руководители для выбора групп рассылки, отсортированные по ФИО
+
+    :param session: Сессия основной БД
+    :return: Пары (ФИО, Telegram ID)
+    """
+    result = await session.execute(
+        select(Employee.fullname, Employee.user_id)
+        .where(Employee.role == HEAD_ROLE)
+        .order_by(Employee.fullname)
+    )
+    return [(fullname, user_id) for fullname, user_id in result.all()]
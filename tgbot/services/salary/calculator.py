@@ -7,6 +7,7 @@ from stp_database import Employee
 
 from infrastructure.api.production_calendar import production_calendar
 from tgbot.misc.dicts import russian_months
+from tgbot.services.concurrency import run_heavy
 from tgbot.services.schedule import ScheduleParser
 
 from .pay_rates import PayRateService
@@ -220,10 +221,11 @@ class SalaryCalculator:
         # Get schedule data
         schedule_parser = ScheduleParser()
         try:
-            schedule_data, additional_shifts_data = (
-                schedule_parser.get_user_schedule_with_additional_shifts(
-                    user.fullname, current_month_name, user.division
-                )
+            schedule_data, additional_shifts_data = await run_heavy(
+                schedule_parser.get_user_schedule_with_additional_shifts,
+                user.fullname,
+                current_month_name,
+                user.division,
             )
         except Exception as e:
             raise Exception(f"Произошла ошибка при расчете: {e}")
@@ -1,13 +1,17 @@
+from __future__ import annotations
+
 import logging
 import re
 from pathlib import Path
 from typing import Any, Dict, List, Optional
 
-import pandas as pd
 from stp_database import Employee, MainRequestsRepo
 
 from tgbot.keyboards.user.schedule.main import changed_schedule_kb
-from tgbot.services.broadcaster import send_message
+from tgbot.misc.lazy import lazy_import
+from tgbot.services.notifications import notify
+
+pd = lazy_import("pandas")
 
 logger = logging.getLogger(__name__)
 
@@ -136,7 +140,7 @@ class ScheduleChangeDetector:
             # Читаем файл один раз
             df = pd.read_excel(file_path, sheet_name=0, header=None, dtype=str)
             logger.debug(
-                f"[График] Прочитан Excel файл {file_path}, размер: {df.shape}"
+                "[График] Прочитан Excel файл %s, размер: %s", file_path, df.shape
             )
 
             # Находим все месяцы и их диапазоны колонок
@@ -167,7 +171,10 @@ class ScheduleChangeDetector:
                     )
 
                     logger.debug(
-                        f"[График] {fullname} - {month}: найдено {len(day_headers)} дней"
+                        "[График] %s - %s: найдено %s дней",
+                        fullname,
+                        month,
+                        len(day_headers),
                     )
 
                     # Извлекаем значения расписания для этого месяца
@@ -191,14 +198,16 @@ class ScheduleChangeDetector:
                 # ОТЛАДОЧНАЯ ИНФОРМАЦИЯ для первых нескольких пользователей
                 if len(schedules) <= 3:
                     logger.debug(
-                        f"[График] График для {fullname}: {len(user_complete_schedule)} записей"
+                        "[График] График для %s: %s записей",
+                        fullname,
+                        len(user_complete_schedule),
                     )
                     sample_keys = list(user_complete_schedule.keys())[
                         :5
                     ]  # Показываем первые 5 ключей
                     for key in sample_keys:
                         logger.debug(
-                            f"[График]   {key}: '{user_complete_schedule[key]}'"
+                            "[График]   %s: '%s'", key, user_complete_schedule[key]
                         )
 
             logger.info(
@@ -317,7 +326,11 @@ class ScheduleChangeDetector:
                     if 1 <= int(day_num) <= 31:
                         day_headers[col_idx] = f"{day_num}({day_abbr})"
                         logger.debug(
-                            f"[График] Найден день: колонка {col_idx} = '{day_num}({day_abbr})' из '{cell_value}'"
+                            "[График] Найден день: колонка %s = '%s(%s)' из '%s'",
+                            col_idx,
+                            day_num,
+                            day_abbr,
+                            cell_value,
                         )
                         continue
 
@@ -331,7 +344,11 @@ class ScheduleChangeDetector:
                     if 1 <= int(day_num) <= 31:
                         day_headers[col_idx] = f"{day_num}.{month_num}"
                         logger.debug(
-                            f"[График] Найден день: колонка {col_idx} = '{day_num}.{month_num}' из '{cell_value}'"
+                            "[График] Найден день: колонка %s = '%s.%s' из '%s'",
+                            col_idx,
+                            day_num,
+                            month_num,
+                            cell_value,
                         )
                         continue
 
@@ -339,7 +356,9 @@ class ScheduleChangeDetector:
                 if cell_value.strip().isdigit() and 1 <= int(cell_value.strip()) <= 31:
                     day_headers[col_idx] = cell_value.strip()
                     logger.debug(
-                        f"[График] Найден день: колонка {col_idx} = '{cell_value.strip()}' (простое число)"
+                        "[График] Найден день: колонка %s = '%s' (простое число)",
+                        col_idx,
+                        cell_value.strip(),
                     )
                     continue
 
@@ -351,11 +370,17 @@ class ScheduleChangeDetector:
                     if bracket_match and 1 <= int(bracket_match.group(1)) <= 31:
                         day_headers[col_idx] = cell_value.strip()
                         logger.debug(
-                            f"[График] Найден день: колонка {col_idx} = '{cell_value.strip()}' (со скобками)"
+                            "[График] Найден день: колонка %s = '%s' (со скобками)",
+                            col_idx,
+                            cell_value.strip(),
                         )
 
         logger.debug(
-            f"[График] Найдено {len(day_headers)} дней в диапазоне колонок {start_col}-{end_col}: {list(day_headers.values())}"
+            "[График] Найдено %s дней в диапазоне колонок %s-%s: %s",
+            len(day_headers),
+            start_col,
+            end_col,
+            list(day_headers.values()),
         )
         return day_headers
 
@@ -418,8 +443,11 @@ class ScheduleChangeDetector:
             # ОТЛАДКА: Добавляем детализированный лог изменений
             for change in changes:
                 logger.debug(
-                    f"[График] Изменение для {fullname} - {change['day']}: "
-                    f"'{change['old_value']}' -> '{change['new_value']}'"
+                    "[График] Изменение для %s - %s: '%s' -> '%s'",
+                    fullname,
+                    change["day"],
+                    change["old_value"],
+                    change["new_value"],
                 )
             return {"fullname": fullname, "changes": changes}
 
@@ -505,11 +533,11 @@ class ScheduleChangeDetector:
                 message += f"{formatted_day} {old_val} → {new_val}\n"
 
             # Send notification
-            success = await send_message(
-                bot=bot,
-                user_id=user_id,
-                text=message,
-                disable_notification=False,
+            success = await notify(
+                bot,
+                user_id,
+                message,
+                job="schedule_changes",
                 reply_markup=changed_schedule_kb(),
             )
 
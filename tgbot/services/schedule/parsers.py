@@ -2,6 +2,8 @@
 Optimized and refactored schedule parsers with common utilities.
 """
 
+from __future__ import annotations
+
 import calendar
 import logging
 import re
@@ -9,20 +11,25 @@ from abc import ABC, abstractmethod
 from collections import defaultdict
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 
-import pandas as pd
-from openpyxl import load_workbook
-from pandas import DataFrame
 from stp_database import Employee, MainRequestsRepo
 
 from ...keyboards.user.schedule.main import get_yekaterinburg_date
+from ...misc.lazy import lazy_import
+from ..concurrency import run_heavy
 from . import DutyInfo, HeadInfo
 from .analyzers import ScheduleAnalyzer
 from .formatters import ScheduleFormatter
 from .managers import MonthManager, ScheduleFileManager
 from .models import GroupMemberInfo
 
+if TYPE_CHECKING:
+    from pandas import DataFrame
+
+pd = lazy_import("pandas")
+openpyxl = lazy_import("openpyxl")
+
 logger = logging.getLogger(__name__)
 
 
@@ -181,7 +188,9 @@ class DateColumnFinder:
         }
 
         target_month_name = month_names[target_month]
-        logger.debug(f"Searching for day {target_day} in month '{target_month_name}'")
+        logger.debug(
+            "Searching for day %s in month '%s'", target_day, target_month_name
+        )
 
         # Step 1: Find the month section
         month_start_col = None
@@ -194,7 +203,9 @@ class DateColumnFinder:
                 if target_month_name in cell_value.upper():
                     month_start_col = col_idx
                     logger.debug(
-                        f"Found month '{target_month_name}' starting at column {col_idx}"
+                        "Found month '%s' starting at column %s",
+                        target_month_name,
+                        col_idx,
                     )
                     break
             if month_start_col is not None:
@@ -219,7 +230,9 @@ class DateColumnFinder:
                     if next_month_name in cell_value.upper():
                         month_end_col = col_idx - 1
                         logger.debug(
-                            f"Month section ends at column {month_end_col} (before {next_month_name})"
+                            "Month section ends at column %s (before %s)",
+                            month_end_col,
+                            next_month_name,
                         )
                         break
                 if month_end_col < len(df.columns) - 1:
@@ -228,7 +241,10 @@ class DateColumnFinder:
                 break
 
         logger.debug(
-            f"Searching for day {target_day} in columns {month_start_col} to {month_end_col}"
+            "Searching for day %s in columns %s to %s",
+            target_day,
+            month_start_col,
+            month_end_col,
         )
 
         # Step 3: Look for the target day within this month's section
@@ -247,14 +263,23 @@ class DateColumnFinder:
 
                 if match and int(match.group(1)) == target_day:
                     logger.debug(
-                        f"Found day {target_day} at row {row_idx}, col {col_idx} in {target_month_name}: '{cell_value}'"
+                        "Found day %s at row %s, col %s in %s: '%s'",
+                        target_day,
+                        row_idx,
+                        col_idx,
+                        target_month_name,
+                        cell_value,
                     )
                     return col_idx
 
                 # Also check for simple day number
                 if cell_value == str(target_day):
                     logger.debug(
-                        f"Found simple day {target_day} at row {row_idx}, col {col_idx} in {target_month_name}"
+                        "Found simple day %s at row %s, col %s in %s",
+                        target_day,
+                        row_idx,
+                        col_idx,
+                        target_month_name,
                     )
                     return col_idx
 
@@ -280,7 +305,9 @@ class DateColumnFinder:
                 match = re.search(day_pattern, cell_value.strip())
 
                 if match and int(match.group(1)) == target_day:
-                    logger.debug(f"Fallback: Found date column {target_day}: {col_idx}")
+                    logger.debug(
+                        "Fallback: Found date column %s: %s", target_day, col_idx
+                    )
                     return col_idx
 
         return None
@@ -302,10 +329,10 @@ class BaseExcelParser(ABC):
         """Read Excel file and return DataFrame."""
         try:
             df = pd.read_excel(file_path, sheet_name=sheet_name, header=None)
-            logger.debug(f"Successfully read sheet: {sheet_name}")
+            logger.debug("Successfully read sheet: %s", sheet_name)
             return df
         except Exception as e:
-            logger.debug(f"Failed to read sheet '{sheet_name}': {e}")
+            logger.debug("Failed to read sheet '%s': %s", sheet_name, e)
             return None
 
     def find_user_row(
@@ -317,7 +344,7 @@ class BaseExcelParser(ABC):
                 cell_value = self.utils.get_cell_value(df, row_idx, col_idx)
 
                 if fullname in cell_value:
-                    logger.debug(f"User '{fullname}' found in row {row_idx}")
+                    logger.debug("User '%s' found in row %s", fullname, row_idx)
                     return row_idx
 
         return None
@@ -367,7 +394,9 @@ class MonthlyScheduleParser(BaseExcelParser, ABC):
                     end_column = next_month_col - 1
                     break
 
-        logger.debug(f"Month '{month}' found in columns {start_column}-{end_column}")
+        logger.debug(
+            "Month '%s' found in columns %s-%s", month, start_column, end_column
+        )
         return start_column, end_column
 
     def find_day_headers(
@@ -393,7 +422,7 @@ class MonthlyScheduleParser(BaseExcelParser, ABC):
                 ):
                     day_headers[col_idx] = cell_value.strip()
 
-        logger.debug(f"Found {len(day_headers)} days in headers")
+        logger.debug("Found %s days in headers", len(day_headers))
         return day_headers
 
 
@@ -455,7 +484,7 @@ class ScheduleParser(MonthlyScheduleParser):
                 raise FileNotFoundError(f"Файл графика для {division} не найден")
 
             # Load with openpyxl to access cell formatting
-            wb = load_workbook(schedule_file, data_only=False)
+            wb = openpyxl.load_workbook(schedule_file, data_only=False)
             ws = wb["ГРАФИК"] if "ГРАФИК" in wb.sheetnames else wb.active
 
             # Also load with pandas for easier data access
@@ -499,7 +528,11 @@ class ScheduleParser(MonthlyScheduleParser):
                         schedule[day] = schedule_value
 
             logger.debug(
-                f"Found {len(schedule)} regular days and {len(additional_shifts)} additional shifts for {fullname} in {month}"
+                "Found %s regular days and %s additional shifts for %s in %s",
+                len(schedule),
+                len(additional_shifts),
+                fullname,
+                month,
             )
             return schedule, additional_shifts
 
@@ -532,7 +565,7 @@ class ScheduleParser(MonthlyScheduleParser):
 
             return False
         except Exception as e:
-            logger.debug(f"Error checking cell color: {e}")
+            logger.debug("Error checking cell color: %s", e)
             return False
 
     async def get_user_schedule_with_duties(
@@ -541,7 +574,9 @@ class ScheduleParser(MonthlyScheduleParser):
         """Get user's schedule with duty information for specified month."""
         try:
             # Get regular schedule data
-            schedule_data = self.get_user_schedule(fullname, month, division)
+            schedule_data = await run_heavy(
+                self.get_user_schedule, fullname, month, division
+            )
 
             if not schedule_data or not stp_repo:
                 return {
@@ -565,7 +600,7 @@ class ScheduleParser(MonthlyScheduleParser):
                 )
 
                 logger.debug(
-                    f"Retrieved duties for {len(month_duties)} days in month {month}"
+                    "Retrieved duties for %s days in month %s", len(month_duties), month
                 )
 
             except Exception as e:
@@ -611,7 +646,9 @@ class ScheduleParser(MonthlyScheduleParser):
                                 break
 
                 except Exception as e:
-                    logger.debug(f"Error checking duty for {fullname} on {day}: {e}")
+                    logger.debug(
+                        "Error checking duty for %s on %s: %s", fullname, day, e
+                    )
 
                 schedule_with_duties[day] = (schedule, duty_info)
 
@@ -620,7 +657,9 @@ class ScheduleParser(MonthlyScheduleParser):
         except Exception as e:
             logger.error(f"Error getting schedule with duties: {e}")
             # Fallback to regular schedule without duties
-            schedule_data = self.get_user_schedule(fullname, month, division)
+            schedule_data = await run_heavy(
+                self.get_user_schedule, fullname, month, division
+            )
             return {day: (schedule, None) for day, schedule in schedule_data.items()}
 
     def get_user_schedule_formatted(
@@ -825,6 +864,27 @@ class DutyScheduleParser(BaseDutyParser):
             logger.error(f"Error getting current helper duty for {division}: {e}")
             return None
 
+    def find_month_date_columns(
+        self, df: pd.DataFrame, date: datetime
+    ) -> Dict[int, int]:
+        """Find date columns for all days in the month of the given date."""
+        days_in_month = calendar.monthrange(date.year, date.month)[1]
+
+        date_columns = {}
+        for day in range(1, days_in_month + 1):
+            try:
+                day_date = datetime(date.year, date.month, day)
+                date_col = self.date_finder.find_date_column(
+                    df, day_date, search_rows=3
+                )
+                if date_col is not None:
+                    date_columns[day] = date_col
+            except ValueError:
+                # Invalid date, skip
+                continue
+
+        return date_columns
+
     async def get_duties_for_month(
         self, date: datetime, division: str, stp_repo: MainRequestsRepo
     ) -> Dict[int, List[DutyInfo]]:
@@ -856,7 +916,7 @@ class DutyScheduleParser(BaseDutyParser):
             sheet_name = self.get_duty_sheet_name(date)
 
             try:
-                df = self.read_excel_file(schedule_file, sheet_name)
+                df = await run_heavy(self.read_excel_file, schedule_file, sheet_name)
             except Exception as e:
                 logger.warning(f"Failed to read schedule with primary sheet name: {e}")
 
@@ -879,9 +939,13 @@ class DutyScheduleParser(BaseDutyParser):
                     ]
                     month_name = month_names[date.month - 1]
                     try:
-                        df = self.read_excel_file(schedule_file, month_name)
+                        df = await run_heavy(
+                            self.read_excel_file, schedule_file, month_name
+                        )
                         logger.debug(
-                            f"Successfully read {division} duty sheet with name: {month_name}"
+                            "Successfully read %s duty sheet with name: %s",
+                            division,
+                            month_name,
                         )
                     except Exception as e2:
                         logger.warning(
@@ -893,32 +957,22 @@ class DutyScheduleParser(BaseDutyParser):
 
             if df is None:
                 logger.debug(
-                    f"[График дежурных] Не удалось найти график дежурных на {date} для {division}"
+                    "[График дежурных] Не удалось найти график дежурных на %s для %s",
+                    date,
+                    division,
                 )
                 raise ValueError("Не удалось найти график дежурных")
 
             # Find all date columns for the month
             month_duties = {}
 
-            # Find all columns that might contain days from this month
-            days_in_month = calendar.monthrange(date.year, date.month)[1]
-
             # Find date columns for all days in the month
-            date_columns = {}
-            for day in range(1, days_in_month + 1):
-                try:
-                    day_date = datetime(date.year, date.month, day)
-                    date_col = self.date_finder.find_date_column(
-                        df, day_date, search_rows=3
-                    )
-                    if date_col is not None:
-                        date_columns[day] = date_col
-                except ValueError:
-                    # Invalid date, skip
-                    continue
+            date_columns = await run_heavy(self.find_month_date_columns, df, date)
 
             logger.debug(
-                f"Found date columns for {len(date_columns)} days in month {date.month}"
+                "Found date columns for %s days in month %s",
+                len(date_columns),
+                date.month,
             )
 
             # Parse duties for all found dates at once
@@ -982,7 +1036,7 @@ class DutyScheduleParser(BaseDutyParser):
             return month_duties
 
         except Exception as e:
-            logger.debug(f"[Дежурные] Не удалось найти график дежурных: {e}")
+            logger.debug("[Дежурные] Не удалось найти график дежурных: %s", e)
             return {}
 
     async def get_duties_for_date(
@@ -1016,7 +1070,7 @@ class DutyScheduleParser(BaseDutyParser):
             sheet_name = self.get_duty_sheet_name(date)
 
             try:
-                df = self.read_excel_file(schedule_file, sheet_name)
+                df = await run_heavy(self.read_excel_file, schedule_file, sheet_name)
             except Exception as e:
                 logger.warning(f"Failed to read schedule with primary sheet name: {e}")
 
@@ -1039,9 +1093,13 @@ class DutyScheduleParser(BaseDutyParser):
                     ]
                     month_name = month_names[date.month - 1]
                     try:
-                        df = self.read_excel_file(schedule_file, month_name)
+                        df = await run_heavy(
+                            self.read_excel_file, schedule_file, month_name
+                        )
                         logger.debug(
-                            f"Successfully read {division} duty sheet with name: {month_name}"
+                            "Successfully read %s duty sheet with name: %s",
+                            division,
+                            month_name,
                         )
                     except Exception as e2:
                         logger.warning(
@@ -1053,7 +1111,9 @@ class DutyScheduleParser(BaseDutyParser):
 
             if df is None:
                 logger.debug(
-                    f"[График дежурных] Не удалось найти график дежурных на {date} для {division}"
+                    "[График дежурных] Не удалось найти график дежурных на %s для %s",
+                    date,
+                    division,
                 )
                 raise ValueError("Не удалось найти график дежурных")
 
@@ -1118,7 +1178,7 @@ class DutyScheduleParser(BaseDutyParser):
             return duties
 
         except Exception as e:
-            logger.debug(f"[Дежурные] Не удалось найти график дежурных:  {e}")
+            logger.debug("[Дежурные] Не удалось найти график дежурных:  %s", e)
             return []
 
     async def format_schedule(
@@ -1280,7 +1340,7 @@ class HeadScheduleParser(BaseExcelParser):
             if not schedule_file:
                 raise FileNotFoundError(f"Head schedule file for {division} not found")
 
-            df = self.read_excel_file(schedule_file, "ГРАФИК")
+            df = await run_heavy(self.read_excel_file, schedule_file, "ГРАФИК")
             if df is None:
                 raise ValueError("Failed to read head schedule")
 
@@ -1350,7 +1410,7 @@ class HeadScheduleParser(BaseExcelParser):
                     return f"{duty.schedule} {duty.shift_type}"
             return None
         except Exception as e:
-            logger.debug(f"Error checking duty for {head_name}: {e}")
+            logger.debug("Error checking duty for %s: %s", head_name, e)
             return None
 
     def format_schedule(self, heads: List[HeadInfo], date: datetime) -> str:
@@ -1505,7 +1565,7 @@ class GroupScheduleParser(BaseExcelParser):
                     logger.warning(f"Schedule file for {div} not found")
                     continue
 
-                df = self.read_excel_file(schedule_file)
+                df = await run_heavy(self.read_excel_file, schedule_file)
                 if df is None:
                     logger.warning(f"Failed to read schedule file for {div}")
                     continue
@@ -1593,10 +1653,10 @@ class GroupScheduleParser(BaseExcelParser):
             try:
                 user = await stp_repo.employee.get_user(fullname=name_cell.strip())
             except Exception as e:
-                logger.debug(f"Error getting user {name_cell}: {e}")
+                logger.debug("Error getting user %s: %s", name_cell, e)
 
             if not user:
-                logger.debug(f"User {name_cell.strip()} not found in DB, skipping")
+                logger.debug("User %s not found in DB, skipping", name_cell.strip())
                 continue
 
             member = GroupMemberInfo(
@@ -2,16 +2,21 @@
 Studies schedule parser for processing and displaying training schedules.
 """
 
+from __future__ import annotations
+
 import logging
 from datetime import datetime
 from pathlib import Path
-from typing import List, Optional, Tuple
-
-import pandas as pd
-from pandas import DataFrame
+from typing import TYPE_CHECKING, List, Optional, Tuple
 
+from ...misc.lazy import lazy_import
 from .parsers import BaseExcelParser
 
+if TYPE_CHECKING:
+    from pandas import DataFrame
+
+pd = lazy_import("pandas")
+
 logger = logging.getLogger(__name__)
 
 
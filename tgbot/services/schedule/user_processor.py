@@ -2,17 +2,21 @@
 User processing service for handling Excel-based user data changes.
 """
 
+from __future__ import annotations
+
 import logging
 import re
 from pathlib import Path
 from typing import Dict, List, Optional
 
-import pandas as pd
 from stp_database import Employee
 from stp_database.repo.STP.employee import EmployeeRepo
 
+from tgbot.misc.lazy import lazy_import
 from tgbot.services.schedulers.hr import get_fired_users_from_excel
 
+pd = lazy_import("pandas")
+
 logger = logging.getLogger(__name__)
 
 
@@ -1,5 +1,7 @@
+import functools
+import inspect
 import logging
-from typing import Dict
+from typing import Dict, Optional
 
 import pytz
 from aiogram import Bot
@@ -8,26 +10,38 @@ from apscheduler.jobstores.memory import MemoryJobStore
 from apscheduler.jobstores.redis import RedisJobStore
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
-from tgbot.config import load_config
+from tgbot.config import Config
+from tgbot.services.leader import LeaderElection
 from tgbot.services.schedulers.achievements import AchievementScheduler
 from tgbot.services.schedulers.hr import HRScheduler
 from tgbot.services.schedulers.studies import StudiesScheduler
 
-config = load_config(".env")
 logger = logging.getLogger(__name__)
 
 
 class SchedulerManager:
-    def __init__(self):
+    def __init__(self, config: Config, election: Optional[LeaderElection] = None):
+        """
+        Args:
+            config: Конфигурация бота (роль процесса и закрепленные задачи
+                берутся из config.scheduler)
+            election: Выбор лидера среди реплик. Если не передан,
+                задачи выполняются без распределенной блокировки
+        """
+        self.role = config.scheduler.role
+        self.worker_jobs = config.scheduler.worker_jobs
+        self.election = election
         self.scheduler = AsyncIOScheduler()
-        self._configure_scheduler()
+        self._configure_scheduler(config)
 
         # Initialize category schedulers
         self.hr = HRScheduler()
-        self.achievements = AchievementScheduler()
+        self.achievements = AchievementScheduler(
+            kpi_poll_interval=config.scheduler.kpi_poll_interval
+        )
         self.studies = StudiesScheduler()
 
-    def _configure_scheduler(self):
+    def _configure_scheduler(self, config: Config):
         job_defaults = {
             "coalesce": True,
             "misfire_grace_time": 300,
@@ -75,16 +89,80 @@ class SchedulerManager:
         # Задачи обучений
         self.studies.setup_jobs(self.scheduler, session_pool, bot)
 
+        self._apply_role()
+        if self.election:
+            self._guard_jobs()
+
         logger.info("[Scheduler] Все задачи настроены")
 
+    def is_worker_job(self, job_id: str) -> bool:
+        """Закреплена ли задача за ролью worker"""
+        if not self.worker_jobs:
+            return True
+        return any(job_id.startswith(prefix) for prefix in self.worker_jobs)
+
+    def _apply_role(self):
+        """Удаление задач, которые не выполняются процессом с текущей ролью"""
+        if self.role == "all":
+            return
+
+        for job in self.scheduler.get_jobs():
+            if self.is_worker_job(job.id) != (self.role == "worker"):
+                job.remove()
+                logger.info(
+                    f"[Scheduler] Задача {job.id} не выполняется в роли {self.role}"
+                )
+
+    def _guard_jobs(self):
+        """Выполнение задач только действующим лидером (проверка fencing token)"""
+        for job in self.scheduler.get_jobs():
+            job.modify(func=self._leader_only(job.id, job.func))
+
+    def _leader_only(self, job_id: str, func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if not await self.election.is_current():
+                logger.warning(
+                    f"[Scheduler] Задача {job_id} пропущена: процесс не является лидером"
+                )
+                return None
+            result = func(*args, **kwargs)
+            if inspect.isawaitable(result):
+                result = await result
+            return result
+
+        return wrapper
+
     def start(self):
-        """Запуск планировщика"""
-        if not self.scheduler.running:
+        """
+        Запуск планировщика. При наличии выбора лидера планировщик
+        запускается на паузе и возобновляется только у лидера
+        """
+        if self.scheduler.running:
+            return
+
+        if self.election:
+            self.scheduler.start(paused=True)
+            self.election.start(on_elected=self._on_elected, on_lost=self._on_lost)
+            logger.info(
+                f"[Scheduler] Планировщик запущен в ожидании лидерства ({self.role})"
+            )
+        else:
             self.scheduler.start()
             logger.info("[Scheduler] Планировщик запущен")
 
-    def shutdown(self):
+    def _on_elected(self):
+        self.scheduler.resume()
+        logger.info(f"[Scheduler] Процесс стал лидером, задачи ({self.role}) активны")
+
+    def _on_lost(self):
+        self.scheduler.pause()
+        logger.warning("[Scheduler] Лидерство потеряно, задачи приостановлены")
+
+    async def shutdown(self):
         """Остановка планировщика"""
+        if self.election:
+            await self.election.stop()
         if self.scheduler.running:
             self.scheduler.shutdown()
             logger.info("[Scheduler] Планировщик остановлен")
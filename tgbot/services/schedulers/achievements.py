@@ -5,21 +5,33 @@
 обработке игровых механик и периодических наград.
 """
 
+from __future__ import annotations
+
+import asyncio
 import json
 import logging
-from datetime import date, timedelta
-from typing import Any, Dict, List, Sequence
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 from aiogram import Bot
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from sqlalchemy import and_, func, select
-from stp_database import MainRequestsRepo
+from redis.asyncio import Redis
+from sqlalchemy import func, insert, or_, select
+from stp_database import Employee, MainRequestsRepo
+from stp_database.models.KPI.spec_kpi import SpecDayKPI, SpecMonthKPI, SpecWeekKPI
 from stp_database.models.STP.transactions import Transaction
 from stp_database.repo.KPI.requests import KPIRequestsRepo
 
-from tgbot.services.broadcaster import send_message
+from tgbot.misc.lazy import lazy_import
+from tgbot.services.balances import Balance, balance_ledger
+from tgbot.services.notifications import notify
 from tgbot.services.schedulers.base import BaseScheduler
 
+# pandas нужен только при проверке достижений
+pd = lazy_import("pandas")
+
 logger = logging.getLogger(__name__)
 
 
@@ -34,8 +46,9 @@ class AchievementScheduler(BaseScheduler):
     - Уведомления о достижениях
     """
 
-    def __init__(self):
+    def __init__(self, kpi_poll_interval: int = 300):
         super().__init__("Достижения")
+        self.kpi_poll_interval = kpi_poll_interval
 
     def setup_jobs(
         self, scheduler: AsyncIOScheduler, session_pool, bot: Bot, kpi_session_pool=None
@@ -43,1019 +56,593 @@ class AchievementScheduler(BaseScheduler):
         """Настройка всех задач достижений"""
         self.logger.info("Настройка задач достижений...")
 
-        # Проверка ежедневных достижений - раз в 12 часов, запускать при старте
-        scheduler.add_job(
-            func=self._check_daily_achievements_job,
-            args=[session_pool, kpi_session_pool, bot],
-            trigger="interval",
-            id="achievements_check_daily_achievements",
-            name="Проверка ежедневных достижений",
-            hours=12,
-            coalesce=True,
-            misfire_grace_time=300,
-            replace_existing=True,
-        )
-
-        # Проверка еженедельных достижений - раз в 12 часов, запускать при старте
+        # Проверка достижений по мере обновления KPI, первая - при старте
         scheduler.add_job(
-            func=self._check_weekly_achievements_job,
+            func=self._watch_kpi_job,
             args=[session_pool, kpi_session_pool, bot],
             trigger="interval",
-            id="achievements_check_weekly_achievements",
-            name="Проверка еженедельных достижений",
-            hours=12,
+            id="achievements_watch_kpi",
+            name="Проверка достижений при обновлении KPI",
+            seconds=self.kpi_poll_interval,
+            next_run_time=datetime.now().astimezone(),
             coalesce=True,
+            max_instances=1,
             misfire_grace_time=300,
             replace_existing=True,
         )
 
-        # Проверка ежемесячных достижений - раз в 12 часов, запускать при старте
+        # Сверка материализованных балансов с журналом транзакций - раз в час
         scheduler.add_job(
-            func=self._check_monthly_achievements_job,
-            args=[session_pool, kpi_session_pool, bot],
+            func=self._reconcile_balances_job,
+            args=[session_pool],
             trigger="interval",
-            id="achievements_check_monthly_achievements",
-            name="Проверка ежемесячных достижений",
-            hours=12,
+            id="achievements_reconcile_balances",
+            name="Сверка балансов с журналом транзакций",
+            hours=1,
             coalesce=True,
             misfire_grace_time=300,
             replace_existing=True,
         )
 
-        # Запуск задач при старте
-        scheduler.add_job(
-            func=self._check_daily_achievements_job,
-            args=[session_pool, kpi_session_pool, bot],
-            trigger="date",
-            id="achievements_startup_daily_achievements",
-            name="Запуск при старте: Проверка ежедневных достижений",
-            run_date=None,
-        )
-
-        scheduler.add_job(
-            func=self._check_weekly_achievements_job,
-            args=[session_pool, kpi_session_pool, bot],
-            trigger="date",
-            id="achievements_startup_weekly_achievements",
-            name="Запуск при старте: Проверка еженедельных достижений",
-            run_date=None,
-        )
-
-        scheduler.add_job(
-            func=self._check_monthly_achievements_job,
-            args=[session_pool, kpi_session_pool, bot],
-            trigger="date",
-            id="achievements_startup_monthly_achievements",
-            name="Запуск при старте: Проверка ежемесячных достижений",
-            run_date=None,
-        )
+    async def _watch_kpi_job(self, session_pool, kpi_session_pool, bot: Bot):
+        """Проверка обновлений KPI и вручение достижений"""
+        await kpi_watcher.poll(session_pool, kpi_session_pool, bot)
 
-    async def _check_daily_achievements_job(
-        self, session_pool, kpi_session_pool, bot: Bot
-    ):
-        """Проверка ежедневных достижений"""
-        self._log_job_execution_start("Ежедневная проверка достижений")
+    async def _reconcile_balances_job(self, session_pool):
+        """Сверка балансов с журналом транзакций"""
+        self._log_job_execution_start("Сверка балансов")
         try:
-            await check_daily_achievements(session_pool, kpi_session_pool, bot)
-            self._log_job_execution_end("Ежедневная проверка достижений", success=True)
+            await balance_ledger.reconcile(session_pool)
+            self._log_job_execution_end("Сверка балансов", success=True)
         except Exception as e:
-            self._log_job_execution_end(
-                "Ежедневная проверка достижений", success=False, error=str(e)
-            )
+            self._log_job_execution_end("Сверка балансов", success=False, error=str(e))
 
-    async def _check_weekly_achievements_job(
-        self, session_pool, kpi_session_pool, bot: Bot
-    ):
-        """Проверка еженедельных достижений"""
-        self._log_job_execution_start("Еженедельная проверка достижений")
-        try:
-            await check_weekly_achievements(session_pool, kpi_session_pool, bot)
-            self._log_job_execution_end(
-                "Еженедельная проверка достижений", success=True
-            )
-        except Exception as e:
-            self._log_job_execution_end(
-                "Еженедельная проверка достижений", success=False, error=str(e)
-            )
 
-    async def _check_monthly_achievements_job(
-        self, session_pool, kpi_session_pool, bot: Bot
-    ):
-        """Проверка ежемесячных достижений"""
-        self._log_job_execution_start("Ежемесячная проверка достижений")
-        try:
-            await check_monthly_achievements(session_pool, kpi_session_pool, bot)
-            self._log_job_execution_end("Ежемесячная проверка достижений", success=True)
-        except Exception as e:
-            self._log_job_execution_end(
-                "Ежемесячная проверка достижений", success=False, error=str(e)
-            )
+# Параметры проверки по периодам: название, репозиторий и модель таблицы KPI,
+# окно (в днях), в течение которого достижение не вручается повторно
+PERIODS = {
+    "d": ("ежедневных", "spec_day_kpi", SpecDayKPI, 1),
+    "w": ("еженедельных", "spec_week_kpi", SpecWeekKPI, 7),
+    "m": ("ежемесячных", "spec_month_kpi", SpecMonthKPI, 30),
+}
 
+# Роли сотрудников, участвующих в игре
+PLAYING_ROLES = (1, 3, 10)
 
-# Функции для работы с достижениями
-async def check_daily_achievements(session_pool, kpi_session_pool, bot: Bot):
-    """
-    Проверка и вручение ежедневных достижений
+# Наибольшая проверенная дата извлечения KPI по периоду
+WATERMARK_KEY = "achievements:kpi_watermark:{period}"
 
-    Args:
-        session_pool: Пул сессий основной БД
-        kpi_session_pool: Пул сессий KPI БД
-        bot: Экземпляр бота
-    """
-    try:
-        async with session_pool() as stp_session, kpi_session_pool() as kpi_session:
-            stp_repo = MainRequestsRepo(stp_session)
-            kpi_repo = KPIRequestsRepo(kpi_session)
 
-            # Получаем всех пользователей
-            playing_users = await stp_repo.employee.get_users(roles=[1, 3, 10])
+class KPIWatcher:
+    """
+    Отслеживание обновлений таблиц KPI
 
-            if not playing_users:
-                logger.info("[Достижения] Нет пользователей в базе данных")
-                return
+    Для каждого периода хранится наибольшая проверенная дата извлечения KPI
+    (high-watermark). Опрос таблицы - один запрос MAX(kpi_extract_date);
+    при появлении новых данных достижения проверяются только для
+    сотрудников, чьи строки KPI обновились.
+    """
 
-            # Получаем все ежедневные достижения
-            daily_achievements_list = await stp_repo.achievement.get_achievements()
-            daily_achievements_list = [
-                ach for ach in daily_achievements_list if ach.period == "d"
-            ]
+    def __init__(self):
+        self.redis: Optional[Redis] = None
+        self._watermarks: Dict[str, datetime] = {}
+
+    def configure(self, redis: Optional[Redis] = None) -> None:
+        """
+        Настройка хранилища отметок
+
+        :param redis: Клиент Redis. Без него отметки хранятся в памяти процесса
+        """
+        self.redis = redis
+
+    async def _get_watermark(self, period: str) -> Optional[datetime]:
+        if self.redis is not None:
+            value = await self.redis.get(WATERMARK_KEY.format(period=period))
+            return datetime.fromisoformat(value.decode()) if value else None
+        return self._watermarks.get(period)
+
+    async def _set_watermark(self, period: str, value: datetime) -> None:
+        if self.redis is not None:
+            await self.redis.set(WATERMARK_KEY.format(period=period), value.isoformat())
+        else:
+            self._watermarks[period] = value
+
+    async def poll(self, session_pool, kpi_session_pool, bot: Bot) -> None:
+        """
+        Проверяет обновления KPI всех периодов и вручает достижения
+        сотрудникам с новыми данными
+
+        :param session_pool: Пул сессий основной БД
+        :param kpi_session_pool: Пул сессий KPI БД
+        :param bot: Экземпляр бота
+        """
+        for period in PERIODS:
+            try:
+                await self._poll_period(session_pool, kpi_session_pool, bot, period)
+            except Exception as e:
+                logger.error(
+                    f"[Достижения] Ошибка проверки обновлений KPI ({PERIODS[period][0]}): {e}"
+                )
 
-            if not daily_achievements_list:
-                logger.info("[Достижения] Нет ежедневных достижений в базе данных")
+    async def _poll_period(
+        self, session_pool, kpi_session_pool, bot: Bot, period: str
+    ) -> None:
+        model = PERIODS[period][2]
+        watermark = await self._get_watermark(period)
+        async with kpi_session_pool() as kpi_session:
+            latest = await kpi_session.scalar(select(func.max(model.kpi_extract_date)))
+            if latest is None or (watermark is not None and latest <= watermark):
                 return
 
-            logger.info(
-                f"[Достижения] Проверка {len(daily_achievements_list)} ежедневных достижений для {len(playing_users)} пользователей"
-            )
+            query = select(model.fullname).where(model.kpi_extract_date <= latest)
+            if watermark is not None:
+                query = query.where(model.kpi_extract_date > watermark)
+            changed = set((await kpi_session.scalars(query)).all())
 
-            new_achievements_count = 0
-
-            for user in playing_users:
-                try:
-                    # Проверяем достижения для пользователя
-                    earned_achievements = await _check_user_daily_achievements(
-                        stp_repo, kpi_repo, user, daily_achievements_list
-                    )
+        logger.info(
+            f"[Достижения] Обновлены KPI ({PERIODS[period][0]}) для {len(changed)} сотрудников"
+        )
+        kpi_rows = await _check_period_achievements(
+            session_pool, kpi_session_pool, bot, period, fullnames=changed
+        )
+        # При ошибке отметка не сдвигается, и проверка повторится при следующем опросе
+        if kpi_rows is not None:
+            await self._set_watermark(period, latest)
 
-                    if earned_achievements:
-                        await _award_achievements(
-                            stp_repo, user, earned_achievements, bot
-                        )
-                        new_achievements_count += len(earned_achievements)
 
-                except Exception as e:
-                    logger.error(
-                        f"[Достижения] Ошибка проверки достижений для пользователя {user.fullname}: {e}"
-                    )
-                    continue
+kpi_watcher = KPIWatcher()
 
-            logger.info(
-                f"[Достижения] Вручено {new_achievements_count} ежедневных достижений"
-            )
 
-    except Exception as e:
-        logger.error(
-            f"[Достижения] Критическая ошибка при проверке ежедневных достижений: {e}"
-        )
-
-
-async def check_weekly_achievements(session_pool, kpi_session_pool, bot: Bot):
+async def _check_period_achievements(
+    session_pool,
+    kpi_session_pool,
+    bot: Bot,
+    period: str,
+    fullnames: Optional[Set[str]] = None,
+) -> Optional[List]:
     """
-    Проверка и вручение еженедельных достижений
+    Пакетная проверка достижений за период
+
+    KPI всех пользователей и уже полученные достижения загружаются двумя
+    запросами, проверка выполняется в памяти, а награды записываются одним
+    пакетным INSERT. Количество запросов не зависит от числа сотрудников.
 
     Args:
         session_pool: Пул сессий основной БД
         kpi_session_pool: Пул сессий KPI БД
         bot: Экземпляр бота
+        period: Период достижений: d, w или m
+        fullnames: Проверить только этих сотрудников (по умолчанию - всех)
+
+    Returns:
+        Проверенные строки KPI или None при ошибке
     """
+    title, kpi_repo_name, _, recent_days = PERIODS[period]
+
     try:
         async with session_pool() as stp_session, kpi_session_pool() as kpi_session:
             stp_repo = MainRequestsRepo(stp_session)
             kpi_repo = KPIRequestsRepo(kpi_session)
 
-            # Получаем всех пользователей
-            playing_users = await stp_repo.employee.get_users(roles=[1, 3, 10])
+            playing_users = await _get_playing_users(stp_repo, fullnames)
 
             if not playing_users:
                 logger.info("[Достижения] Нет пользователей в базе данных")
-                return
+                return []
 
-            # Получаем все еженедельные достижения
-            weekly_achievements_list = await stp_repo.achievement.get_achievements()
-            weekly_achievements_list = [
-                ach for ach in weekly_achievements_list if ach.period == "w"
+            achievements_list = [
+                ach
+                for ach in await stp_repo.achievement.get_achievements()
+                if ach.period == period
             ]
 
-            if not weekly_achievements_list:
-                logger.info("[Достижения] Нет еженедельных достижений в базе данных")
-                return
+            if not achievements_list:
+                logger.info(f"[Достижения] Нет {title} достижений в базе данных")
+                return []
 
             logger.info(
-                f"[Достижения] Проверка {len(weekly_achievements_list)} еженедельных достижений для {len(playing_users)} пользователей"
+                f"[Достижения] Проверка {len(achievements_list)} {title} достижений для {len(playing_users)} пользователей"
             )
 
-            new_achievements_count = 0
-
-            for user in playing_users:
-                try:
-                    # Проверяем достижения для пользователя
-                    earned_achievements = await _check_user_weekly_achievements(
-                        stp_repo, kpi_repo, user, weekly_achievements_list
-                    )
-
-                    if earned_achievements:
-                        await _award_achievements(
-                            stp_repo, user, earned_achievements, bot
-                        )
-                        new_achievements_count += len(earned_achievements)
-
-                except Exception as e:
-                    logger.error(
-                        f"[Достижения] Ошибка проверки еженедельных достижений для пользователя {user.fullname}: {e}"
-                    )
-                    continue
-
-            logger.info(
-                f"[Достижения] Вручено {new_achievements_count} еженедельных достижений"
+            # KPI всех пользователей за период одним запросом
+            kpi_rows = await getattr(kpi_repo, kpi_repo_name).get_kpi_by_names(
+                [user.fullname for user in playing_users]
             )
-
-    except Exception as e:
-        logger.error(
-            f"[Достижения] Критическая ошибка при проверке еженедельных достижений: {e}"
-        )
-
-
-async def check_monthly_achievements(session_pool, kpi_session_pool, bot: Bot):
-    """
-    Проверка и вручение ежемесячных достижений
-
-    Args:
-        session_pool: Пул сессий основной БД
-        kpi_session_pool: Пул сессий KPI БД
-        bot: Экземпляр бота
-    """
-    try:
-        async with session_pool() as stp_session, kpi_session_pool() as kpi_session:
-            stp_repo = MainRequestsRepo(stp_session)
-            kpi_repo = KPIRequestsRepo(kpi_session)
-
-            # Получаем всех пользователей
-            playing_users = await stp_repo.employee.get_users(roles=[1, 3, 10])
-
-            if not playing_users:
-                logger.info("[Достижения] Нет пользователей в базе данных")
-                return
-
-            # Получаем все ежемесячные достижения
-            monthly_achievements_list = await stp_repo.achievement.get_achievements()
-            monthly_achievements_list = [
-                ach for ach in monthly_achievements_list if ach.period == "m"
+            kpi_by_name = {
+                kpi.fullname: kpi for kpi in kpi_rows if kpi.kpi_extract_date
+            }
+            users_with_kpi = [
+                user for user in playing_users if user.fullname in kpi_by_name
             ]
-
-            if not monthly_achievements_list:
-                logger.info("[Достижения] Нет ежемесячных достижений в базе данных")
-                return
-
-            logger.info(
-                f"[Достижения] Проверка {len(monthly_achievements_list)} ежемесячных достижений для {len(playing_users)} пользователей"
+            if not users_with_kpi:
+                logger.info(f"[Достижения] Нет KPI данных для {title} достижений")
+                return kpi_rows
+
+            received = await _get_received_achievements(
+                stp_repo,
+                user_ids=[user.user_id for user in users_with_kpi],
+                achievement_ids=[ach.id for ach in achievements_list],
+                kpi_extract_dates={
+                    kpi.kpi_extract_date for kpi in kpi_by_name.values()
+                },
+                recent_days=recent_days,
             )
 
-            new_achievements_count = 0
-
-            for user in playing_users:
-                try:
-                    # Проверяем достижения для пользователя
-                    earned_achievements = await _check_user_monthly_achievements(
-                        stp_repo, kpi_repo, user, monthly_achievements_list
-                    )
-
-                    if earned_achievements:
-                        await _award_achievements(
-                            stp_repo, user, earned_achievements, bot
-                        )
-                        new_achievements_count += len(earned_achievements)
+            awards = _evaluate_achievements(
+                users_with_kpi, kpi_by_name, achievements_list, received
+            )
+            if not awards:
+                logger.info(f"[Достижения] Вручено 0 {title} достижений")
+                return kpi_rows
 
-                except Exception as e:
-                    logger.error(
-                        f"[Достижения] Ошибка проверки ежемесячных достижений для пользователя {user.fullname}: {e}"
-                    )
-                    continue
+            balances = await _insert_awards(stp_repo, awards)
+            await _notify_awards(awards, balances, bot)
 
             logger.info(
-                f"[Достижения] Вручено {new_achievements_count} ежемесячных достижений"
+                f"[Достижения] Вручено {sum(len(earned) for _, earned in awards.values())} {title} достижений {len(awards)} пользователям"
             )
+            return kpi_rows
 
     except Exception as e:
         logger.error(
-            f"[Достижения] Критическая ошибка при проверке ежемесячных достижений: {e}"
+            f"[Достижения] Критическая ошибка при проверке {title} достижений: {e}"
         )
+        return None
 
 
-# Вспомогательные функции
-async def _check_user_daily_achievements(
-    stp_repo: MainRequestsRepo, kpi_repo: KPIRequestsRepo, user, achievements_list: List
-) -> List[Dict]:
+async def _get_playing_users(
+    stp_repo: MainRequestsRepo, fullnames: Optional[Set[str]] = None
+) -> List[Employee]:
     """
-    Проверка ежедневных достижений для конкретного пользователя
+    Получает участников игры, зарегистрированных в боте, одним запросом
 
     Args:
-        stp_repo: Репозиторий основной БД
-        kpi_repo: Репозиторий KPI БД
-        user: Пользователь
-        achievements_list: Список доступных ежедневных достижений
+        stp_repo: Репозиторий БД
+        fullnames: Только эти сотрудники (по умолчанию - все)
 
     Returns:
-        Список новых достижений для вручения
+        Сотрудники с ролями PLAYING_ROLES и Telegram ID
     """
-    earned_achievements = []
-
-    try:
-        if not user.user_id:
-            return earned_achievements
-
-        # Получаем KPI пользователя за сегодня
-        user_kpi = await kpi_repo.spec_day_kpi.get_kpi(user.fullname)
-        if not user_kpi:
-            logger.debug(
-                f"[Достижения] Нет KPI данных для пользователя {user.fullname}"
-            )
-            return earned_achievements
-
-        # Получаем kpi_extract_date из KPI данных
-        kpi_extract_date = user_kpi.kpi_extract_date
-        if not kpi_extract_date:
-            logger.debug(
-                f"[Достижения] Нет kpi_extract_date в KPI данных для пользователя {user.fullname}"
-            )
-            return earned_achievements
-
-        # Проверяем, есть ли уже достижения с этим kpi_extracted_at
-        existing_transactions = await _get_user_achievements_by_kpi_date(
-            stp_repo, user.user_id, kpi_extract_date
-        )
-        existing_achievement_ids = {
-            t.source_id for t in existing_transactions if t.source_id
-        }
+    query = select(Employee).where(
+        Employee.role.in_(PLAYING_ROLES), Employee.user_id.is_not(None)
+    )
+    if fullnames is not None:
+        query = query.where(Employee.fullname.in_(fullnames))
+    result = await stp_repo.session.scalars(query)
+    return list(result.all())
 
-        # Также проверяем достижения за последний день (для предотвращения дублирования)
-        recent_transactions = await _get_user_achievements_last_n_days(
-            stp_repo, user.user_id, 1
-        )
-        recent_achievement_ids = {
-            t.source_id for t in recent_transactions if t.source_id
-        }
-
-        # Проверяем каждое доступное достижение
-        for achievement in achievements_list:
-            try:
-                # Пропускаем достижение если уже получено с этим kpi_extracted_at
-                if achievement.id in existing_achievement_ids:
-                    logger.debug(
-                        f"[Достижения] Достижение {achievement.name} уже получено для kpi_extract_date {kpi_extract_date}"
-                    )
-                    continue
-
-                # Пропускаем если достижение было получено за последний день
-                if achievement.id in recent_achievement_ids:
-                    logger.debug(
-                        f"[Достижения] Достижение {achievement.name} уже получено за последний день"
-                    )
-                    continue
-
-                # Проверяем соответствие пользователя критериям достижения
-                if not _user_matches_achievement_criteria(user, achievement):
-                    continue
-
-                # Проверяем KPI критерии
-                if await _check_kpi_criteria(user_kpi, achievement.kpi):
-                    earned_achievements.append(
-                        {
-                            "id": achievement.id,
-                            "name": achievement.name,
-                            "description": achievement.description,
-                            "reward_points": achievement.reward,
-                            "kpi_values": _get_user_kpi_values(
-                                user_kpi, achievement.kpi
-                            ),
-                            "kpi_extract_date": kpi_extract_date,  # Добавляем дату KPI
-                        }
-                    )
-                    logger.info(
-                        f"[Достижения] Пользователь {user.fullname} заработал достижение '{achievement.name}'"
-                    )
-
-            except Exception as e:
-                logger.error(
-                    f"[Достижения] Ошибка проверки достижения {achievement.name} для {user.fullname}: {e}"
-                )
-                continue
 
-    except Exception as e:
-        logger.error(
-            f"[Достижения] Ошибка проверки достижений пользователя {user.fullname}: {e}"
-        )
-
-    return earned_achievements
-
-
-async def _check_user_weekly_achievements(
-    stp_repo: MainRequestsRepo, kpi_repo: KPIRequestsRepo, user, achievements_list: List
-) -> List[Dict]:
+async def _get_received_achievements(
+    stp_repo: MainRequestsRepo,
+    user_ids: List[int],
+    achievement_ids: List[int],
+    kpi_extract_dates: Set,
+    recent_days: int,
+) -> Tuple[Set[Tuple[int, int, Any]], Set[Tuple[int, int]]]:
     """
-    Проверка еженедельных достижений для конкретного пользователя
+    Получает уже врученные достижения всех пользователей одним запросом
 
     Args:
-        stp_repo: Репозиторий основной БД
-        kpi_repo: Репозиторий KPI БД
-        user: Пользователь
-        achievements_list: Список доступных еженедельных достижений
+        stp_repo: Репозиторий БД
+        user_ids: ID проверяемых пользователей
+        achievement_ids: ID проверяемых достижений
+        kpi_extract_dates: Даты извлечения KPI проверяемого периода
+        recent_days: Окно защиты от повторного вручения (дней)
 
     Returns:
-        Список новых достижений для вручения
-    """
-    earned_achievements = []
-
-    try:
-        if not user.user_id:
-            return earned_achievements
-
-        # Получаем KPI пользователя за неделю
-        user_kpi = await kpi_repo.spec_week_kpi.get_kpi(user.fullname)
-        if not user_kpi:
-            logger.debug(
-                f"[Достижения] Нет недельных KPI данных для пользователя {user.fullname}"
-            )
-            return earned_achievements
-
-        # Получаем kpi_extract_date из KPI данных
-        kpi_extract_date = user_kpi.kpi_extract_date
-        if not kpi_extract_date:
-            logger.debug(
-                f"[Достижения] Нет kpi_extract_date в недельных KPI данных для пользователя {user.fullname}"
-            )
-            return earned_achievements
-
-        # Проверяем, есть ли уже достижения с этим kpi_extracted_at
-        existing_transactions = await _get_user_achievements_by_kpi_date(
-            stp_repo, user.user_id, kpi_extract_date
-        )
-        existing_achievement_ids = {
-            t.source_id for t in existing_transactions if t.source_id
-        }
-
-        # Также проверяем достижения за последнюю неделю (для предотвращения дублирования)
-        recent_transactions = await _get_user_achievements_last_n_days(
-            stp_repo, user.user_id, 7
-        )
-        recent_achievement_ids = {
-            t.source_id for t in recent_transactions if t.source_id
-        }
-
-        # Проверяем каждое доступное достижение
-        for achievement in achievements_list:
-            try:
-                # Пропускаем достижение если уже получено с этим kpi_extracted_at
-                if achievement.id in existing_achievement_ids:
-                    logger.debug(
-                        f"[Достижения] Достижение {achievement.name} уже получено для kpi_extract_date {kpi_extract_date}"
-                    )
-                    continue
-
-                # Пропускаем если достижение было получено за последнюю неделю
-                if achievement.id in recent_achievement_ids:
-                    logger.debug(
-                        f"[Достижения] Достижение {achievement.name} уже получено за последнюю неделю"
-                    )
-                    continue
-
-                # Проверяем соответствие пользователя критериям достижения
-                if not _user_matches_achievement_criteria(user, achievement):
-                    continue
-
-                # Проверяем KPI критерии
-                if await _check_kpi_criteria(user_kpi, achievement.kpi):
-                    earned_achievements.append(
-                        {
-                            "id": achievement.id,
-                            "name": achievement.name,
-                            "description": achievement.description,
-                            "reward_points": achievement.reward,
-                            "kpi_values": _get_user_kpi_values(
-                                user_kpi, achievement.kpi
-                            ),
-                            "kpi_extract_date": kpi_extract_date,  # Добавляем дату KPI
-                        }
-                    )
-                    logger.info(
-                        f"[Достижения] Пользователь {user.fullname} заработал еженедельное достижение '{achievement.name}'"
-                    )
-
-            except Exception as e:
-                logger.error(
-                    f"[Достижения] Ошибка проверки еженедельного достижения {achievement.name} для {user.fullname}: {e}"
-                )
-                continue
-
-    except Exception as e:
-        logger.error(
-            f"[Достижения] Ошибка проверки еженедельных достижений пользователя {user.fullname}: {e}"
+        Пары множеств: (пользователь, достижение, kpi_extracted_at) и
+        (пользователь, достижение) для достижений за последние recent_days дней
+    """
+    cutoff_date = date.today() - timedelta(days=recent_days)
+
+    result = await stp_repo.session.execute(
+        select(
+            Transaction.user_id,
+            Transaction.source_id,
+            Transaction.kpi_extracted_at,
+            Transaction.created_at,
+        ).where(
+            Transaction.source_type == "achievement",
+            Transaction.user_id.in_(user_ids),
+            Transaction.source_id.in_(achievement_ids),
+            or_(
+                Transaction.kpi_extracted_at.in_(kpi_extract_dates),
+                func.date(Transaction.created_at) >= cutoff_date,
+            ),
         )
+    )
 
-    return earned_achievements
+    by_kpi_date = set()
+    recent = set()
+    for user_id, source_id, kpi_extracted_at, created_at in result.all():
+        by_kpi_date.add((user_id, source_id, kpi_extracted_at))
+        if created_at and created_at.date() >= cutoff_date:
+            recent.add((user_id, source_id))
+    return by_kpi_date, recent
 
 
-async def _check_user_monthly_achievements(
-    stp_repo: MainRequestsRepo, kpi_repo: KPIRequestsRepo, user, achievements_list: List
-) -> List[Dict]:
+def _evaluate_achievements(
+    users: List,
+    kpi_by_name: Dict,
+    achievements_list: List,
+    received: Tuple[Set, Set],
+) -> Dict[int, Tuple[Any, List[Dict]]]:
     """
-    Проверка ежемесячных достижений для конкретного пользователя
+    Проверяет критерии всех достижений для всех пользователей
+
+    Пользователи и их KPI собираются в таблицу, каждое достижение
+    проверяется булевой маской по ее столбцам. Применимость по направлению
+    и должности вычисляется одной маской на каждое значение.
 
     Args:
-        stp_repo: Репозиторий основной БД
-        kpi_repo: Репозиторий KPI БД
-        user: Пользователь
-        achievements_list: Список доступных ежемесячных достижений
+        users: Пользователи с KPI за период
+        kpi_by_name: KPI пользователей по ФИО
+        achievements_list: Проверяемые достижения
+        received: Уже врученные достижения из _get_received_achievements
 
     Returns:
-        Список новых достижений для вручения
-    """
-    earned_achievements = []
-
-    try:
-        if not user.user_id:
-            return earned_achievements
-
-        # Получаем KPI пользователя за месяц
-        user_kpi = await kpi_repo.spec_month_kpi.get_kpi(user.fullname)
-        if not user_kpi:
-            logger.debug(
-                f"[Достижения] Нет месячных KPI данных для пользователя {user.fullname}"
+        Новые достижения по ID пользователя: (пользователь, список достижений)
+    """
+    by_kpi_date, recent = received
+
+    # Пользователи без строки KPI пропускаются, а не прерывают проверку периода
+    users = [user for user in users if kpi_by_name.get(user.fullname) is not None]
+    if not users:
+        return {}
+
+    table = pd.DataFrame(
+        {
+            "user_id": [user.user_id for user in users],
+            "division": [user.division for user in users],
+            "position": [user.position for user in users],
+            **{
+                column: pd.to_numeric(
+                    [
+                        getattr(kpi_by_name[user.fullname], column, None)
+                        for user in users
+                    ],
+                    errors="coerce",
+                )
+                for column in set(KPI_COLUMNS.values())
+            },
+        }
+    )
+
+    # Уже полученные достижения: с тем же kpi_extracted_at или за последний период
+    blocked: Dict[int, Set[int]] = {}
+    extract_dates = {
+        user.user_id: getattr(kpi_by_name[user.fullname], "kpi_extract_date", None)
+        for user in users
+    }
+    for user_id, achievement_id, kpi_extracted_at in by_kpi_date:
+        if extract_dates.get(user_id) == kpi_extracted_at:
+            blocked.setdefault(achievement_id, set()).add(user_id)
+    for user_id, achievement_id in recent:
+        blocked.setdefault(achievement_id, set()).add(user_id)
+
+    division_masks: Dict[str, pd.Series] = {}
+    position_masks: Dict[str, pd.Series] = {}
+    awards = {}
+
+    for achievement in achievements_list:
+        compiled = _compile_achievement(achievement)
+        if compiled is None:
+            continue
+
+        if achievement.division not in division_masks:
+            division_masks[achievement.division] = _division_mask(
+                table["division"], achievement.division
             )
-            return earned_achievements
-
-        # Получаем kpi_extract_date из KPI данных
-        kpi_extract_date = user_kpi.kpi_extract_date
-        if not kpi_extract_date:
-            logger.debug(
-                f"[Достижения] Нет kpi_extract_date в месячных KPI данных для пользователя {user.fullname}"
+        if achievement.position not in position_masks:
+            position_masks[achievement.position] = (
+                table["position"] == achievement.position
+                if achievement.position != "ALL"
+                else pd.Series(True, index=table.index)
             )
-            return earned_achievements
-
-        # Проверяем, есть ли уже достижения с этим kpi_extracted_at
-        existing_transactions = await _get_user_achievements_by_kpi_date(
-            stp_repo, user.user_id, kpi_extract_date
-        )
-        existing_achievement_ids = {
-            t.source_id for t in existing_transactions if t.source_id
-        }
-
-        # Также проверяем достижения за последний месяц (для предотвращения дублирования)
-        recent_transactions = await _get_user_achievements_last_n_days(
-            stp_repo, user.user_id, 30
-        )
-        recent_achievement_ids = {
-            t.source_id for t in recent_transactions if t.source_id
-        }
-
-        # Проверяем каждое доступное достижение
-        for achievement in achievements_list:
-            try:
-                # Пропускаем достижение если уже получено с этим kpi_extracted_at
-                if achievement.id in existing_achievement_ids:
-                    logger.debug(
-                        f"[Достижения] Достижение {achievement.name} уже получено для kpi_extract_date {kpi_extract_date}"
-                    )
-                    continue
-
-                # Пропускаем если достижение было получено за последний месяц
-                if achievement.id in recent_achievement_ids:
-                    logger.debug(
-                        f"[Достижения] Достижение {achievement.name} уже получено за последний месяц"
-                    )
-                    continue
-
-                # Проверяем соответствие пользователя критериям достижения
-                if not _user_matches_achievement_criteria(user, achievement):
-                    continue
-
-                # Проверяем KPI критерии
-                if await _check_kpi_criteria(user_kpi, achievement.kpi):
-                    earned_achievements.append(
-                        {
-                            "id": achievement.id,
-                            "name": achievement.name,
-                            "description": achievement.description,
-                            "reward_points": achievement.reward,
-                            "kpi_values": _get_user_kpi_values(
-                                user_kpi, achievement.kpi
-                            ),
-                            "kpi_extract_date": kpi_extract_date,  # Добавляем дату KPI
-                        }
-                    )
-                    logger.info(
-                        f"[Достижения] Пользователь {user.fullname} заработал ежемесячное достижение '{achievement.name}'"
-                    )
 
-            except Exception as e:
-                logger.error(
-                    f"[Достижения] Ошибка проверки ежемесячного достижения {achievement.name} для {user.fullname}: {e}"
-                )
-                continue
-
-    except Exception as e:
-        logger.error(
-            f"[Достижения] Ошибка проверки ежемесячных достижений пользователя {user.fullname}: {e}"
+        mask = (
+            division_masks[achievement.division]
+            & position_masks[achievement.position]
+            & compiled.mask(table)
         )
-
-    return earned_achievements
-
-
-async def _award_achievements(
-    stp_repo: MainRequestsRepo, user, achievements: List[Dict], bot: Bot
-):
-    """
-    Вручение достижений пользователю
-
-    Args:
-        stp_repo: Репозиторий БД
-        user: Пользователь
-        achievements: Список достижений для вручения
-        bot: Экземпляр бота
-    """
-    try:
-        successful_achievements = []
-        total_reward = 0
-        final_balance = None
-
-        # Сначала создаем все транзакции
-        for achievement in achievements:
-            # Создаем транзакцию в БД
-            comment = f'Достижение "{achievement["name"]}". Выполненный показатель: {_format_kpi_values(achievement["kpi_values"])}'
-
-            transaction, new_balance = await stp_repo.transaction.add_transaction(
-                user_id=user.user_id,
-                transaction_type="earn",
-                source_type="achievement",
-                amount=achievement["reward_points"],
-                source_id=achievement["id"],
-                comment=comment,
-                kpi_extracted_at=achievement.get("kpi_extract_date"),
-            )
-
-            if transaction:
-                successful_achievements.append(achievement)
-                total_reward += achievement["reward_points"]
-                final_balance = new_balance  # Сохраняем финальный баланс
-
-                logger.debug(
-                    f"[Достижения] Вручено достижение '{achievement['name']}' ({achievement['reward_points']} баллов) пользователю {user.fullname}"
-                )
-            else:
-                logger.error(
-                    f"[Достижения] Не удалось создать транзакцию для достижения '{achievement['name']}' пользователю {user.fullname}"
-                )
-
-        # Отправляем одно уведомление обо всех полученных достижениях
-        if successful_achievements:
-            logger.debug(
-                f"[Достижения] Отправка уведомления о {len(successful_achievements)} достижениях ({total_reward} баллов) пользователю {user.fullname}"
+        if achievement.id in blocked:
+            mask &= ~table["user_id"].isin(blocked[achievement.id])
+
+        for row in mask.to_numpy().nonzero()[0]:
+            user = users[row]
+            user_kpi = kpi_by_name[user.fullname]
+            awards.setdefault(user.user_id, (user, []))[1].append(
+                {
+                    "id": achievement.id,
+                    "name": achievement.name,
+                    "description": achievement.description,
+                    "reward_points": achievement.reward,
+                    "kpi_values": compiled.values(user_kpi),
+                    "kpi_extract_date": getattr(user_kpi, "kpi_extract_date", None),
+                }
             )
-            message = _create_batch_achievements_message(
-                successful_achievements, total_reward, final_balance
+            logger.info(
+                f"[Достижения] Пользователь {user.fullname} заработал достижение '{achievement.name}'"
             )
-            success = await send_message(bot, user.user_id, message)
 
-            if success:
-                logger.debug(
-                    f"[Достижения] Уведомление успешно отправлено пользователю {user.fullname}"
-                )
-            else:
-                logger.debug(
-                    f"[Достижения] Не удалось отправить уведомление пользователю {user.fullname} (возможно, пользователь не начал диалог с ботом)"
-                )
+    return awards
 
-    except Exception as e:
-        logger.error(
-            f"[Достижения] Ошибка вручения достижений пользователю {user.fullname}: {e}"
-        )
 
-
-async def _get_user_achievements_today(
-    stp_repo: MainRequestsRepo, user_id: int
-) -> Sequence[Transaction] | list[Any]:
+async def _insert_awards(
+    stp_repo: MainRequestsRepo, awards: Dict[int, Tuple[Any, List[Dict]]]
+) -> Dict[int, int]:
     """
-    Получает достижения пользователя за сегодня
+    Записывает транзакции всех наград одним пакетным INSERT
 
     Args:
         stp_repo: Репозиторий БД
-        user_id: ID пользователя
+        awards: Новые достижения по ID пользователя
 
     Returns:
-        Список транзакций-достижений за сегодня
-    """
-    try:
-        today = date.today()
-
-        # Получаем транзакции-достижения за сегодня
-        query = select(Transaction).filter(
-            and_(
-                Transaction.user_id == user_id,
-                Transaction.source_type == "achievement",
-                func.date(Transaction.created_at) == today,
-            )
-        )
-
-        result = await stp_repo.session.execute(query)
-        return result.scalars().all()
-
-    except Exception as e:
-        logger.error(
-            f"[Достижения] Ошибка получения достижений сегодня для пользователя {user_id}: {e}"
-        )
-        return []
-
+        Балансы награжденных пользователей после вручения
+    """
+    rows = [
+        {
+            "user_id": user_id,
+            "type": "earn",
+            "source_type": "achievement",
+            "source_id": achievement["id"],
+            "amount": achievement["reward_points"],
+            "comment": f'Достижение "{achievement["name"]}". Выполненный показатель: {_format_kpi_values(achievement["kpi_values"])}',
+            "kpi_extracted_at": achievement["kpi_extract_date"],
+        }
+        for user_id, (_, earned) in awards.items()
+        for achievement in earned
+    ]
 
-async def _get_user_achievements_this_week(
-    stp_repo: MainRequestsRepo, user_id: int
-) -> Sequence[Transaction] | list[Any]:
-    """
-    Получает достижения пользователя за текущую неделю
+    await stp_repo.session.execute(insert(Transaction), rows)
+    await stp_repo.session.commit()
 
-    Args:
-        stp_repo: Репозиторий БД
-        user_id: ID пользователя
+    # Награды за достижения увеличивают и баланс, и сумму заработанного
+    deltas = {}
+    for user_id, (_, earned) in awards.items():
+        reward = sum(achievement["reward_points"] for achievement in earned)
+        deltas[user_id] = Balance(reward, reward)
+    await balance_ledger.apply(deltas)
 
-    Returns:
-        Список транзакций-достижений за текущую неделю
-    """
+    # Балансы для уведомлений
     try:
-        # Вычисляем начало недели (понедельник)
-        today = date.today()
-        days_since_monday = today.weekday()
-        week_start = today - timedelta(days=days_since_monday)
-
-        # Получаем транзакции-достижения за текущую неделю
-        query = select(Transaction).filter(
-            and_(
-                Transaction.user_id == user_id,
-                Transaction.source_type == "achievement",
-                func.date(Transaction.created_at) >= week_start,
-            )
-        )
-
-        result = await stp_repo.session.execute(query)
-        return result.scalars().all()
-
+        balances = await balance_ledger.get_many(stp_repo, awards.keys())
+        return {user_id: balance.balance for user_id, balance in balances.items()}
     except Exception as e:
-        logger.error(
-            f"[Достижения] Ошибка получения достижений на этой неделе для пользователя {user_id}: {e}"
-        )
-        return []
+        logger.error(f"[Достижения] Ошибка получения балансов награжденных: {e}")
+        return {}
 
 
-async def _get_user_achievements_this_month(
-    stp_repo: MainRequestsRepo, user_id: int
-) -> Sequence[Transaction] | list[Any]:
+async def _notify_awards(
+    awards: Dict[int, Tuple[Any, List[Dict]]], balances: Dict[int, int], bot: Bot
+):
     """
-    Получает достижения пользователя за текущий месяц
+    Отправляет каждому награжденному одно уведомление обо всех достижениях
 
     Args:
-        stp_repo: Репозиторий БД
-        user_id: ID пользователя
-
-    Returns:
-        Список транзакций-достижений за текущий месяц
+        awards: Новые достижения по ID пользователя
+        balances: Балансы пользователей после вручения
+        bot: Экземпляр бота
     """
-    try:
-        # Вычисляем начало месяца
-        today = date.today()
-        month_start = today.replace(day=1)
-
-        # Получаем транзакции-достижения за текущий месяц
-        query = select(Transaction).filter(
-            and_(
-                Transaction.user_id == user_id,
-                Transaction.source_type == "achievement",
-                func.date(Transaction.created_at) >= month_start,
+    results = await asyncio.gather(
+        *(
+            notify(
+                bot,
+                user_id,
+                _create_batch_achievements_message(
+                    earned,
+                    sum(achievement["reward_points"] for achievement in earned),
+                    balances.get(user_id),
+                ),
+                job="achievements",
             )
+            for user_id, (_, earned) in awards.items()
         )
-
-        result = await stp_repo.session.execute(query)
-        return result.scalars().all()
-
-    except Exception as e:
-        logger.error(
-            f"[Достижения] Ошибка получения достижений в этом месяце для пользователя {user_id}: {e}"
+    )
+    failed = results.count(False)
+    if failed:
+        logger.debug(
+            "[Достижения] Не удалось отправить %s уведомлений о достижениях", failed
         )
-        return []
-
-
-async def _get_user_achievements_by_kpi_date(
-    stp_repo: MainRequestsRepo, user_id: int, kpi_extract_date
-) -> Sequence[Transaction] | list:
-    """
-    Получает достижения пользователя с определенным kpi_extracted_at
 
-    Args:
-        stp_repo: Репозиторий БД
-        user_id: ID пользователя
-        kpi_extract_date: Дата извлечения KPI
-
-    Returns:
-        Список транзакций-достижений с указанным kpi_extracted_at
-    """
-    try:
-        # Получаем транзакции-достижения с указанным kpi_extracted_at
-        query = select(Transaction).filter(
-            and_(
-                Transaction.user_id == user_id,
-                Transaction.source_type == "achievement",
-                Transaction.kpi_extracted_at == kpi_extract_date,
-            )
-        )
 
-        result = await stp_repo.session.execute(query)
-        return result.scalars().all()
+# Столбцы KPI и подписи в сообщениях по названиям показателей в критериях
+KPI_COLUMNS = {
+    "AHT": "aht",
+    "CC": "contacts_count",
+    "TC": "contacts_count",
+    "FLR": "flr",
+    "CSI": "csi",
+    "POK": "pok",
+    "DELAY": "delay",
+    "SalesCount": "sales_count",
+    "SalesPotential": "sales_potential",
+}
+KPI_LABELS = {"CC": "Контактов", "TC": "Контактов"}
 
-    except Exception as e:
-        logger.error(
-            f"[Достижения] Ошибка получения достижений по kpi_extract_date {kpi_extract_date} для пользователя {user_id}: {e}"
-        )
-        return []
+# Направления, входящие в НТП
+NTP_DIVISIONS = ["НТП", "НТП1", "НТП2"]
 
 
-async def _get_user_achievements_last_n_days(
-    stp_repo: MainRequestsRepo, user_id: int, n_days: int
-) -> Sequence[Transaction] | list:
+@dataclass(frozen=True)
+class CompiledCriteria:
     """
-    Получает достижения пользователя за последние n дней
+    Разобранные KPI критерии достижения
 
     Args:
-        stp_repo: Репозиторий БД
-        user_id: ID пользователя
-        n_days: Количество дней назад
+        ranges: Кортежи (название показателя, столбец KPI, минимум, максимум).
+            Столбец None для неизвестного показателя - критерий не выполняется
+    """
+
+    ranges: Tuple[Tuple[str, str | None, float, float], ...]
+
+    def mask(self, table: pd.DataFrame) -> pd.Series:
+        """Маска строк таблицы KPI, удовлетворяющих всем критериям"""
+        mask = pd.Series(True, index=table.index)
+        for _, column, min_val, max_val in self.ranges:
+            if column is None:
+                return pd.Series(False, index=table.index)
+            # Пустые значения (NaN) не попадают ни в один диапазон
+            mask &= table[column].between(min_val, max_val)
+        return mask
+
+    def values(self, user_kpi) -> Dict:
+        """Значения показателей пользователя для сообщения о достижении"""
+        return {
+            KPI_LABELS.get(kpi_name, kpi_name): getattr(user_kpi, column, None)
+            for kpi_name, column, _, _ in self.ranges
+            if column is not None
+        }
 
-    Returns:
-        Список транзакций-достижений за последние n дней
-    """
-    try:
-        # Вычисляем дату n дней назад
-        cutoff_date = date.today() - timedelta(days=n_days)
-
-        # Получаем транзакции-достижения за последние n дней
-        query = select(Transaction).filter(
-            and_(
-                Transaction.user_id == user_id,
-                Transaction.source_type == "achievement",
-                func.date(Transaction.created_at) >= cutoff_date,
-            )
-        )
 
-        result = await stp_repo.session.execute(query)
-        return result.scalars().all()
+@lru_cache(maxsize=512)
+def _compile_criteria(kpi_criteria_str: str) -> CompiledCriteria:
+    """
+    Разбирает JSON строку критериев (например: {"AHT":[0,740],"CC":[20,99999]})
 
-    except Exception as e:
-        logger.error(
-            f"[Достижения] Ошибка получения достижений за последние {n_days} дней для пользователя {user_id}: {e}"
+    Результат кешируется по строке критериев, поэтому JSON каждого
+    достижения разбирается один раз
+    """
+    kpi_criteria = json.loads(kpi_criteria_str)
+    return CompiledCriteria(
+        tuple(
+            (kpi_name, KPI_COLUMNS.get(kpi_name), criteria[0], criteria[1])
+            for kpi_name, criteria in kpi_criteria.items()
         )
-        return []
+    )
 
 
-def _user_matches_achievement_criteria(user, achievement) -> bool:
+def _compile_achievement(achievement) -> CompiledCriteria | None:
     """
-    Проверяет соответствие пользователя критериям достижения
+    Критерии достижения или None, если их не удалось разобрать
 
     Args:
-        user: Пользователь
         achievement: Достижение
-
-    Returns:
-        True если пользователь подходит под критерии
     """
     try:
-        # Проверяем направление (division)
-        if achievement.division != "ALL":
-            user_division = user.division
-            achievement_division = achievement.division
-
-            # Если достижение для НЦК - пользователь должен быть только из НЦК
-            if achievement_division == "НЦК":
-                if user_division != "НЦК":
-                    return False
-            # Если достижение для НТП - пользователь может быть из НТП, НТП1, НТП2
-            elif achievement_division == "НТП":
-                if user_division not in ["НТП", "НТП1", "НТП2"]:
-                    return False
-            # Для других направлений - точное совпадение
-            else:
-                if user_division != achievement_division:
-                    return False
-
-        # Проверяем позицию (точное совпадение)
-        if achievement.position != "ALL" and user.position != achievement.position:
-            return False
-
-        return True
-
+        return _compile_criteria(achievement.kpi)
     except Exception as e:
         logger.error(
-            f"[Достижения] Ошибка проверки критериев достижения {achievement.name}: {e}"
+            f"[Достижения] Ошибка разбора KPI критериев достижения {achievement.name}: {e}"
         )
-        return False
+        return None
 
 
-async def _check_kpi_criteria(user_kpi, kpi_criteria_str: str) -> bool:
+def _division_mask(divisions: pd.Series, achievement_division: str) -> pd.Series:
     """
-    Проверяет соответствие KPI пользователя критериям достижения
+    Маска пользователей, подходящих достижению по направлению
 
     Args:
-        user_kpi: KPI пользователя за день
-        kpi_criteria_str: JSON строка с критериями (например: {"AHT":[0,740],"CC":[20,99999]})
-
-    Returns:
-        True если KPI соответствует критериям
-    """
-    try:
-        kpi_criteria = json.loads(kpi_criteria_str)
-
-        for kpi_name, criteria_range in kpi_criteria.items():
-            min_val, max_val = criteria_range[0], criteria_range[1]
-
-            # Получаем значение KPI пользователя
-            user_value = None
-
-            if kpi_name == "AHT":
-                user_value = user_kpi.aht
-            elif kpi_name == "CC" or kpi_name == "TC":  # TC - это contacts_count
-                user_value = user_kpi.contacts_count
-            elif kpi_name == "FLR":
-                user_value = user_kpi.flr
-            elif kpi_name == "CSI":
-                user_value = user_kpi.csi
-            elif kpi_name == "POK":
-                user_value = user_kpi.pok
-            elif kpi_name == "DELAY":
-                user_value = user_kpi.delay
-            elif kpi_name == "SalesCount":
-                user_value = user_kpi.sales_count
-            elif kpi_name == "SalesPotential":
-                user_value = user_kpi.sales_potential
-
-            if user_value is None:
-                logger.debug(
-                    f"[Достижения] Нет данных по KPI {kpi_name} для пользователя"
-                )
-                return False
-
-            # Проверяем диапазон
-            if not (min_val <= user_value <= max_val):
-                return False
-
-        return True
-
-    except Exception as e:
-        logger.error(f"[Достижения] Ошибка проверки KPI критериев: {e}")
-        return False
-
-
-def _get_user_kpi_values(user_kpi, kpi_criteria_str: str) -> Dict:
-    """
-    Получает актуальные значения KPI пользователя согласно критериям
-
-    Args:
-        user_kpi: KPI пользователя за день
-        kpi_criteria_str: JSON строка с критериями
-
-    Returns:
-        Словарь с актуальными значениями KPI
-    """
-    kpi_values = {}
-
-    try:
-        kpi_criteria = json.loads(kpi_criteria_str)
-
-        for kpi_name in kpi_criteria.keys():
-            if kpi_name == "AHT":
-                kpi_values["AHT"] = user_kpi.aht
-            elif kpi_name == "CC" or kpi_name == "TC":
-                kpi_values["Контактов"] = user_kpi.contacts_count
-            elif kpi_name == "FLR":
-                kpi_values["FLR"] = user_kpi.flr
-            elif kpi_name == "CSI":
-                kpi_values["CSI"] = user_kpi.csi
-            elif kpi_name == "POK":
-                kpi_values["POK"] = user_kpi.pok
-            elif kpi_name == "DELAY":
-                kpi_values["DELAY"] = user_kpi.delay
-            elif kpi_name == "SalesCount":
-                kpi_values["SalesCount"] = user_kpi.sales_count
-            elif kpi_name == "SalesPotential":
-                kpi_values["SalesPotential"] = user_kpi.sales_potential
-
-    except Exception as e:
-        logger.error(f"[Достижения] Ошибка получения значений KPI: {e}")
-
-    return kpi_values
+        divisions: Направления пользователей
+        achievement_division: Направление достижения
+    """
+    if achievement_division == "ALL":
+        return pd.Series(True, index=divisions.index)
+    # Достижение для НТП доступно пользователям НТП, НТП1 и НТП2
+    if achievement_division == "НТП":
+        return divisions.isin(NTP_DIVISIONS)
+    return divisions == achievement_division
 
 
 def _format_kpi_values(kpi_values: Dict) -> str:
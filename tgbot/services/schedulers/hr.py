@@ -11,15 +11,18 @@ from datetime import datetime
 from pathlib import Path
 from typing import Dict, List
 
-import pandas as pd
 from aiogram import Bot
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from stp_database.repo.STP.employee import EmployeeRepo
 from stp_database.repo.STP.requests import MainRequestsRepo
 
-from tgbot.services.broadcaster import send_message
+from tgbot.misc.lazy import lazy_import
+from tgbot.services.group_cache import groups_cache
+from tgbot.services.notifications import notify
 from tgbot.services.schedulers.base import BaseScheduler
 
+pd = lazy_import("pandas")
+
 logger = logging.getLogger(__name__)
 
 
@@ -352,6 +355,9 @@ async def remove_fired_users_from_groups(
                         db_removed = await stp_repo.group_member.remove_member(
                             group_membership.group_id, employee.user_id
                         )
+                        groups_cache.forget_member(
+                            group_membership.group_id, employee.user_id
+                        )
 
                         if db_removed:
                             groups_removed_from += 1
@@ -509,7 +515,7 @@ async def send_notifications_to_supervisors(
             message = create_notification_message(head_name, subordinates)
 
             # Отправляем уведомление
-            success = await send_message(bot, supervisor.user_id, message)
+            success = await notify(bot, supervisor.user_id, message, job="hr")
             notification_results[head_name] = success
 
             if success:
@@ -4,6 +4,7 @@ Studies scheduler for managing study session notifications.
 Handles notifications for participants when there's less than a week before study dates.
 """
 
+import asyncio
 import logging
 from datetime import datetime, timedelta
 from pathlib import Path
@@ -13,7 +14,7 @@ from aiogram import Bot
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from stp_database.repo.STP.requests import MainRequestsRepo
 
-from tgbot.services.broadcaster import send_message
+from tgbot.services.notifications import notify
 from tgbot.services.schedule.studies_parser import StudiesScheduleParser, StudySession
 from tgbot.services.schedulers.base import BaseScheduler
 
@@ -152,13 +153,16 @@ async def send_study_notifications(
         Dict with notification results per session
     """
     notification_results = {}
+    # (session key, participant name, delivery) awaited after all sessions:
+    # a participant of several sessions gets the later notices in one digest
+    deliveries = []
 
     async with session_pool() as session:
         stp_repo = MainRequestsRepo(session)
 
         for session_obj in sessions:
             session_key = f"{session_obj.date.strftime('%d.%m.%Y')}_{session_obj.title}"
-            notifications_sent = 0
+            notification_results[session_key] = 0
 
             # Get unique participant names (avoid duplicates)
             # Only extract names from the ФИО field (column 2) - these are the actual participants
@@ -205,17 +209,10 @@ async def send_study_notifications(
                     )
 
                     # Send notification
-                    success = await send_message(bot, participant.user_id, message)
-
-                    if success:
-                        notifications_sent += 1
-                        logger.debug(
-                            f"[Обучения] {participant_name} уведомлен о скором обучении"
-                        )
-                    else:
-                        logger.warning(
-                            f"[Обучения] Ошибка уведомления {participant_name}"
-                        )
+                    delivery = asyncio.ensure_future(
+                        notify(bot, participant.user_id, message, job="studies")
+                    )
+                    deliveries.append((session_key, participant_name, delivery))
 
                 except Exception as e:
                     logger.error(
@@ -223,10 +220,25 @@ async def send_study_notifications(
                     )
                     continue
 
-            notification_results[session_key] = notifications_sent
-            logger.info(
-                f"[Обучения] Обучение {session_key}: отправлено {notifications_sent} уведомлений"
+    for session_key, participant_name, delivery in deliveries:
+        try:
+            success = await delivery
+        except Exception as e:
+            logger.error(
+                f"[Обучения] Error notifying participant {participant_name}: {e}"
             )
+            continue
+
+        if success:
+            notification_results[session_key] += 1
+            logger.debug(f"[Обучения] {participant_name} уведомлен о скором обучении")
+        else:
+            logger.warning(f"[Обучения] Ошибка уведомления {participant_name}")
+
+    for session_key, notifications_sent in notification_results.items():
+        logger.info(
+            f"[Обучения] Обучение {session_key}: отправлено {notifications_sent} уведомлений"
+        )
 
     return notification_results
 
@@ -6,6 +6,7 @@ from stp_database.repo.STP.requests import MainRequestsRepo
 
 from tgbot.misc.helpers import get_role
 from tgbot.services.leveling import LevelingSystem
+from tgbot.services.statistics import player_statistics
 
 logger = logging.getLogger(__name__)
 
@@ -41,23 +42,15 @@ class SearchService:
     async def get_user_statistics(user_id: int, stp_repo: MainRequestsRepo) -> dict:
         """Получить статистику пользователя (уровень, очки, достижения, покупки)"""
         try:
-            # Получаем базовые данные
-            user_purchases = await stp_repo.purchase.get_user_purchases(user_id)
-            achievements_sum = await stp_repo.transaction.get_user_achievements_sum(
-                user_id
-            )
-            purchases_sum = await stp_repo.purchase.get_user_purchases_sum(user_id)
-
-            # Рассчитываем уровень
-            user_balance = await stp_repo.transaction.get_user_balance(user_id)
-            current_level = LevelingSystem.calculate_level(achievements_sum)
+            # Баланс из BalanceLedger, покупки - одним запросом или из кеша
+            statistics = await player_statistics.user(stp_repo, user_id)
 
             return {
-                "level": current_level,
-                "balance": user_balance,
-                "total_earned": achievements_sum,
-                "total_spent": purchases_sum,
-                "purchases_count": len(user_purchases),
+                "level": LevelingSystem.calculate_level(statistics.achievements),
+                "balance": statistics.balance,
+                "total_earned": statistics.achievements,
+                "total_spent": statistics.purchases_sum,
+                "purchases_count": statistics.purchases_count,
             }
         except Exception as e:
             logger.error(f"Ошибка получения статистики пользователя {user_id}: {e}")
@@ -73,36 +66,13 @@ class SearchService:
     async def get_group_statistics(head_name: str, stp_repo: MainRequestsRepo) -> dict:
         """Получить общую статистику группы руководителя"""
         try:
-            # Получаем сотрудников группы
-            group_users = await stp_repo.employee.get_users_by_head(head_name)
-
-            total_points = 0
-            group_purchases = {}
-
-            for user in group_users:
-                if user.user_id:  # Только авторизованные пользователи
-                    # Суммируем очки
-                    achievements_sum = (
-                        await stp_repo.transaction.get_user_achievements_sum(
-                            user.user_id
-                        )
-                    )
-                    total_points += achievements_sum
-
-                    # Собираем статистику предметов
-                    most_bought_product = (
-                        await stp_repo.purchase.get_most_bought_product(user.user_id)
-                    )
-                    if most_bought_product:
-                        product_name = most_bought_product[0]
-                        product_count = most_bought_product[1]
-                        group_purchases[product_name] = (
-                            group_purchases.get(product_name, 0) + product_count
-                        )
+            # Состав и покупки группы - одним запросом или из кеша
+            statistics = await player_statistics.group(stp_repo, head_name)
 
             return {
-                "total_users": len(group_users),
-                "total_points": total_points,
+                "total_users": statistics.total_users,
+                "total_points": statistics.total_points,
+                "most_popular_product": statistics.most_popular_product,
             }
         except Exception as e:
             logger.error(f"Ошибка получения статистики группы {head_name}: {e}")
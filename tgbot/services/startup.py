@@ -0,0 +1,45 @@
+"""
+Отчет о времени запуска бота по этапам
+"""
+
+import logging
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class StartupReport:
+    """
+    Замер длительности этапов запуска
+    """
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.phases: list[tuple[str, float]] = []
+
+    @contextmanager
+    def phase(self, name: str):
+        """
+        Замеряет длительность этапа
+
+        :param name: Название этапа
+        """
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - started_at))
+
+    @property
+    def total(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    def log(self) -> None:
+        """
+        Выводит отчет в лог
+        """
+        lines = [
+            f"  {name:<32} {elapsed * 1000:8.1f}мс" for name, elapsed in self.phases
+        ]
+        logger.info(f"[Запуск] Бот запущен за {self.total:.2f}с:\n" + "\n".join(lines))
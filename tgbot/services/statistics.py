@@ -0,0 +1,261 @@
+"""
+Игровая статистика сотрудников и групп
+
+Баланс и баллы за достижения берутся из материализованных балансов
+(BalanceLedger), а покупки агрегируются в БД одним запросом (для группы -
+с группировкой по сотруднику и предмету) и кешируются в Redis (без Redis -
+в памяти процесса). Покупки и продажи предметов записываются вместе с
+транзакциями, поэтому кеш сбрасывается через подписку на BalanceLedger:
+статистика пользователя и группы, в которую он входит.
+"""
+
+import json
+import logging
+import time
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+from redis.asyncio import Redis
+from sqlalchemy import func, select
+from stp_database import Employee, MainRequestsRepo, Product
+from stp_database.models.STP.purchase import Purchase
+
+from tgbot.services.balances import Balance, balance_ledger
+
+logger = logging.getLogger(__name__)
+
+USER_KEY = "statistics:user:{user_id}"
+GROUP_KEY = "statistics:group:{head}"
+# Группа, в статистику которой входит пользователь
+MEMBER_KEY = "statistics:member:{user_id}"
+
+# Статистика сбрасывается при каждой транзакции, TTL ограничивает время,
+# за которое статистика группы узнает о переводах и увольнениях сотрудников
+STATISTICS_TTL = 15 * 60
+
+
+@dataclass(frozen=True)
+class UserStatistics:
+    """
+    Игровая статистика пользователя
+
+    :param balance: Текущий баланс
+    :param achievements: Баллы, заработанные достижениями
+    :param purchases_count: Количество купленных предметов
+    :param purchases_sum: Стоимость купленных предметов
+    """
+
+    balance: int = 0
+    achievements: int = 0
+    purchases_count: int = 0
+    purchases_sum: int = 0
+
+
+@dataclass(frozen=True)
+class GroupStatistics:
+    """
+    Игровая статистика группы руководителя
+
+    :param total_users: Количество сотрудников группы
+    :param total_points: Баллы, заработанные достижениями всеми сотрудниками
+    :param most_popular_product: Самый покупаемый в группе предмет
+    """
+
+    total_users: int = 0
+    total_points: int = 0
+    most_popular_product: Optional[str] = None
+
+
+class PlayerStatistics:
+    """
+    Кеш игровой статистики пользователей и групп
+    """
+
+    def __init__(self):
+        self.redis: Optional[Redis] = None
+        # Кеш без Redis: ключ -> (истекает, статистика)
+        self._local: dict[str, tuple[float, object]] = {}
+        # Группы пользователей без Redis: ID пользователя -> ФИО руководителя
+        self._members: dict[int, str] = {}
+
+    def configure(self, redis: Optional[Redis] = None) -> None:
+        """
+        Настройка кеша статистики и подписка на изменения балансов
+
+        :param redis: Клиент Redis. Без него кеш хранится в памяти процесса
+        """
+        self.redis = redis
+        self._local.clear()
+        self._members.clear()
+        balance_ledger.subscribe(self.forget)
+
+    async def user(self, stp_repo: MainRequestsRepo, user_id: int) -> UserStatistics:
+        """
+        Статистика пользователя
+
+        Баланс и баллы за достижения читаются из BalanceLedger, в БД
+        агрегируются только покупки.
+
+        :param stp_repo: Репозиторий основной БД
+        :param user_id: Telegram ID пользователя
+        """
+        balance = await balance_ledger.get(stp_repo, user_id)
+
+        key = USER_KEY.format(user_id=user_id)
+        purchases = await self._get(key)
+        if purchases is None:
+            result = await stp_repo.session.execute(
+                select(
+                    func.count(Purchase.id),
+                    func.coalesce(func.sum(Product.cost), 0),
+                )
+                .join(Product, Product.id == Purchase.product_id)
+                .where(Purchase.user_id == user_id)
+            )
+            purchases_count, purchases_sum = result.one()
+            purchases = {
+                "purchases_count": int(purchases_count),
+                "purchases_sum": int(purchases_sum),
+            }
+            await self._set(key, purchases)
+
+        return UserStatistics(balance.balance, balance.achievements, **purchases)
+
+    async def group(self, stp_repo: MainRequestsRepo, head: str) -> GroupStatistics:
+        """
+        Статистика группы руководителя
+
+        Баллы за достижения читаются из BalanceLedger, состав группы и
+        покупки по паре (сотрудник, предмет) - одним запросом.
+
+        :param stp_repo: Репозиторий основной БД
+        :param head: ФИО руководителя
+        """
+        key = GROUP_KEY.format(head=head)
+        cached = await self._get(key)
+        if cached is not None:
+            return GroupStatistics(**cached)
+
+        products = (
+            select(
+                Purchase.user_id,
+                Product.name,
+                func.count(Purchase.id).label("purchases"),
+            )
+            .join(Product, Product.id == Purchase.product_id)
+            .where(
+                Purchase.user_id.in_(
+                    select(Employee.user_id).where(Employee.head == head)
+                )
+            )
+            .group_by(Purchase.user_id, Product.id, Product.name)
+            .subquery()
+        )
+        # Строка на пару (сотрудник, предмет); сотрудники без покупок - одной строкой
+        result = await stp_repo.session.execute(
+            select(
+                Employee.id,
+                Employee.user_id,
+                products.c.name,
+                products.c.purchases,
+            )
+            .outerjoin(products, products.c.user_id == Employee.user_id)
+            .where(Employee.head == head)
+        )
+
+        employees = set()
+        member_user_ids = set()
+        product_counts: dict[str, int] = {}
+        for employee_id, user_id, product_name, purchases in result:
+            employees.add(employee_id)
+            if user_id:
+                member_user_ids.add(user_id)
+            if product_name:
+                product_counts[product_name] = (
+                    product_counts.get(product_name, 0) + purchases
+                )
+
+        balances = await balance_ledger.get_many(stp_repo, member_user_ids)
+        statistics = GroupStatistics(
+            total_users=len(employees),
+            total_points=sum(balance.achievements for balance in balances.values()),
+            most_popular_product=max(
+                product_counts, key=product_counts.get, default=None
+            ),
+        )
+
+        await self._set(key, asdict(statistics))
+        await self._remember_members(head, member_user_ids)
+        return statistics
+
+    async def forget(self, deltas: dict[int, Balance]) -> None:
+        """
+        Сбрасывает статистику пользователей и их групп
+
+        :param deltas: Изменения балансов по Telegram ID пользователя
+        """
+        if self.redis is None:
+            for user_id in deltas:
+                self._local.pop(USER_KEY.format(user_id=user_id), None)
+                head = self._members.pop(user_id, None)
+                if head is not None:
+                    self._local.pop(GROUP_KEY.format(head=head), None)
+            return
+
+        try:
+            member_keys = [MEMBER_KEY.format(user_id=user_id) for user_id in deltas]
+            heads = await self.redis.mget(member_keys)
+            keys = [USER_KEY.format(user_id=user_id) for user_id in deltas]
+            keys += [
+                GROUP_KEY.format(
+                    head=head.decode() if isinstance(head, bytes) else head
+                )
+                for head in heads
+                if head is not None
+            ]
+            await self.redis.delete(*keys, *member_keys)
+        except Exception as e:
+            logger.error(f"[Статистика] Ошибка сброса статистики: {e}")
+
+    async def _remember_members(self, head: str, user_ids) -> None:
+        """Связь участников с группой для сброса ее статистики"""
+        if self.redis is None:
+            for user_id in user_ids:
+                self._members[user_id] = head
+            return
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for user_id in user_ids:
+                    pipe.set(
+                        MEMBER_KEY.format(user_id=user_id), head, ex=STATISTICS_TTL
+                    )
+                await pipe.execute()
+        except Exception as e:
+            logger.error(f"[Статистика] Ошибка записи участников группы {head}: {e}")
+
+    async def _get(self, key: str) -> Optional[dict]:
+        if self.redis is None:
+            cached = self._local.get(key)
+            if cached and cached[0] > time.monotonic():
+                return cached[1]
+            return None
+        try:
+            cached = await self.redis.get(key)
+        except Exception as e:
+            logger.error(f"[Статистика] Ошибка чтения {key}: {e}")
+            return None
+        return json.loads(cached) if cached is not None else None
+
+    async def _set(self, key: str, value: dict) -> None:
+        if self.redis is None:
+            self._local[key] = (time.monotonic() + STATISTICS_TTL, value)
+            return
+        try:
+            await self.redis.set(
+                key, json.dumps(value, ensure_ascii=False), ex=STATISTICS_TTL
+            )
+        except Exception as e:
+            logger.error(f"[Статистика] Ошибка записи {key}: {e}")
+
+
+player_statistics = PlayerStatistics()
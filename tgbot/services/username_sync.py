@@ -0,0 +1,114 @@
+"""
+Отложенная синхронизация юзернеймов сотрудников
+
+Изменения юзернеймов копятся в очереди (последнее значение для каждого
+пользователя) и периодически записываются в БД одним UPDATE.
+"""
+
+import asyncio
+import logging
+from typing import Optional
+
+from sqlalchemy import case, update
+from stp_database import Employee
+
+logger = logging.getLogger(__name__)
+
+
+class UsernameSyncQueue:
+    """
+    Очередь синхронизации юзернеймов с объединением изменений по пользователю
+    """
+
+    def __init__(self, flush_interval: float = 30, max_batch: int = 500):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._pending: dict[int, Optional[str]] = {}
+        # Изменения, которые записываются в БД в данный момент
+        self._flushing: dict[int, Optional[str]] = {}
+        self._session_pool = None
+        self._task: Optional[asyncio.Task] = None
+
+    def enqueue(self, user_id: int, username: Optional[str]) -> bool:
+        """
+        Добавляет изменение юзернейма в очередь
+
+        :param user_id: Telegram ID пользователя
+        :param username: Новый юзернейм или None, если он удален
+        :return: False, если это значение уже ожидает записи в БД
+        """
+        queue = self._pending if user_id in self._pending else self._flushing
+        if user_id in queue and queue[user_id] == username:
+            return False
+        self._pending[user_id] = username
+        return True
+
+    async def flush(self) -> int:
+        """
+        Записывает накопленные изменения в БД одним запросом
+
+        :return: Количество обновленных пользователей
+        """
+        if not self._pending or self._session_pool is None:
+            return 0
+
+        batch = dict(list(self._pending.items())[: self.max_batch])
+        for user_id in batch:
+            self._pending.pop(user_id, None)
+        self._flushing = batch
+
+        try:
+            async with self._session_pool() as session:
+                await session.execute(
+                    update(Employee)
+                    .where(Employee.user_id.in_(batch.keys()))
+                    .values(username=case(batch, value=Employee.user_id))
+                    .execution_options(synchronize_session=False)
+                )
+                await session.commit()
+        except Exception as e:
+            # Возвращаем изменения в очередь, если за это время не пришли более новые
+            for user_id, username in batch.items():
+                self._pending.setdefault(user_id, username)
+            logger.error(f"[Юзернейм] Ошибка пакетного обновления юзернеймов: {e}")
+            return 0
+        finally:
+            self._flushing = {}
+
+        logger.info(f"[Юзернейм] Обновлены юзернеймы {len(batch)} пользователей")
+        return len(batch)
+
+    def start(self, session_pool) -> None:
+        """
+        Запускает фоновую задачу периодической записи изменений
+
+        :param session_pool: Пул сессий основной БД
+        """
+        self._session_pool = session_pool
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Останавливает фоновую задачу и записывает оставшиеся изменения
+        """
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        while self._pending:
+            if not await self.flush():
+                break
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            while await self.flush() >= self.max_batch:
+                pass
+
+
+username_sync = UsernameSyncQueue()
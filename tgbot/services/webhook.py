@@ -0,0 +1,69 @@
+"""
+Прием апдейтов через вебхук
+
+Каждый воркер поднимает aiohttp сервер на собственном порту
+(WEBHOOK_PORT + номер воркера), локальный reverse proxy распределяет
+запросы Telegram между воркерами. Состояния FSM хранятся в Redis,
+поэтому любой воркер может обработать апдейт любого чата.
+"""
+
+import logging
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from tgbot.config import WebhookConfig
+
+logger = logging.getLogger(__name__)
+
+
+async def set_webhook(
+    bot: Bot, config: WebhookConfig, allowed_updates: list[str]
+) -> None:
+    """
+    Регистрирует вебхук в Telegram. Вызывается только первым воркером
+    """
+    await bot.set_webhook(
+        url=config.url,
+        secret_token=config.secret,
+        allowed_updates=allowed_updates,
+        max_connections=max(40, config.workers * 20),
+    )
+    logger.info(f"[Вебхук] Вебхук установлен: {config.url}")
+
+
+async def start_webhook_server(
+    dp: Dispatcher, bot: Bot, config: WebhookConfig, worker_index: int = 0
+) -> web.AppRunner:
+    """
+    Запускает HTTP сервер воркера, передающий апдейты в диспетчер.
+    Запросы без верного секретного токена отклоняются с кодом 401
+
+    :param worker_index: Номер воркера, определяет порт сервера
+    :return: Runner сервера для остановки
+    """
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        handle_in_background=True,
+        secret_token=config.secret,
+    ).register(app, path=config.path)
+    app.router.add_get("/health", _health_handler)
+    setup_application(app, dp, bot=bot)
+
+    port = config.port + worker_index
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host=config.host, port=port)
+    await site.start()
+
+    logger.info(
+        f"[Вебхук] Воркер {worker_index} принимает апдейты на http://{config.host}:{port}{config.path}"
+    )
+    return runner
+
+
+async def _health_handler(request: web.Request) -> web.Response:
+    return web.Response(text="ok")